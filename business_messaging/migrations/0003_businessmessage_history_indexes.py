@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('business_messaging', '0002_initial'),
+        ('cloud_messaging', '0004_message_history_indexes'),
+        ('healtho_pro_user', '0003_domain_url'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='businessmessage',
+            index=models.Index(fields=['conversation', '-timestamp', '-id'], name='business_me_convers_a41e4e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='businessmessage',
+            index=models.Index(fields=['group', '-timestamp', '-id'], name='business_me_group_i_935008_idx'),
+        ),
+    ]
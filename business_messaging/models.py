@@ -80,6 +80,11 @@ class BusinessMessage(models.Model):
 
     class Meta:
         ordering = ('-timestamp',)
+        indexes = [
+            # Keyset pagination of the history of a chat, see MessageCursorPagination
+            models.Index(fields=['conversation', '-timestamp', '-id']),
+            models.Index(fields=['group', '-timestamp', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.sender}->{self.conversation if self.conversation else self.group} : {self.text if self.text else 'Attachment'}"
@@ -3,6 +3,7 @@ from rest_framework import serializers
 
 from business_messaging.models import BusinessGroup, BusinessMessage, BusinessMessagingFile
 from business_messaging.views import get_latest_business_message
+from cloud_messaging.inbox import get_prefetched_inbox_entry
 from healtho_pro_user.models.users_models import HealthOProMessagingUser
 
 
@@ -35,7 +36,7 @@ class MessagingBusinessGroupSerializer(serializers.ModelSerializer):
 
     def get_latest_message(self, obj):
         with schema_context(obj.client.schema_name):
-            latest_message = obj.messages.first()
+            latest_message = obj.latest_message if hasattr(obj, 'inbox_entry') else obj.messages.first()
             if latest_message:
                 return {
                     'sender': latest_message.sender.id,
@@ -45,6 +46,9 @@ class MessagingBusinessGroupSerializer(serializers.ModelSerializer):
             return None
 
     def get_current_user_unread_messages_count(self, obj):
+        inbox_entry = get_prefetched_inbox_entry(obj, self.context.get('msg_user'))
+        if inbox_entry is not None:
+            return inbox_entry.unread_count
         with schema_context(obj.client.schema_name):
             messaging_user = self.context['msg_user']
             unread_count = obj.get_unread_message_count(messaging_user)
@@ -54,7 +58,10 @@ class MessagingBusinessGroupSerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
         representation['is_group'] = True
 
-        latest_message, latest_message_time = get_latest_business_message(instance)
+        if hasattr(instance, 'inbox_entry'):
+            latest_message_time = instance.latest_message_time
+        else:
+            latest_message, latest_message_time = get_latest_business_message(instance)
         representation['latest_message_time'] = latest_message_time
         representation['members'] = HealthOProMessagingUserListSerializer(instance.members, many=True).data
         # representation['admin'] = HealthOProMessagingUserListSerializer(instance.admin, many=True).data
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CloudMessagingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cloud_messaging'
+
+    def ready(self):
+        import cloud_messaging.signals
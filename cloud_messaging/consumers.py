@@ -1,3 +1,4 @@
+import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async  # Import for async database operations
@@ -10,11 +11,12 @@ from rest_framework.response import Response
 
 from business_messaging.models import BusinessGroup, BusinessMessage, BusinessMessagingFile, BusinessMessageReadStatus
 from business_messaging.serializers import BusinessMessagingMessageSerializer, MessagingBusinessGroupSerializer
-from business_messaging.views import get_latest_business_message
-from cloud_messaging.models import Conversation, Group, Message, MessagingFile, MessageReadStatus
+from cloud_messaging.inbox import get_inbox_chats, mark_chat_as_read, get_chat_type, get_chat_schema_context
+from cloud_messaging.models import Conversation, Group, Message, MessagingFile, MessageReadStatus, ChatInboxEntry
 from cloud_messaging.serializers import HealthOProMessagingUserListSerializer, MessagingConversationSerializer, \
     MessagingCombinedChatSerializer, MessagingMessageSerializer, MessagingGroupSerializer
 from cloud_messaging.views import CombinedChatView, GetAllMessagesCount, UserReadMessages, UserReadConfirmationInGroup
+from healtho_pro.pagination import MessageCursorPagination
 from healtho_pro_user.models.users_models import HealthOProMessagingUser, Client
 
 
@@ -24,10 +26,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.client = self.scope['client']
         self.msg_user = self.scope['msg_user']
 
+        # Chats of the rooms used on this connection and their member ids, keyed by (chat type, room group name)
+        self.room_chats = {}
+        self.room_member_ids = {}
+
         self.user_chats = await self.get_user_chats_room_names(self.msg_user)
 
-        for room_group_name in self.user_chats:
-            await self.channel_layer.group_add(room_group_name, self.channel_name)
+        await asyncio.gather(*[self.channel_layer.group_add(room_group_name, self.channel_name)
+                               for room_group_name in self.user_chats])
 
         await self.accept()
 
@@ -37,8 +43,65 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({"type": "get_messaging_user", "msg_user": msg_user_data}, default=str))
 
     async def disconnect(self, close_code):
-        for room_group_name in self.user_chats:
-            await self.channel_layer.group_discard(room_group_name, self.channel_name)
+        await asyncio.gather(*[self.channel_layer.group_discard(room_group_name, self.channel_name)
+                               for room_group_name in getattr(self, 'user_chats', [])])
+
+    def cache_room_chat(self, chat):
+        if isinstance(chat, Conversation):
+            member_ids = {chat.initiator_id, chat.receiver_id}
+        else:
+            member_ids = {member.id for member in chat.members.all()}
+        key = (get_chat_type(chat), chat.room_group_name)
+        self.room_chats[key] = chat
+        self.room_member_ids[key] = member_ids
+        return chat
+
+    def forget_room_chat(self, room_group_name):
+        for key in [key for key in self.room_chats if key[1] == room_group_name]:
+            del self.room_chats[key]
+            del self.room_member_ids[key]
+
+    def get_group_chat_type(self):
+        # Users of a client chat in the business groups of the client's schema
+        return ChatInboxEntry.BUSINESS_GROUP if self.msg_user.client else ChatInboxEntry.GROUP
+
+    def load_room_chat(self, chat_type, room_group_name):
+        if chat_type == ChatInboxEntry.CONVERSATION:
+            chat = Conversation.objects.select_related('client').get(room_group_name=room_group_name)
+        elif chat_type == ChatInboxEntry.BUSINESS_GROUP:
+            with schema_context(self.msg_user.client.schema_name):
+                chat = BusinessGroup.objects.select_related('client').prefetch_related(
+                    'members').get(room_group_name=room_group_name)
+        else:
+            chat = Group.objects.prefetch_related('members').get(room_group_name=room_group_name)
+        return self.cache_room_chat(chat)
+
+    def get_room_chat(self, chat_type, room_group_name):
+        # Resolved once per connection, later messages of the room reuse the cached chat
+        chat = self.room_chats.get((chat_type, room_group_name))
+        if chat is None:
+            chat = self.load_room_chat(chat_type, room_group_name)
+        return chat
+
+    def is_room_member(self, chat):
+        key = (get_chat_type(chat), chat.room_group_name)
+        if self.msg_user.id in self.room_member_ids[key]:
+            return True
+        # The user may have been added after the membership was cached
+        self.load_room_chat(*key)
+        return self.msg_user.id in self.room_member_ids[key]
+
+    def save_message(self, message_model, file_model, serializer_class, data, **chat):
+        # The message, its attachments and the read statuses and inbox entries saved with it are one transaction
+        attachments = data.get('attachment')
+        with transaction.atomic():
+            message = message_model.objects.create(sender=self.msg_user, text=data.get('text'), **chat)
+            if attachments:
+                files = file_model.objects.bulk_create(
+                    [file_model(file=attachment['file'], file_name=attachment['file_name'])
+                     for attachment in attachments])
+                message.attachment.add(*files)
+            return serializer_class(message).data
 
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
@@ -159,19 +222,19 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
 
         elif message_type == "get_personal_chats":
-            messages = await self.get_personal_messages(data)
+            messages, positions = await self.get_personal_messages(data)
 
             # Send message to WebSocket
             await self.send(
-                text_data=json.dumps({"type": "get_personal_chats", "messages": messages}, default=str))
+                text_data=json.dumps({"type": "get_personal_chats", "messages": messages, **positions}, default=str))
 
 
         elif message_type == "get_group_chats":
-            messages = await self.get_group_messages(data)
+            messages, positions = await self.get_group_messages(data)
 
             # Send message to WebSocket
             await self.send(
-                text_data=json.dumps({"type": "get_group_chats", "messages": messages}, default=str))
+                text_data=json.dumps({"type": "get_group_chats", "messages": messages, **positions}, default=str))
 
         elif message_type == "mark_personal_chats_as_read":
             chats = await self.mark_personal_chats_as_read(self.room_group_name)
@@ -239,32 +302,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 elif make_admin:
                    group.admin.add(*members)
 
+        self.forget_room_chat(self.room_group_name)
 
 
 
     # Function to get Room Group names for the user.
     @database_sync_to_async
     def get_user_combined_chats(self):
-        combined_list = []
-        personal_chats = Conversation.objects.filter(Q(initiator=self.msg_user) | Q(receiver=self.msg_user))
-        combined_list.extend(personal_chats)
-
-        if self.client:
-            # Use schema_context to wrap the query
-            with schema_context(self.client.schema_name):
-                # Efficiently fetch business group chats related to the current user within the client's schema
-                business_group_chats = BusinessGroup.objects.filter(members=self.msg_user)
-                combined_list.extend(business_group_chats)
-
-        group_chats = Group.objects.filter(members=self.msg_user)
-        combined_list.extend(group_chats)
-
-        # Extract last message timestamps
-        for chat in combined_list:
-            chat.latest_message, chat.latest_message_time = get_latest_business_message(chat)
-
-        # Sort by last message timestamp
-        sorted_list = sorted(combined_list, key=lambda x: x.latest_message_time, reverse=True)
+        sorted_list = get_inbox_chats(self.msg_user)
 
         serializer = MessagingCombinedChatSerializer(sorted_list, many=True, context={"msg_user": self.msg_user})
 
@@ -272,14 +317,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def get_user_conversations(self):
-        personal_chats = Conversation.objects.filter(Q(initiator=self.msg_user) | Q(receiver=self.msg_user))
-
-        # Extract last message timestamps
-        for chat in personal_chats:
-            chat.latest_message, chat.latest_message_time = get_latest_business_message(chat)
-
-        # Sort by last message timestamp
-        sorted_list = sorted(personal_chats, key=lambda x: x.latest_message_time, reverse=True)
+        personal_chats = get_inbox_chats(self.msg_user, chat_types=[ChatInboxEntry.CONVERSATION])
 
         serializer = MessagingCombinedChatSerializer(personal_chats, many=True, context={"msg_user": self.msg_user})
 
@@ -287,24 +325,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def get_user_groups(self):
-        combined_list = []
-
-        if self.client:
-            # Use schema_context to wrap the query
-            with schema_context(self.client.schema_name):
-                # Efficiently fetch business group chats related to the current user within the client's schema
-                business_group_chats = BusinessGroup.objects.filter(members=self.msg_user)
-                combined_list.extend(business_group_chats)
-
-        group_chats = Group.objects.filter(members=self.msg_user)
-        combined_list.extend(group_chats)
-
-        # Extract last message timestamps
-        for chat in combined_list:
-            chat.latest_message, chat.latest_message_time = get_latest_business_message(chat)
-
-        # Sort by last message timestamp
-        sorted_list = sorted(combined_list, key=lambda x: x.latest_message_time, reverse=True)
+        sorted_list = get_inbox_chats(self.msg_user, chat_types=[ChatInboxEntry.GROUP, ChatInboxEntry.BUSINESS_GROUP])
 
         serializer = MessagingCombinedChatSerializer(sorted_list, many=True, context={"msg_user": self.msg_user})
 
@@ -318,67 +339,49 @@ class ChatConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def mark_personal_chats_as_read(self, room_group_name):
         # Check if the current user is a part of the conversation
-        conversation = Conversation.objects.get(room_group_name=room_group_name)
-        if self.msg_user == conversation.initiator or self.msg_user == conversation.receiver:
-            if self.msg_user == conversation.initiator:
-                partner = conversation.receiver
-            else:
-                partner = conversation.initiator
-
-            if conversation.client:
-                with schema_context(conversation.client.schema_name):
-                    messages = BusinessMessage.objects.filter(conversation=conversation, sender=partner, is_read=False)
-                    # Update is_read status for messages
-                    for message in messages:
-                        message.is_read = True
-                        message.save()
+        conversation = self.get_room_chat(ChatInboxEntry.CONVERSATION, room_group_name)
+        if self.is_room_member(conversation):
+            if self.msg_user.id == conversation.initiator_id:
+                partner_id = conversation.receiver_id
             else:
-                # Filter messages by conversation ID and check if the current user is the receiver
-                messages = Message.objects.filter(conversation=conversation, sender=partner, is_read=False)
+                partner_id = conversation.initiator_id
+
+            message_model = BusinessMessage if conversation.client_id else Message
+            with get_chat_schema_context(conversation):
                 # Update is_read status for messages
-                for message in messages:
-                    message.is_read = True
-                    message.save()
+                message_model.objects.filter(conversation=conversation, sender_id=partner_id,
+                                             is_read=False).update(is_read=True)
+
+            mark_chat_as_read(self.msg_user, conversation)
 
 
     @database_sync_to_async
     def mark_group_messages_as_read(self, room_group_name):
-        if self.msg_user.client:
-            with schema_context(self.msg_user.client.schema_name):
-                try:
-                    group = BusinessGroup.objects.get(room_group_name=room_group_name)
-                except BusinessGroup.DoesNotExist:
-                    return Response({"message": "Group Does Not Exist"}, status=404)
-
-                if self.msg_user not in group.members.all():
-                    return Response({"message": "You are not in this group"}, status=403)
-
-                # Get all messages in the group sent by other members
-                messages = BusinessMessage.objects.filter(group=group).exclude(sender=self.msg_user)
-
-                # Update read status for each message for the user
-                BusinessMessageReadStatus.objects.filter(
-                    user=self.msg_user,
-                    message__in=messages
-                ).update(is_read=True)
-        else:
-            try:
-                group = Group.objects.get(room_group_name=room_group_name)
-            except Group.DoesNotExist:
-                return Response({"message": "Group Does Not Exist"}, status=404)
+        try:
+            group = self.get_room_chat(self.get_group_chat_type(), room_group_name)
+        except (Group.DoesNotExist, BusinessGroup.DoesNotExist):
+            return Response({"message": "Group Does Not Exist"}, status=404)
+
+        if not self.is_room_member(group):
+            return Response({"message": "You are not in this group"}, status=403)
 
-            if self.msg_user not in group.members.all():
-                return Response({"message": "You are not in this group"}, status=403)
+        if isinstance(group, BusinessGroup):
+            message_model, read_status_model = BusinessMessage, BusinessMessageReadStatus
+        else:
+            message_model, read_status_model = Message, MessageReadStatus
 
+        with get_chat_schema_context(group):
             # Get all messages in the group sent by other members
-            messages = Message.objects.filter(group=group).exclude(sender=self.msg_user)
+            messages = message_model.objects.filter(group=group).exclude(sender=self.msg_user)
 
             # Update read status for each message for the user
-            MessageReadStatus.objects.filter(
+            read_status_model.objects.filter(
                 user=self.msg_user,
                 message__in=messages
             ).update(is_read=True)
 
+        mark_chat_as_read(self.msg_user, group)
+
 
     @database_sync_to_async
     def get_combined_chats(self):
@@ -431,6 +434,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # Create a new message in the conversation
             message = Message.objects.create(conversation=conversation, sender=self.msg_user, text=message_text)
 
+        self.cache_room_chat(conversation)
+
         # Serialize the conversation and message data with context
         conversation_serializer = MessagingConversationSerializer(conversation, context={'msg_user': self.msg_user})
 
@@ -472,6 +477,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
                         message=BusinessMessage.objects.create(sender=creator, text=text, group=group)
 
+                        self.cache_room_chat(group)
                         serializer = MessagingBusinessGroupSerializer(group, context={"msg_user":self.msg_user})
                         return serializer.data, group.room_group_name
 
@@ -480,6 +486,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     group.members.set(group_members)
                     group.admin.set(group_admin)
                     message = Message.objects.create(sender=creator, text=text, group=group)
+                    self.cache_room_chat(group)
                     serializer=MessagingGroupSerializer(group, context={"msg_user":self.msg_user})
                     return serializer.data, group.room_group_name
         else:
@@ -502,6 +509,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
                     group.save()
 
+                    self.cache_room_chat(group)
                     serializer = MessagingBusinessGroupSerializer(group, context={"msg_user":self.msg_user})
                     return serializer.data, group.room_group_name
 
@@ -521,78 +529,33 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
                 group.save()
 
+                self.cache_room_chat(group)
                 serializer = MessagingGroupSerializer(group, context={"msg_user":self.msg_user})
                 return serializer.data, group.room_group_name
 
 
     @database_sync_to_async
     def send_and_save_message_in_group(self, data):
-        text = data.get('text')
-        attachments = data.get('attachment')
-
-        if self.msg_user.client:
-            with schema_context(self.msg_user.client.schema_name):
-                group = BusinessGroup.objects.get(room_group_name=self.room_group_name)
-                message = BusinessMessage.objects.create(sender=self.msg_user,
-                                                         group=group,
-                                                         text=text)
-
-                if attachments:
-                    for attachment in attachments:
-                        file = BusinessMessagingFile.objects.create(file=attachment['file'],
-                                                                    file_name=attachment['file_name'])
-                        message.attachment.add(file)
-
-                return BusinessMessagingMessageSerializer(message).data
-        else:
-            group = BusinessGroup.objects.get(room_group_name=self.room_group_name)
-            message = BusinessMessage.objects.create(sender=self.msg_user,
-                                                     group=group,
-                                                     text=text)
-
-            if attachments:
-                for attachment in attachments:
-                    file = BusinessMessagingFile.objects.create(file=attachment['file'],
-                                                                file_name=attachment['file_name'])
-                    message.attachment.add(file)
-
-            return BusinessMessagingMessageSerializer(message).data
-
+        group = self.get_room_chat(self.get_group_chat_type(), self.room_group_name)
 
+        if self.is_room_member(group):
+            with get_chat_schema_context(group):
+                if isinstance(group, BusinessGroup):
+                    return self.save_message(BusinessMessage, BusinessMessagingFile, BusinessMessagingMessageSerializer,
+                                             data, group=group)
+                return self.save_message(Message, MessagingFile, MessagingMessageSerializer, data, group=group)
 
     @database_sync_to_async
     def send_and_save_message_in_conversation(self, data):
-        text = data.get('text')
-        attachments = data.get('attachment')
-
-        # Check if a conversation already exists
-        conversation = Conversation.objects.get(room_group_name=self.room_group_name)
-
-        if self.msg_user in [conversation.initiator, conversation.receiver]:
-            if conversation.client:
-                with schema_context(conversation.client.schema_name):
-                    message = BusinessMessage.objects.create(sender=self.msg_user,
-                                                             conversation=conversation,
-                                                             text=text)
-
-                    if attachments:
-                        for attachment in attachments:
-                            file = BusinessMessagingFile.objects.create(file=attachment['file'],
-                                                                file_name=attachment['file_name'])
-                            message.attachment.add(file)
-
-                    return BusinessMessagingMessageSerializer(message).data
-            else:
-                message = Message.objects.create(sender=self.msg_user,
-                                                 conversation=conversation,
-                                                 text=text)
-                if attachments:
-                    for attachment in attachments:
-                        file = MessagingFile.objects.create(file=attachment['file'],
-                                                            file_name=attachment['file_name'])
-                        message.attachment.add(file)
+        conversation = self.get_room_chat(ChatInboxEntry.CONVERSATION, self.room_group_name)
 
-                return MessagingMessageSerializer(message).data
+        if self.is_room_member(conversation):
+            with get_chat_schema_context(conversation):
+                if conversation.client_id:
+                    return self.save_message(BusinessMessage, BusinessMessagingFile,
+                                             BusinessMessagingMessageSerializer, data, conversation=conversation)
+                return self.save_message(Message, MessagingFile, MessagingMessageSerializer, data,
+                                         conversation=conversation)
 
     async def handle_start_conversation_with_msg_user(self, event):
         # Send message to WebSocket
@@ -610,6 +573,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
 
     async def handle_create_or_edit_group_with_msg_user(self, event):
+        if event["sender"] != self.msg_user.username:
+            self.forget_room_chat(event["room_group_name"])
+
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
             "type": "create_or_edit_group",
@@ -655,93 +621,67 @@ class ChatConsumer(AsyncWebsocketConsumer):
             text_data=json.dumps({"type": "get_combined_chats", "combined_chats": combined_chats}, default=str))
 
 
+    def get_message_page(self, messages, serializer_class, data):
+        # Older messages by cursor, newer ones by since, latest_message_id is still accepted from older clients
+        latest_message_id = data.get('latest_message_id')
+        if latest_message_id and not data.get('cursor'):
+            messages = messages.filter(id__lt=int(latest_message_id))
+
+        try:
+            page, positions = MessageCursorPagination().get_page(messages.select_related('sender'),
+                                                                 page_size=data.get('page_size', 25),
+                                                                 cursor=data.get('cursor'), since=data.get('since'))
+        except ValidationError as error:
+            # An invalid cursor is answered with an error frame instead of closing the connection
+            return None, {'error': error.detail}
+        return serializer_class(page, many=True).data, positions
+
     @database_sync_to_async
     def get_group_messages(self, data):
-        sender = self.msg_user
-        if self.msg_user.client:
-            with schema_context(self.msg_user.client.schema_name):
-                group=BusinessGroup.objects.get(room_group_name=self.room_group_name)
-                page_size = data.get('page_size')
-                if not page_size:
-                    page_size = 25
-                latest_message_id = data.get('latest_message_id')
-                if self.msg_user in group.members.all():
-                    messages=BusinessMessage.objects.filter(group=group)[:int(page_size)]
+        group = self.get_room_chat(self.get_group_chat_type(), self.room_group_name)
 
-                    if latest_message_id:
-                        messages = BusinessMessage.objects.filter(group=group, id__lt=int(latest_message_id))[
-                                   :int(page_size)]
-
-                    serializer = BusinessMessagingMessageSerializer(messages, many=True)
-                    return serializer.data
-
-        else:
-            group = Group.objects.get(room_group_name=self.room_group_name)
-            page_size = data.get('page_size')
-            if not page_size:
-                page_size = 25
-            latest_message_id = data.get('latest_message_id')
-            if self.msg_user in group.members.all():
-                messages = Message.objects.filter(group=group)[:int(page_size)]
-
-                if latest_message_id:
-                    messages = Message.objects.filter(group=group, id__lt=int(latest_message_id))[
-                               :int(page_size)]
+        if self.is_room_member(group):
+            if isinstance(group, BusinessGroup):
+                message_model, serializer_class = BusinessMessage, BusinessMessagingMessageSerializer
+            else:
+                message_model, serializer_class = Message, MessagingMessageSerializer
 
-                serializer = MessagingMessageSerializer(messages, many=True)
-                return serializer.data
+            with get_chat_schema_context(group):
+                return self.get_message_page(message_model.objects.filter(group=group), serializer_class, data)
+        return None, {}
 
 
     @database_sync_to_async
     def get_personal_messages(self, data):
-        sender = self.msg_user
-        conversation = Conversation.objects.get(room_group_name=self.room_group_name)
-        page_size = data.get('page_size')
-
-        if not page_size:
-            page_size = 25
-
-        latest_message_id = data.get('latest_message_id')
-
-        if sender in [conversation.initiator, conversation.receiver]:
-            if conversation.client:
-                with schema_context(conversation.client.schema_name):
-                    messages = BusinessMessage.objects.filter(conversation=conversation)[:int(page_size)]
-                    if latest_message_id:
-                        messages = BusinessMessage.objects.filter(conversation=conversation, id__lt=int(latest_message_id))[
-                                   :int(page_size)]
+        conversation = self.get_room_chat(ChatInboxEntry.CONVERSATION, self.room_group_name)
 
-                    serializer = BusinessMessagingMessageSerializer(messages, many=True)
-                    return serializer.data
+        if self.is_room_member(conversation):
+            if conversation.client_id:
+                message_model, serializer_class = BusinessMessage, BusinessMessagingMessageSerializer
             else:
-                messages = Message.objects.filter(conversation=conversation)[:int(page_size)]
+                message_model, serializer_class = Message, MessagingMessageSerializer
 
-                if latest_message_id:
-                    messages = Message.objects.filter(conversation=conversation, id__lt=int(latest_message_id))[
-                               :int(page_size)]
+            with get_chat_schema_context(conversation):
+                return self.get_message_page(message_model.objects.filter(conversation=conversation),
+                                             serializer_class, data)
+        return None, {}
 
-                serializer = MessagingMessageSerializer(messages, many=True)
-                return serializer.data
 
-
-    # Function to get Room Group names for the user.
+    # Function to get Room Group names for the user, caching the chats of the rooms for the connection.
     @database_sync_to_async
     def get_user_chats_room_names(self, msg_user):
-        room_group_names = []
-        personal_chats = Conversation.objects.filter(Q(initiator=msg_user) | Q(receiver=msg_user)).values_list(
-            'room_group_name',
-            flat=True)
-        room_group_names.extend(personal_chats)
+        for conversation in Conversation.objects.filter(Q(initiator=msg_user) | Q(receiver=msg_user)).select_related(
+                'client'):
+            self.cache_room_chat(conversation)
 
         if self.client:
             # Use schema_context to wrap the query
             with schema_context(self.client.schema_name):
-                # Efficiently fetch business group chats related to the current user within the client's schema
-                business_group_chats = BusinessGroup.objects.filter(members=msg_user).values_list('room_group_name',
-                                                                                                  flat=True)
-                room_group_names.extend(business_group_chats)
+                for group in BusinessGroup.objects.filter(members=msg_user).select_related('client').prefetch_related(
+                        'members'):
+                    self.cache_room_chat(group)
 
-        group_chats = Group.objects.filter(members=msg_user).values_list('room_group_name', flat=True)
-        room_group_names.extend(group_chats)
+        for group in Group.objects.filter(members=msg_user).prefetch_related('members'):
+            self.cache_room_chat(group)
 
-        return room_group_names
+        return list({room_group_name for _, room_group_name in self.room_chats})
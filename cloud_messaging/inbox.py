@@ -0,0 +1,222 @@
+from contextlib import nullcontext
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, F, Case, When, Count, Sum
+from django_tenants.utils import schema_context
+
+from business_messaging.models import BusinessGroup, BusinessMessage, BusinessMessageReadStatus
+from cloud_messaging.models import ChatInboxEntry, Conversation, Group, Message, MessageReadStatus
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+ENTRY_UNIQUE_FIELDS = ['msg_user', 'chat_type', 'room_group_name']
+
+INBOX_BUILT_KEY_PREFIX = 'chat_inbox_built'
+
+
+def get_chat_type(chat):
+    if isinstance(chat, Conversation):
+        return ChatInboxEntry.CONVERSATION
+    elif isinstance(chat, BusinessGroup):
+        return ChatInboxEntry.BUSINESS_GROUP
+    return ChatInboxEntry.GROUP
+
+
+def get_chat_client_id(chat):
+    # Messages of business conversations and business groups are saved in the schema of the client
+    return None if isinstance(chat, Group) else chat.client_id
+
+
+def get_chat_schema_context(chat):
+    if get_chat_client_id(chat):
+        return schema_context(chat.client.schema_name)
+    return nullcontext()
+
+
+def get_chat_member_ids(chat):
+    if isinstance(chat, Conversation):
+        return [user_id for user_id in [chat.initiator_id, chat.receiver_id] if user_id]
+    with get_chat_schema_context(chat):
+        return list(chat.members.values_list('id', flat=True))
+
+
+def record_chat_message(chat, message):
+    """
+    Moves the chat to the top of the inbox of every member and counts the message as unread for all but the sender.
+    Called when a message is created, in the transaction of the message.
+    """
+    chat_type = get_chat_type(chat)
+    member_ids = get_chat_member_ids(chat)
+    if not member_ids:
+        return
+
+    client_id = get_chat_client_id(chat)
+    with transaction.atomic():
+        ChatInboxEntry.objects.bulk_create(
+            [ChatInboxEntry(msg_user_id=user_id, chat_type=chat_type, room_group_name=chat.room_group_name,
+                            client_id=client_id) for user_id in member_ids], ignore_conflicts=True)
+
+        ChatInboxEntry.objects.filter(chat_type=chat_type, room_group_name=chat.room_group_name,
+                                      msg_user_id__in=member_ids).update(
+            last_message_id=message.id,
+            last_message_at=message.timestamp,
+            unread_count=Case(When(msg_user_id=message.sender_id, then=F('unread_count')),
+                              default=F('unread_count') + 1))
+
+
+def mark_chat_as_read(msg_user, chat):
+    ChatInboxEntry.objects.filter(msg_user=msg_user, chat_type=get_chat_type(chat),
+                                  room_group_name=chat.room_group_name).update(unread_count=0)
+
+
+def get_prefetched_inbox_entry(chat, msg_user):
+    # Inbox entry set on the chat by get_inbox_chats(), when it belongs to the user being served
+    entry = getattr(chat, 'inbox_entry', None)
+    if entry is not None and msg_user is not None and entry.msg_user_id == msg_user.id:
+        return entry
+    return None
+
+
+def get_chat_messages_and_unread_counts(chat, member_ids):
+    if isinstance(chat, Conversation):
+        message_model = BusinessMessage if chat.client_id else Message
+        messages = message_model.objects.filter(conversation=chat)
+        unread_counts = {
+            chat.initiator_id: messages.filter(sender_id=chat.receiver_id, is_read=False).count(),
+            chat.receiver_id: messages.filter(sender_id=chat.initiator_id, is_read=False).count(),
+        }
+        return messages, unread_counts
+
+    if isinstance(chat, BusinessGroup):
+        messages = BusinessMessage.objects.filter(group=chat)
+        read_statuses = BusinessMessageReadStatus.objects.filter(message__group=chat, is_read=False)
+    else:
+        messages = Message.objects.filter(group=chat)
+        read_statuses = MessageReadStatus.objects.filter(message__group=chat, is_read=False)
+
+    unread_counts = {row['user']: row['unread_count'] for row in read_statuses.filter(
+        user_id__in=member_ids).values('user').annotate(unread_count=Count('id'))}
+    return messages, unread_counts
+
+
+def refresh_chat_entries(chat):
+    """
+    Recomputes the inbox entries of every member of the chat from its messages.
+    Used when members change or messages are deleted, and to build the entries of existing chats.
+    """
+    chat_type = get_chat_type(chat)
+    with get_chat_schema_context(chat):
+        member_ids = get_chat_member_ids(chat)
+        messages, unread_counts = get_chat_messages_and_unread_counts(chat, member_ids)
+        last_message = messages.order_by('-timestamp', '-id').first()
+
+    client_id = get_chat_client_id(chat)
+    with transaction.atomic():
+        ChatInboxEntry.objects.filter(chat_type=chat_type, room_group_name=chat.room_group_name).exclude(
+            msg_user_id__in=member_ids).delete()
+
+        ChatInboxEntry.objects.bulk_create(
+            [ChatInboxEntry(msg_user_id=user_id, chat_type=chat_type, room_group_name=chat.room_group_name,
+                            client_id=client_id,
+                            last_message_id=last_message.id if last_message else None,
+                            last_message_at=last_message.timestamp if last_message else None,
+                            unread_count=unread_counts.get(user_id, 0)) for user_id in member_ids],
+            update_conflicts=True, unique_fields=ENTRY_UNIQUE_FIELDS,
+            update_fields=['client', 'last_message_id', 'last_message_at', 'unread_count'])
+
+
+def get_user_chats(msg_user):
+    # Every chat of the user, read from the chat tables, used only to build missing inbox entries
+    chats = list(Conversation.objects.filter(Q(initiator=msg_user) | Q(receiver=msg_user)))
+    chats.extend(Group.objects.filter(members=msg_user))
+    if msg_user.client:
+        with schema_context(msg_user.client.schema_name):
+            chats.extend(BusinessGroup.objects.filter(members=msg_user).select_related('client'))
+    return chats
+
+
+def ensure_user_inbox(msg_user):
+    """
+    Builds the entries of every chat of the user once, for chats that were created before the inbox existed.
+    A user can already have entries of newer messages, so a marker in the cache records that the build ran.
+    """
+    marker_key = f'{INBOX_BUILT_KEY_PREFIX}:{msg_user.id}'
+    if cache.get(marker_key):
+        return
+    for chat in get_user_chats(msg_user):
+        try:
+            refresh_chat_entries(chat)
+        except Exception as error:
+            logger.error(f"Error building inbox entries of {chat.room_group_name}: {error}", exc_info=True)
+    cache.set(marker_key, True, timeout=None)
+
+
+def get_total_unread_count(msg_user):
+    ensure_user_inbox(msg_user)
+    return ChatInboxEntry.objects.filter(msg_user=msg_user).aggregate(total=Sum('unread_count'))['total'] or 0
+
+
+def get_inbox_chats(msg_user, chat_types=None):
+    """
+    Chats of the user ordered by their latest message, read from the inbox entries.
+    Every chat gets latest_message, latest_message_time and inbox_entry set, which the messaging serializers
+    use instead of querying the latest message and the unread count of each chat.
+    """
+    ensure_user_inbox(msg_user)
+
+    entries = ChatInboxEntry.objects.filter(msg_user=msg_user).select_related('client').order_by(
+        '-last_message_at', '-id')
+    if chat_types:
+        entries = entries.filter(chat_type__in=chat_types)
+    entries = list(entries)
+
+    room_names = {chat_type: [] for chat_type, _ in ChatInboxEntry.CHAT_TYPE_CHOICES}
+    business_group_room_names = {}
+    public_message_ids, business_message_ids = [], {}
+    for entry in entries:
+        room_names[entry.chat_type].append(entry.room_group_name)
+        if entry.chat_type == ChatInboxEntry.BUSINESS_GROUP:
+            business_group_room_names.setdefault(entry.client, []).append(entry.room_group_name)
+        if entry.last_message_id:
+            if entry.client_id:
+                business_message_ids.setdefault(entry.client, []).append(entry.last_message_id)
+            else:
+                public_message_ids.append(entry.last_message_id)
+
+    chats = {}
+    for conversation in Conversation.objects.filter(
+            room_group_name__in=room_names[ChatInboxEntry.CONVERSATION]).select_related(
+            'initiator__pro_user', 'receiver__pro_user', 'client'):
+        chats[(ChatInboxEntry.CONVERSATION, conversation.room_group_name)] = conversation
+
+    for group in Group.objects.filter(room_group_name__in=room_names[ChatInboxEntry.GROUP]).select_related(
+            'creator__pro_user').prefetch_related('members__pro_user'):
+        chats[(ChatInboxEntry.GROUP, group.room_group_name)] = group
+
+    messages = {(None, message.id): message for message in
+                Message.objects.filter(id__in=public_message_ids).select_related('sender')}
+
+    for client in set(business_group_room_names) | set(business_message_ids):
+        with schema_context(client.schema_name):
+            for group in BusinessGroup.objects.filter(
+                    room_group_name__in=business_group_room_names.get(client, [])).select_related(
+                    'client', 'creator__pro_user').prefetch_related('members__pro_user'):
+                chats[(ChatInboxEntry.BUSINESS_GROUP, group.room_group_name)] = group
+
+            for message in BusinessMessage.objects.filter(
+                    id__in=business_message_ids.get(client, [])).select_related('sender'):
+                messages[(client.id, message.id)] = message
+
+    inbox_chats = []
+    for entry in entries:
+        chat = chats.get((entry.chat_type, entry.room_group_name))
+        if chat is None:
+            continue
+        chat.inbox_entry = entry
+        chat.latest_message = messages.get((entry.client_id, entry.last_message_id))
+        chat.latest_message_time = entry.last_message_at
+        inbox_chats.append(chat)
+    return inbox_chats
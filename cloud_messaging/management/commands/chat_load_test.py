@@ -0,0 +1,200 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django_tenants.utils import schema_context
+
+from business_messaging.models import BusinessMessage
+from cloud_messaging.consumers import ChatConsumer
+from cloud_messaging.models import Message
+from healtho_pro_user.models.users_models import HealthOProMessagingUser
+
+# Texts of the messages sent by the load test start with this, other messages of the rooms are not measured
+MESSAGE_PREFIX = 'chat_load_test'
+
+
+class LoadTestConnection:
+    """
+    One websocket connection to ChatConsumer with the scope WebsocketAuthenticationMiddleware would set.
+    A reader task keeps the arrival time of every frame, by frame type, so requests and broadcasts can be timed.
+    """
+
+    def __init__(self, msg_user):
+        self.msg_user = msg_user
+        self.communicator = WebsocketCommunicator(self.application, 'ws_chat/')
+        self.frames = {}
+        self.delivery_latencies = []
+        self.reader = None
+
+    async def application(self, scope, receive, send):
+        scope.update({'user': self.msg_user.pro_user, 'client': self.msg_user.client, 'msg_user': self.msg_user})
+        return await ChatConsumer.as_asgi()(scope, receive, send)
+
+    def get_frames(self, frame_type):
+        return self.frames.setdefault(frame_type, asyncio.Queue())
+
+    async def connect(self, timeout):
+        connected, _ = await self.communicator.connect(timeout=timeout)
+        if not connected:
+            raise CommandError(f'Connection of {self.msg_user} was rejected')
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self):
+        while True:
+            frame = json.loads(await self.communicator.receive_from(timeout=None))
+            received_at = time.perf_counter()
+            message = frame.get('message')
+            if frame['type'] == 'send_messages_in_group' and isinstance(message, dict) and \
+                    str(message.get('text', '')).startswith(MESSAGE_PREFIX):
+                self.delivery_latencies.append(received_at - float(message['text'].split()[-1]))
+            await self.get_frames(frame['type']).put(received_at)
+
+    async def request(self, frame_type, timeout, room_group_name='', data=None):
+        # Round trip of a request, until the consumer answers with a frame of the same type
+        sent_at = time.perf_counter()
+        await self.communicator.send_to(text_data=json.dumps(
+            {'type': frame_type, 'room_group_name': room_group_name, 'data': data or {}}))
+        return await asyncio.wait_for(self.get_frames(frame_type).get(), timeout) - sent_at
+
+    async def disconnect(self):
+        if self.reader:
+            self.reader.cancel()
+            await asyncio.gather(self.reader, return_exceptions=True)
+        await self.communicator.disconnect()
+
+
+class Command(BaseCommand):
+    help = ('Drives ChatConsumer with websocket connections of existing messaging users over a local in-memory '
+            'channel layer. Reports connect time, request round trips and, with --room, the delivery of group '
+            'messages to the connected members. The messages sent in --room are deleted after each run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', default='10,100,500',
+                            help='Comma separated connection counts to run, default 10,100,500')
+        parser.add_argument('--users', default='',
+                            help='Comma separated messaging user ids, default the active messaging users. '
+                                 'Users are reused when there are fewer users than connections')
+        parser.add_argument('--request-type', default='get_total_messages_count',
+                            help='Request sent by every connection, default get_total_messages_count')
+        parser.add_argument('--requests', type=int, default=5, help='Requests sent per connection, default 5')
+        parser.add_argument('--room', default=None,
+                            help='room_group_name of a group of the users to send messages in, default none')
+        parser.add_argument('--messages', type=int, default=20,
+                            help='Messages sent in --room per run, default 20')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for a frame, default 30')
+
+    def handle(self, *args, **options):
+        connection_counts = [int(count) for count in options['connections'].split(',') if count.strip()]
+        msg_users = self.get_msg_users(options['users'], max(connection_counts))
+        if not msg_users:
+            raise CommandError('No messaging users found')
+
+        for connections in connection_counts:
+            # Capacity is raised so the run measures fan-out rather than dropped messages of full channels
+            capacity = 2 * (options['messages'] + options['requests']) + 100
+            channel_layers = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer',
+                                          'CONFIG': {'capacity': capacity}}}
+            started_on = datetime.now()
+            try:
+                with override_settings(CHANNEL_LAYERS=channel_layers):
+                    result = asyncio.run(self.run(
+                        [msg_users[index % len(msg_users)] for index in range(connections)], options))
+            finally:
+                if options['room']:
+                    self.delete_sent_messages(msg_users[0], started_on)
+            request_type = options['request_type']
+            line = (f"connections={connections} connect_p50={result['connect'][0]:.1f}ms "
+                    f"connect_p99={result['connect'][1]:.1f}ms {request_type}_p50={result['request'][0]:.1f}ms "
+                    f"{request_type}_p99={result['request'][1]:.1f}ms")
+            if options['room']:
+                line += (f" deliveries={result['deliveries']} throughput={result['per_second']:.0f} msg/s "
+                         f"delivery_p50={result['delivery'][0]:.1f}ms delivery_p99={result['delivery'][1]:.1f}ms")
+            self.stdout.write(line)
+
+    def delete_sent_messages(self, sender, started_on):
+        # Deleting the messages also removes their read statuses and refreshes the inbox entries of the group
+        filters = {'sender': sender, 'text__startswith': MESSAGE_PREFIX, 'timestamp__gte': started_on}
+        if sender.client:
+            with schema_context(sender.client.schema_name):
+                deleted, _ = BusinessMessage.objects.filter(**filters).delete()
+        else:
+            deleted, _ = Message.objects.filter(**filters).delete()
+        self.stdout.write(f"Deleted {deleted} load test rows")
+
+    @staticmethod
+    def get_msg_users(user_ids, limit):
+        msg_users = HealthOProMessagingUser.objects.filter(is_active=True).select_related(
+            'pro_user', 'client').order_by('id')
+        if user_ids:
+            msg_users = msg_users.filter(pk__in=[int(user_id) for user_id in user_ids.split(',') if user_id.strip()])
+        return list(msg_users[:limit])
+
+    async def run(self, msg_users, options):
+        timeout = options['timeout']
+        connections = [LoadTestConnection(msg_user) for msg_user in msg_users]
+
+        async def connect(connection):
+            # Until the messaging user frame ChatConsumer.connect sends after joining the rooms
+            started = time.perf_counter()
+            await connection.connect(timeout)
+            await asyncio.wait_for(connection.get_frames('get_messaging_user').get(), timeout)
+            return time.perf_counter() - started
+
+        try:
+            connect_times = await asyncio.gather(*[connect(connection) for connection in connections])
+
+            async def send_requests(connection):
+                return [await connection.request(options['request_type'], timeout)
+                        for _ in range(options['requests'])]
+
+            request_times = [request_time for times in await asyncio.gather(
+                *[send_requests(connection) for connection in connections]) for request_time in times]
+
+            result = {
+                'connect': self.percentiles(connect_times),
+                'request': self.percentiles(request_times),
+            }
+            if options['room']:
+                result.update(await self.send_room_messages(connections, options['room'], options['messages'],
+                                                            timeout))
+            return result
+        finally:
+            await asyncio.gather(*[connection.disconnect() for connection in connections], return_exceptions=True)
+            await get_channel_layer().flush()
+
+    async def send_room_messages(self, connections, room_group_name, messages, timeout):
+        sender = connections[0]
+        started = time.perf_counter()
+        for message in range(messages):
+            await sender.request('send_messages_in_group', timeout, room_group_name=room_group_name,
+                                 data={'text': f'{MESSAGE_PREFIX} {message} {time.perf_counter()}'})
+
+        # Members receive the broadcasts in the background, the run ends once no delivery arrived for a second
+        delivered = -1
+        while delivered != sum(len(connection.delivery_latencies) for connection in connections):
+            delivered = sum(len(connection.delivery_latencies) for connection in connections)
+            await asyncio.sleep(1)
+        elapsed = time.perf_counter() - started - 1
+
+        latencies = [latency for connection in connections for latency in connection.delivery_latencies]
+        return {
+            'deliveries': len(latencies),
+            'per_second': len(latencies) / elapsed if elapsed > 0 else 0,
+            'delivery': self.percentiles(latencies),
+        }
+
+    @classmethod
+    def percentiles(cls, values):
+        values = sorted(values)
+        return cls.percentile(values, 50) * 1000, cls.percentile(values, 99) * 1000
+
+    @staticmethod
+    def percentile(values, percent):
+        if not values:
+            return 0
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django_tenants.utils import schema_context
+
+from business_messaging.models import BusinessGroup
+from cloud_messaging.inbox import refresh_chat_entries
+from cloud_messaging.models import Conversation, Group
+from healtho_pro_user.models.users_models import Client
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the chat inbox entries of every conversation and group from their messages'
+
+    def refresh(self, chats):
+        refreshed = 0
+        for chat in chats:
+            try:
+                refresh_chat_entries(chat)
+                refreshed += 1
+            except Exception as error:
+                self.stderr.write(f'Error rebuilding inbox of {chat.room_group_name}: {error}')
+        return refreshed
+
+    def handle(self, *args, **options):
+        refreshed = self.refresh(Conversation.objects.select_related('client').iterator())
+        refreshed += self.refresh(Group.objects.iterator())
+
+        for client in Client.objects.exclude(schema_name='public'):
+            with schema_context(client.schema_name):
+                refreshed += self.refresh(list(BusinessGroup.objects.select_related('client')))
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt inbox entries of {refreshed} chats'))
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_messaging', '0002_initial'),
+        ('healtho_pro_user', '0003_domain_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatInboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_type', models.CharField(choices=[('conversation', 'Conversation'), ('group', 'Group'), ('business_group', 'Business Group')], max_length=20)),
+                ('room_group_name', models.CharField(max_length=100)),
+                ('last_message_id', models.BigIntegerField(blank=True, null=True)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='healtho_pro_user.client')),
+                ('msg_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='healtho_pro_user.healthopromessaginguser')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['msg_user', '-last_message_at'], name='cloud_messa_msg_use_d54a28_idx'), models.Index(fields=['chat_type', 'room_group_name'], name='cloud_messa_chat_ty_15f889_idx')],
+                'unique_together': {('msg_user', 'chat_type', 'room_group_name')},
+            },
+        ),
+    ]
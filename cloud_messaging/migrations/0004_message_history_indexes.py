@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud_messaging', '0003_chatinboxentry'),
+        ('healtho_pro_user', '0003_domain_url'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', '-timestamp', '-id'], name='cloud_messa_convers_ea885a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['group', '-timestamp', '-id'], name='cloud_messa_group_i_9e89ab_idx'),
+        ),
+    ]
@@ -117,6 +117,11 @@ class Message(models.Model):
 
     class Meta:
         ordering = ('-timestamp',)
+        indexes = [
+            # Keyset pagination of the history of a chat, see MessageCursorPagination
+            models.Index(fields=['conversation', '-timestamp', '-id']),
+            models.Index(fields=['group', '-timestamp', '-id']),
+        ]
 
 
 
@@ -130,3 +135,37 @@ class MessageReadStatus(models.Model):
 
     def __str__(self):
         return f"{self.user} - {self.message} - {'Read' if self.is_read else 'Unread'}"
+
+
+class ChatInboxEntry(models.Model):
+    """
+    One row per chat of a messaging user, kept up to date when messages are sent and read,
+    so that the chat list and the unread counts are read without going through every chat.
+    """
+    CONVERSATION = 'conversation'
+    GROUP = 'group'
+    BUSINESS_GROUP = 'business_group'
+    CHAT_TYPE_CHOICES = [
+        (CONVERSATION, 'Conversation'),
+        (GROUP, 'Group'),
+        (BUSINESS_GROUP, 'Business Group'),
+    ]
+
+    msg_user = models.ForeignKey(HealthOProMessagingUser, on_delete=models.CASCADE, related_name='inbox_entries')
+    chat_type = models.CharField(max_length=20, choices=CHAT_TYPE_CHOICES)
+    room_group_name = models.CharField(max_length=100)
+    # Schema of the chat messages, for business conversations and business groups
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, blank=True, null=True)
+    last_message_id = models.BigIntegerField(blank=True, null=True)
+    last_message_at = models.DateTimeField(blank=True, null=True)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('msg_user', 'chat_type', 'room_group_name')
+        indexes = [
+            models.Index(fields=['msg_user', '-last_message_at']),
+            models.Index(fields=['chat_type', 'room_group_name']),
+        ]
+
+    def __str__(self):
+        return f"{self.msg_user} - {self.room_group_name} ({self.unread_count} unread)"
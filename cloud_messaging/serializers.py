@@ -4,6 +4,7 @@ from django_tenants.utils import schema_context
 
 from business_messaging.models import BusinessMessage, BusinessGroup
 from business_messaging.serializers import MessagingBusinessGroupSerializer
+from cloud_messaging.inbox import get_prefetched_inbox_entry
 from healtho_pro_user.models.users_models import HealthOProMessagingUser, HealthOProUser
 from healtho_pro_user.serializers.users_serializers import UserSerializer
 from .models import Conversation, Message, Group, MessagingFile
@@ -80,6 +81,10 @@ class MessagingConversationSerializer(serializers.ModelSerializer):
         try:
             msg_user = self.context['msg_user']
 
+            inbox_entry = get_prefetched_inbox_entry(obj, msg_user)
+            if inbox_entry is not None:
+                return inbox_entry.unread_count
+
             if obj.client and msg_user == obj.initiator:
                 with schema_context(obj.client.schema_name):
                     return BusinessMessage.objects.filter(conversation=obj, is_read=False, sender=obj.receiver).count()
@@ -98,7 +103,9 @@ class MessagingConversationSerializer(serializers.ModelSerializer):
 
     def get_latest_message(self, instance):
         try:
-            if instance.client:
+            if hasattr(instance, 'inbox_entry'):
+                latest_message = instance.latest_message
+            elif instance.client:
                 with schema_context(instance.client.schema_name):
                     latest_message = BusinessMessage.objects.filter(conversation=instance).first()
             else:
@@ -148,7 +155,7 @@ class MessagingGroupSerializer(serializers.ModelSerializer):
         return len(obj.members.all())
 
     def get_latest_message(self, obj):
-        latest_message = obj.messages.first()
+        latest_message = obj.latest_message if hasattr(obj, 'inbox_entry') else obj.messages.first()
         if latest_message:
             return {
                 'sender': latest_message.sender.id,
@@ -159,13 +166,19 @@ class MessagingGroupSerializer(serializers.ModelSerializer):
 
     def get_current_user_unread_messages_count(self, obj):
         messaging_user = self.context['msg_user']
+        inbox_entry = get_prefetched_inbox_entry(obj, messaging_user)
+        if inbox_entry is not None:
+            return inbox_entry.unread_count
         unread_count = obj.get_unread_message_count(messaging_user)
         return unread_count
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         representation['is_group'] = True
-        representation['latest_message_time'] = instance.latest_message.timestamp
+        if hasattr(instance, 'inbox_entry'):
+            representation['latest_message_time'] = instance.latest_message_time
+        else:
+            representation['latest_message_time'] = instance.latest_message.timestamp
         representation['members']=HealthOProMessagingUserListSerializer(instance.members, many=True).data
         # representation['admin'] = HealthOProMessagingUserListSerializer(instance.admin, many=True).data
         representation['creator'] = HealthOProMessagingUserListSerializer(instance.creator).data
@@ -179,16 +192,6 @@ class MessagingCombinedChatSerializer(serializers.Serializer):
     latest_message_time = serializers.DateTimeField()
     latest_message = serializers.SerializerMethodField()
 
-    def get_id(self, instance):
-        if isinstance(instance, Group):
-            return MessagingGroupSerializer(instance, context={"msg_user": self.context['msg_user']}).data
-
-        elif isinstance(instance, BusinessGroup):
-            return MessagingBusinessGroupSerializer(instance, context={"msg_user": self.context['msg_user']}).data
-
-        elif isinstance(instance, Conversation):
-            return MessagingConversationSerializer(instance, context={"msg_user": self.context['msg_user']}).data
-
     def get_id(self, instance):
         if isinstance(instance, Group):
             return MessagingGroupSerializer(instance, context={"msg_user": self.context['msg_user']}).data
@@ -0,0 +1,50 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from business_messaging.models import BusinessMessage, BusinessGroup
+from cloud_messaging.inbox import record_chat_message, refresh_chat_entries
+from cloud_messaging.models import Message, Group
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_message_chat(message):
+    return message.conversation if message.conversation_id else message.group
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=BusinessMessage)
+def update_inbox_on_new_message(sender, instance, created, **kwargs):
+    if created:
+        try:
+            chat = get_message_chat(instance)
+            if chat is not None:
+                record_chat_message(chat, instance)
+        except Exception as error:
+            logger.error(f"Error updating chat inbox for {sender.__name__} {instance.id}: {error}", exc_info=True)
+
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=BusinessMessage)
+def update_inbox_on_deleted_message(sender, instance, **kwargs):
+    try:
+        chat = get_message_chat(instance)
+        if chat is not None:
+            refresh_chat_entries(chat)
+    except Exception as error:
+        logger.error(f"Error updating chat inbox after deleting {sender.__name__} {instance.id}: {error}",
+                     exc_info=True)
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+@receiver(m2m_changed, sender=BusinessGroup.members.through)
+def update_inbox_on_group_members_change(sender, instance, action, reverse, **kwargs):
+    # Only changes made from the group side, e.g. group.members.add(...), which is how members are managed
+    if reverse or action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+    try:
+        refresh_chat_entries(instance)
+    except Exception as error:
+        logger.error(f"Error updating chat inbox of group {instance.room_group_name}: {error}", exc_info=True)
@@ -2,7 +2,6 @@ from datetime import timedelta, datetime
 from django.utils import timezone
 from django.utils.text import slugify
 from django_filters.rest_framework import DjangoFilterBackend
-from django_tenants.utils import schema_context
 from rest_framework import status, generics
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (CreateAPIView, RetrieveAPIView,
@@ -12,8 +11,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from business_messaging.models import BusinessGroup
-from healtho_pro.pagination import MessagePagination
+from healtho_pro.pagination import MessagePagination, MessageCursorPagination
+from cloud_messaging.inbox import get_total_unread_count, mark_chat_as_read
 from healtho_pro_user.models.users_models import HealthOProUser, HealthOProMessagingUser
 from .models import Conversation, Message, Group, MessageReadStatus
 from rest_framework.response import Response
@@ -25,7 +24,6 @@ from .serializers import (MessagingConversationSerializer,
 from django.db.models import Q
 from django.http import JsonResponse
 from asgiref.sync import async_to_sync
-from .models import Message
 from django.db.models import Max
 
 
@@ -679,7 +677,7 @@ class MessageListCreateInPersonalChat(generics.ListCreateAPIView):
     serializer_class = MessagingMessageSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
-    pagination_class = MessagePagination
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
         conversation_id = self.kwargs.get('convo_id')
@@ -827,7 +825,7 @@ class MessageListCreateInGroupChat(generics.ListCreateAPIView):
     serializer_class = MessagingMessageSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
-    pagination_class = MessagePagination
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
         current_user = self.request.user
@@ -1023,6 +1021,8 @@ class UserReadMessages(generics.CreateAPIView):
                 message.is_read = True
                 message.save()
 
+            mark_chat_as_read(messaging_user, conversation)
+
             return Response({"message": "Messages updated successfully"}, status=status.HTTP_200_OK)
         else:
             return Response({'message': 'You are not in this conversation'}, status=status.HTTP_400_BAD_REQUEST)
@@ -1057,6 +1057,8 @@ class UserReadConfirmationInGroup(generics.CreateAPIView):
             message__in=messages
         ).update(is_read=True)
 
+        mark_chat_as_read(messaging_user, group)
+
         return Response({"message": "message updated as read"})
 
 
@@ -1114,29 +1116,9 @@ class GroupEditView(generics.UpdateAPIView):
 
 class GetAllMessagesCount(APIView):
     def get(self, msg_user):
-        messages_count = 0
         messaging_user = msg_user
         try:
-            personal_chats = Conversation.objects.filter(
-                Q(initiator=messaging_user) | Q(receiver=messaging_user))
-            groups = Group.objects.filter(members=messaging_user)
-
-            # Some all messages count in all chats and
-            for chat in personal_chats.all():
-                # print(chat)
-                serializer = MessagingConversationSerializer(chat, context={'msg_user': msg_user})
-                messages_count += serializer.get_self_unread_messages(chat)
-            for group in groups.all():
-                serializer = MessagingGroupSerializer(group, context={'msg_user': msg_user})
-                messages_count += serializer.get_current_user_unread_messages_count(group)
-
-            if messaging_user.client:
-                with schema_context(messaging_user.client.schema_name):
-                    business_groups = BusinessGroup.objects.filter(members=messaging_user)
-                    for group in business_groups.all():
-                        serializer = MessagingGroupSerializer(group, context={'msg_user': msg_user})
-                        messages_count += serializer.get_current_user_unread_messages_count(group)
-
+            messages_count = get_total_unread_count(messaging_user)
 
             return Response({"total_messages_count": messages_count}, status=status.HTTP_200_OK)
 
@@ -10,6 +10,7 @@ from healtho_pro_user.models.business_models import BusinessProfiles
 from healtho_pro_user.models.users_models import Client
 from pro_laboratory.models.client_based_settings_models import BusinessDataStatus
 from pro_laboratory.models.global_models import LabFixedParametersReportTemplate, LabFixedReportNormalReferralRanges
+from pro_laboratory.reference_ranges import bump_reference_ranges_version
 from pro_universal_data.models import ULabReportsGender, ULabPatientAge
 
 '''
@@ -241,6 +242,7 @@ def copy_biz_data(old_schema, new_schema, department_list):
                                     if ranges_to_create:
                                         print('creating')
                                         LabFixedReportNormalReferralRanges.objects.bulk_create(ranges_to_create)
+                                        bump_reference_ranges_version(new_schema)
                                         print(f'{len(ranges_to_create)} ranges created for {new_fixed_param}')
 
                                 else:
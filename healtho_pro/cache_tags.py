@@ -0,0 +1,55 @@
+import time
+
+from django.core.cache import cache
+
+GENERATION_KEY_PREFIX = 'cache_generation'
+
+
+def cache_family(name, scope=None):
+    """
+    Name of a group of cache entries that are invalidated together, e.g. cache_family('lab_staff', client).
+    Model instances are scoped by their primary key.
+    """
+    if scope is None:
+        return name
+    return f"{name}:{getattr(scope, 'pk', scope)}"
+
+
+def _generation_key(family):
+    return f'{GENERATION_KEY_PREFIX}:{family}'
+
+
+def _initial_generation():
+    # Starts from the current time, so that an evicted generation never comes back as one that was used before
+    return int(time.time() * 1000)
+
+
+def get_generation(family):
+    key = _generation_key(family)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _initial_generation(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def tagged_cache_key(family, *parts):
+    """
+    Cache key of an entry of the family. The key contains the current generation of the family,
+    so after bump_generation() the old entries are never read again and expire with their timeout.
+    """
+    key = f'{family}:g{get_generation(family)}'
+    if parts:
+        key = f"{key}:{'_'.join(str(part) for part in parts)}"
+    return key
+
+
+def bump_generation(family):
+    # Invalidates every entry of the family with a single INCR, instead of scanning the keyspace for them
+    key = _generation_key(family)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Never created or evicted, a new time based generation still differs from every earlier one
+        cache.add(key, _initial_generation(), timeout=None)
+        return cache.incr(key)
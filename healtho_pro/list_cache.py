@@ -0,0 +1,143 @@
+import hashlib
+import pickle
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from rest_framework.response import Response
+
+from healtho_pro.cache_tags import bump_generation, cache_family, tagged_cache_key
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY_PREFIX = 'list_cache_stats'
+
+HIT = 'hits'
+MISS = 'misses'
+SKIPPED = 'skipped'
+
+
+def get_list_cache_family(family_name, schema_name=None, per_tenant=True):
+    if not per_tenant:
+        return family_name
+    return cache_family(family_name, schema_name or connection.schema_name)
+
+
+def invalidate_list_cache(family_name, schema_name=None, per_tenant=True):
+    bump_generation(get_list_cache_family(family_name, schema_name=schema_name, per_tenant=per_tenant))
+
+
+def _stats_key(family_name, counter):
+    return f'{STATS_KEY_PREFIX}:{family_name}:{counter}'
+
+
+def count_list_cache_event(family_name, counter):
+    key = _stats_key(family_name, counter)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+    except Exception as error:
+        logger.error(f"Error counting list cache {counter} for {family_name}: {error}")
+
+
+def get_list_cache_stats(family_name):
+    keys = {counter: _stats_key(family_name, counter) for counter in [HIT, MISS, SKIPPED]}
+    values = cache.get_many(keys.values())
+    return {counter: values.get(key, 0) for counter, key in keys.items()}
+
+
+class CachedListMixin:
+    """
+    Caches the serialized response of list(), per tenant and per normalized set of query params.
+    With CustomPagination every page is cached separately.
+    Writes through the viewset invalidate the whole family, other writers call invalidate_list_cache().
+    """
+    list_cache_family = None
+    list_cache_per_tenant = True
+    list_cache_timeout = None
+    list_cache_max_entry_size = None
+    # Longer values (usually search text being typed) are not worth an entry of their own
+    list_cache_max_param_length = 100
+
+    def get_list_cache_timeout(self):
+        if self.list_cache_timeout is not None:
+            return self.list_cache_timeout
+        return getattr(settings, 'LIST_CACHE_TIMEOUT', 300)
+
+    def get_list_cache_max_entry_size(self):
+        if self.list_cache_max_entry_size is not None:
+            return self.list_cache_max_entry_size
+        return getattr(settings, 'LIST_CACHE_MAX_ENTRY_SIZE', 512 * 1024)
+
+    def get_list_cache_params(self, request):
+        params = []
+        for name in sorted(request.query_params.keys()):
+            values = [value.strip() for value in request.query_params.getlist(name) if value.strip()]
+            if values:
+                params.append((name, tuple(values)))
+
+        paginator = getattr(self, 'paginator', None)
+        if paginator is not None and hasattr(paginator, 'get_cache_key_params'):
+            params = [param for param in params
+                      if param[0] not in (paginator.page_query_param, paginator.page_size_query_param)]
+            params.extend(paginator.get_cache_key_params(request))
+        return params
+
+    def get_list_cache_key(self, request):
+        params = self.get_list_cache_params(request)
+        if any(len(value) > self.list_cache_max_param_length for _, values in params for value in values):
+            return None
+
+        digest = hashlib.md5(repr(params).encode('utf-8')).hexdigest()
+        family = get_list_cache_family(self.list_cache_family, per_tenant=self.list_cache_per_tenant)
+        return tagged_cache_key(family, connection.schema_name, digest)
+
+    def list(self, request, *args, **kwargs):
+        try:
+            cache_key = self.get_list_cache_key(request)
+            cached_data = cache.get(cache_key) if cache_key else None
+        except Exception as error:
+            logger.error(f"Error reading list cache of {self.list_cache_family}: {error}")
+            cache_key, cached_data = None, None
+
+        if cached_data is not None:
+            count_list_cache_event(self.list_cache_family, HIT)
+            return Response(cached_data)
+
+        response = super().list(request, *args, **kwargs)
+
+        if cache_key and response.status_code == 200:
+            try:
+                entry_size = len(pickle.dumps(response.data, protocol=pickle.HIGHEST_PROTOCOL))
+                if entry_size <= self.get_list_cache_max_entry_size():
+                    cache.set(cache_key, response.data, timeout=self.get_list_cache_timeout())
+                    count_list_cache_event(self.list_cache_family, MISS)
+                else:
+                    count_list_cache_event(self.list_cache_family, SKIPPED)
+            except Exception as error:
+                logger.error(f"Error saving list cache of {self.list_cache_family}: {error}")
+        else:
+            count_list_cache_event(self.list_cache_family, SKIPPED)
+        return response
+
+    def invalidate_list_cache(self):
+        try:
+            invalidate_list_cache(self.list_cache_family, per_tenant=self.list_cache_per_tenant)
+        except Exception as error:
+            logger.error(f"Error invalidating list cache of {self.list_cache_family}: {error}")
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.invalidate_list_cache()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.invalidate_list_cache()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self.invalidate_list_cache()
@@ -1,5 +1,11 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
@@ -30,6 +36,16 @@ class CustomPagination(PageNumberPagination):
             return None  # Return None to indicate retrieving all values
         return super().paginate_queryset(queryset, request, view)
 
+    def get_cache_key_params(self, request):
+        """
+        Page number and page size of the request, normalized so that requests for the same page share a cache entry.
+        """
+        page_size = self.get_page_size(request)
+        if page_size is None:
+            return [(self.page_size_query_param, ('all',))]
+        page_number = (request.query_params.get(self.page_query_param) or '1').strip()
+        return [(self.page_query_param, (page_number,)), (self.page_size_query_param, (str(page_size),))]
+
 
 class MessagePagination(PageNumberPagination):
     page_size = 20
@@ -58,3 +74,109 @@ class MessagePagination(PageNumberPagination):
         if page_size is None:
             return None  # Return None to indicate retrieving all values
         return super().paginate_queryset(queryset, request, view)
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination of chat messages on (timestamp, id), newest first.
+    A page is read with an index range scan from the cursor, so there is no COUNT(*) and no OFFSET and
+    older pages cost the same as the first one.
+
+    cursor: opaque position of the last message of the previous page, the page continues with older messages.
+    since: position of the newest message the client already has, the page returns newer messages oldest first
+    so that a reconnecting client can sync them page by page without gaps.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    since_query_param = 'since'
+
+    @staticmethod
+    def encode_cursor(message):
+        position = f"{message.timestamp.isoformat()}|{message.id}"
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            timestamp, message_id = base64.urlsafe_b64decode(str(cursor).encode()).decode().split('|')
+            return datetime.fromisoformat(timestamp), int(message_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({"message": "Invalid cursor"})
+
+    def clamp_page_size(self, page_size):
+        # Page sizes out of 1..max_page_size are clamped, anything that is not a number gets the default size
+        try:
+            page_size = int(self.page_size if page_size is None else page_size)
+        except (TypeError, ValueError):
+            page_size = self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_page(self, queryset, page_size=None, cursor=None, since=None):
+        """
+        Returns the messages of the page with next_cursor, to read older messages, sync_cursor, the newest
+        position the client has after this page, and has_more.
+        """
+        page_size = self.clamp_page_size(page_size)
+
+        if since:
+            timestamp, message_id = self.decode_cursor(since)
+            queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id))
+            messages = list(queryset.order_by('timestamp', 'id')[:page_size + 1])
+        else:
+            if cursor:
+                timestamp, message_id = self.decode_cursor(cursor)
+                queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+            messages = list(queryset.order_by('-timestamp', '-id')[:page_size + 1])
+
+        has_more = len(messages) > page_size
+        messages = messages[:page_size]
+
+        if since:
+            next_cursor = None
+            sync_cursor = self.encode_cursor(messages[-1]) if messages else since
+        else:
+            next_cursor = self.encode_cursor(messages[-1]) if has_more else None
+            sync_cursor = self.encode_cursor(messages[0]) if messages and not cursor else None
+
+        return messages, {'next_cursor': next_cursor, 'sync_cursor': sync_cursor, 'has_more': has_more}
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get(self.page_size_query_param)
+        if page_size == 'all':
+            return None  # Return None to indicate retrieving all values
+        if page_size:
+            try:
+                return int(page_size)
+            except ValueError:
+                pass
+        return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if page_size is None:
+            return None  # Return None to indicate retrieving all values
+
+        self.request = request
+        messages, self.positions = self.get_page(queryset, page_size,
+                                                 cursor=request.query_params.get(self.cursor_query_param),
+                                                 since=request.query_params.get(self.since_query_param))
+        return messages
+
+    def get_next_link(self):
+        url = self.request.build_absolute_uri()
+        if self.positions['has_more'] and self.positions['next_cursor']:
+            return replace_query_param(url, self.cursor_query_param, self.positions['next_cursor'])
+        if self.positions['has_more']:
+            return replace_query_param(url, self.since_query_param, self.positions['sync_cursor'])
+        return None
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.positions['next_cursor'],
+            'sync_cursor': self.positions['sync_cursor'],
+            'has_more': self.positions['has_more'],
+            'results': data,
+        })
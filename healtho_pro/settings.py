@@ -315,3 +315,64 @@ CHANNEL_LAYERS = {
 }
 
 SENDINBLUE_API_KEY =os.environ.get('SENDINBLUE_API_KEY')
+
+# Lab report PDF rendering worker pool (defaults to the number of CPU cores)
+REPORT_RENDER_WORKERS = int(os.environ.get('REPORT_RENDER_WORKERS', 0)) or None
+REPORT_RENDER_JOB_TTL = int(os.environ.get('REPORT_RENDER_JOB_TTL', 60 * 60))
+
+# Rendered test report PDFs, stored per tenant schema (defaults to MEDIA_ROOT/report_pdf_cache)
+REPORT_PDF_CACHE_DIR = os.environ.get('REPORT_PDF_CACHE_DIR')
+REPORT_PDF_CACHE_MAX_AGE_DAYS = int(os.environ.get('REPORT_PDF_CACHE_MAX_AGE_DAYS', 30))
+
+# Serialized list responses cached by CachedListMixin
+LIST_CACHE_TIMEOUT = int(os.environ.get('LIST_CACHE_TIMEOUT', 300))
+LIST_CACHE_MAX_ENTRY_SIZE = int(os.environ.get('LIST_CACHE_MAX_ENTRY_SIZE', 512 * 1024))
+
+# Machine integration messages: 'sync' applies them during the request, 'queued' saves and acknowledges them
+# and leaves them to the background consumer, which processes them in batches of MACHINE_INGESTION_BATCH_SIZE
+MACHINE_INGESTION_MODE = os.environ.get('MACHINE_INGESTION_MODE', 'sync')
+MACHINE_INGESTION_BATCH_SIZE = int(os.environ.get('MACHINE_INGESTION_BATCH_SIZE', 50))
+
+# Users, clients and lab staff resolved by the request middlewares are kept in-process for this many seconds
+REQUEST_CONTEXT_CACHE_TTL = int(os.environ.get('REQUEST_CONTEXT_CACHE_TTL', 30))
+
+# Activity logs are queued and written in the background in batches of ACTIVITY_LOG_BATCH_SIZE or every
+# ACTIVITY_LOG_FLUSH_INTERVAL_MS, 'sync' writes each log when its transaction commits
+ACTIVITY_LOG_MODE = os.environ.get('ACTIVITY_LOG_MODE', 'async')
+ACTIVITY_LOG_BATCH_SIZE = int(os.environ.get('ACTIVITY_LOG_BATCH_SIZE', 200))
+ACTIVITY_LOG_FLUSH_INTERVAL_MS = int(os.environ.get('ACTIVITY_LOG_FLUSH_INTERVAL_MS', 500))
+ACTIVITY_LOG_QUEUE_SIZE = int(os.environ.get('ACTIVITY_LOG_QUEUE_SIZE', 10000))
+
+# Largest radius the nearby doctors, hospitals, labs and pharmacies searches accept through radius_km
+NEARBY_MAX_RADIUS_KM = float(os.environ.get('NEARBY_MAX_RADIUS_KM', 50))
+
+# Most medicines returned per pharmacy by the mobile app master search
+MEDICINE_SEARCH_LIMIT_PER_PHARMACY = int(os.environ.get('MEDICINE_SEARCH_LIMIT_PER_PHARMACY', 20))
+
+# Lab analytics of ranges ending before today are read from the per-tenant daily rollups
+ANALYTICS_ROLLUPS_ENABLED = os.environ.get('ANALYTICS_ROLLUPS_ENABLED', 'True') == 'True'
+
+# SMS and WhatsApp notifications of registration and report completion: 'queued' sends them from
+# OUTBOUND_MESSAGE_WORKERS background threads, 'sync' sends them in the request once it commits.
+# Vendor errors are retried OUTBOUND_MESSAGE_MAX_ATTEMPTS times, waiting OUTBOUND_MESSAGE_RETRY_DELAY_SECONDS
+# doubled on every attempt. The rate limits are per process, 0 sends without limit
+OUTBOUND_MESSAGE_MODE = os.environ.get('OUTBOUND_MESSAGE_MODE', 'queued')
+OUTBOUND_MESSAGE_WORKERS = int(os.environ.get('OUTBOUND_MESSAGE_WORKERS', 4))
+OUTBOUND_MESSAGE_BATCH_SIZE = int(os.environ.get('OUTBOUND_MESSAGE_BATCH_SIZE', 20))
+OUTBOUND_MESSAGE_MAX_ATTEMPTS = int(os.environ.get('OUTBOUND_MESSAGE_MAX_ATTEMPTS', 5))
+OUTBOUND_MESSAGE_RETRY_DELAY_SECONDS = int(os.environ.get('OUTBOUND_MESSAGE_RETRY_DELAY_SECONDS', 30))
+OUTBOUND_MESSAGE_LEASE_SECONDS = int(os.environ.get('OUTBOUND_MESSAGE_LEASE_SECONDS', 300))
+OUTBOUND_SMS_RATE_PER_SECOND = float(os.environ.get('OUTBOUND_SMS_RATE_PER_SECOND', 10))
+OUTBOUND_WHATSAPP_RATE_PER_SECOND = float(os.environ.get('OUTBOUND_WHATSAPP_RATE_PER_SECOND', 10))
+# Timeout of each SMS and WhatsApp vendor call. The claim of a queued message is renewed before it is sent, so
+# MESSAGING_REQUEST_TIMEOUT_SECONDS times the vendor calls of one message must stay below the lease
+MESSAGING_REQUEST_TIMEOUT_SECONDS = int(os.environ.get('MESSAGING_REQUEST_TIMEOUT_SECONDS', 30))
+
+# Bulk SMS and WhatsApp campaigns are sent by BULK_MESSAGING_MAX_JOBS background jobs, each rendering and saving
+# BULK_MESSAGING_BATCH_SIZE messages at a time and sending them over BULK_MESSAGING_CONCURRENCY pooled connections.
+# Running jobs without progress for BULK_MESSAGING_JOB_STALE_SECONDS are marked as failed
+BULK_MESSAGING_MAX_JOBS = int(os.environ.get('BULK_MESSAGING_MAX_JOBS', 2))
+BULK_MESSAGING_BATCH_SIZE = int(os.environ.get('BULK_MESSAGING_BATCH_SIZE', 100))
+BULK_MESSAGING_CONCURRENCY = int(os.environ.get('BULK_MESSAGING_CONCURRENCY', 8))
+BULK_MESSAGING_REQUEST_TIMEOUT_SECONDS = int(os.environ.get('BULK_MESSAGING_REQUEST_TIMEOUT_SECONDS', 30))
+BULK_MESSAGING_JOB_STALE_SECONDS = int(os.environ.get('BULK_MESSAGING_JOB_STALE_SECONDS', 900))
@@ -1,15 +1,19 @@
 from urllib.parse import parse_qs
 
 import jwt
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
 from django.conf import settings
 from django.db import connection
 from django.http import JsonResponse
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth import get_user_model
-from django.http import HttpResponseForbidden
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
 
 from healtho_pro_user.models.users_models import HealthOProMessagingUser
-from healtho_pro_user.models.users_models import HealthOProUser, Client
+from healtho_pro_user.models.users_models import Client
+from healtho_pro_user.request_context import get_request_context
 
 
 def get_token_from_request(request):
@@ -53,30 +57,11 @@ def get_user_from_token(token):
 
 def jwt_authentication_middleware(get_response):
     def middleware(request):
-        token = get_token_from_request(request)
-
-        if token:
-            try:
-                user = get_user_from_token(token)
-
-                # Assuming session_id is stored in the user model; adjust if it's stored elsewhere
-                session_id = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"]).get('session_id')
+        # Token, user and session are resolved once per request, see get_request_context()
+        context = get_request_context(request)
 
-                if user.session_id != session_id:
-                    raise PermissionDenied("Token invalid or expired")
-
-                # url_list = ['/user/businessprofiles/']
-                # print(request.path)
-
-                #
-                # if user.id==1:
-                #     if request.path not in url_list:
-                #         raise PermissionDenied("no access for this url")
-
-            except HealthOProUser.DoesNotExist:
-                raise PermissionDenied("No active session found")
-            except PermissionDenied as e:
-                return JsonResponse({'error': str(e)}, status=403)
+        if context.has_bearer_token and context.error:
+            return JsonResponse({'error': context.error}, status=403)
 
         return get_response(request)
 
@@ -101,30 +86,11 @@ class TenantContextMiddleware:
         self.get_response = get_response
 
     def __call__(self, request):
-        # Extract the token from the Authorization header
-        token = request.META.get('HTTP_AUTHORIZATION', '').split(' ')[-1]
+        # Client of the token, read from the request context instead of decoding the token again
+        request.client = get_request_context(request).client
 
-        # Decode the token to extract the client_id
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-        except jwt.InvalidTokenError:
-            payload = {}
-
-        client_id = payload.get('client_id')
-
-        if client_id:
-            try:
-                request.client=Client.objects.get(pk=client_id)
-                # Assuming get_schema_name_from_tenant_id is a function that retrieves the schema name
-                schema_name = get_schema_name_from_tenant_id(client_id)
-                if schema_name:
-                    connection.set_schema(schema_name)
-
-            except Client.DoesNotExist:
-                # If the client doesn't exist, handle accordingly
-                pass
-        else:
-            request.client = None
+        if request.client:
+            connection.set_schema(request.client.schema_name)
 
         response = self.get_response(request)
 
@@ -134,19 +100,6 @@ class TenantContextMiddleware:
         return response
 
 
-from channels.middleware import BaseMiddleware
-from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import AccessToken
-from rest_framework.exceptions import AuthenticationFailed
-
-
-# from channels.middleware import BaseMiddleware
-# from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import AccessToken
-from rest_framework.exceptions import AuthenticationFailed
-
 class WebsocketAuthenticationMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
         try:
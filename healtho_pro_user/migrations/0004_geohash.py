@@ -0,0 +1,71 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:34
+
+from django.db import migrations, models
+
+# Frozen copy of the geohash encoding of mobile_app.geo_index at the time of this migration
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 7
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(geohash)
+
+
+def get_geohash(latitude, longitude):
+    # Coordinates are stored as text, rows with missing or invalid values are not indexed
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+        return encode_geohash(latitude, longitude)
+    return None
+
+
+def set_geohashes(apps, schema_editor):
+    for model_name in ['ProDoctor', 'BusinessProfiles']:
+        model = apps.get_model('healtho_pro_user', model_name)
+        rows = []
+        for row in model.objects.exclude(latitude__isnull=True).exclude(longitude__isnull=True).only(
+                'id', 'latitude', 'longitude'):
+            row.geohash = get_geohash(row.latitude, row.longitude)
+            if row.geohash:
+                rows.append(row)
+        model.objects.bulk_update(rows, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healtho_pro_user', '0003_domain_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='businessprofiles',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='prodoctor',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.RunPython(set_geohashes, migrations.RunPython.noop),
+    ]
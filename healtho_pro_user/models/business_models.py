@@ -58,6 +58,7 @@ class BusinessProfiles(models.Model):
     geo_location = models.CharField(max_length=100, blank=True, null=True)
     latitude = models.CharField(max_length=100, blank=True, null=True)
     longitude = models.CharField(max_length=100, blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, null=True, db_index=True)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     website = models.URLField(blank=True, null=True)
     referral_amount_per_patient = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
@@ -172,6 +172,7 @@ class ProDoctor(models.Model):
     graduation_year = models.IntegerField(blank=True, null=True)
     latitude = models.CharField(max_length=100, blank=True, null=True)
     longitude = models.CharField(max_length=100, blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, null=True, db_index=True)
     profile_image = models.TextField(null=True)
     added_on = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from django.conf import settings
+from django_tenants.utils import schema_context
+
+from healtho_pro_user.models.users_models import HealthOProUser, Client
+from pro_laboratory.models.global_models import LabStaff
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stored for lookups that found nothing, so that they are not repeated on every request
+MISSING = object()
+
+
+class TTLCache:
+    """
+    In-process LRU whose entries expire after a few seconds.
+    Saves made in this process invalidate their entries through signals, the short TTL bounds how long
+    the other processes keep serving an entry that changed.
+    """
+
+    def __init__(self, max_entries=2048, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get_ttl(self):
+        return self.ttl if self.ttl is not None else getattr(settings, 'REQUEST_CONTEXT_CACHE_TTL', 30)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.get_ttl(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, load):
+        value = self.get(key)
+        if value is None:
+            value = load()
+            self.set(key, MISSING if value is None else value)
+        return None if value is MISSING else value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_matching(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = TTLCache()
+client_cache = TTLCache(max_entries=512)
+lab_staff_cache = TTLCache(max_entries=4096)
+
+
+def get_cached_user(user_id):
+    return user_cache.get_or_load(str(user_id), lambda: HealthOProUser.objects.filter(pk=user_id).first())
+
+
+def get_cached_client(client_id):
+    return client_cache.get_or_load(str(client_id), lambda: Client.objects.filter(pk=client_id).first())
+
+
+def get_cached_lab_staff(client, user):
+    def load():
+        with schema_context(client.schema_name):
+            return LabStaff.objects.filter(mobile_number=user.phone_number).first()
+
+    return lab_staff_cache.get_or_load((client.schema_name, user.phone_number), load)
+
+
+def invalidate_user_context(user_id):
+    # Called when a user is saved, e.g. a new session_id on login, so the old token is refused right away
+    user_cache.delete(str(user_id))
+
+
+def invalidate_client_context(client_id):
+    client_cache.delete(str(client_id))
+
+
+def invalidate_lab_staff_context(schema_name):
+    lab_staff_cache.delete_matching(lambda key: key[0] == schema_name)
+
+
+class RequestContext:
+    """
+    Token, user, client and staff of a request, resolved once and shared by the middlewares.
+    error is set when a bearer token was sent but could not be used.
+    """
+
+    def __init__(self, request):
+        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+        self.has_bearer_token = auth_header.startswith('Bearer ')
+        self.token = auth_header.split(' ')[-1]
+        self.payload = {}
+        self.error = None
+        self._lab_staff = MISSING
+
+        if self.token:
+            try:
+                self.payload = jwt.decode(self.token, settings.SECRET_KEY, algorithms=['HS256'])
+            except jwt.ExpiredSignatureError:
+                self.error = "Token has expired"
+            except jwt.InvalidTokenError:
+                self.error = "Invalid token"
+
+        self.user_id = self.payload.get('user_id')
+        self.client_id = self.payload.get('client_id')
+        self.user = get_cached_user(self.user_id) if self.user_id else None
+        self.client = get_cached_client(self.client_id) if self.client_id else None
+
+        if self.user_id and self.user is None:
+            self.error = "User does not exist"
+        elif self.user is not None and self.user.session_id != self.payload.get('session_id'):
+            self.error = "Token invalid or expired"
+
+    @property
+    def schema_name(self):
+        return self.client.schema_name if self.client else None
+
+    @property
+    def lab_staff(self):
+        # Only the activity log needs the staff, so it is looked up on first use
+        if self._lab_staff is MISSING:
+            self._lab_staff = None
+            if self.client and self.user:
+                try:
+                    self._lab_staff = get_cached_lab_staff(self.client, self.user)
+                except Exception as error:
+                    logger.info(f'Error getting lab staff of {self.user} in {self.client}: {error}')
+        return self._lab_staff
+
+
+def get_request_context(request):
+    context = getattr(request, 'request_context', None)
+    if context is None:
+        context = RequestContext(request)
+        request.request_context = context
+    return context
@@ -3,6 +3,10 @@ import threading
 
 import schedule
 import time
+from machine_integration_files.ingestion_queue import requeue_pending_messages
+from pro_laboratory.bulk_messaging_jobs import requeue_bulk_messaging_jobs
+from pro_laboratory.outbound_messages import requeue_due_messages
+from pro_laboratory.report_pdf_cache import purge_expired_reports
 from pro_laboratory.views.subscription_data_views import check_completed_business_plans
 
 
@@ -14,6 +18,10 @@ def run_scheduler():
     print('Scheduled tasks are running')
     schedule.every(10).minutes.do(check_scheduling_running_status)
     schedule.every().day.at("06:00").do(check_completed_business_plans)
+    schedule.every().day.at("03:00").do(purge_expired_reports)
+    schedule.every(5).minutes.do(requeue_pending_messages)
+    schedule.every(1).minutes.do(requeue_due_messages)
+    schedule.every(5).minutes.do(requeue_bulk_messaging_jobs)
     while True:
         schedule.run_pending()
         time.sleep(1)
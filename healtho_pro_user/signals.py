@@ -1,18 +1,22 @@
 import logging
 from datetime import timedelta, datetime
 
-from django.core.cache import cache
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from django_tenants.utils import schema_context
 from rest_framework.response import Response
 
+from healtho_pro.cache_tags import bump_generation, cache_family
+from healtho_pro.list_cache import invalidate_list_cache
 from healtho_pro_user.models.business_models import BusinessProfiles, GlobalBusinessSettings, BusinessModules
+from healtho_pro_user.models.universal_models import ProDoctor
 from healtho_pro_user.models.subscription_models import OverallBusinessSubscriptionStatus, \
     OverallBusinessSubscriptionPlansPurchased, BusinessBillCalculationType, BusinessSubscriptionPlans
 from healtho_pro_user.models.users_models import HealthOProUser, Client, UserTenant
+from healtho_pro_user.request_context import invalidate_user_context, invalidate_client_context, \
+    invalidate_lab_staff_context
 from pro_laboratory.models.client_based_settings_models import LetterHeadSettings, BusinessDataStatus, \
     PrintReportSettings, BusinessDiscountSettings, BusinessPaidAmountSettings, PrintDueReports, BusinessMessageSettings, \
     PrintTestReportSettings
@@ -26,8 +30,9 @@ from pro_laboratory.models.patient_models import Patient, LabPatientInvoice, Lab
     LabPatientPackages, LabPatientRefund
 from pro_laboratory.models.phlebotomists_models import LabPhlebotomist
 from pro_laboratory.models.subscription_data_models import BusinessSubscriptionPlansPurchased
-from pro_laboratory.models.universal_models import ActivityLogs
+from pro_laboratory.activity_log_writer import log_activity
 from pro_laboratory.views.client_based_settings_views import get_default_letterhead_settings
+from mobile_app.geo_index import get_geohash
 from pro_universal_data.models import MessagingVendors, UniversalActionType, MessagingTemplates, MessagingSendType, \
     ULabFonts
 from pro_universal_data.views import send_and_log_sms, send_and_log_whatsapp_sms
@@ -195,12 +200,11 @@ def activity_log_for_patient(sender, instance, created, **kwargs):
         patient = instance
         client = instance.client
         lab_staff = instance.created_by if instance.created_by else None
-        user = (HealthOProUser.objects.get(phone_number=lab_staff.mobile_number)) if lab_staff else None
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -225,12 +229,11 @@ def activity_log_for_patient_invoice(sender, instance, created, **kwargs):
         patient = instance.patient
         client = patient.client
         lab_staff = patient.created_by
-        user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number) if lab_staff else None
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -258,12 +261,11 @@ def activity_log_for_patient_receipts(sender, instance, created, **kwargs):
         patient = instance.patient
         client = patient.client
         lab_staff = instance.created_by
-        user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number) if lab_staff else None
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -291,13 +293,12 @@ def activity_log_for_patient_tests(sender, instance, created, **kwargs):
         patient = instance.patient
         client = patient.client
         lab_staff = patient.created_by
-        user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number) if lab_staff else None
 
         try:
             if not instance.is_package_test:
                 # with schema_context(client.schema_name):
-                activity_log = ActivityLogs.objects.create(
-                    user=user,
+                log_activity(
+                    user_phone_number=lab_staff.mobile_number if lab_staff else None,
                     lab_staff=lab_staff,
                     client=client,
                     patient=patient,
@@ -324,12 +325,11 @@ def activity_log_for_patient_packages(sender, instance, created, **kwargs):
         patient = instance.patient
         client = patient.client
         lab_staff = instance.created_by
-        user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number)
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -356,7 +356,6 @@ def activity_log_for_patient_refund(sender, instance, created, **kwargs):
         patient = instance.patient
         client = patient.client
         lab_staff = instance.created_by
-        user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number)
 
         try:
             activity = [f"For patient {patient.name}:"]
@@ -376,8 +375,8 @@ def activity_log_for_patient_refund(sender, instance, created, **kwargs):
                 activity.append(f"Cancelled packages: {cancelled_packages}")
 
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -404,12 +403,11 @@ def activity_log_for_phlebotomist(sender, instance, created, **kwargs):
         patient = instance.LabPatientTestID.patient
         client = patient.client
         lab_staff = instance.collected_by
-        user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number)
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -437,16 +435,11 @@ def activity_log_for_technician(sender, instance, created, **kwargs):
         patient = instance.LabPatientTestID.patient
         client = patient.client
         lab_staff = instance.report_created_by
-        try:
-            user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number)
-        except Exception as error:
-            print(error)
-            user = None
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -490,16 +483,11 @@ def activity_log_for_technician_remarks(sender, instance, created, **kwargs):
         patient = instance.LabPatientTestID.patient
         client = patient.client
         lab_staff = instance.added_by
-        try:
-            user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number)
-        except Exception as error:
-            print(error)
-            user = None
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -526,16 +514,11 @@ def activity_log_for_word_template(sender, instance, created, **kwargs):
         patient = instance.LabPatientTestID.patient
         client = patient.client
         lab_staff = instance.created_by
-        try:
-            user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number)
-        except Exception as error:
-            print(error)
-            user = None
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -560,16 +543,11 @@ def activity_log_for_fixed_template(sender, instance, created, **kwargs):
         patient = instance.LabPatientTestID.patient
         client = patient.client
         lab_staff = instance.created_by
-        try:
-            user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number)
-        except Exception as error:
-            print(error)
-            user = None
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -596,16 +574,11 @@ def activity_log_for_dr(sender, instance, created, **kwargs):
         patient = instance.LabPatientTestID.patient
         client = patient.client
         lab_staff = instance.added_by
-        try:
-            user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number)
-        except Exception as error:
-            print(error)
-            user = None
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -631,16 +604,11 @@ def activity_log_for_doctor_remarks(sender, instance, created, **kwargs):
         patient = instance.LabPatientTestID.patient
         client = patient.client
         lab_staff = instance.added_by
-        try:
-            user = HealthOProUser.objects.get(phone_number=lab_staff.mobile_number)
-        except Exception as error:
-            print(error)
-            user = None
 
         try:
             # with schema_context(client.schema_name):
-            activity_log = ActivityLogs.objects.create(
-                user=user,
+            log_activity(
+                user_phone_number=lab_staff.mobile_number if lab_staff else None,
                 lab_staff=lab_staff,
                 client=client,
                 patient=patient,
@@ -660,16 +628,26 @@ def activity_log_for_doctor_remarks(sender, instance, created, **kwargs):
                 exc_info=True)
 
 
+@receiver(pre_save, sender=LabStaff)
+def remember_lab_staff_mobile_number(sender, instance, **kwargs):
+    # The staff directory cached for the previous number is invalidated too when the number changes
+    instance._previous_mobile_number = LabStaff.objects.filter(pk=instance.pk).values_list(
+        'mobile_number', flat=True).first() if instance.pk else None
+
+
 @receiver(post_save, sender=LabStaff)
 @receiver(post_delete, sender=LabStaff)
 def invalidate_cache_on_lab_staff_update(sender, instance, **kwargs):
+    schema_name = connection.schema_name
+    mobile_numbers = {instance.mobile_number, getattr(instance, '_previous_mobile_number', None)} - {None}
+
     def invalidate_cache():
         print('started deleting cache')
         try:
-            cache_key = f"user_login_data_{instance.mobile_number}_"
-            for key in cache.keys(f"{cache_key}*"):
-                cache.delete(key)
-                print(f"Deleted cache:{key}")
+            for mobile_number in mobile_numbers:
+                generation = bump_generation(cache_family('user_login_data', mobile_number))
+                print(f"Invalidated user login data cache of {mobile_number}, generation {generation}")
+            invalidate_list_cache('lab_staff', schema_name=schema_name)
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -678,14 +656,12 @@ def invalidate_cache_on_lab_staff_update(sender, instance, **kwargs):
 
 @receiver(post_save, sender=LabStaffLoginAccess)
 @receiver(post_delete, sender=LabStaffLoginAccess)
-def invalidate_cache_on_lab_staff_update(sender, instance, **kwargs):
+def invalidate_cache_on_lab_staff_login_access_update(sender, instance, **kwargs):
     def invalidate_cache():
         print('started deleting cache')
         try:
-            cache_key = f"user_login_data_{instance.lab_staff_id.mobile_number}_"
-            for key in cache.keys(f"{cache_key}*"):
-                cache.delete(key)
-                print(f"Deleted cache:{key}")
+            generation = bump_generation(cache_family('user_login_data', instance.lab_staff_id.mobile_number))
+            print(f"Invalidated user login data cache, generation {generation}")
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -693,14 +669,12 @@ def invalidate_cache_on_lab_staff_update(sender, instance, **kwargs):
 
 
 @receiver(post_delete, sender=HealthOProUser)
-def invalidate_cache_on_user_update(sender, instance,created, **kwargs):
+def invalidate_cache_on_user_update(sender, instance, **kwargs):
     def invalidate_cache():
         print('started deleting cache')
         try:
-            cache_key = f"user_login_data_{instance.phone_number}_"
-            for key in cache.keys(f"{cache_key}*"):
-                cache.delete(key)
-                print(f"Deleted cache: {key}")
+            generation = bump_generation(cache_family('user_login_data', instance.phone_number))
+            print(f"Invalidated user login data cache, generation {generation}")
 
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
@@ -708,6 +682,26 @@ def invalidate_cache_on_user_update(sender, instance,created, **kwargs):
     transaction.on_commit(invalidate_cache)
 
 
+@receiver(post_save, sender=HealthOProUser)
+@receiver(post_delete, sender=HealthOProUser)
+def invalidate_request_context_of_user(sender, instance, **kwargs):
+    # A new session_id must be checked by the next request, not after the cached user expires
+    transaction.on_commit(lambda: invalidate_user_context(instance.id))
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_request_context_of_client(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_client_context(instance.id))
+
+
+@receiver(post_save, sender=LabStaff)
+@receiver(post_delete, sender=LabStaff)
+def invalidate_request_context_of_lab_staff(sender, instance, **kwargs):
+    schema_name = connection.schema_name
+    transaction.on_commit(lambda: invalidate_lab_staff_context(schema_name))
+
+
 @receiver(post_save, sender=BusinessProfiles)
 def invalidate_cache_if_disabled(sender, instance, **kwargs):
     if instance.is_account_disabled:
@@ -716,10 +710,7 @@ def invalidate_cache_if_disabled(sender, instance, **kwargs):
             for user_tenant in user_tenants:
                 user = HealthOProUser.objects.get(id=user_tenant.user.id)
 
-                cache_key = f"user_login_data_{user.phone_number}_"
-                for key in cache.keys(f"{cache_key}*"):
-                    cache.delete(key)
-                    print(f"Deleted cache:{key}")
+                bump_generation(cache_family('user_login_data', user.phone_number))
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -779,4 +770,8 @@ def department_modified(sender, instance, **kwargs):
                     word_param.save()
 
 
-
+@receiver(pre_save, sender=ProDoctor)
+@receiver(pre_save, sender=BusinessProfiles)
+def set_geohash(sender, instance, **kwargs):
+    # Keeps the geohash used by the nearby searches of the mobile app in step with the coordinates
+    instance.geohash = get_geohash(instance.latitude, instance.longitude)
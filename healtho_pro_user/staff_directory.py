@@ -0,0 +1,101 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import connection, DatabaseError
+from django_tenants.utils import schema_context, get_public_schema_name
+
+from healtho_pro.cache_tags import cache_family, tagged_cache_key
+from pro_laboratory.models.global_models import LabStaff, LabStaffRole
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+STAFF_DIRECTORY_TIMEOUT = 60 * 60
+
+STAFF_FIELDS = ['id', 'name', 'is_superadmin', 'is_active', 'is_login_access', 'role_name']
+
+
+def get_staff_from_schemas(phone_number, schema_names):
+    """
+    Staff rows of the phone number in every schema, read with a single UNION ALL over the tenant schemas.
+    Only staff with a role are returned, a staff without a role cannot log in.
+    """
+    staff_table = connection.ops.quote_name(LabStaff._meta.db_table)
+    role_table = connection.ops.quote_name(LabStaffRole._meta.db_table)
+
+    queries, params = [], []
+    for schema_name in schema_names:
+        schema = connection.ops.quote_name(schema_name)
+        queries.append(
+            f"SELECT %s::text, staff.id, staff.name, staff.is_superadmin, staff.is_active, staff.is_login_access, "
+            f"role.name "
+            f"FROM {schema}.{staff_table} staff INNER JOIN {schema}.{role_table} role ON role.id = staff.role_id "
+            f"WHERE staff.mobile_number = %s")
+        params.extend([schema_name, phone_number])
+
+    directory = {}
+    if not queries:
+        return directory
+
+    with connection.cursor() as cursor:
+        cursor.execute(' UNION ALL '.join(queries), params)
+        for row in cursor.fetchall():
+            directory[row[0]] = dict(zip(STAFF_FIELDS, row[1:]))
+    return directory
+
+
+def get_staff_from_each_schema(phone_number, schema_names):
+    # Used when the UNION query fails, e.g. a schema of a client without tables
+    directory = {}
+    for schema_name in schema_names:
+        try:
+            with schema_context(schema_name):
+                staff = LabStaff.objects.select_related('role').filter(mobile_number=phone_number,
+                                                                      role__isnull=False).first()
+        except Exception as error:
+            logger.error(f"Error getting lab staff of {phone_number} in {schema_name}: {error}")
+            continue
+        if staff is not None:
+            directory[schema_name] = {
+                'id': staff.id,
+                'name': staff.name,
+                'is_superadmin': staff.is_superadmin,
+                'is_active': staff.is_active,
+                'is_login_access': staff.is_login_access,
+                'role_name': staff.role.name,
+            }
+    return directory
+
+
+def get_staff_directory(phone_number, schema_names):
+    """
+    Staff of a phone number in each of the schemas, {schema_name: staff}, cached per phone number.
+    The cache belongs to the user_login_data family of the phone number, so the LabStaff and login access
+    hooks that bump it also invalidate the directory. The schemas are part of the key, so a user added to
+    another tenant gets a new directory.
+    """
+    # Lab staff only exist in the tenant schemas
+    schema_names = sorted(set(schema_names) - {get_public_schema_name()})
+    schemas_hash = hashlib.md5(','.join(schema_names).encode()).hexdigest()
+
+    try:
+        cache_key = tagged_cache_key(cache_family('user_login_data', phone_number), 'staff_directory', schemas_hash)
+        directory = cache.get(cache_key)
+    except Exception as error:
+        logger.error(f"Error reading staff directory of {phone_number}: {error}")
+        cache_key, directory = None, None
+
+    if directory is None:
+        try:
+            directory = get_staff_from_schemas(phone_number, schema_names)
+        except DatabaseError as error:
+            logger.warning(f"Staff directory query of {phone_number} failed, reading each schema: {error}")
+            directory = get_staff_from_each_schema(phone_number, schema_names)
+
+        if cache_key:
+            try:
+                cache.set(cache_key, directory, timeout=STAFF_DIRECTORY_TIMEOUT)
+            except Exception as error:
+                logger.error(f"Error saving staff directory of {phone_number}: {error}")
+    return directory
@@ -1,19 +1,19 @@
 from datetime import datetime, timedelta
 
 import jwt
-from django.core.cache import cache
 from django.utils import timezone
 from rest_framework import generics, permissions, viewsets
 from django.contrib.auth import get_user_model
-from django_tenants.utils import schema_context
 from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
 
 from healtho_pro import settings
+from healtho_pro.cache_tags import bump_generation, cache_family
 from healtho_pro_user.models.business_models import BusinessProfiles
 from healtho_pro_user.models.universal_models import ProDoctor, ProDoctorProfessionalDetails
 from healtho_pro_user.models.users_models import HealthOProUser, OTP, ULoginSliders, UserTenant, Client
 from healtho_pro_user.serializers.users_serializers import UserSerializer, CustomUserSerializer, \
     ULoginSlidersSerializer, DoctorSerializer
+from healtho_pro_user.staff_directory import get_staff_directory
 from pro_laboratory.models.global_models import LabStaff, LabStaffRole
 from pro_universal_data.views import send_webbased_whatsapp_message, send_sms
 from rest_framework_simplejwt.views import TokenObtainPairView
@@ -128,10 +128,7 @@ class SetPasswordForUser(APIView):
 
                 print('started deleting cache')
                 try:
-                    cache_key = f"user_login_data_{user.phone_number}_"
-                    for key in cache.keys(f"{cache_key}*"):
-                        cache.delete(key)
-                        print(f"Deleted cache:{key}")
+                    bump_generation(cache_family('user_login_data', user.phone_number))
                 except Exception as e:
                     print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -199,17 +196,21 @@ class UserLoginView(APIView):
                 user_tenants_without_public = UserTenant.objects.filter(user=user).prefetch_related('client').exclude(
                     client=public_tenant)
                 if (user.user_type.id == 3 or user.user_type.id == 2) and user_tenants_without_public:
-                    user_tenants = UserTenant.objects.filter(user=user).prefetch_related('client')
+                    user_tenants = list(UserTenant.objects.filter(user=user).select_related('client'))
+
+                    # Businesses by name and the staff of the user in every tenant, instead of queries per tenant
+                    businesses = {business.organization_name: business for business in
+                                  BusinessProfiles.objects.filter(
+                                      organization_name__in=[ut.client.name for ut in user_tenants])}
+                    staff_directory = get_staff_directory(user.phone_number,
+                                                          [ut.client.schema_name for ut in user_tenants])
+
                     tenants_list = []
                     for ut in user_tenants:
                         try:
-                            business = BusinessProfiles.objects.get(organization_name=ut.client.name)
-
-                            try:
-                                with schema_context(ut.client.schema_name):
-                                    lab_staff = LabStaff.objects.get(mobile_number=user.phone_number)
-                                    lab_staff_role = LabStaffRole.objects.get(id=lab_staff.role_id)
-                            except LabStaff.DoesNotExist:
+                            business = businesses.get(ut.client.name)
+                            lab_staff = staff_directory.get(ut.client.schema_name)
+                            if business is None or lab_staff is None:
                                 continue
 
                             business_logo_url = business.b_logo if business.b_logo else None
@@ -233,13 +234,13 @@ class UserLoginView(APIView):
                                 "b_id": business.id,
                                 "business_name": business.organization_name,
                                 "is_account_disabled": business.is_account_disabled,
-                                "provider_type": business.provider_type.id,
-                                "lab_staff_id": lab_staff.id,
-                                "lab_staff_name": lab_staff.name,
-                                "lab_staff_role": lab_staff_role.name,
-                                "is_superadmin": lab_staff.is_superadmin,
-                                "is_active": lab_staff.is_active,
-                                "is_login_access": lab_staff.is_login_access,
+                                "provider_type": business.provider_type_id,
+                                "lab_staff_id": lab_staff['id'],
+                                "lab_staff_name": lab_staff['name'],
+                                "lab_staff_role": lab_staff['role_name'],
+                                "is_superadmin": lab_staff['is_superadmin'],
+                                "is_active": lab_staff['is_active'],
+                                "is_login_access": lab_staff['is_login_access'],
                                 'refresh': refresh_token,
                                 'access': access_token,
                             })
@@ -1,14 +1,11 @@
 import json
 import logging
 from time import time
-import jwt
-from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 from django_tenants.utils import schema_context
-from healtho_pro_user.models.users_models import Client, HealthOProUser
-from pro_laboratory.models.global_models import LabStaff
-from pro_laboratory.models.universal_models import ActivityLogs, ChangesInModels
+from healtho_pro_user.request_context import get_request_context
+from pro_laboratory.activity_log_writer import log_activity
 from urls_models import urls_with_models
 
 # Configure logging
@@ -74,28 +71,11 @@ class LoggingMiddleware:
 
         else:
             try:
-                token = request.META.get('HTTP_AUTHORIZATION', '').split(' ')[-1]
-                if token:
-                    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-                else:
-                    payload = {}
-
-                user_id = payload.get('user_id')
-                client_id = payload.get('client_id')
-
-                if user_id:
-                    user = HealthOProUser.objects.get(pk=user_id)
-                if client_id:
-                    client = Client.objects.get(pk=client_id)
-
-                if client and user:
-                    try:
-                        with schema_context(client.schema_name):
-                            lab_staff = LabStaff.objects.get(mobile_number=user.phone_number)
-                    except Exception as error:
-                        logger.info(
-                            f'Error while creating activity log,for {user},{client},{operation} Request on {url} -'
-                            f'Response ({error})')
+                # User, client and staff of the token, shared with the authentication and tenant middlewares
+                request_context = get_request_context(request)
+                user = request_context.user
+                client = request_context.client
+                lab_staff = request_context.lab_staff
 
                 operation = request.method
                 url = request.path
@@ -176,10 +156,7 @@ class LoggingMiddleware:
                                 value_after = getattr(model_object_after, field_name)
                                 # print(value_before,  value_after)
                                 if value_before != value_after:
-                                    change = ChangesInModels.objects.create(field_name=field_name,
-                                                                            before_value=value_before,
-                                                                            after_value=value_after)
-                                    changes.append(change)
+                                    changes.append((field_name, value_before, value_after))
 
                             try:
                                 if model in patient_related_models:
@@ -213,34 +190,10 @@ class LoggingMiddleware:
 
                 elif (request.method == 'PUT' or request.method == 'PATCH') and (url not in not_required_urls_for_put_method):
                     if request.client:
-                        with schema_context(client.schema_name):
-                            if changes:
-                                activity_log = ActivityLogs.objects.create(
-                                    user=user,
-                                    lab_staff=lab_staff,
-                                    client=client,
-                                    patient=patient,
-                                    operation=operation,
-                                    url=url,
-                                    model=model,
-                                    activity=activity,
-                                    model_instance_id=model_instance_id,
-                                    response_code=response_code,
-                                    duration=duration
-                                )
-
-                                for change in changes:
-                                    activity_log.changes.add(change)
-                            else:
-                                pass
-                    else:
-                        pass
-
-
-                else:
-                    if request.client:
-                        with schema_context(client.schema_name):
-                            activity_log = ActivityLogs.objects.create(
+                        if changes:
+                            # Written in the background by the activity log writer
+                            log_activity(
+                                schema_name=client.schema_name,
                                 user=user,
                                 lab_staff=lab_staff,
                                 client=client,
@@ -251,19 +204,36 @@ class LoggingMiddleware:
                                 activity=activity,
                                 model_instance_id=model_instance_id,
                                 response_code=response_code,
-                                duration=duration
+                                duration=duration,
+                                changes=changes
                             )
+                        else:
+                            pass
+                    else:
+                        pass
 
-                            if changes:
-                                for change in changes:
-                                    activity_log.changes.add(change)
+
+                else:
+                    if request.client:
+                        log_activity(
+                            schema_name=client.schema_name,
+                            user=user,
+                            lab_staff=lab_staff,
+                            client=client,
+                            patient=patient,
+                            operation=operation,
+                            url=url,
+                            model=model,
+                            activity=activity,
+                            model_instance_id=model_instance_id,
+                            response_code=response_code,
+                            duration=duration,
+                            changes=changes
+                        )
 
                     else:
                         pass
 
-            except jwt.InvalidTokenError:
-                payload = {}
-
             except Exception as error:
                 logger.info(
                     f'Request {operation} {url} - Response {response_code} - Duration {duration} seconds Error:{error}')
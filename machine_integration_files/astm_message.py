@@ -1,7 +1,4 @@
-from pro_laboratory.models.labtechnicians_models import LabPatientFixedReportTemplate, LabTechnicians
-from pro_laboratory.models.phlebotomists_models import LabPhlebotomist
-from pro_laboratory.views.labtechnicians_views import LabPatientTestReportGenerationViewset
-from pro_laboratory.views.machine_integration_views import process_parameter_value
+from machine_integration_files.result_ingestion import save_machine_results
 from pro_laboratory.views.universal_views import logger
 
 
@@ -10,8 +7,7 @@ def astm_to_dictionary(astm_data):
     Parse ASTM message into a structured dictionary with field names as per the ASTM standard.
     """
     print('parsing started')
-    logger.error(f"MCIT - Error: parsing started", exc_info=True)
-    logger.info(f"MCIT - Error: parsing started", exc_info=True)
+    logger.info(f"MCIT - Error: parsing started")
     parsed_data = {
         "header": {},
         "patient": {},
@@ -121,7 +117,7 @@ def astm_to_dictionary(astm_data):
             }
 
 
-    logger.error(f"MCIT - Error: parsing data {parsed_data}", exc_info=True)
+    logger.info(f"MCIT - Error: parsing data {parsed_data}")
     return parsed_data
 
 
@@ -141,90 +137,66 @@ def extract_observation_text_for_astm(observation_identifier):
     return " ".join(values)
 
 
+def get_results_from_astm(entered_values):
+    return [(extract_observation_text_for_astm(obj.get('universal_test_id')), obj.get('data_or_measurement_value'))
+            for obj in entered_values]
+
+
+def get_sample_results_from_astm(astm_decoded_message):
+    # Sample id and (mcode, value) results of a decoded message, without saving anything
+    order = astm_decoded_message.get('order') if astm_decoded_message else None
+    if not order:
+        return None, []
+    return order.get('specimen_id'), get_results_from_astm(astm_decoded_message.get('results') or [])
+
+
 def check_sample_exists_and_process_astm(astm_decoded_message):
     print('checking for sample started')
-    logger.error(f"MCIT - Error: checking for sample started", exc_info=True)
+    logger.info(f"MCIT - Error: checking for sample started")
     sample_id = None
     saving_status = None
     if astm_decoded_message:
         print('inside astm decoded message')
-        logger.error(f"MCIT - Error: inside astm decoded message", exc_info=True)
+        logger.info(f"MCIT - Error: inside astm decoded message")
         OBR = astm_decoded_message.get('order')
         if OBR:
             sample_id = OBR.get('specimen_id')
             entered_values = astm_decoded_message.get('results')
             print('sample_id',sample_id)
 
-            logger.error(f"MCIT - Error: 'sample_id',{sample_id}", exc_info=True)
+            logger.info(f"MCIT - Error: 'sample_id',{sample_id}")
 
             if sample_id and entered_values:
-                phlebotomists = LabPhlebotomist.objects.filter(assession_number=sample_id, is_received=True)
-
-                if phlebotomists:
-                    print('sample_existss', phlebotomists)
-
-                    logger.error(f"MCIT - Error: 'sample_existss', {phlebotomists}", exc_info=True)
-                    lab_patient_tests = phlebotomists.values_list('LabPatientTestID', flat=True)
-
-                    for lab_patient_test_id in lab_patient_tests:
-                        generate_test_params = LabPatientTestReportGenerationViewset()
-                        generate_test_params.create(lab_patient_test_id=lab_patient_test_id)
-                        technician = LabTechnicians.objects.filter(LabPatientTestID__id=lab_patient_test_id).first()
-                        technician.has_machine_integration=True
-                        technician.save()
+                results = get_results_from_astm(entered_values)
+                saving_status = save_machine_results(sample_id, results)
 
-                    params = LabPatientFixedReportTemplate.objects.filter(LabPatientTestID__id__in=lab_patient_tests)
-                    processed_params = []
-
-                    for obj in entered_values:
-                        param_name_from_machine = extract_observation_text_for_astm(obj.get('universal_test_id'))
-                        param_value_from_machine = obj.get('data_or_measurement_value')
-                        print('param identifier:', param_name_from_machine, 'value:', param_value_from_machine,'\n')
-                        logger.error(f"MCIT - Error: ('param identifier:', {param_name_from_machine}, 'value:', {param_value_from_machine})'\n'", exc_info=True)
-
-
-                        if param_name_from_machine:
-                            test_parameters = params.filter(template__mcode=param_name_from_machine)
-                            print('test parameter with mcode exists or not:',test_parameters)
-                            logger.error(f"MCIT - Error: 'test parameter with mcode exists or not:',{test_parameters}", exc_info=True)
-
-                            if test_parameters:
-                                for test_parameter in test_parameters:
-                                    param_value_from_machine = process_parameter_value(parameter=test_parameter,
-                                                                                       parameter_value_from_machine=param_value_from_machine)
-                                    processed_params.append(f"{test_parameter.parameter}:{param_value_from_machine}")
-                                    test_parameter.value = param_value_from_machine
-                                    test_parameter.save()
-
-                    saving_status = f'Processed for {processed_params}'
+                if saving_status is not None:
                     print(saving_status)
-
-                    logger.error(f"MCIT - Error: {saving_status}", exc_info=True)
-
+                    logger.info(f"MCIT - Error: {saving_status}")
                     return sample_id,saving_status
                 else:
                     print('Error: matching sample does not exist')
 
-                    logger.error(f"MCIT - Error:  matching sample does not exist", exc_info=True)
+                    logger.warning(f"MCIT - Error:  matching sample does not exist")
                     saving_status = f'Not processed matching sample does not exist'
                     return sample_id,saving_status
 
             else:
                 print('Error: sample id and values not available')
 
-                logger.error(f"MCIT - Error: sample id and values not available", exc_info=True)
+                logger.warning(f"MCIT - Error: sample id and values not available")
                 saving_status = f'Not processed sample id and values not available'
                 return sample_id,saving_status
         else:
             print('Error: Segment - Order not fount to get specimen id!')
 
-            logger.error(f"MCIT - Error: Segment - Order not fount to get specimen id!", exc_info=True)
+            logger.warning(f"MCIT - Error: Segment - Order not fount to get specimen id!")
             saving_status = f'Not processed sample id and values not available'
             return sample_id, saving_status
     else:
         print('Error at ASTM message starting itself!')
 
-        logger.error(f"MCIT - Error:Error at ASTM message starting itself!", exc_info=True)
+        logger.warning(f"MCIT - Error:Error at ASTM message starting itself!")
         saving_status = f'Not processed sample id and values not available'
         return sample_id, saving_status
 
@@ -236,5 +208,5 @@ def process_astm_message(message=None):
     sample_id, saving_status = check_sample_exists_and_process_astm(modified_msg)
     print('machine integration process done')
 
-    logger.error(f"MCIT - Error: machine integration process done", exc_info=True)
+    logger.info(f"MCIT - Error: machine integration process done")
     return sample_id, saving_status
\ No newline at end of file
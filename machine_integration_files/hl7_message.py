@@ -1,7 +1,4 @@
-from pro_laboratory.models.labtechnicians_models import LabPatientFixedReportTemplate, LabTechnicians
-from pro_laboratory.models.phlebotomists_models import LabPhlebotomist
-from pro_laboratory.views.labtechnicians_views import LabPatientTestReportGenerationViewset
-from pro_laboratory.views.machine_integration_views import process_parameter_value
+from machine_integration_files.result_ingestion import save_machine_results
 
 from pro_laboratory.views.universal_views import logger
 
@@ -11,7 +8,7 @@ def hl7_to_dictionary(hl7_message):
     Parse HL7 message into a structured dictionary with snake_case field names.
     """
 
-    logger.error(f"MCIT - Error: Parsing started", exc_info=True)
+    logger.info(f"MCIT - Error: Parsing started")
     parsed_data = {}
     segments = hl7_message.strip().split('\r')
 
@@ -160,7 +157,7 @@ def hl7_to_dictionary(hl7_message):
         else:
             parsed_data[segment_name] = segment_data
 
-    logger.error(f"MCIT - Error: Decode message at the end: \n {parsed_data}", exc_info=True)
+    logger.info(f"MCIT - Error: Decode message at the end: \n {parsed_data}")
     return parsed_data
 
 
@@ -172,9 +169,34 @@ def extract_observation_text_for_hl7(observation_identifier):
     return components[1] if len(components) > 1 else components[0]
 
 
+def get_observations_from_hl7(hl7_decoded_message):
+    entered_values = hl7_decoded_message.get('OBX')
+    if entered_values:
+        if isinstance(entered_values, dict):
+            # Wrap the dict in a list to preserve its structure
+            entered_values = [entered_values]
+        elif not isinstance(entered_values, list):
+            # Wrap non-list, non-dict values in a list
+            entered_values = [entered_values]
+    return entered_values
+
+
+def get_results_from_hl7(entered_values):
+    return [(extract_observation_text_for_hl7(obj.get('observation_identifier')), obj.get('observation_value'))
+            for obj in entered_values]
+
+
+def get_sample_results_from_hl7(hl7_decoded_message):
+    # Sample id and (mcode, value) results of a decoded message, without saving anything
+    OBR = hl7_decoded_message.get('OBR') if hl7_decoded_message else None
+    if not OBR:
+        return None, []
+    return OBR.get('filler_order_number'), get_results_from_hl7(get_observations_from_hl7(hl7_decoded_message) or [])
+
+
 def check_sample_exists_and_process_hl7(hl7_decoded_message):
     print('checking for sample started')
-    logger.error(f"MCIT - Error: checking for sample started", exc_info=True)
+    logger.info(f"MCIT - Error: checking for sample started")
     sample_id = None
     saving_status = None
     if hl7_decoded_message:
@@ -182,85 +204,42 @@ def check_sample_exists_and_process_hl7(hl7_decoded_message):
 
         if OBR:
             sample_id = OBR.get('filler_order_number')
-            entered_values = hl7_decoded_message.get('OBX')
-            if entered_values:
-                if isinstance(entered_values, dict):
-                    # Wrap the dict in a list to preserve its structure
-                    entered_values = [entered_values]
-                elif not isinstance(entered_values, list):
-                    # Wrap non-list, non-dict values in a list
-                    entered_values = [entered_values]
+            entered_values = get_observations_from_hl7(hl7_decoded_message)
             print('sample_id',sample_id)
 
             if sample_id and entered_values:
-                phlebotomists = LabPhlebotomist.objects.filter(assession_number=sample_id, is_received=True)
-
-                if phlebotomists:
-                    print('sample_existss', phlebotomists)
-
-                    logger.error(f"MCIT - Error: sample_existss", exc_info=True)
-                    lab_patient_tests = phlebotomists.values_list('LabPatientTestID', flat=True)
-
-                    for lab_patient_test_id in lab_patient_tests:
-                        generate_test_params = LabPatientTestReportGenerationViewset()
-                        generate_test_params.create(lab_patient_test_id=lab_patient_test_id)
-                        technician = LabTechnicians.objects.filter(LabPatientTestID__id=lab_patient_test_id).first()
-                        technician.has_machine_integration = True
-                        technician.save()
-
-                    params = LabPatientFixedReportTemplate.objects.filter(LabPatientTestID__id__in=lab_patient_tests)
-                    processed_params = []
-
-                    for obj in entered_values:
-                        print(obj)
-                        param_name_from_machine = extract_observation_text_for_hl7(obj.get('observation_identifier'))
-                        param_value_from_machine = obj.get('observation_value')
-                        print('param identifier:', param_name_from_machine, 'value:', param_value_from_machine, type(param_value_from_machine),'\n')
-
-                        logger.error(f"MCIT - Error:'param identifier:', {param_name_from_machine}, 'value:', {param_value_from_machine},{type(param_value_from_machine)},'\n'", exc_info=True)
-
-                        if param_name_from_machine:
-                            test_parameters = params.filter(template__mcode=param_name_from_machine)
-                            print('test parameter with mcode exists or not:',test_parameters)
-                            logger.error(f"MCIT - Error: test parameter with mcode exists or not:',{test_parameters}", exc_info=True)
-
-                            if test_parameters:
-                                for test_parameter in test_parameters:
-                                    param_value_from_machine = process_parameter_value(parameter=test_parameter,
-                                                                                       parameter_value_from_machine=param_value_from_machine)
-                                    processed_params.append(f"{test_parameter.parameter}:{param_value_from_machine}")
-                                    test_parameter.value = param_value_from_machine
-                                    test_parameter.save()
-                    saving_status = f'Processed for {processed_params}'
+                results = get_results_from_hl7(entered_values)
+                saving_status = save_machine_results(sample_id, results)
+
+                if saving_status is not None:
                     print(saving_status)
-                    logger.error(f"MCIT - Error: {saving_status}", exc_info=True)
+                    logger.info(f"MCIT - Error: {saving_status}")
                     return sample_id,saving_status
                 else:
                     print('Error: matching sample does not exist')
-                    logger.error(f"MCIT - Error:matching sample does not existd", exc_info=True)
+                    logger.warning(f"MCIT - Error:matching sample does not existd")
                     saving_status = f'Not processed matching sample does not exist'
                     return sample_id,saving_status
 
             else:
                 print('Error: sample id and values not available')
-                logger.error(f"MCIT - Error: sample id and values not available", exc_info=True)
+                logger.warning(f"MCIT - Error: sample id and values not available")
                 saving_status = f'Not processed sample id and values not available'
                 return sample_id,saving_status
         else:
             print(f'could not find OBR!:the message decode is this: {hl7_decoded_message}')
-            logger.error(f"MCIT - Error: could not find OBR!:the message decoded is this:  \n {hl7_decoded_message}",
-                         exc_info=True)
+            logger.warning(f"MCIT - Error: could not find OBR!:the message decoded is this:  \n {hl7_decoded_message}")
             return sample_id, saving_status
     else:
         print('error at hl7 starting itself!')
-        logger.error(f"MCIT - Error: error at hl7 starting itself with the message \n {hl7_decoded_message}", exc_info=True)
+        logger.warning(f"MCIT - Error: error at hl7 starting itself with the message \n {hl7_decoded_message}")
         return sample_id,saving_status
 
 def process_hl7_message(message=None):
     modified_msg = hl7_to_dictionary(message)
     sample_id, saving_status = check_sample_exists_and_process_hl7(modified_msg)
     print('machine integration process done')
-    logger.error(f"MCIT - Error:machine integration process done", exc_info=True)
+    logger.info(f"MCIT - Error:machine integration process done")
     return sample_id, saving_status
 
 
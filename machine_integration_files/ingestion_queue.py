@@ -0,0 +1,187 @@
+import queue
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import Count, Min, Max, Q
+from django.utils import timezone
+from django_tenants.utils import schema_context
+
+from healtho_pro_user.models.users_models import Client
+from machine_integration_files.astm_message import astm_to_dictionary, get_sample_results_from_astm
+from machine_integration_files.hl7_message import hl7_to_dictionary, get_sample_results_from_hl7
+from machine_integration_files.result_ingestion import save_machine_results
+from pro_laboratory.models.machine_integration_models import DataFromProcessingMachine
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_sample_results(message):
+    if message.compliance == 'HL7':
+        return get_sample_results_from_hl7(hl7_to_dictionary(message.data))
+    elif message.compliance == 'ASTM':
+        return get_sample_results_from_astm(astm_to_dictionary(message.data))
+    raise ValueError(f"Compliance Not Selected: HL7 or ASTM! ({message.compliance})")
+
+
+def process_message_batch(messages):
+    """
+    Parses the messages and saves their results with one save_machine_results() per sample.
+    Results of messages of the same sample are applied in the order of arrival, so the latest value wins.
+    """
+    results_by_sample = {}
+    messages_by_sample = {}
+    for message in messages:
+        try:
+            sample_id, results = get_sample_results(message)
+        except Exception as error:
+            logger.error(f"MCIT - Error: parsing of machine message {message.id} failed: {error}", exc_info=True)
+            message.status, message.saving_status = DataFromProcessingMachine.FAILED, f'Not processed: {error}'
+            continue
+
+        message.sample_id = sample_id
+        if not sample_id or not results:
+            message.status = DataFromProcessingMachine.FAILED
+            message.saving_status = 'Not processed sample id and values not available'
+            continue
+
+        results_by_sample.setdefault(sample_id, []).extend(results)
+        messages_by_sample.setdefault(sample_id, []).append(message)
+
+    for sample_id, results in results_by_sample.items():
+        try:
+            saving_status = save_machine_results(sample_id, results)
+            if saving_status is None:
+                status, saving_status = DataFromProcessingMachine.FAILED, 'Not processed matching sample does not exist'
+            else:
+                status = DataFromProcessingMachine.PROCESSED
+        except Exception as error:
+            logger.error(f"MCIT - Error: saving results of sample {sample_id} failed: {error}", exc_info=True)
+            status, saving_status = DataFromProcessingMachine.FAILED, f'Not processed: {error}'
+
+        for message in messages_by_sample[sample_id]:
+            message.status, message.saving_status = status, saving_status
+
+    processed_on = timezone.now()
+    for message in messages:
+        message.processed_on = processed_on
+    DataFromProcessingMachine.objects.bulk_update(messages, ['status', 'sample_id', 'saving_status', 'processed_on'])
+
+
+def process_queued_messages(batch_size=None):
+    """
+    Processes the queued messages of the current schema in micro-batches.
+    Rows are locked with SKIP LOCKED until their batch is committed, so several consumers never take the
+    same message and a crash leaves the batch queued for the next run.
+    """
+    batch_size = batch_size or getattr(settings, 'MACHINE_INGESTION_BATCH_SIZE', 50)
+    processed = 0
+    while True:
+        with transaction.atomic():
+            messages = list(DataFromProcessingMachine.objects.select_for_update(skip_locked=True).filter(
+                status=DataFromProcessingMachine.QUEUED).order_by('id')[:batch_size])
+            if not messages:
+                return processed
+            process_message_batch(messages)
+        processed += len(messages)
+
+
+class MachineMessageConsumer:
+    """
+    Background thread that processes queued machine messages.
+    The ingestion view only saves the raw message and calls notify() with its schema, schemas notified
+    while a batch is running are collected and processed together in the next round.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+
+    def notify(self, schema_name):
+        self.start()
+        self._schemas.put(schema_name)
+
+    def _next_schemas(self):
+        schemas = {self._schemas.get()}
+        while True:
+            try:
+                schemas.add(self._schemas.get_nowait())
+            except queue.Empty:
+                return schemas
+
+    def _run(self):
+        while True:
+            for schema_name in self._next_schemas():
+                try:
+                    with schema_context(schema_name):
+                        processed = process_queued_messages()
+                    logger.info(f"MCIT - processed {processed} queued machine messages of {schema_name}")
+                except Exception as error:
+                    logger.error(f"MCIT - Error: processing queued machine messages of {schema_name} failed: {error}",
+                                 exc_info=True)
+                finally:
+                    close_old_connections()
+
+
+machine_message_consumer = MachineMessageConsumer()
+
+
+def enqueue_machine_messages(schema_name):
+    # The message is handed to the consumer once it is committed, otherwise the consumer could miss it
+    transaction.on_commit(lambda: machine_message_consumer.notify(schema_name))
+
+
+def requeue_pending_messages():
+    # Picks up messages left queued by a restart, run by the scheduler
+    for client in Client.objects.exclude(schema_name='public'):
+        try:
+            with schema_context(client.schema_name):
+                has_pending = DataFromProcessingMachine.objects.filter(
+                    status=DataFromProcessingMachine.QUEUED).exists()
+            if has_pending:
+                machine_message_consumer.notify(client.schema_name)
+        except Exception as error:
+            logger.error(f"MCIT - Error: checking queued machine messages of {client.schema_name} failed: {error}")
+
+
+def get_machine_ingestion_metrics(window_minutes=60):
+    """
+    Per machine backlog, lag and throughput of the current schema.
+    lag_seconds is the age of the oldest queued message, throughput counts messages processed in the window.
+    """
+    now = timezone.now()
+    window_start = now - timedelta(minutes=window_minutes)
+    processed_in_window = Q(processed_on__gte=window_start)
+
+    metrics = []
+    for row in DataFromProcessingMachine.objects.filter(
+            Q(status=DataFromProcessingMachine.QUEUED) | processed_in_window).values('machine', 'machine__name').annotate(
+            queued=Count('id', filter=Q(status=DataFromProcessingMachine.QUEUED)),
+            oldest_queued_on=Min('added_on', filter=Q(status=DataFromProcessingMachine.QUEUED)),
+            processed=Count('id', filter=processed_in_window & Q(status=DataFromProcessingMachine.PROCESSED)),
+            failed=Count('id', filter=processed_in_window & Q(status=DataFromProcessingMachine.FAILED)),
+            last_processed_on=Max('processed_on'),
+    ).order_by('machine'):
+        oldest_queued_on = row['oldest_queued_on']
+        metrics.append({
+            'machine': row['machine'],
+            'machine_name': row['machine__name'],
+            'queued': row['queued'],
+            'lag_seconds': (now - oldest_queued_on).total_seconds() if oldest_queued_on else 0,
+            'processed': row['processed'],
+            'failed': row['failed'],
+            'throughput_per_minute': round((row['processed'] + row['failed']) / window_minutes, 2),
+            'last_processed_on': row['last_processed_on'],
+        })
+    return {'window_minutes': window_minutes, 'machines': metrics}
@@ -0,0 +1,86 @@
+from django.db import transaction
+
+from pro_laboratory.models.labtechnicians_models import LabPatientFixedReportTemplate, LabTechnicians
+from pro_laboratory.models.phlebotomists_models import LabPhlebotomist
+from pro_laboratory.report_pdf_cache import invalidate_test_reports
+from pro_laboratory.views.labtechnicians_views import LabPatientTestReportGenerationViewset
+from pro_laboratory.views.machine_integration_views import process_parameter_value
+from pro_laboratory.views.universal_views import logger
+
+
+def get_received_test_ids_for_sample(sample_id):
+    test_ids = LabPhlebotomist.objects.filter(assession_number=sample_id, is_received=True).values_list(
+        'LabPatientTestID', flat=True)
+    return sorted({test_id for test_id in test_ids if test_id is not None})
+
+
+def generate_missing_test_parameters(test_ids):
+    # Report parameters are generated once per test, later messages of the same sample only update values
+    generated_test_ids = set(LabPatientFixedReportTemplate.objects.filter(
+        LabPatientTestID__id__in=test_ids).values_list('LabPatientTestID', flat=True).distinct())
+
+    missing_test_ids = [lab_patient_test_id for lab_patient_test_id in test_ids
+                        if lab_patient_test_id not in generated_test_ids]
+    if missing_test_ids:
+        generate_test_params = LabPatientTestReportGenerationViewset()
+        generate_test_params.create(lab_patient_test_ids=missing_test_ids)
+
+    LabTechnicians.objects.filter(LabPatientTestID__id__in=test_ids).update(has_machine_integration=True)
+
+
+def get_parameters_by_mcode(test_ids):
+    parameters_by_mcode = {}
+    for parameter in LabPatientFixedReportTemplate.objects.filter(
+            LabPatientTestID__id__in=test_ids, template__mcode__isnull=False).select_related('template'):
+        parameters_by_mcode.setdefault(parameter.template.mcode, []).append(parameter)
+    return parameters_by_mcode
+
+
+def invalidate_reports_of_tests(test_ids):
+    for test_id in test_ids:
+        try:
+            invalidate_test_reports(test_id)
+        except Exception as error:
+            logger.error(f"Report cache invalidation failed for test {test_id}: {error}")
+
+
+def save_machine_results(sample_id, results):
+    """
+    Saves the values of one sample sent by a machine.
+    results is a list of (mcode, value) in the order of the message, a later value of the same mcode wins.
+    Returns the saving status, or None when no received sample matches the sample id.
+    """
+    test_ids = get_received_test_ids_for_sample(sample_id)
+    if not test_ids:
+        return None
+
+    logger.info(f"MCIT - Error: sample exists with tests {test_ids}")
+
+    with transaction.atomic():
+        generate_missing_test_parameters(test_ids)
+        parameters_by_mcode = get_parameters_by_mcode(test_ids)
+
+        updated_parameters = {}
+        processed_params = []
+        for param_name_from_machine, param_value_from_machine in results:
+            test_parameters = parameters_by_mcode.get(param_name_from_machine) if param_name_from_machine else None
+            print('param identifier:', param_name_from_machine, 'value:', param_value_from_machine,
+                  'matching parameters:', test_parameters)
+            logger.info(f"MCIT - Error: 'param identifier:', {param_name_from_machine}, 'value:', "
+                         f"{param_value_from_machine}, 'matching parameters:', {test_parameters}")
+
+            for test_parameter in test_parameters or []:
+                value = process_parameter_value(parameter=test_parameter,
+                                                parameter_value_from_machine=param_value_from_machine)
+                processed_params.append(f"{test_parameter.parameter}:{value}")
+                test_parameter.value = value
+                updated_parameters[test_parameter.pk] = test_parameter
+
+        if updated_parameters:
+            LabPatientFixedReportTemplate.objects.bulk_update(list(updated_parameters.values()), ['value'])
+
+            # bulk_update sends no post_save, so the cached reports of these tests are removed here
+            updated_test_ids = {parameter.LabPatientTestID_id for parameter in updated_parameters.values()}
+            transaction.on_commit(lambda: invalidate_reports_of_tests(updated_test_ids))
+
+    return f'Processed for {processed_params}'
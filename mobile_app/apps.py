@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MobileAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mobile_app'
+
+    def ready(self):
+        import mobile_app.signals
@@ -0,0 +1,174 @@
+import base64
+import math
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Precision stored on the rows, about 150 m x 150 m cells
+GEOHASH_PRECISION = 7
+
+# Most cells a search may cover, the precision is lowered until the bounding box fits in this many cells
+MAX_SEARCH_CELLS = 32
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(geohash)
+
+
+def parse_coordinates(latitude, longitude):
+    # Coordinates are stored as text, rows with missing or invalid values are not indexed
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+        return latitude, longitude
+    return None
+
+
+def get_geohash(latitude, longitude):
+    coordinates = parse_coordinates(latitude, longitude)
+    return encode_geohash(*coordinates) if coordinates else None
+
+
+def get_bounding_box(latitude, longitude, radius_km):
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    lon_delta = math.degrees(radius_km / (EARTH_RADIUS_KM * max(math.cos(math.radians(latitude)), 0.01)))
+    return (max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0),
+            max(longitude - lon_delta, -180.0), min(longitude + lon_delta, 180.0))
+
+
+def get_cell_size(precision):
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def steps(start, end, size):
+    # Points no further apart than a cell, so every cell row or column between start and end gets one
+    values = []
+    value = start
+    while value < end:
+        values.append(value)
+        value += size
+    values.append(end)
+    return values
+
+
+def get_covering_geohashes(bounding_box):
+    """
+    Geohash prefixes whose cells cover the bounding box, at the finest precision that needs at most
+    MAX_SEARCH_CELLS cells.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_size, lon_size = get_cell_size(precision)
+        if ((max_lat - min_lat) / lat_size + 2) * ((max_lon - min_lon) / lon_size + 2) > MAX_SEARCH_CELLS:
+            continue
+        return {encode_geohash(latitude, longitude, precision)
+                for latitude in steps(min_lat, max_lat, lat_size)
+                for longitude in steps(min_lon, max_lon, lon_size)}
+    return set()
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    lat1, lat2 = math.radians(latitude1), math.radians(latitude2)
+    d_lat, d_lon = lat2 - lat1, math.radians(longitude2 - longitude1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def encode_cursor(distance, pk):
+    return base64.urlsafe_b64encode(f"{distance!r}|{pk}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        distance, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return float(distance), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError({"message": "Invalid cursor"})
+
+
+def get_radius_km(request, default_radius_km):
+    try:
+        radius_km = float(request.query_params.get('radius_km') or default_radius_km)
+    except ValueError:
+        raise ValidationError({"message": "radius_km must be a number"})
+    return min(max(radius_km, 0.1), getattr(settings, 'NEARBY_MAX_RADIUS_KM', 50))
+
+
+def find_nearby(queryset, latitude, longitude, radius_km):
+    """
+    Rows of the queryset within radius_km, as (distance_km, row) sorted by distance and id.
+    Candidates are read through the geohash index for the cells of the bounding box, only they are parsed
+    and get their exact distance computed.
+    """
+    bounding_box = get_bounding_box(latitude, longitude, radius_km)
+    cells = get_covering_geohashes(bounding_box)
+    if not cells:
+        return []
+
+    cells_filter = Q()
+    for cell in cells:
+        cells_filter |= Q(geohash__startswith=cell)
+
+    min_lat, max_lat, min_lon, max_lon = bounding_box
+    nearby = []
+    for row in queryset.filter(cells_filter):
+        coordinates = parse_coordinates(row.latitude, row.longitude)
+        if coordinates is None:
+            continue
+        if not (min_lat <= coordinates[0] <= max_lat and min_lon <= coordinates[1] <= max_lon):
+            continue
+        distance = haversine_km(latitude, longitude, *coordinates)
+        if distance <= radius_km:
+            nearby.append((distance, row))
+
+    nearby.sort(key=lambda item: (item[0], item[1].pk))
+    return nearby
+
+
+def get_nearby_page(request, queryset, latitude, longitude, default_radius_km, page_size=10):
+    """
+    One page of the rows near the location, continuing after the (distance, id) of the cursor.
+    Returns the rows with their distances, the cursor of the next page and the number of rows in the radius.
+    """
+    radius_km = get_radius_km(request, default_radius_km)
+    nearby = find_nearby(queryset, latitude, longitude, radius_km)
+
+    results = nearby
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        position = decode_cursor(cursor)
+        results = [item for item in nearby if (item[0], item[1].pk) > position]
+
+    try:
+        page_size = int(request.query_params.get('page_size') or page_size)
+    except ValueError:
+        raise ValidationError({"message": "page_size must be a number"})
+
+    page = results[:max(page_size, 1)]
+    next_cursor = encode_cursor(page[-1][0], page[-1][1].pk) if len(results) > len(page) else None
+    return page, next_cursor, len(nearby), radius_km
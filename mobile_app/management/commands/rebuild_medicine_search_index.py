@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from mobile_app.medicine_search import get_pharmacy_clients, rebuild_client_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the shared medicine search index from the pharmacy items of every pharmacy tenant'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schema', help='Only rebuild the items of this tenant schema')
+
+    def handle(self, *args, **options):
+        clients = get_pharmacy_clients()
+        if options['schema']:
+            clients = clients.filter(schema_name=options['schema'])
+
+        indexed = 0
+        for client in clients:
+            try:
+                count = rebuild_client_index(client)
+            except Exception as error:
+                self.stderr.write(f'Error rebuilding medicine search index of {client.schema_name}: {error}')
+                continue
+            if count is None:
+                self.stdout.write(f'Skipped {client.schema_name}, it has no pharmacy items table')
+                continue
+            indexed += count
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} pharmacy items'))
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django_tenants.utils import schema_context
+
+from healtho_pro_user.models.users_models import Client
+from mobile_app.models import PharmaItemSearchEntry
+from pro_pharmacy.models import PharmaItems
+
+INDEXED_FIELDS = ['name', 'normalized_name', 'item_image', 'price', 'quantity', 'last_updated']
+
+
+def normalize_medicine_name(name):
+    return ' '.join((name or '').lower().split())
+
+
+def get_pharmacy_clients():
+    return Client.objects.filter(users__HealthcareRegistryType__id=3).distinct()
+
+
+def get_search_entry(client, item):
+    return PharmaItemSearchEntry(client=client, item_id=item.id, name=item.name,
+                                 normalized_name=normalize_medicine_name(item.name), item_image=item.item_image,
+                                 price=item.price, quantity=item.quantity)
+
+
+def index_pharma_items(client, items, batch_size=1000):
+    # Inserts the entries of new items and updates the existing ones
+    entries = [get_search_entry(client, item) for item in items]
+    with schema_context('public'):
+        PharmaItemSearchEntry.objects.bulk_create(entries, batch_size=batch_size, update_conflicts=True,
+                                                  unique_fields=['client', 'item_id'], update_fields=INDEXED_FIELDS)
+    return len(entries)
+
+
+def remove_pharma_items(client, item_ids):
+    with schema_context('public'):
+        PharmaItemSearchEntry.objects.filter(client=client, item_id__in=item_ids).delete()
+
+
+def rebuild_client_index(client):
+    """
+    Replaces the search entries of a pharmacy with its current items.
+    Returns the number of indexed items, None when the schema has no pharmacy tables.
+    """
+    with schema_context(client.schema_name):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [PharmaItems._meta.db_table])
+            if cursor.fetchone()[0] is None:
+                return None
+        items = list(PharmaItems.objects.only('id', 'name', 'item_image', 'price', 'quantity'))
+
+    with schema_context('public'):
+        PharmaItemSearchEntry.objects.filter(client=client).exclude(item_id__in=[item.id for item in items]).delete()
+    return index_pharma_items(client, items)
+
+
+def search_medicines(query, limit_per_pharmacy=None):
+    """
+    Medicines whose name contains the query, from every pharmacy in one query on the search index.
+    Results are grouped per pharmacy, the best trigram matches first, at most limit_per_pharmacy per pharmacy.
+    """
+    if limit_per_pharmacy is None:
+        limit_per_pharmacy = getattr(settings, 'MEDICINE_SEARCH_LIMIT_PER_PHARMACY', 20)
+
+    normalized_query = normalize_medicine_name(query)
+    entries = PharmaItemSearchEntry.objects.select_related('client')
+    if normalized_query:
+        entries = entries.filter(normalized_name__contains=normalized_query).annotate(
+            similarity=TrigramSimilarity('normalized_name', normalized_query))
+        ranking = [F('similarity').desc(), 'normalized_name', 'item_id']
+    else:
+        ranking = ['normalized_name', 'item_id']
+
+    entries = entries.annotate(
+        pharmacy_rank=Window(RowNumber(), partition_by=[F('client_id')], order_by=ranking),
+    ).filter(pharmacy_rank__lte=limit_per_pharmacy).order_by('client_id', 'pharmacy_rank')
+
+    result = {}
+    for entry in entries:
+        pharmacy = result.setdefault(entry.client_id, {
+            "client": entry.client.schema_name,
+            "best_match": getattr(entry, 'similarity', 0),
+            "pharma_items": [],
+        })
+        pharmacy["pharma_items"].append({
+            "item_id": entry.item_id,
+            "name": entry.name,
+            "item_image": entry.item_image,
+            "quantity": entry.quantity,
+            "price": entry.price,
+        })
+
+    # Pharmacies with the closest match first
+    pharmacies = sorted(result.values(), key=lambda pharmacy: pharmacy["best_match"], reverse=True)
+    for pharmacy in pharmacies:
+        del pharmacy["best_match"]
+    return pharmacies
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:36
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healtho_pro_user', '0004_geohash'),
+        ('mobile_app', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='PharmaItemSearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_id', models.BigIntegerField()),
+                ('name', models.CharField(max_length=600)),
+                ('normalized_name', models.CharField(max_length=600)),
+                ('item_image', models.TextField(blank=True, null=True)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('quantity', models.PositiveIntegerField(blank=True, null=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pharma_item_search_entries', to='healtho_pro_user.client')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['normalized_name'], name='pharma_item_search_trgm', opclasses=['gin_trgm_ops'])],
+                'unique_together': {('client', 'item_id')},
+            },
+        ),
+    ]
@@ -1,7 +1,9 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from healtho_pro_user.models.universal_models import HealthcareRegistryType
+from healtho_pro_user.models.users_models import Client
 from pro_laboratory.models.patient_models import Patient
 
 
@@ -57,3 +59,28 @@ class Category(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class PharmaItemSearchEntry(models.Model):
+    """
+    Copy of the pharmacy items of every pharmacy tenant, kept in the shared schema so that the mobile app
+    searches medicines of all pharmacies with one query. Rows are maintained by the PharmaItems signals.
+    """
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='pharma_item_search_entries')
+    item_id = models.BigIntegerField()
+    name = models.CharField(max_length=600)
+    # Lower case name with single spaces, searched through its trigram index
+    normalized_name = models.CharField(max_length=600)
+    item_image = models.TextField(null=True, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    quantity = models.PositiveIntegerField(null=True, blank=True)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('client', 'item_id')
+        indexes = [
+            GinIndex(fields=['normalized_name'], opclasses=['gin_trgm_ops'], name='pharma_item_search_trgm'),
+        ]
+
+    def __str__(self):
+        return self.name
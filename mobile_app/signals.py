@@ -0,0 +1,48 @@
+from django.db import connection, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from healtho_pro_user.models.users_models import Client
+from mobile_app.medicine_search import index_pharma_items, remove_pharma_items
+from pro_pharmacy.models import PharmaItems
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_client(schema_name):
+    return Client.objects.filter(schema_name=schema_name).first()
+
+
+@receiver(post_save, sender=PharmaItems)
+def index_pharma_item_on_save(sender, instance, **kwargs):
+    # Indexed once the save commits, so the shared index never holds items that were rolled back
+    schema_name = connection.schema_name
+
+    def index():
+        try:
+            client = get_client(schema_name)
+            if client is not None:
+                index_pharma_items(client, [instance])
+        except Exception as error:
+            logger.error(f"Error indexing pharma item {instance.id} of {schema_name}: {error}",
+                         exc_info=True)
+
+    transaction.on_commit(index)
+
+
+@receiver(post_delete, sender=PharmaItems)
+def remove_pharma_item_on_delete(sender, instance, **kwargs):
+    schema_name, item_id = connection.schema_name, instance.id
+
+    def remove():
+        try:
+            client = get_client(schema_name)
+            if client is not None:
+                remove_pharma_items(client, [item_id])
+        except Exception as error:
+            logger.error(f"Error removing pharma item {item_id} of {schema_name} from the index: {error}",
+                         exc_info=True)
+
+    transaction.on_commit(remove)
@@ -3,7 +3,6 @@ from django.db import connection
 from django.db.models import Q, Count
 from django_tenants.utils import schema_context
 from geopy import Nominatim
-from geopy.distance import geodesic
 from rest_framework import viewsets, generics, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
@@ -32,6 +31,8 @@ from mobile_app.serializers import QuickServicesSerializer, \
     DoctorLanguageSpokenSerializer, DoctorSpecializationsSerializer, PharmaItemsSerializer
 
 from healtho_pro_user.models.universal_models import UProDoctorSpecializations, ProDoctorLanguageSpoken
+from mobile_app.geo_index import parse_coordinates, get_nearby_page
+from mobile_app.medicine_search import search_medicines
 from mobile_app.models import QuickServices, MobileAppLabMenus, Category
 from pro_pharmacy.models import PharmaItems, OrderItem, PharmaStock
 
@@ -364,23 +365,8 @@ class DeliveryModeView(generics.ListAPIView):
 
 
 def search_medicines_in_pharmacies(medicine_name):
-    clients = Client.objects.filter(users__HealthcareRegistryType__id=3).distinct()
-    result = []
-
-    for client in clients:
-        with schema_context(client.schema_name):
-            cursor = connection.cursor()
-            cursor.execute("SELECT to_regclass('pro_pharmacy_pharmaitems')")
-            table_exists = cursor.fetchone()[0]
-
-            if table_exists:
-                medicines = PharmaItems.objects.filter(name__icontains=medicine_name)
-                if medicines.exists():
-                    result.append({
-                        "client": client.schema_name,
-                        "pharma_items": PharmaItemsGetSerializer(medicines, many=True).data
-                    })
-    return result
+    # One query on the shared medicine search index instead of a query in every pharmacy schema
+    return search_medicines(medicine_name)
 
 
 @api_view(['GET'])
@@ -403,116 +389,52 @@ def master_search(request):
     return Response(response_data)
 
 
-class NearbyDoctorsView(APIView):
-    def post(self, request, *args, **kwargs):
-        serializer = GetNearestSerializer(data=request.data)
-        if serializer.is_valid():
-            user_location = (
-                float(serializer.validated_data['latitude']),
-                float(serializer.validated_data['longitude'])
-            )
-
-            specialization_id = request.query_params.get('specialization_id')
+def get_nearby_response(request, queryset, serializer_class, default_radius_km):
+    """
+    Rows of the queryset near the location in the request body, nearest first.
+    The radius can be changed with the radius_km query param, the next page is read with the returned next_cursor.
+    """
+    serializer = GetNearestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            nearby_doctors = []
-            doctors = ProDoctor.objects.all()
-            if specialization_id:
-                doctors = doctors.filter(professional_details__specialization__id=specialization_id)
-            for doctor in doctors:
-                if doctor.latitude and doctor.longitude:
-                    doctor_location = (float(doctor.latitude), float(doctor.longitude))
-                    distance = geodesic(user_location, doctor_location).km
-                    if distance <= 2:
-                        nearby_doctors.append(doctor)
+    user_location = parse_coordinates(serializer.validated_data['latitude'], serializer.validated_data['longitude'])
+    if user_location is None:
+        return Response({"message": "Invalid latitude or longitude"}, status=status.HTTP_400_BAD_REQUEST)
 
-            paginator = api_settings.DEFAULT_PAGINATION_CLASS()
-            page = paginator.paginate_queryset(nearby_doctors, request)
-            if page is not None:
-                doctor_serializer = DoctorSerializer(page, many=True)
-                return paginator.get_paginated_response(doctor_serializer.data)
+    page, next_cursor, count, radius_km = get_nearby_page(request, queryset, *user_location, default_radius_km)
+    results = serializer_class([row for distance, row in page], many=True).data
+    for result, (distance, row) in zip(results, page):
+        result['distance_km'] = round(distance, 3)
 
-            doctor_serializer = DoctorSerializer(nearby_doctors, many=True)
-            return Response(doctor_serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'count': count, 'radius_km': radius_km, 'next_cursor': next_cursor, 'results': results})
 
 
-class NearbyHospitalsView(APIView):
+class NearbyDoctorsView(APIView):
     def post(self, request, *args, **kwargs):
-        serializer = GetNearestSerializer(data=request.data)
-        if serializer.is_valid():
-            user_location = (
-                float(serializer.validated_data['latitude']), float(serializer.validated_data['longitude']))
-            nearby_hospitals = []
-            for hospital in BusinessProfiles.objects.filter(provider_type_id=2):
-                if hospital.latitude and hospital.longitude:
-                    hospital_location = (float(hospital.latitude), float(hospital.longitude))
-                    distance = geodesic(user_location, hospital_location).km
-                    if distance <= 10:
-                        nearby_hospitals.append(hospital)
+        doctors = ProDoctor.objects.all()
+        specialization_id = request.query_params.get('specialization_id')
+        if specialization_id:
+            doctors = doctors.filter(professional_details__specialization__id=specialization_id).distinct()
+        return get_nearby_response(request, doctors, DoctorSerializer, default_radius_km=2)
 
-            paginator = api_settings.DEFAULT_PAGINATION_CLASS()
-            page = paginator.paginate_queryset(nearby_hospitals, request)
-            if page is not None:
-                hospital_serializer = HospitalSerializer(page, many=True)
-                return paginator.get_paginated_response(hospital_serializer.data)
 
-            hospital_serializer = HospitalSerializer(nearby_hospitals, many=True)
-            return Response(hospital_serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+class NearbyHospitalsView(APIView):
+    def post(self, request, *args, **kwargs):
+        hospitals = BusinessProfiles.objects.filter(provider_type_id=2)
+        return get_nearby_response(request, hospitals, HospitalSerializer, default_radius_km=10)
 
 
 class NearbyLaboratoriesView(APIView):
     def post(self, request, *args, **kwargs):
-        serializer = GetNearestSerializer(data=request.data)
-        if serializer.is_valid():
-            user_location = (
-                float(serializer.validated_data['latitude']), float(serializer.validated_data['longitude']))
-            nearby_laboratories = []
-            for laboratory in BusinessProfiles.objects.filter(provider_type_id=1):
-                if laboratory.latitude and laboratory.longitude:
-                    laboratory_location = (float(laboratory.latitude), float(laboratory.longitude))
-                    distance = geodesic(user_location, laboratory_location).km
-                    if distance <= 2:
-                        nearby_laboratories.append(laboratory)
-
-            paginator = api_settings.DEFAULT_PAGINATION_CLASS()
-            page = paginator.paginate_queryset(nearby_laboratories, request)
-            if page is not None:
-                hospital_serializer = HospitalSerializer(page, many=True)
-                return paginator.get_paginated_response(hospital_serializer.data)
-
-            hospital_serializer = HospitalSerializer(nearby_laboratories, many=True)
-            return Response(hospital_serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        laboratories = BusinessProfiles.objects.filter(provider_type_id=1)
+        return get_nearby_response(request, laboratories, HospitalSerializer, default_radius_km=2)
 
 
 class NearbyPharmaciesView(APIView):
     def post(self, request, *args, **kwargs):
-        serializer = GetNearestSerializer(data=request.data)
-        if serializer.is_valid():
-            user_location = (
-                float(serializer.validated_data['latitude']), float(serializer.validated_data['longitude']))
-            nearby_pharmacies = []
-            for pharmacy in BusinessProfiles.objects.filter(provider_type_id=3):
-                if pharmacy.latitude and pharmacy.longitude:
-                    pharmacy_location = (float(pharmacy.latitude), float(pharmacy.longitude))
-                    distance = geodesic(user_location, pharmacy_location).km
-                    if distance <= 10:
-                        nearby_pharmacies.append(pharmacy)
-
-            paginator = api_settings.DEFAULT_PAGINATION_CLASS()
-            page = paginator.paginate_queryset(nearby_pharmacies, request)
-            if page is not None:
-                pharmacy_serializer = HospitalSerializer(page, many=True)
-                return paginator.get_paginated_response(pharmacy_serializer.data)
-
-            pharmacy_serializer = HospitalSerializer(nearby_pharmacies, many=True)
-            return Response(pharmacy_serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        pharmacies = BusinessProfiles.objects.filter(provider_type_id=3)
+        return get_nearby_response(request, pharmacies, HospitalSerializer, default_radius_km=10)
 
 
 class LabGlobalPackagesAPIView(generics.ListAPIView):
@@ -0,0 +1,196 @@
+import atexit
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction, close_old_connections
+from django_tenants.utils import schema_context
+
+from healtho_pro_user.models.users_models import HealthOProUser
+from pro_laboratory.models.universal_models import ActivityLogs, ChangesInModels
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityLogEvent:
+    """
+    Compact record of one activity log, holding ids instead of model instances.
+    The user can be given by phone number, the writer resolves the phone numbers of a batch with one query.
+    """
+    __slots__ = ('schema_name', 'user_id', 'user_phone_number', 'fields', 'changes')
+
+    def __init__(self, schema_name, user_id=None, user_phone_number=None, changes=None, **fields):
+        self.schema_name = schema_name
+        self.user_id = user_id
+        self.user_phone_number = user_phone_number
+        self.changes = changes or []
+        self.fields = fields
+
+
+class ActivityLogWriter:
+    """
+    Background thread that writes activity logs in batches.
+    Events are flushed per schema with bulk_create every ACTIVITY_LOG_FLUSH_INTERVAL_MS or as soon as
+    ACTIVITY_LOG_BATCH_SIZE events are waiting. When ACTIVITY_LOG_QUEUE_SIZE events are waiting, new events
+    are dropped and counted rather than slowing down the requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._events = queue.Queue(maxsize=getattr(settings, 'ACTIVITY_LOG_QUEUE_SIZE', 10000))
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_flush_on = None
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def enqueue(self, event):
+        self.start()
+        try:
+            self._events.put_nowait(event)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Activity log queue is full, dropped a {event.fields.get('model')} log of "
+                           f"{event.schema_name}")
+
+    def _next_batch(self):
+        batch_size = getattr(settings, 'ACTIVITY_LOG_BATCH_SIZE', 200)
+        deadline = time.monotonic() + getattr(settings, 'ACTIVITY_LOG_FLUSH_INTERVAL_MS', 500) / 1000
+
+        batch = [self._events.get()]
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._events.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._events.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _run(self):
+        while True:
+            try:
+                self.write(self._next_batch())
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        # Writes the waiting events in the calling thread, used when the process exits
+        batch = self._drain()
+        if batch:
+            self.write(batch)
+
+    def write(self, batch):
+        events_by_schema = {}
+        for event in batch:
+            events_by_schema.setdefault(event.schema_name, []).append(event)
+
+        user_ids = {}
+        phone_numbers = {event.user_phone_number for event in batch if event.user_phone_number and not event.user_id}
+        if phone_numbers:
+            try:
+                with schema_context('public'):
+                    user_ids = dict(HealthOProUser.objects.filter(phone_number__in=phone_numbers).values_list(
+                        'phone_number', 'id'))
+            except Exception as error:
+                logger.error(f"Error getting users of activity logs: {error}", exc_info=True)
+
+        for schema_name, events in events_by_schema.items():
+            try:
+                with schema_context(schema_name):
+                    write_activity_logs(events, user_ids)
+                self.written += len(events)
+            except Exception as error:
+                self.failed += len(events)
+                logger.error(f"Error writing {len(events)} activity logs of {schema_name}: {error}", exc_info=True)
+        self.last_flush_on = time.time()
+
+    def get_metrics(self):
+        return {
+            'queue_depth': self._events.qsize(),
+            'queue_size': self._events.maxsize,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'last_flush_on': self.last_flush_on,
+        }
+
+
+def write_activity_logs(events, user_ids):
+    # Changes, logs and the links between them, one bulk insert each
+    with transaction.atomic():
+        logs = ActivityLogs.objects.bulk_create([
+            ActivityLogs(user_id=event.user_id or user_ids.get(event.user_phone_number), **event.fields)
+            for event in events])
+
+        changes = ChangesInModels.objects.bulk_create([
+            ChangesInModels(field_name=field_name, before_value=before_value, after_value=after_value)
+            for event in events for field_name, before_value, after_value in event.changes])
+
+        links, position = [], 0
+        for log, event in zip(logs, events):
+            for change in changes[position:position + len(event.changes)]:
+                links.append(ActivityLogs.changes.through(activitylogs_id=log.id, changesinmodels_id=change.id))
+            position += len(event.changes)
+        if links:
+            ActivityLogs.changes.through.objects.bulk_create(links)
+
+
+activity_log_writer = ActivityLogWriter()
+
+
+def get_change_value(value):
+    # Stored as text the way ChangesInModels would convert it, so that events hold no model instances
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def log_activity(user=None, user_phone_number=None, lab_staff=None, client=None, patient=None, changes=None,
+                 schema_name=None, **fields):
+    """
+    Queues an activity log of the current schema, or of schema_name.
+    It is queued once the current transaction commits, so logs of rolled back saves are never written and
+    the rows they refer to exist when the writer inserts them.
+    changes is a list of (field_name, before_value, after_value).
+    """
+    event = ActivityLogEvent(
+        schema_name=schema_name or connection.schema_name,
+        user_id=user.id if user else None,
+        user_phone_number=user_phone_number,
+        changes=[(field_name, get_change_value(before_value), get_change_value(after_value))
+                 for field_name, before_value, after_value in changes or []],
+        lab_staff_id=lab_staff.id if lab_staff else None,
+        client_id=client.id if client else None,
+        patient_id=patient.id if patient else None,
+        **fields)
+
+    if getattr(settings, 'ACTIVITY_LOG_MODE', 'async') == 'sync':
+        transaction.on_commit(lambda: activity_log_writer.write([event]))
+    else:
+        transaction.on_commit(lambda: activity_log_writer.enqueue(event))
+
+
+def get_activity_log_metrics():
+    return activity_log_writer.get_metrics()
@@ -0,0 +1,326 @@
+"""
+Bulk SMS and WhatsApp campaigns sent in the background as BulkMessagingJob rows.
+
+A job resolves its template and vendor once, then works through the recipients in batches of
+BULK_MESSAGING_BATCH_SIZE: the messages of a batch are rendered together in the job thread, sent by
+BULK_MESSAGING_CONCURRENCY threads over one pooled session, and saved with their logs in bulk together with the
+progress of the job, which the job status endpoint reports.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction, close_old_connections
+from django.db.models import F
+from django_tenants.utils import schema_context
+from requests.adapters import HTTPAdapter
+
+from healtho_pro_user.models.users_models import Client
+from pro_laboratory.messaging_template_engine import render_messaging_templates, \
+    render_messaging_template_with_values
+from pro_laboratory.models.bulk_messaging_models import BulkMessagingJob, BulkMessagingHistory, \
+    BulkMessagingLogs, BulkSendSMSData, BulkSendAndSaveWhatsAppSMSData, BulkWhatsAppMessagingLogs, \
+    BusinessMessagesCredits
+from pro_universal_data.models import MessagingVendors
+from pro_universal_data.template_data import template_data_many
+from pro_universal_data.views import FAST2SMS_KEY
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+FAST2SMS_URL = "https://www.fast2sms.com/dev/bulkV2"
+META_WHATSAPP_KEY = os.environ.get('META_WHATSAPP_KEY')
+META_WHATSAPP_URL = f"https://graph.facebook.com/v18.0/{os.environ.get('META_WHATSAPP_PHONE_ID')}/messages"
+
+def get_sms_request(template, numbers, template_values):
+    return {
+        'method': 'GET',
+        'url': FAST2SMS_URL,
+        'headers': {'cache-control': "no-cache"},
+        'params': {
+            "authorization": FAST2SMS_KEY,
+            "route": template.route,
+            "sender_id": template.sender_id,
+            "message": template.templateId,
+            "variables_values": '|'.join(template_values.values()),
+            "mapping": '|'.join(template_values.keys()),
+            "numbers": numbers,
+        },
+    }
+
+
+def get_whatsapp_request(template, numbers, template_values):
+    return {
+        'method': 'POST',
+        'url': META_WHATSAPP_URL,
+        'headers': {'Authorization': f'Bearer {META_WHATSAPP_KEY}', 'Content-Type': 'application/json'},
+        'json': {
+            'messaging_product': 'whatsapp',
+            'to': numbers,
+            'type': 'template',
+            'template': {
+                'name': template.templateId,
+                'language': {'code': 'en'},
+                "components": [{
+                    "type": "body",
+                    "parameters": [{"type": "text", "text": value} for value in template_values.values()]
+                }]
+            }
+        },
+    }
+
+
+def get_sms_status(response):
+    # Response code and message of a Fast2SMS response, as BulkMessagingLogsViewSet saves them
+    response_json = response.json()
+    return response_json.get('status_code', response.status_code), response_json.get('message')
+
+
+def get_whatsapp_status(response):
+    # Response code and message of a Meta WhatsApp response, as BulkWhatsAppMessagingLogsViewSet saves them
+    response_json = response.json()
+    if response.status_code == 200:
+        return response.status_code, response_json['messages'][0].get('message_status')
+    return response.status_code, str(response_json['error']['message'])
+
+
+class BulkMessagingChannel:
+    def __init__(self, data_model, log_model, template_field, vendor_name, get_request, get_status):
+        self.data_model = data_model
+        self.log_model = log_model
+        self.template_field = template_field
+        self.vendor_name = vendor_name
+        self.get_request = get_request
+        self.get_status = get_status
+
+
+CHANNELS = {
+    'SMS': BulkMessagingChannel(BulkSendSMSData, BulkMessagingLogs, 'sms_template', 'Fast2SMS',
+                                get_sms_request, get_sms_status),
+    'WhatsApp': BulkMessagingChannel(BulkSendAndSaveWhatsAppSMSData, BulkWhatsAppMessagingLogs, 'mwa_template',
+                                     'Meta WhatsApp', get_whatsapp_request, get_whatsapp_status),
+}
+
+
+def get_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def send_request(session, request):
+    # Runs in the sender threads, so it only talks to the vendor and never to the database
+    try:
+        return session.request(timeout=getattr(settings, 'BULK_MESSAGING_REQUEST_TIMEOUT_SECONDS', 30), **request)
+    except Exception as error:
+        return error
+
+
+class BulkMessagingJobRunner:
+    """
+    Sends the messages of one job. recipients are dicts with the numbers and either the search_id of a patient,
+    doctor or staff whose details fill the tags of the template, or the details themselves keyed by "{tag}".
+    """
+
+    def __init__(self, job, recipients, client):
+        self.job = job
+        self.recipients = recipients
+        self.client = client
+        self.template = job.template
+        self.channel = CHANNELS[job.template.messaging_service_types.name]
+        self.vendor = MessagingVendors.objects.get(name=self.channel.vendor_name)
+        self.sent = 0
+        self.failed = 0
+
+    def render(self, recipients):
+        """
+        Returns the message and template values of each recipient. The details of the recipients given by their
+        search_id are read together with template_data_many() and rendered in one pass.
+        """
+        search_ids = [recipient['search_id'] for recipient in recipients if recipient.get('details') is None]
+        rendered = iter([])
+        if search_ids:
+            details_by_id = {}
+            try:
+                details_by_id = template_data_many(search_ids, self.job.messaging_send_type, self.client)
+            except Exception as error:
+                logger.error(f"While fetching details of bulk messaging job {self.job.pk} - {error}")
+            rendered = iter(render_messaging_templates(self.template.templateContent,
+                                                       [details_by_id.get(search_id, {}) for search_id in search_ids]))
+
+        return [render_messaging_template_with_values(self.template.templateContent, recipient['details'])
+                if recipient.get('details') is not None else next(rendered) for recipient in recipients]
+
+    def save_batch(self, messages, responses, skipped=0):
+        # Saves the messages of a batch with their logs and adds the sent ones to the credits used and the job
+        sent_on = datetime.now()
+        data = [self.channel.data_model(**{self.channel.template_field: self.template},
+                                        search_id=recipient.get('search_id'), numbers=recipient['numbers'],
+                                        messaging_send_type=self.job.messaging_send_type, message=content,
+                                        sent_on=sent_on)
+                for recipient, content in messages]
+
+        logs = []
+        sent = 0
+        for sms, response in zip(data, responses):
+            if isinstance(response, Exception):
+                response_code, response_message = None, f"{response}"
+            else:
+                try:
+                    response_code, response_message = self.channel.get_status(response)
+                except Exception as error:
+                    response_code, response_message = response.status_code, f"{error}"
+                if response.status_code == 200:
+                    sent += 1
+            logs.append(self.channel.log_model(sms=sms, messaging_vendor=self.vendor, response_code=response_code,
+                                               status=f"{response_code}, {response_message}", message=sms.message,
+                                               businessid=self.template.sender_id,
+                                               messaging_send_type=self.job.messaging_send_type,
+                                               numbers=sms.numbers, sent_on=sent_on))
+
+        with transaction.atomic():
+            self.channel.data_model.objects.bulk_create(data)
+            self.channel.log_model.objects.bulk_create(logs)
+            if sent:
+                credits = BusinessMessagesCredits.objects.filter(
+                    messaging_service_types=self.template.messaging_service_types).last()
+                if credits:
+                    BusinessMessagesCredits.objects.filter(pk=credits.pk).update(
+                        total_messages=F('total_messages') + sent)
+            BulkMessagingJob.objects.filter(pk=self.job.pk).update(
+                sent_messages=F('sent_messages') + sent,
+                failed_messages=F('failed_messages') + len(data) - sent + skipped, last_updated=datetime.now())
+        return sent
+
+    def run(self):
+        batch_size = max(1, getattr(settings, 'BULK_MESSAGING_BATCH_SIZE', 100))
+        concurrency = max(1, getattr(settings, 'BULK_MESSAGING_CONCURRENCY', 8))
+
+        with get_session(concurrency) as session, ThreadPoolExecutor(max_workers=concurrency) as senders:
+            for start in range(0, len(self.recipients), batch_size):
+                batch = self.recipients[start:start + batch_size]
+                recipients = [recipient for recipient in batch if recipient.get('numbers')]
+                skipped = len(batch) - len(recipients)
+                messages = [(recipient, content, template_values) for recipient, (content, template_values)
+                            in zip(recipients, self.render(recipients))]
+
+                requests_of_batch = [self.channel.get_request(self.template, recipient['numbers'], template_values)
+                                     for recipient, _, template_values in messages]
+                responses = list(senders.map(lambda request: send_request(session, request), requests_of_batch))
+
+                batch_sent = self.save_batch([(recipient, content) for recipient, content, _ in messages], responses,
+                                             skipped)
+                self.sent += batch_sent
+                self.failed += len(messages) - batch_sent + skipped
+
+
+def run_bulk_messaging_job(job_id, client):
+    # Claims the job if it is still queued, so a job notified twice is only sent once
+    now = datetime.now()
+    if not BulkMessagingJob.objects.filter(pk=job_id, status=BulkMessagingJob.QUEUED).update(
+            status=BulkMessagingJob.RUNNING, started_on=now, last_updated=now):
+        return
+    job = BulkMessagingJob.objects.select_related('template__messaging_service_types', 'messaging_send_type',
+                                                  'created_by').get(pk=job_id)
+
+    runner = None
+    job_status, error = BulkMessagingJob.COMPLETED, None
+    try:
+        runner = BulkMessagingJobRunner(job, job.recipients, client)
+        runner.run()
+    except Exception as run_error:
+        logger.error(f"Bulk messaging job {job_id} failed: {run_error}", exc_info=True)
+        job_status, error = BulkMessagingJob.FAILED, f"{run_error}"
+
+    # The history records the messages sent even when the job stopped half way, as their credits are used
+    sent = runner.sent if runner else 0
+    history = BulkMessagingHistory.objects.create(template=job.template, sent_messages=sent,
+                                                  created_by=job.created_by)
+    BulkMessagingJob.objects.filter(pk=job_id).update(status=job_status, error=error, history=history,
+                                                      finished_on=datetime.now())
+    if runner:
+        logger.info(f"Bulk messaging job {job_id} {job_status}, {runner.sent} sent and {runner.failed} failed")
+
+
+class BulkMessagingJobQueue:
+    """
+    BULK_MESSAGING_MAX_JOBS daemon threads running the jobs they are notified of, one at a time each.
+    The job rows are the durable queue, a job lost from the in-process queue by a restart is notified again by
+    requeue_bulk_messaging_jobs().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        self._threads = []
+
+    def start(self):
+        if not self._threads:
+            with self._lock:
+                if not self._threads:
+                    for _ in range(max(1, getattr(settings, 'BULK_MESSAGING_MAX_JOBS', 2))):
+                        thread = threading.Thread(target=self._run, daemon=True)
+                        thread.start()
+                        self._threads.append(thread)
+
+    def notify(self, schema_name, job_id):
+        self.start()
+        self._jobs.put((schema_name, job_id))
+
+    def _run(self):
+        while True:
+            schema_name, job_id = self._jobs.get()
+            try:
+                client = Client.objects.filter(schema_name=schema_name).first()
+                with schema_context(schema_name):
+                    run_bulk_messaging_job(job_id, client)
+            except Exception as error:
+                logger.error(f"Error running bulk messaging job {job_id} of {schema_name}: {error}", exc_info=True)
+            finally:
+                close_old_connections()
+
+
+bulk_messaging_job_queue = BulkMessagingJobQueue()
+
+
+def start_bulk_messaging_job(template, messaging_send_type, recipients, created_by=None):
+    """
+    Saves a queued job for the recipients and starts it in the background once the current transaction commits.
+    Returns the job, whose progress is served by BulkMessagingJobViewSet.
+    """
+    job = BulkMessagingJob.objects.create(template=template, messaging_send_type=messaging_send_type,
+                                          recipients=recipients, total_messages=len(recipients),
+                                          created_by=created_by)
+    schema_name = connection.schema_name
+    transaction.on_commit(lambda: bulk_messaging_job_queue.notify(schema_name, job.id))
+    return job
+
+
+def requeue_bulk_messaging_jobs():
+    """
+    Run by the scheduler. Jobs queued for longer than BULK_MESSAGING_JOB_STALE_SECONDS are notified again, in
+    case the process they were queued in restarted. Running jobs that made no progress for as long are marked as
+    failed, they are not resumed as the messages of the batch they were sending may already be delivered.
+    """
+    stale_before = datetime.now() - timedelta(seconds=getattr(settings, 'BULK_MESSAGING_JOB_STALE_SECONDS', 900))
+    for client in Client.objects.exclude(schema_name='public'):
+        try:
+            with schema_context(client.schema_name):
+                BulkMessagingJob.objects.filter(status=BulkMessagingJob.RUNNING, last_updated__lt=stale_before).update(
+                    status=BulkMessagingJob.FAILED, error='Interrupted before all messages were sent',
+                    finished_on=datetime.now())
+                job_ids = list(BulkMessagingJob.objects.filter(
+                    status=BulkMessagingJob.QUEUED, last_updated__lt=stale_before).values_list('id', flat=True))
+                # Notified jobs are not notified again before they are stale once more
+                BulkMessagingJob.objects.filter(id__in=job_ids).update(last_updated=datetime.now())
+            for job_id in job_ids:
+                bulk_messaging_job_queue.notify(client.schema_name, job_id)
+        except Exception as error:
+            logger.error(f"Error checking bulk messaging jobs of {client.schema_name}: {error}")
@@ -0,0 +1,226 @@
+"""
+Daily rollups of collections, registrations, tests and referral revenue of a tenant.
+
+Saves of the source rows mark their date as pending. The rollups of a pending date are recomputed from the
+source rows the next time a report reads them, so the reports read rollups for past dates and raw rows only
+for today. The rebuild_daily_rollups command backfills and reconciles them.
+"""
+from datetime import datetime, time, timedelta, date as date_type
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum, Count, DecimalField, F
+from django.db.models.functions import Coalesce, ExtractHour, TruncMonth
+
+from pro_laboratory.models.patient_models import Patient, LabPatientReceipts, LabPatientRefund, LabPatientTests
+from pro_laboratory.models.rollup_models import DailyRollupPendingDate, DailyCollectionRollup, \
+    DailyRegistrationRollup, DailyTestRollup, DailyReferralRollup
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_MODELS = [DailyCollectionRollup, DailyRegistrationRollup, DailyTestRollup, DailyReferralRollup]
+
+
+def to_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def mark_rollup_dates(dates):
+    # The version of a pending date counts the saves since its rollups were last recomputed
+    dates = sorted({to_date(value) for value in dates if value})
+    if not dates:
+        return
+    table = connection.ops.quote_name(DailyRollupPendingDate._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (date, version) VALUES {', '.join(['(%s, 1)'] * len(dates))} "
+            f"ON CONFLICT (date) DO UPDATE SET version = {table}.version + 1", dates)
+
+
+def mark_rollup_dates_on_commit(*dates):
+    # Marked after the commit, so that a save never holds the lock of the pending date of the day
+    def mark():
+        try:
+            mark_rollup_dates(dates)
+        except Exception as error:
+            logger.error(f"Error marking rollup dates {dates} of {connection.schema_name}: {error}", exc_info=True)
+
+    transaction.on_commit(mark)
+
+
+def get_day_filter(date):
+    day_start = datetime.combine(date, time.min)
+    return {'added_on__gte': day_start, 'added_on__lt': day_start + timedelta(days=1)}
+
+
+def compute_collection_rollups(date):
+    day = get_day_filter(date)
+    rollups = {}
+
+    def get_rollup(lab_staff_id, pay_mode_id):
+        key = (lab_staff_id, pay_mode_id)
+        if key not in rollups:
+            rollups[key] = DailyCollectionRollup(date=date, lab_staff_id=lab_staff_id, pay_mode_id=pay_mode_id)
+        return rollups[key]
+
+    for row in LabPatientReceipts.objects.filter(**day).values('created_by_id', 'payments__pay_mode_id').annotate(
+            collected_amount=Sum('payments__paid_amount'), receipts_count=Count('id', distinct=True)):
+        if row['payments__pay_mode_id'] is None:
+            continue
+        rollup = get_rollup(row['created_by_id'], row['payments__pay_mode_id'])
+        rollup.collected_amount = row['collected_amount'] or 0
+        rollup.receipts_count = row['receipts_count']
+
+    for row in LabPatientRefund.objects.filter(**day).values('created_by_id', 'refund_mode_id').annotate(
+            refund_amount=Sum('refund'), refunds_count=Count('id')):
+        rollup = get_rollup(row['created_by_id'], row['refund_mode_id'])
+        rollup.refund_amount = row['refund_amount'] or 0
+        rollup.refunds_count = row['refunds_count']
+
+    return list(rollups.values())
+
+
+def compute_registration_rollups(date):
+    return [
+        DailyRegistrationRollup(date=date, hour=row['hour'], lab_staff_id=row['created_by_id'],
+                                branch_id=row['branch_id'], patients_count=row['patients_count'])
+        for row in Patient.objects.filter(**get_day_filter(date)).annotate(hour=ExtractHour('added_on')).values(
+            'hour', 'created_by_id', 'branch_id').annotate(patients_count=Count('id'))]
+
+
+def compute_test_rollups(date):
+    return [
+        DailyTestRollup(date=date, global_test_id=row['LabGlobalTestId_id'], department_id=row['department_id'],
+                        branch_id=row['branch_id'], is_package_test=row['is_package_test'],
+                        tests_count=row['tests_count'], total_price=row['total_price'] or 0)
+        for row in LabPatientTests.objects.filter(**get_day_filter(date)).exclude(
+            status_id__name='Cancelled').values(
+            'LabGlobalTestId_id', 'department_id', 'branch_id', 'is_package_test').annotate(
+            tests_count=Count('id'), total_price=Sum('price'))]
+
+
+def compute_referral_rollups(date):
+    return [
+        DailyReferralRollup(date=date, referral_doctor_id=row['referral_doctor_id'],
+                            patients_count=row['patients_count'], total_price=row['total_price'],
+                            total_cost=row['total_cost'])
+        for row in Patient.objects.filter(**get_day_filter(date), referral_doctor__isnull=False).values(
+            'referral_doctor_id').annotate(
+            patients_count=Count('id'),
+            total_price=Coalesce(Sum('labpatientinvoice__total_price'), 0, output_field=DecimalField()),
+            total_cost=Coalesce(Sum('labpatientinvoice__total_cost'), 0, output_field=DecimalField()))]
+
+
+def get_rollup_rows(date):
+    # Rows of the date as comparable tuples, used to tell whether a refresh changed anything
+    rows = set()
+    for model in ROLLUP_MODELS:
+        fields = [field.attname for field in model._meta.concrete_fields if field.name != 'id']
+        rows.update((model.__name__, *row) for row in model.objects.filter(date=date).values_list(*fields))
+    return rows
+
+
+def refresh_rollup_date(date, force=False):
+    """
+    Recomputes the rollups of a pending date from the source rows.
+    The pending row is locked while the date is recomputed, so concurrent refreshes of a date skip it and the
+    saves committed meanwhile mark the date again once the lock is released.
+    With force the date is recomputed even when it is not pending, returns whether its rollups changed.
+    """
+    if force:
+        mark_rollup_dates([date])
+
+    with transaction.atomic():
+        pending = DailyRollupPendingDate.objects.select_for_update(skip_locked=not force).filter(date=date).first()
+        if pending is None:
+            return False
+
+        before = get_rollup_rows(date) if force else None
+        for model in ROLLUP_MODELS:
+            model.objects.filter(date=date).delete()
+        DailyCollectionRollup.objects.bulk_create(compute_collection_rollups(date))
+        DailyRegistrationRollup.objects.bulk_create(compute_registration_rollups(date))
+        DailyTestRollup.objects.bulk_create(compute_test_rollups(date))
+        DailyReferralRollup.objects.bulk_create(compute_referral_rollups(date))
+        pending.delete()
+
+        return before != get_rollup_rows(date) if force else True
+
+
+def refresh_pending_dates(start_date, end_date):
+    for date in DailyRollupPendingDate.objects.filter(date__range=[start_date, end_date]).order_by(
+            'date').values_list('date', flat=True):
+        refresh_rollup_date(date)
+
+
+def can_use_rollups(end_date):
+    # Today is still changing, so only ranges that end before today are read from rollups
+    return getattr(settings, 'ANALYTICS_ROLLUPS_ENABLED', True) and to_date(end_date) < date_type.today()
+
+
+def get_rollups(model, start_date, end_date):
+    start_date, end_date = to_date(start_date), to_date(end_date)
+    refresh_pending_dates(start_date, end_date)
+    return model.objects.filter(date__range=[start_date, end_date])
+
+
+def get_referral_totals(doctor_ids, start_date, end_date, by_month=False):
+    """
+    Patients, invoice total price and total cost per referral doctor, {(doctor_id, (year, month)): totals}
+    by month or {(doctor_id, None): totals}. Read from rollups when the range ends before today.
+    """
+    if can_use_rollups(end_date):
+        rows = get_rollups(DailyReferralRollup, start_date, end_date).filter(referral_doctor_id__in=doctor_ids)
+        month_field = 'date'
+        totals = {'patients_count': Sum('patients_count'), 'total_price': Sum('total_price'),
+                  'total_cost': Sum('total_cost')}
+    else:
+        rows = Patient.objects.filter(referral_doctor_id__in=doctor_ids, added_on__date__gte=to_date(start_date),
+                                      added_on__date__lte=to_date(end_date))
+        month_field = 'added_on'
+        totals = {'patients_count': Count('id'), 'total_price': Sum('labpatientinvoice__total_price'),
+                  'total_cost': Sum('labpatientinvoice__total_cost')}
+
+    group_by = ['referral_doctor_id']
+    if by_month:
+        rows = rows.annotate(month=TruncMonth(month_field))
+        group_by.append('month')
+
+    referral_totals = {}
+    for row in rows.values(*group_by).annotate(**totals).order_by():
+        month = (row['month'].year, row['month'].month) if by_month else None
+        referral_totals[(row['referral_doctor_id'], month)] = {
+            'patients_count': row['patients_count'] or 0,
+            'total_price': row['total_price'] or 0,
+            'total_cost': row['total_cost'] or 0,
+        }
+    return referral_totals
+
+
+def get_test_counts(start_date, end_date):
+    """
+    Non package tests per global test between the dates, most done first, from rollups.
+    Rows hold LabGlobalTestId and patients_count like the grouped LabPatientTests query they replace.
+    """
+    return get_rollups(DailyTestRollup, start_date, end_date).filter(is_package_test=False).values(
+        LabGlobalTestId=F('global_test_id')).annotate(patients_count=Sum('tests_count')).order_by('-patients_count')
+
+
+def get_staff_collections(lab_staff, start_date, end_date):
+    # Collected and refunded amounts of a staff per pay mode name, from rollups
+    collections = {}
+    for row in get_rollups(DailyCollectionRollup, start_date, end_date).filter(lab_staff=lab_staff).values(
+            'pay_mode__name').annotate(collected_amount=Sum('collected_amount'), refund_amount=Sum('refund_amount')):
+        collections[row['pay_mode__name']] = {'collected_amount': row['collected_amount'],
+                                              'refund_amount': row['refund_amount']}
+    return collections
+
+
+def get_registration_counts(start_date, end_date, branches=None):
+    # Patients registered per date, from rollups
+    rows = get_rollups(DailyRegistrationRollup, start_date, end_date)
+    if branches is not None:
+        rows = rows.filter(branch__in=branches)
+    return dict(rows.values('date').annotate(total=Sum('patients_count')).values_list('date', 'total'))
@@ -0,0 +1,118 @@
+"""
+Dashboard widgets computed with one grouped or conditional aggregate query each,
+instead of an aggregate per payment mode, per total or per day.
+"""
+import calendar
+from datetime import timedelta
+
+from django.db.models import Sum, Count, Q, DecimalField
+from django.db.models.functions import Coalesce, ExtractHour, TruncDate, TruncMonth
+
+
+def get_collections_by_pay_mode(receipts, refunds, payment_modes, start_date, end_date):
+    """
+    New collections, previous due collections, refunds and subtotals per payment mode name for the receipts
+    and refunds added between start_date and end_date, with a 'total' of each.
+    New collections are payments of invoices added in the same dates, previous due collections payments of
+    invoices added before start_date.
+    """
+    new_invoices = Q(invoiceid__added_on__date__range=[start_date, end_date])
+    previous_invoices = Q(invoiceid__added_on__lt=start_date)
+    payments = receipts.filter(added_on__date__range=[start_date, end_date]).values(
+        'payments__pay_mode__name').annotate(
+        new_collections=Sum('payments__paid_amount', filter=new_invoices),
+        previous_due_collections=Sum('payments__paid_amount', filter=previous_invoices),
+    )
+    payments_by_mode = {row['payments__pay_mode__name']: row for row in payments}
+
+    refunds_by_mode = dict(refunds.filter(added_on__date__range=[start_date, end_date]).values(
+        'refund_mode__name').annotate(total=Sum('refund')).values_list('refund_mode__name', 'total'))
+
+    new_collections = {}
+    previous_due_collections = {}
+    refund_collections = {}
+    subtotals = {}
+    for mode in payment_modes:
+        mode_payments = payments_by_mode.get(mode, {})
+        new_collections[mode] = mode_payments.get('new_collections') or 0
+        previous_due_collections[mode] = mode_payments.get('previous_due_collections') or 0
+        refund_collections[mode] = refunds_by_mode.get(mode) or 0
+        subtotals[mode] = new_collections[mode] + previous_due_collections[mode] - refund_collections[mode]
+
+    new_collections['total'] = sum(new_collections[mode] for mode in payment_modes)
+    previous_due_collections['total'] = sum(previous_due_collections[mode] for mode in payment_modes)
+    refund_collections['total'] = sum(refund_collections[mode] for mode in payment_modes)
+    subtotals['total'] = sum(subtotals[mode] for mode in payment_modes)
+
+    return {
+        'new_collections': new_collections,
+        'previous_due_collections': previous_due_collections,
+        'refund_collections': refund_collections,
+        'subtotals': subtotals
+    }
+
+
+def get_invoice_totals(invoices):
+    # Totals of the invoices and their count, which tells an empty queryset apart from one summing to 0
+    return invoices.aggregate(
+        invoice_count=Count('id'),
+        total_amount=Coalesce(Sum('total_cost'), 0, output_field=DecimalField()),
+        total_discount=Coalesce(Sum('total_discount'), 0, output_field=DecimalField()),
+        net_amount=Coalesce(Sum('total_price'), 0, output_field=DecimalField()),
+        balance_amount=Coalesce(Sum('total_due'), 0, output_field=DecimalField()),
+        refund_amount=Coalesce(Sum('total_refund'), 0, output_field=DecimalField()),
+        total_paid=Coalesce(Sum('total_paid'), 0, output_field=DecimalField()),
+    )
+
+
+def get_patient_overview(patients):
+    counts = patients.aggregate(
+        total_patients=Count('id'),
+        male_count=Count('id', filter=Q(gender__name='Male')),
+        female_count=Count('id', filter=Q(gender__name='Female')),
+        age_0_18=Count('id', filter=Q(age__lte=18)),
+        age_19_30=Count('id', filter=Q(age__gte=19, age__lte=30)),
+        age_31_50=Count('id', filter=Q(age__gte=31, age__lte=50)),
+        age_above_50=Count('id', filter=Q(age__gt=50)),
+    )
+    return {
+        'total_patients': counts['total_patients'],
+        'male_count': counts['male_count'],
+        'female_count': counts['female_count'],
+        'age_group': {
+            '0_18': counts['age_0_18'],
+            '19_30': counts['age_19_30'],
+            '31_50': counts['age_31_50'],
+            'above_50': counts['age_above_50'],
+        }
+    }
+
+
+def get_patient_counts_by_hour(patients):
+    counts = dict(patients.annotate(hour=ExtractHour('added_on')).values('hour').annotate(
+        total=Count('id')).values_list('hour', 'total'))
+    return {hour: counts.get(hour, 0) for hour in range(24)}
+
+
+def get_patient_counts_by_date(patients, start_date, end_date, date_format):
+    # Count of every date from start_date up to, not including, end_date, keyed by the formatted date
+    counts = dict(patients.annotate(date=TruncDate('added_on')).values('date').annotate(
+        total=Count('id')).values_list('date', 'total'))
+    return format_counts_by_date(counts, start_date, end_date, date_format)
+
+
+def format_counts_by_date(counts, start_date, end_date, date_format):
+    patient_counts = {}
+    current_date = start_date
+    while current_date < end_date:
+        patient_counts[current_date.strftime(date_format)] = counts.get(current_date, 0)
+        current_date += timedelta(days=1)
+    return patient_counts
+
+
+def get_patient_counts_by_month(patients):
+    counts = {}
+    for month, total in patients.annotate(month=TruncMonth('added_on')).values('month').annotate(
+            total=Count('id')).values_list('month', 'total'):
+        counts[month.month] = counts.get(month.month, 0) + total
+    return {calendar.month_name[month_num]: counts.get(month_num, 0) for month_num in range(1, 13)}
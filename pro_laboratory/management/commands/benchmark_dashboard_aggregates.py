@@ -0,0 +1,182 @@
+import calendar
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum, Q, DecimalField
+from django.db.models.functions import Coalesce
+from django.test.utils import CaptureQueriesContext
+from django_tenants.utils import schema_context
+
+from pro_laboratory.dashboard_aggregates import get_collections_by_pay_mode, get_invoice_totals, \
+    get_patient_overview, get_patient_counts_by_date, get_patient_counts_by_month
+from pro_laboratory.models.patient_models import Patient, LabPatientInvoice, LabPatientPayments, \
+    LabPatientReceipts, LabPatientRefund
+from pro_universal_data.models import ULabPaymentModeType
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Seeds patients, invoices, receipts and refunds in a tenant schema, compares the query count and '
+            'latency of the dashboard widgets computed per payment mode, per total and per day with the grouped '
+            'queries of pro_laboratory.dashboard_aggregates, then rolls the seeded rows back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schema', required=True, help='Tenant schema to seed and query')
+        parser.add_argument('--patients', type=int, default=5000, help='Patients to seed, default 5000')
+        parser.add_argument('--days', type=int, default=90, help='Days the seeded rows are spread over, default 90')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each widget, the best is reported')
+
+    def handle(self, *args, **options):
+        with schema_context(options['schema']):
+            payment_modes = list(ULabPaymentModeType.objects.all())
+            if not payment_modes:
+                raise CommandError('No payment modes found, at least one ULabPaymentModeType is needed')
+            try:
+                with transaction.atomic():
+                    self.seed(payment_modes, options['patients'], options['days'])
+                    self.compare(payment_modes, options['days'], options['repeat'])
+                    raise Rollback
+            except Rollback:
+                self.stdout.write('Seeded rows rolled back')
+
+    def seed(self, payment_modes, patients_count, days):
+        now = datetime.now()
+        dates = [now - timedelta(days=random.randrange(days), hours=random.randrange(24))
+                 for _ in range(patients_count)]
+
+        patients = Patient.objects.bulk_create([
+            Patient(name=f'Benchmark patient {number}', age=random.randrange(1, 90),
+                    mobile_number=f'9{number:09d}') for number in range(patients_count)])
+        invoices = LabPatientInvoice.objects.bulk_create([
+            LabPatientInvoice(patient=patient, invoice_id=f'BENCH{patient.id}', total_cost=Decimal(500),
+                              total_price=Decimal(450), total_discount=Decimal(50), total_paid=Decimal(300),
+                              total_due=Decimal(150)) for patient in patients])
+        payments = LabPatientPayments.objects.bulk_create([
+            LabPatientPayments(pay_mode=random.choice(payment_modes), paid_amount=Decimal(300)) for _ in patients])
+        receipts = LabPatientReceipts.objects.bulk_create([
+            LabPatientReceipts(patient=patient, invoiceid=invoice, Receipt_id=f'BENCH{patient.id}')
+            for patient, invoice in zip(patients, invoices)])
+        LabPatientReceipts.payments.through.objects.bulk_create([
+            LabPatientReceipts.payments.through(labpatientreceipts_id=receipt.id, labpatientpayments_id=payment.id)
+            for receipt, payment in zip(receipts, payments)])
+        refunds = LabPatientRefund.objects.bulk_create([
+            LabPatientRefund(patient=patient, refund=Decimal(50), refund_mode=random.choice(payment_modes),
+                             refund_id=f'BENCH{patient.id}') for patient in patients[::10]])
+
+        # added_on is set on insert, the seeded dates are written afterwards
+        for rows in [patients, invoices, receipts]:
+            for row, added_on in zip(rows, dates):
+                row.added_on = added_on
+            type(rows[0]).objects.bulk_update(rows, ['added_on'], batch_size=1000)
+        for refund, added_on in zip(refunds, dates[::10]):
+            refund.added_on = added_on
+        LabPatientRefund.objects.bulk_update(refunds, ['added_on'], batch_size=1000)
+
+        self.stdout.write(f'Seeded {len(patients)} patients, invoices and receipts and {len(refunds)} refunds '
+                          f'over {days} days')
+
+    def measure(self, function, repeat):
+        best, queries, result = None, 0, None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                result = function()
+                elapsed = time.perf_counter() - started
+            queries = len(captured.captured_queries)
+            best = elapsed if best is None else min(best, elapsed)
+        return result, queries, best * 1000
+
+    def compare(self, payment_modes, days, repeat):
+        mode_names = [mode.name for mode in payment_modes]
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=days)
+        receipts, refunds = LabPatientReceipts.objects.all(), LabPatientRefund.objects.all()
+        invoices, patients = LabPatientInvoice.objects.all(), Patient.objects.all()
+
+        widgets = [
+            ('day wise collections',
+             lambda: collections_per_mode(receipts, refunds, mode_names, start_date, end_date),
+             lambda: get_collections_by_pay_mode(receipts, refunds, mode_names, start_date, end_date)),
+            ('business status', lambda: invoice_totals_per_field(invoices), lambda: get_invoice_totals(invoices)),
+            ('patient overview', lambda: patient_overview_per_count(patients), lambda: get_patient_overview(patients)),
+            ('patients per day',
+             lambda: patient_counts_per_day(patients, start_date, end_date),
+             lambda: get_patient_counts_by_date(patients, start_date, end_date + timedelta(days=1), '%a, %Y %b %d')),
+            ('patients per month', lambda: patient_counts_per_row(patients),
+             lambda: get_patient_counts_by_month(patients)),
+        ]
+
+        for name, per_item, grouped in widgets:
+            expected, before_queries, before_ms = self.measure(per_item, repeat)
+            result, after_queries, after_ms = self.measure(grouped, repeat)
+            matches = all(result.get(key) == value for key, value in expected.items())
+            self.stdout.write(f'{name}: {before_queries} queries {before_ms:.1f}ms -> {after_queries} queries '
+                              f'{after_ms:.1f}ms, results {"match" if matches else "DIFFER"}')
+
+
+# The widgets as they were computed before, one query per payment mode, total or day
+
+def collections_per_mode(receipts, refunds, payment_modes, start_date, end_date):
+    new_collections, previous_due_collections, refund_collections, subtotals = {}, {}, {}, {}
+    for mode in payment_modes:
+        new_collections[mode] = receipts.filter(
+            payments__pay_mode__name=mode, added_on__date__range=[start_date, end_date],
+            invoiceid__added_on__date__range=[start_date, end_date]
+        ).aggregate(total=Sum('payments__paid_amount'))['total'] or 0
+        previous_due_collections[mode] = receipts.filter(
+            payments__pay_mode__name=mode, added_on__date__range=[start_date, end_date],
+            invoiceid__added_on__lt=start_date
+        ).aggregate(total=Sum('payments__paid_amount'))['total'] or 0
+        refund_collections[mode] = refunds.filter(
+            refund_mode__name=mode, added_on__date__range=[start_date, end_date]
+        ).aggregate(total=Sum('refund'))['total'] or 0
+        subtotals[mode] = new_collections[mode] + previous_due_collections[mode] - refund_collections[mode]
+
+    for collections in [new_collections, previous_due_collections, refund_collections, subtotals]:
+        collections['total'] = sum(collections[mode] for mode in payment_modes)
+    return {'new_collections': new_collections, 'previous_due_collections': previous_due_collections,
+            'refund_collections': refund_collections, 'subtotals': subtotals}
+
+
+def invoice_totals_per_field(invoices):
+    fields = {'total_amount': 'total_cost', 'total_discount': 'total_discount', 'net_amount': 'total_price',
+              'balance_amount': 'total_due', 'refund_amount': 'total_refund', 'total_paid': 'total_paid'}
+    return {name: invoices.aggregate(total=Coalesce(Sum(field), 0, output_field=DecimalField()))['total']
+            for name, field in fields.items()}
+
+
+def patient_overview_per_count(patients):
+    return {
+        'total_patients': patients.count(),
+        'male_count': patients.filter(gender__name='Male').count(),
+        'female_count': patients.filter(gender__name='Female').count(),
+        'age_group': {
+            '0_18': patients.filter(age__lte=18).count(),
+            '19_30': patients.filter(Q(age__gte=19) & Q(age__lte=30)).count(),
+            '31_50': patients.filter(Q(age__gte=31) & Q(age__lte=50)).count(),
+            'above_50': patients.filter(age__gt=50).count(),
+        }
+    }
+
+
+def patient_counts_per_day(patients, start_date, end_date):
+    patient_counts = {}
+    current_date = start_date
+    while current_date <= end_date:
+        patient_counts[current_date.strftime('%a, %Y %b %d')] = patients.filter(added_on__date=current_date).count()
+        current_date += timedelta(days=1)
+    return patient_counts
+
+
+def patient_counts_per_row(patients):
+    month_count_dict = {calendar.month_name[month_num]: 0 for month_num in range(1, 13)}
+    for patient in patients:
+        month_count_dict[calendar.month_name[patient.added_on.month]] += 1
+    return month_count_dict
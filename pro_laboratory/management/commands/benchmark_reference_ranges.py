@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django_tenants.utils import schema_context
+
+from pro_laboratory.models.global_models import LabFixedReportNormalReferralRanges
+from pro_laboratory.reference_ranges import ReferenceRangeIndex
+
+
+class Command(BaseCommand):
+    help = ('Compares the per-lookup cost of the normal range of a parameter for a patient read with a query, as '
+            'report generation did, with the in-memory reference range index, on the ranges of a tenant schema. '
+            'Lookups are random parameters, genders and ages, and both paths must return the same ranges.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schema', required=True, help='Tenant schema whose ranges are looked up')
+        parser.add_argument('--lookups', type=int, default=2000, help='Lookups of each path, default 2000')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random lookups')
+
+    def handle(self, *args, **options):
+        with schema_context(options['schema']):
+            parameter_ids = list(LabFixedReportNormalReferralRanges.objects.exclude(
+                parameter_id__isnull=True).values_list('parameter_id', flat=True).distinct())
+            if not parameter_ids:
+                raise CommandError(f"No normal referral ranges found in {options['schema']}")
+
+            rng = random.Random(options['seed'])
+            lookups = [(rng.choice(parameter_ids), rng.choice(['Male', 'Female']), rng.randrange(0, 100 * 365))
+                       for _ in range(options['lookups'])]
+
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                index = ReferenceRangeIndex()
+            build_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(f'Index of {len(index)} ranges of {len(parameter_ids)} parameters built in '
+                              f'{build_ms:.1f}ms with {len(captured.captured_queries)} queries')
+
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                expected = [query_normal_range(*lookup) for lookup in lookups]
+                query_seconds = time.perf_counter() - started
+            query_count = len(captured.captured_queries)
+
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                results = [index.get_normal_range(*lookup) for lookup in lookups]
+                index_seconds = time.perf_counter() - started
+            index_count = len(captured.captured_queries)
+
+            mismatches = sum(1 for result, normal_range in zip(results, expected)
+                             if getattr(result, 'id', None) != getattr(normal_range, 'id', None))
+            found = sum(1 for normal_range in expected if normal_range is not None)
+
+            self.stdout.write(f'{len(lookups)} lookups, {found} with a matching range')
+            self.stdout.write(f'query: {query_count} queries, {query_seconds * 1e6 / len(lookups):.1f}us per lookup')
+            self.stdout.write(f'index: {index_count} queries, {index_seconds * 1e6 / len(lookups):.1f}us per lookup')
+            if mismatches:
+                self.stdout.write(self.style.ERROR(f'{mismatches} lookups returned different ranges'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Both paths returned the same ranges'))
+
+
+def query_normal_range(parameter_id, patient_gender, patient_age_in_days):
+    # The lookup as it was done before, one query per parameter of every patient test
+    return LabFixedReportNormalReferralRanges.objects.filter(
+        parameter_id=parameter_id, gender__name__in=["Both", f"{patient_gender}"],
+        age_min_in_days__lte=patient_age_in_days, age_max_in_days__gte=patient_age_in_days).first()
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, date as date_type
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import TruncDate
+from django_tenants.utils import schema_context
+
+from healtho_pro_user.models.users_models import Client
+from pro_laboratory.daily_rollups import refresh_rollup_date
+from pro_laboratory.models.patient_models import Patient, LabPatientReceipts, LabPatientRefund, LabPatientTests
+from pro_laboratory.models.rollup_models import DailyRollupPendingDate
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the daily rollups of collections, registrations, tests and referral revenue from the '
+            'source rows and reports the dates whose rollups had drifted. Without dates every date with data up '
+            'to yesterday is rebuilt, with --pending only the dates marked by saves since their last refresh.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schema', help='Only rebuild the rollups of this tenant schema')
+        parser.add_argument('--from', dest='from_date', help='First date to rebuild, YYYY-MM-DD')
+        parser.add_argument('--to', dest='to_date', help='Last date to rebuild, YYYY-MM-DD, default yesterday')
+        parser.add_argument('--pending', action='store_true', help='Only refresh the pending dates')
+
+    def parse_date(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+        except ValueError:
+            raise CommandError(f'Invalid date {value}, use YYYY-MM-DD')
+
+    def get_dates(self, from_date, to_date, pending):
+        if pending:
+            dates = DailyRollupPendingDate.objects.values_list('date', flat=True)
+        else:
+            dates = set()
+            for model in [Patient, LabPatientReceipts, LabPatientRefund, LabPatientTests]:
+                dates.update(model.objects.annotate(day=TruncDate('added_on')).values_list('day', flat=True).distinct())
+        return sorted(date for date in dates if date and (from_date is None or date >= from_date) and date <= to_date)
+
+    def handle(self, *args, **options):
+        from_date = self.parse_date(options['from_date'])
+        to_date = self.parse_date(options['to_date']) or date_type.today() - timedelta(days=1)
+
+        clients = Client.objects.exclude(schema_name='public')
+        if options['schema']:
+            clients = clients.filter(schema_name=options['schema'])
+
+        for client in clients:
+            rebuilt, drifted = 0, []
+            try:
+                with schema_context(client.schema_name):
+                    for date in self.get_dates(from_date, to_date, options['pending']):
+                        if refresh_rollup_date(date, force=not options['pending']):
+                            drifted.append(date)
+                        rebuilt += 1
+            except Exception as error:
+                self.stderr.write(f'Error rebuilding daily rollups of {client.schema_name}: {error}')
+                continue
+
+            changed = 'refreshed' if options['pending'] else 'changed'
+            self.stdout.write(f'{client.schema_name}: rebuilt {rebuilt} dates, {len(drifted)} {changed}')
+            for date in drifted[:20]:
+                self.stdout.write(f'  {date}')
+
+        self.stdout.write(self.style.SUCCESS('Daily rollups rebuilt'))
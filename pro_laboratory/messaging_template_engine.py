@@ -0,0 +1,102 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from pro_laboratory.report_template_engine import tag_table, TAG_PATTERN
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Same pattern the messaging views used to tell {Constant: value} placeholders from tags
+CONSTANT_PATTERN = re.compile(r'{Constant:\s*([^}]*)\s*}')
+
+LITERAL = 0
+CONSTANT = 1
+TAG = 2
+
+CompiledMessagingTemplate = namedtuple('CompiledMessagingTemplate', ['nodes'])
+
+
+@lru_cache(maxsize=512)
+def compile_messaging_template(content):
+    """
+    Parses the templateContent of an SMS or WhatsApp template into literal, {Constant: value} and {tag} nodes.
+    Nodes are (type, text, constant value), the text of a placeholder being the whole "{...}" as it is the key of
+    the values sent to the vendors.
+    """
+    content = content or ""
+    nodes = []
+    position = 0
+    for match in TAG_PATTERN.finditer(content):
+        if match.start() > position:
+            nodes.append((LITERAL, content[position:match.start()], None))
+        tag_name = match.group(0)
+        constant = CONSTANT_PATTERN.match(tag_name)
+        if constant:
+            nodes.append((CONSTANT, tag_name, constant.group(1)))
+        else:
+            nodes.append((TAG, tag_name, None))
+        position = match.end()
+
+    if position < len(content):
+        nodes.append((LITERAL, content[position:], None))
+
+    return CompiledMessagingTemplate(nodes=tuple(nodes))
+
+
+def resolve_messaging_tag(tags, tag_name, details):
+    # The value of a tag's formula for the details, "*tag*" when the tag, its formula or its value is missing
+    tag = tags.get(tag_name)
+    if tag is None:
+        logger.error(f"{tag_name} - This tag does not exist!")
+    elif not tag.has_formula:
+        logger.error(f"{tag_name} - This tag does not have a formula! Please check")
+    else:
+        try:
+            if tag.code is None:
+                raise SyntaxError(f"invalid formula for {tag_name}")
+            return str(eval(tag.code, {'details': details}))
+        except Exception as error:
+            logger.error(f"{tag_name} - This tag has error in the formula! Please check: {error}")
+    return f"*{tag_name[1:-1]}*"
+
+
+def render_compiled_messaging_template(compiled, get_tag_value):
+    """
+    Returns the message and the value of each placeholder, in the order they first appear, which are the
+    variables of the Fast2SMS and Meta WhatsApp templates.
+    """
+    parts = []
+    template_values = {}
+    for node_type, text, constant in compiled.nodes:
+        if node_type == LITERAL:
+            parts.append(text)
+            continue
+        tag_value = constant if node_type == CONSTANT else get_tag_value(text)
+        template_values[text] = tag_value
+        parts.append(tag_value)
+    return ''.join(parts), template_values
+
+
+def render_messaging_templates(content, details_list):
+    """
+    Renders the template for the details of each recipient, from template_data() or template_data_many().
+    The template is compiled and the tag table read once for all of them.
+    Returns a list of (message, template values) in the order of details_list.
+    """
+    compiled = compile_messaging_template(content)
+    tags = tag_table.get_tags()
+    return [render_compiled_messaging_template(compiled,
+                                               lambda tag_name: resolve_messaging_tag(tags, tag_name, details))
+            for details in details_list]
+
+
+def render_messaging_template(content, details):
+    return render_messaging_templates(content, [details])[0]
+
+
+def render_messaging_template_with_values(content, values):
+    # Renders the template with the values given for its tags, keyed by "{tag}", like the campaign recipients
+    return render_compiled_messaging_template(compile_messaging_template(content),
+                                              lambda tag_name: str(values.get(tag_name, "")))
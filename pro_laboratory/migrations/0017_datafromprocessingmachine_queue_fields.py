@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pro_laboratory', '0016_labtechnicians_last_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datafromprocessingmachine',
+            name='compliance',
+            field=models.CharField(blank=True, max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='datafromprocessingmachine',
+            name='status',
+            field=models.CharField(blank=True, choices=[('queued', 'Queued'), ('processed', 'Processed'), ('failed', 'Failed')], max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='datafromprocessingmachine',
+            name='sample_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='datafromprocessingmachine',
+            name='saving_status',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='datafromprocessingmachine',
+            name='processed_on',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='datafromprocessingmachine',
+            index=models.Index(fields=['status', 'id'], name='pro_laborat_status_d4d06f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datafromprocessingmachine',
+            index=models.Index(fields=['machine', 'status'], name='pro_laborat_machine_a77b26_idx'),
+        ),
+    ]
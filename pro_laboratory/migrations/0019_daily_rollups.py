@@ -0,0 +1,136 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def mark_existing_dates_pending(apps, schema_editor):
+    # Rollups of the existing dates are computed when first read, or by the rebuild_daily_rollups command
+    dates = set()
+    for model_name in ['Patient', 'LabPatientReceipts', 'LabPatientRefund', 'LabPatientTests']:
+        model = apps.get_model('pro_laboratory', model_name)
+        dates.update(model.objects.annotate(day=TruncDate('added_on')).values_list('day', flat=True).distinct())
+
+    pending_date = apps.get_model('pro_laboratory', 'DailyRollupPendingDate')
+    pending_date.objects.bulk_create([pending_date(date=date) for date in dates if date], batch_size=1000,
+                                     ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healtho_pro_user', '0004_geohash'),
+        ('pro_hospital', '0006_patientvitals_created_by_alter_patientvitals_patient'),
+        ('pro_laboratory', '0018_sequencecounter'),
+        ('pro_pharmacy', '0002_pharmastock_over_all_tax'),
+        ('pro_universal_data', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCollectionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('collected_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('receipts_count', models.PositiveIntegerField(default=0)),
+                ('refund_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('refunds_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyReferralRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('patients_count', models.PositiveIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyRegistrationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('patients_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyRollupPendingDate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('version', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyTestRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('is_package_test', models.BooleanField(default=False)),
+                ('tests_count', models.PositiveIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='labpatientreceipts',
+            index=models.Index(fields=['added_on'], name='pro_laborat_added_o_c42706_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='labpatientrefund',
+            index=models.Index(fields=['added_on'], name='pro_laborat_added_o_310319_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='labpatienttests',
+            index=models.Index(fields=['added_on'], name='pro_laborat_added_o_8ed7ce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['added_on'], name='pro_laborat_added_o_691c62_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailycollectionrollup',
+            name='lab_staff',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='pro_laboratory.labstaff'),
+        ),
+        migrations.AddField(
+            model_name='dailycollectionrollup',
+            name='pay_mode',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pro_universal_data.ulabpaymentmodetype'),
+        ),
+        migrations.AddField(
+            model_name='dailyreferralrollup',
+            name='referral_doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pro_laboratory.labdoctors'),
+        ),
+        migrations.AddField(
+            model_name='dailyregistrationrollup',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='healtho_pro_user.businessaddresses'),
+        ),
+        migrations.AddField(
+            model_name='dailyregistrationrollup',
+            name='lab_staff',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='pro_laboratory.labstaff'),
+        ),
+        migrations.AddField(
+            model_name='dailytestrollup',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='healtho_pro_user.businessaddresses'),
+        ),
+        migrations.AddField(
+            model_name='dailytestrollup',
+            name='department',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='pro_laboratory.labdepartments'),
+        ),
+        migrations.AddField(
+            model_name='dailytestrollup',
+            name='global_test',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='pro_laboratory.labglobaltests'),
+        ),
+        migrations.RunPython(mark_existing_dates_pending, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('healtho_pro_user', '0004_geohash'),
+        ('pro_laboratory', '0019_daily_rollups'),
+        ('pro_universal_data', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(choices=[('sms', 'SMS'), ('whatsapp', 'WhatsApp')], max_length=20)),
+                ('search_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('numbers', models.CharField(max_length=255)),
+                ('send_reports_type', models.CharField(blank=True, max_length=50, null=True)),
+                ('dedup_key', models.CharField(blank=True, max_length=200, null=True, unique=True)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_on', models.DateTimeField(blank=True, null=True)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('sent_on', models.DateTimeField(blank=True, null=True)),
+                ('added_on', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='healtho_pro_user.client')),
+                ('messaging_send_type', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='pro_universal_data.messagingsendtype')),
+                ('template', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='pro_universal_data.messagingtemplates')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_on'], name='pro_laborat_status_543575_idx')],
+            },
+        ),
+    ]
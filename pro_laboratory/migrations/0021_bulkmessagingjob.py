@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 21:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pro_laboratory', '0020_outboundmessage'),
+        ('pro_universal_data', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkMessagingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('recipients', models.JSONField(default=list)),
+                ('total_messages', models.IntegerField(default=0)),
+                ('sent_messages', models.IntegerField(default=0)),
+                ('failed_messages', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('started_on', models.DateTimeField(blank=True, null=True)),
+                ('finished_on', models.DateTimeField(blank=True, null=True)),
+                ('added_on', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='pro_laboratory.labstaff')),
+                ('history', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pro_laboratory.bulkmessaginghistory')),
+                ('messaging_send_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='pro_universal_data.messagingsendtype')),
+                ('template', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='pro_laboratory.bulkmessagingtemplates')),
+            ],
+        ),
+    ]
@@ -18,4 +18,6 @@ from . import sourcing_lab_models
 from . import messaging_models
 from . import bulk_messaging_models
 from . import b2b_models
+from . import sequence_models
+from . import rollup_models
 
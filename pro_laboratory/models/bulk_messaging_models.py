@@ -94,4 +94,27 @@ class BulkMessagingHistory(models.Model):
     template = models.ForeignKey(BulkMessagingTemplates, on_delete=models.PROTECT, blank=True, null=True)
     sent_messages=models.IntegerField(blank=True, null=True)
     added_on = models.DateTimeField(auto_now_add=True)
-    created_by = models.ForeignKey(LabStaff, on_delete=models.PROTECT, blank=True, null=True)
\ No newline at end of file
+    created_by = models.ForeignKey(LabStaff, on_delete=models.PROTECT, blank=True, null=True)
+
+
+class BulkMessagingJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (COMPLETED, 'Completed'), (FAILED, 'Failed')]
+
+    template = models.ForeignKey(BulkMessagingTemplates, on_delete=models.PROTECT, blank=True, null=True)
+    messaging_send_type = models.ForeignKey(MessagingSendType, on_delete=models.PROTECT, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    recipients = models.JSONField(default=list)
+    total_messages = models.IntegerField(default=0)
+    sent_messages = models.IntegerField(default=0)
+    failed_messages = models.IntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    history = models.ForeignKey(BulkMessagingHistory, on_delete=models.SET_NULL, blank=True, null=True)
+    started_on = models.DateTimeField(blank=True, null=True)
+    finished_on = models.DateTimeField(blank=True, null=True)
+    added_on = models.DateTimeField(auto_now_add=True)
+    last_updated = models.DateTimeField(auto_now=True)
+    created_by = models.ForeignKey(LabStaff, on_delete=models.PROTECT, blank=True, null=True)
@@ -8,6 +8,26 @@ class ProcessingMachine(models.Model):
     last_updated = models.DateTimeField(auto_now=True)
 
 class DataFromProcessingMachine(models.Model):
+    QUEUED = 'queued'
+    PROCESSED = 'processed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (PROCESSED, 'Processed'),
+        (FAILED, 'Failed'),
+    ]
+
     machine  = models.ForeignKey(ProcessingMachine, on_delete=models.PROTECT, blank=True, null=True)
     data = models.TextField(blank=True, null=True)
+    compliance = models.CharField(max_length=10, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, blank=True, null=True)
+    sample_id = models.CharField(max_length=100, blank=True, null=True)
+    saving_status = models.TextField(blank=True, null=True)
+    processed_on = models.DateTimeField(blank=True, null=True)
     added_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['machine', 'status']),
+        ]
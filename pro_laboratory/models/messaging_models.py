@@ -66,3 +66,50 @@ class WhatsappConfigurations(models.Model):
     added_on = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
     last_updated_by = models.ForeignKey(HealthOProUser, on_delete=models.PROTECT, blank=True, null=True)
+
+
+class OutboundMessage(models.Model):
+    """
+    SMS or WhatsApp message waiting to be sent by the outbound message dispatcher.
+    A message with a dedup_key is queued at most once, a message that failed with a vendor error is retried
+    with a growing delay until OUTBOUND_MESSAGE_MAX_ATTEMPTS.
+    """
+    SMS = 'sms'
+    WHATSAPP = 'whatsapp'
+    CHANNEL_CHOICES = [
+        (SMS, 'SMS'),
+        (WHATSAPP, 'WhatsApp'),
+    ]
+
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES)
+    # Without constraints, so that queueing with a missing template never fails the transaction queueing it
+    template = models.ForeignKey(MessagingTemplates, on_delete=models.DO_NOTHING, db_constraint=False)
+    messaging_send_type = models.ForeignKey(MessagingSendType, on_delete=models.DO_NOTHING, db_constraint=False)
+    client = models.ForeignKey(Client, on_delete=models.PROTECT, blank=True, null=True)
+    search_id = models.CharField(max_length=100, blank=True, null=True)
+    numbers = models.CharField(max_length=255)
+    send_reports_type = models.CharField(max_length=50, blank=True, null=True)
+    dedup_key = models.CharField(max_length=200, unique=True, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_on = models.DateTimeField(blank=True, null=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    sent_on = models.DateTimeField(blank=True, null=True)
+    added_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_on']),
+        ]
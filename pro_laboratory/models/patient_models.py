@@ -1,5 +1,5 @@
 import datetime
-from django.db import models, transaction
+from django.db import models
 from django.utils import timezone
 
 from healtho_pro_user.models.business_models import BusinessAddresses
@@ -9,6 +9,7 @@ from pro_laboratory.models.doctors_models import LabDoctors
 from pro_laboratory.models.global_models import LabGlobalTests, LabDiscountType, LabStaff, LabDepartments, \
     LabGlobalPackages
 
+from pro_laboratory.models.sequence_models import SequenceCounter
 from pro_laboratory.models.sourcing_lab_models import SourcingLabRegistration
 
 from pro_universal_data.models import ULabPaymentModeType, ULabTestStatus, ULabPatientAge, \
@@ -49,6 +50,11 @@ class Patient(models.Model):
     patient_type = models.ForeignKey(PatientType, on_delete=models.PROTECT, blank=True, null=True)
     tax_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['added_on']),
+        ]
+
     def __str__(self):
         return f'{self.id},{self.visit_id},{self.title}, {self.name},  {self.created_by}'
 
@@ -57,13 +63,11 @@ class Patient(models.Model):
             patient_added_on = self.added_on or timezone.now()
 
             current_date = patient_added_on.strftime('%y%m%d')
-            today = patient_added_on.date()
 
             existing_patients = Patient.objects.filter(name=self.name, mobile_number=self.mobile_number).first()
 
-            patients = Patient.objects.filter(added_on__date__gte=today,
-                                              added_on__date__lt=today + timezone.timedelta(days=1))
-            patients_count = patients.count() + 1
+            patients_count = SequenceCounter.next_value('visit_id', current_date,
+                                                        initial=lambda: get_last_visit_number(current_date))
 
             if existing_patients:
                 self.mr_no = existing_patients.mr_no
@@ -75,6 +79,16 @@ class Patient(models.Model):
         super().save(*args, **kwargs)
 
 
+def get_last_visit_number(current_date):
+    # Highest number already used in the visit ids of the date, as visit_id is unique
+    last_number = 0
+    for visit_id in Patient.objects.filter(visit_id__startswith=f'{current_date}-').values_list('visit_id', flat=True):
+        number = visit_id[len(current_date) + 1:]
+        if number.isdigit():
+            last_number = max(last_number, int(number))
+    return last_number
+
+
 
 
 
@@ -105,10 +119,11 @@ class LabPatientInvoice(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.invoice_id:
-            with transaction.atomic():
-                date = timezone.now().date().strftime('%y%m%d')
-                today_invoice_count = LabPatientInvoice.objects.filter(added_on__date=timezone.now().date()).count() + 1
-                self.invoice_id = f"INV{date}{today_invoice_count:04d}"
+            today = timezone.now().date()
+            date = today.strftime('%y%m%d')
+            today_invoice_count = SequenceCounter.next_value(
+                'invoice_id', date, initial=lambda: LabPatientInvoice.objects.filter(added_on__date=today).count())
+            self.invoice_id = f"INV{date}{today_invoice_count:04d}"
         super().save(*args, **kwargs)
 
 
@@ -141,16 +156,22 @@ class LabPatientReceipts(models.Model):
     before_payment_due = models.DecimalField(max_digits=10, decimal_places=2, default=0, null=True)
     after_payment_due = models.DecimalField(max_digits=10, decimal_places=2, default=0, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['added_on']),
+        ]
+
     def __str__(self):
         return f"Receipt({self.Receipt_id}) for {self.invoiceid}"
 
     def save(self, *args, **kwargs):
-        date = timezone.now().date()
-        receipts = LabPatientReceipts.objects.filter(added_on__date=date)
-        receipt_number = receipts.count() + 1
-        date = date.strftime('%y%m%d')
-        receipt_id = f"RC{date}{receipt_number:04d}"
-        self.Receipt_id = receipt_id
+        if not self.Receipt_id:
+            today = timezone.now().date()
+            date = today.strftime('%y%m%d')
+            receipt_number = SequenceCounter.next_value(
+                'receipt_id', date, initial=lambda: LabPatientReceipts.objects.filter(added_on__date=today).count())
+            receipt_id = f"RC{date}{receipt_number:04d}"
+            self.Receipt_id = receipt_id
         super().save(*args, **kwargs)
 
 
@@ -173,6 +194,11 @@ class LabPatientTests(models.Model):
     sourcing_lab = models.ForeignKey(SourcingLabRegistration, on_delete=models.PROTECT, blank=True, null=True)
     branch = models.ForeignKey(BusinessAddresses, on_delete=models.PROTECT, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['added_on']),
+        ]
+
     def __str__(self):
         return f"{self.id}. {self.name}"
 
@@ -217,16 +243,22 @@ class LabPatientRefund(models.Model):
     packages = models.ManyToManyField(LabPatientPackages, blank=True)
     refund_id = models.CharField(max_length=500, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['added_on']),
+        ]
+
     def __str__(self):
         return f"Refund ({self.refund_id})"
 
     def save(self, *args, **kwargs):
-        date = timezone.now().date()
-        refunds = LabPatientRefund.objects.filter(added_on__date=date)
-        refunds_number = refunds.count() + 1
-        date = date.strftime('%y%m%d')
-        refund_id = f"REF{date}{refunds_number:03d}"
-        self.refund_id = refund_id
+        if not self.refund_id:
+            today = timezone.now().date()
+            date = today.strftime('%y%m%d')
+            refunds_number = SequenceCounter.next_value(
+                'refund_id', date, initial=lambda: LabPatientRefund.objects.filter(added_on__date=today).count())
+            refund_id = f"REF{date}{refunds_number:03d}"
+            self.refund_id = refund_id
 
         super().save(*args, **kwargs)
 
@@ -0,0 +1,58 @@
+from django.db import models
+
+from healtho_pro_user.models.business_models import BusinessAddresses
+from pro_laboratory.models.doctors_models import LabDoctors
+from pro_laboratory.models.global_models import LabStaff, LabGlobalTests, LabDepartments
+from pro_universal_data.models import ULabPaymentModeType
+
+
+class DailyRollupPendingDate(models.Model):
+    """
+    Date whose rollups are out of date. Saves of patients, invoices, receipts, refunds and tests bump the
+    version of their date, the rollups of the date are recomputed the next time they are read.
+    """
+    date = models.DateField(unique=True)
+    version = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.date} (v{self.version})"
+
+
+class DailyCollectionRollup(models.Model):
+    # Receipt payments and refunds of a day per staff and pay mode
+    date = models.DateField(db_index=True)
+    lab_staff = models.ForeignKey(LabStaff, on_delete=models.CASCADE, null=True, blank=True)
+    pay_mode = models.ForeignKey(ULabPaymentModeType, on_delete=models.CASCADE)
+    collected_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    receipts_count = models.PositiveIntegerField(default=0)
+    refund_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refunds_count = models.PositiveIntegerField(default=0)
+
+
+class DailyRegistrationRollup(models.Model):
+    # Patients registered in an hour of a day per staff and branch
+    date = models.DateField(db_index=True)
+    hour = models.PositiveSmallIntegerField()
+    lab_staff = models.ForeignKey(LabStaff, on_delete=models.CASCADE, null=True, blank=True)
+    branch = models.ForeignKey(BusinessAddresses, on_delete=models.CASCADE, null=True, blank=True)
+    patients_count = models.PositiveIntegerField(default=0)
+
+
+class DailyTestRollup(models.Model):
+    # Tests of a day per global test and department, cancelled tests are left out
+    date = models.DateField(db_index=True)
+    global_test = models.ForeignKey(LabGlobalTests, on_delete=models.CASCADE, null=True, blank=True)
+    department = models.ForeignKey(LabDepartments, on_delete=models.CASCADE, null=True, blank=True)
+    branch = models.ForeignKey(BusinessAddresses, on_delete=models.CASCADE, null=True, blank=True)
+    is_package_test = models.BooleanField(default=False)
+    tests_count = models.PositiveIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+
+class DailyReferralRollup(models.Model):
+    # Patients registered on a day per referral doctor, with the totals of their invoices
+    date = models.DateField(db_index=True)
+    referral_doctor = models.ForeignKey(LabDoctors, on_delete=models.CASCADE)
+    patients_count = models.PositiveIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
@@ -0,0 +1,40 @@
+from django.db import models, transaction, IntegrityError
+
+
+class SequenceCounter(models.Model):
+    """
+    Last number given out for a sequence and key, e.g. ('visit_id', '250116').
+    Rows are locked with SELECT ... FOR UPDATE while a number is taken, so concurrent inserts never
+    get the same number and no table has to be counted to find the next one.
+    """
+    name = models.CharField(max_length=50)
+    key = models.CharField(max_length=50)
+    value = models.PositiveBigIntegerField(default=0)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('name', 'key')
+
+    def __str__(self):
+        return f"{self.name}:{self.key}={self.value}"
+
+    @classmethod
+    def next_value(cls, name, key, initial=None):
+        """
+        Takes the next number of the sequence.
+        initial is called once, when the key is first used, to start from the numbers already given out
+        before the counter existed. The lock is held until the surrounding transaction ends.
+        """
+        with transaction.atomic():
+            counter = cls.objects.select_for_update().filter(name=name, key=key).first()
+            if counter is None:
+                try:
+                    with transaction.atomic():
+                        counter = cls.objects.create(name=name, key=key, value=initial() if initial else 0)
+                except IntegrityError:
+                    # Created by a concurrent insert, which held the row until it committed
+                    counter = cls.objects.select_for_update().get(name=name, key=key)
+
+            counter.value += 1
+            counter.save(update_fields=['value', 'last_updated'])
+            return counter.value
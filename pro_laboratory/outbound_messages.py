@@ -0,0 +1,266 @@
+"""
+SMS and WhatsApp messages sent in the background by a pool of dispatcher threads.
+
+Messages are saved as OutboundMessage rows in the transaction that causes them, and the dispatcher is woken up
+with the schema once it commits, so a request never waits for a messaging vendor. The rows are the durable queue,
+the in-process queue only carries wake-ups, and the scheduler picks up messages left by a restart.
+"""
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection, transaction, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from django_tenants.utils import schema_context
+
+from healtho_pro_user.models.users_models import Client
+from pro_laboratory.models.messaging_models import OutboundMessage
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Errors of the send functions worth another attempt, the others (no credits, inactive template or service)
+# would fail the same way again
+RETRYABLE_ERRORS = {'Message sending failed'}
+
+
+class RateLimiter:
+    # Token bucket shared by the dispatcher threads of the process, a rate of 0 sends without limit
+    def __init__(self, rate_per_second):
+        self.rate = rate_per_second
+        self._tokens = rate_per_second
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            self._tokens -= 1
+        if wait:
+            time.sleep(wait)
+
+
+def get_retry_delay(attempts):
+    base_delay = getattr(settings, 'OUTBOUND_MESSAGE_RETRY_DELAY_SECONDS', 30)
+    return timedelta(seconds=min(base_delay * 2 ** (attempts - 1), 60 * 60))
+
+
+def get_lease_end():
+    return timezone.now() + timedelta(seconds=getattr(settings, 'OUTBOUND_MESSAGE_LEASE_SECONDS', 300))
+
+
+def claim_due_messages(batch_size):
+    """
+    Marks a batch of due messages of the current schema as sending and returns them.
+    Rows are taken with SKIP LOCKED, so the dispatcher threads of all processes claim different messages.
+    A claim expires after OUTBOUND_MESSAGE_LEASE_SECONDS, after which requeue_due_messages() queues it again,
+    send_messages() renews it before sending each message of the batch.
+    """
+    now = timezone.now()
+    locked_until = get_lease_end()
+    with transaction.atomic():
+        # The template and send type have no database constraint, they are prefetched rather than joined so that
+        # a message whose template is missing is still claimed and failed
+        messages = list(OutboundMessage.objects.select_for_update(skip_locked=True, of=('self',)).select_related(
+            'client').prefetch_related('template', 'messaging_send_type').filter(
+            Q(next_attempt_on__isnull=True) | Q(next_attempt_on__lte=now),
+            status=OutboundMessage.QUEUED).order_by('id')[:batch_size])
+        for message in messages:
+            message.status = OutboundMessage.SENDING
+            message.locked_until = locked_until
+            message.attempts += 1
+        if messages:
+            OutboundMessage.objects.bulk_update(messages, ['status', 'locked_until', 'attempts'])
+    return messages
+
+
+def renew_claim(message):
+    # Extends the claim of a message about to be sent, False when the claim expired and the message was queued again
+    locked_until = get_lease_end()
+    renewed = OutboundMessage.objects.filter(pk=message.id, status=OutboundMessage.SENDING,
+                                             locked_until=message.locked_until).update(locked_until=locked_until)
+    if renewed:
+        message.locked_until = locked_until
+    return bool(renewed)
+
+
+def send_message(message):
+    # Returns None when the message was sent, otherwise the error and whether it is worth another attempt
+    from pro_universal_data.views import send_and_log_sms, send_and_log_whatsapp_sms
+
+    try:
+        template, messaging_send_type = message.template, message.messaging_send_type
+    except ObjectDoesNotExist as error:
+        return f"{error}", False
+
+    try:
+        if message.channel == OutboundMessage.SMS:
+            response = send_and_log_sms(search_id=message.search_id, numbers=message.numbers,
+                                        sms_template=template, messaging_send_type=messaging_send_type,
+                                        client=message.client)
+        else:
+            response = send_and_log_whatsapp_sms(search_id=message.search_id, numbers=message.numbers,
+                                                 mwa_template=template, messaging_send_type=messaging_send_type,
+                                                 client=message.client, send_reports_type=message.send_reports_type)
+    except Exception as error:
+        return f"{error}", True
+
+    if response.status_code == 200:
+        return None, False
+    error = response.data.get('Error') if isinstance(response.data, dict) else None
+    error = error or f"{response.data}"
+    return error, error in RETRYABLE_ERRORS
+
+
+def send_messages(messages, rate_limiters):
+    """
+    Sends claimed messages and saves the outcome of each as soon as it is known, so that a crash in the
+    middle of a batch does not send the messages already sent again.
+    Returns the earliest next attempt of the messages queued again, if any.
+    """
+    max_attempts = getattr(settings, 'OUTBOUND_MESSAGE_MAX_ATTEMPTS', 5)
+    next_attempt_on = None
+    for message in messages:
+        rate_limiter = rate_limiters.get(message.channel)
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+
+        # Messages later in the batch would otherwise outlive the claim while the earlier ones are sent
+        if not renew_claim(message):
+            logger.warning(f"Claim of outbound {message.channel} message {message.id} expired before it was sent")
+            continue
+
+        error, retryable = send_message(message)
+        now = timezone.now()
+        if error is None:
+            message.status, message.sent_on, message.last_error = OutboundMessage.SENT, now, None
+        elif retryable and message.attempts < max_attempts:
+            message.status, message.last_error = OutboundMessage.QUEUED, error
+            message.next_attempt_on = now + get_retry_delay(message.attempts)
+            next_attempt_on = min(next_attempt_on or message.next_attempt_on, message.next_attempt_on)
+        else:
+            message.status, message.last_error = OutboundMessage.FAILED, error
+            logger.error(f"Outbound {message.channel} message {message.id} to {message.numbers} failed after "
+                         f"{message.attempts} attempts: {error}")
+        message.locked_until = None
+        message.save(update_fields=['status', 'sent_on', 'last_error', 'next_attempt_on', 'locked_until'])
+    return next_attempt_on
+
+
+class OutboundMessageDispatcher:
+    """
+    Pool of OUTBOUND_MESSAGE_WORKERS threads sending the queued messages of the schemas they are notified of.
+    A thread that claims a full batch notifies the schema again before sending it, so idle threads join in
+    on a large backlog. Messages queued again for a retry wake the schema up when they are due.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = queue.Queue()
+        self._threads = []
+        self.rate_limiters = {
+            OutboundMessage.SMS: RateLimiter(getattr(settings, 'OUTBOUND_SMS_RATE_PER_SECOND', 10)),
+            OutboundMessage.WHATSAPP: RateLimiter(getattr(settings, 'OUTBOUND_WHATSAPP_RATE_PER_SECOND', 10)),
+        }
+
+    def start(self):
+        if not self._threads:
+            with self._lock:
+                if not self._threads:
+                    for _ in range(max(1, getattr(settings, 'OUTBOUND_MESSAGE_WORKERS', 4))):
+                        thread = threading.Thread(target=self._run, daemon=True)
+                        thread.start()
+                        self._threads.append(thread)
+
+    def notify(self, schema_name):
+        self.start()
+        self._schemas.put(schema_name)
+
+    def notify_at(self, schema_name, when):
+        delay = max((when - timezone.now()).total_seconds(), 0)
+        timer = threading.Timer(delay, self.notify, args=[schema_name])
+        timer.daemon = True
+        timer.start()
+
+    def process(self, schema_name):
+        # Sends one batch of the schema, returns the number of messages claimed
+        batch_size = getattr(settings, 'OUTBOUND_MESSAGE_BATCH_SIZE', 20)
+        with schema_context(schema_name):
+            messages = claim_due_messages(batch_size)
+            if len(messages) == batch_size:
+                self.notify(schema_name)
+            next_attempt_on = send_messages(messages, self.rate_limiters)
+        if next_attempt_on is not None:
+            self.notify_at(schema_name, next_attempt_on)
+        return len(messages)
+
+    def _run(self):
+        while True:
+            schema_name = self._schemas.get()
+            try:
+                self.process(schema_name)
+            except Exception as error:
+                logger.error(f"Error sending outbound messages of {schema_name}: {error}", exc_info=True)
+            finally:
+                close_old_connections()
+
+
+outbound_message_dispatcher = OutboundMessageDispatcher()
+
+
+def send_due_messages():
+    # Sends the due messages of the current schema in the calling thread, used by the 'sync' mode
+    schema_name = connection.schema_name
+    batch_size = getattr(settings, 'OUTBOUND_MESSAGE_BATCH_SIZE', 20)
+    while True:
+        messages = claim_due_messages(batch_size)
+        if not messages:
+            return
+        next_attempt_on = send_messages(messages, outbound_message_dispatcher.rate_limiters)
+        if next_attempt_on is not None:
+            outbound_message_dispatcher.notify_at(schema_name, next_attempt_on)
+
+
+def enqueue_messages(messages):
+    """
+    Saves OutboundMessage rows in the current transaction and has them sent once it commits.
+    Messages whose dedup_key is already queued or sent are left out.
+    """
+    messages = [message for message in messages if message.numbers]
+    if not messages:
+        return
+    OutboundMessage.objects.bulk_create(messages, ignore_conflicts=True)
+
+    schema_name = connection.schema_name
+    if getattr(settings, 'OUTBOUND_MESSAGE_MODE', 'queued') == 'sync':
+        transaction.on_commit(send_due_messages)
+    else:
+        transaction.on_commit(lambda: outbound_message_dispatcher.notify(schema_name))
+
+
+def requeue_due_messages():
+    # Queues again the messages whose claim expired in a restart and wakes up the schemas with due messages,
+    # run by the scheduler
+    for client in Client.objects.exclude(schema_name='public'):
+        try:
+            with schema_context(client.schema_name):
+                now = timezone.now()
+                OutboundMessage.objects.filter(status=OutboundMessage.SENDING, locked_until__lt=now).update(
+                    status=OutboundMessage.QUEUED, locked_until=None)
+                has_due = OutboundMessage.objects.filter(
+                    Q(next_attempt_on__isnull=True) | Q(next_attempt_on__lte=now),
+                    status=OutboundMessage.QUEUED).exists()
+            if has_due:
+                outbound_message_dispatcher.notify(client.schema_name)
+        except Exception as error:
+            logger.error(f"Error checking outbound messages of {client.schema_name}: {error}")
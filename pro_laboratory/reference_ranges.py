@@ -0,0 +1,133 @@
+import bisect
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import connection
+
+from pro_laboratory.models.global_models import LabFixedReportNormalReferralRanges
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY_PREFIX = 'reference_ranges_version'
+
+
+class ReferenceRangeIndex:
+    """
+    Normal referral ranges of all the fixed report parameters of one tenant, loaded with one query.
+    For each parameter and gender the ranges are sorted by their minimum age in days, so a lookup bisects to the
+    ranges starting at or before the age and only checks those.
+    Instances are shared between requests of the schema, so the ranges in it must not be modified.
+    """
+
+    def __init__(self, normal_ranges=None):
+        if normal_ranges is None:
+            normal_ranges = LabFixedReportNormalReferralRanges.objects.select_related('gender').order_by('id')
+
+        intervals = {}
+        for normal_range in normal_ranges:
+            # Ranges without ages never match the age filters of the query this index replaces
+            if normal_range.age_min_in_days is None or normal_range.age_max_in_days is None:
+                continue
+            intervals.setdefault((normal_range.parameter_id_id, normal_range.gender.name), []).append(
+                (normal_range.age_min_in_days, normal_range.id, normal_range))
+
+        self.ranges = {}
+        for key, parameter_intervals in intervals.items():
+            parameter_intervals.sort(key=lambda interval: (interval[0], interval[1]))
+            self.ranges[key] = ([interval[0] for interval in parameter_intervals],
+                                [interval[2] for interval in parameter_intervals])
+
+    def __len__(self):
+        return sum(len(starts) for starts, _ in self.ranges.values())
+
+    def _find(self, parameter_id, gender_name, patient_age_in_days):
+        entry = self.ranges.get((parameter_id, gender_name))
+        if entry is None:
+            return None
+        starts, normal_ranges = entry
+        found = None
+        for normal_range in normal_ranges[:bisect.bisect_right(starts, patient_age_in_days)]:
+            if normal_range.age_max_in_days >= patient_age_in_days and (found is None or normal_range.id < found.id):
+                found = normal_range
+        return found
+
+    def get_normal_range(self, parameter_id, patient_gender, patient_age_in_days):
+        """
+        Range of the parameter for the patient's gender or Both whose ages cover the patient's age, the one
+        added first when several match, like the first() of a query filtering the ranges by gender and age.
+        """
+        if patient_age_in_days is None:
+            return None
+        matches = [self._find(parameter_id, gender_name, patient_age_in_days)
+                   for gender_name in {"Both", f"{patient_gender}"}]
+        matches = [normal_range for normal_range in matches if normal_range is not None]
+        return min(matches, key=lambda normal_range: normal_range.id) if matches else None
+
+    def get_referral_range(self, parameter, patient_gender, patient_age_in_days):
+        # The referral range of the parameter, otherwise its normal range for the patient as "min-max"
+        if parameter.referral_range:
+            return parameter.referral_range
+        normal_range = self.get_normal_range(parameter.id, patient_gender, patient_age_in_days)
+        return f"{normal_range.value_min}-{normal_range.value_max}" if normal_range else ""
+
+
+def _version_key(schema_name):
+    return f'{VERSION_KEY_PREFIX}:{schema_name}'
+
+
+def bump_reference_ranges_version(schema_name=None):
+    schema_name = schema_name or connection.schema_name
+    cache.set(_version_key(schema_name), uuid.uuid4().hex, timeout=None)
+
+
+class ReferenceRangeCache:
+    """
+    Indexes are kept in-process per schema with the version they were built at.
+    Saves and deletes of the ranges bump the version of their schema, after which the next lookup of every
+    process builds the index again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def _get_version(self, schema_name):
+        version_key = _version_key(schema_name)
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(version_key)
+        return version
+
+    def get(self):
+        schema_name = connection.schema_name
+        try:
+            version = self._get_version(schema_name)
+        except Exception as error:
+            # Without the version a cached index cannot be trusted, so it is read from the database
+            logger.error(f"Error reading reference ranges version of {schema_name}: {error}")
+            return ReferenceRangeIndex()
+
+        entry = self._indexes.get(schema_name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        index = ReferenceRangeIndex()
+        with self._lock:
+            self._indexes[schema_name] = (version, index)
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+reference_range_cache = ReferenceRangeCache()
+
+
+def get_reference_range_index():
+    # Index of the schema the connection is currently set to
+    return reference_range_cache.get()
@@ -0,0 +1,149 @@
+"""
+Generation of the report parameters of patient tests from their fixed parameters report templates.
+
+The templates and the already generated parameters of all the tests are read with one query each, the
+reference ranges are looked up in the cached reference range index and the missing parameters are inserted
+together.
+"""
+from datetime import datetime
+
+from django.db import transaction
+
+from pro_laboratory.activity_log_writer import log_activity
+from pro_laboratory.models.global_models import LabFixedParametersReportTemplate
+from pro_laboratory.models.labtechnicians_models import LabPatientFixedReportTemplate
+from pro_laboratory.reference_ranges import get_reference_range_index
+from pro_laboratory.report_pdf_cache import invalidate_test_reports
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columns an existing report parameter must match to be reused instead of generated again
+MATCH_FIELDS = ['LabGlobalTestID_id', 'LabPatientTestID_id', 'template_id', 'ordering', 'group', 'method',
+                'parameter', 'units', 'formula', 'referral_range', 'is_value_bold', 'is_value_only']
+
+
+def get_patient_age_in_days(patient):
+    patient_age_units = patient.ULabPatientAge.name
+
+    if patient_age_units == "Days":
+        return patient.age
+    elif patient_age_units == "Months":
+        return patient.age * 30
+    elif patient_age_units == "Years":
+        return patient.age * 365
+    elif patient_age_units == "DOB":
+        return (datetime.now().date() - patient.dob).days
+    return 0
+
+
+def get_match_key(report_parameter):
+    return tuple(getattr(report_parameter, field) for field in MATCH_FIELDS)
+
+
+def invalidate_reports_on_commit(test_ids):
+    # bulk_create sends no post_save, so the cached reports of these tests are removed here
+    def invalidate():
+        for test_id in test_ids:
+            try:
+                invalidate_test_reports(test_id)
+            except Exception as error:
+                logger.error(f"Report cache invalidation failed for test {test_id}: {error}")
+
+    transaction.on_commit(invalidate)
+
+
+def log_created_report_parameters(report_parameters, created_by=None):
+    # bulk_create sends no post_save either, these are the logs activity_log_for_fixed_template writes on a save
+    clients = {}
+    for report_parameter in report_parameters:
+        lab_patient_test = report_parameter.LabPatientTestID
+        patient = lab_patient_test.patient
+        if patient.id not in clients:
+            clients[patient.id] = patient.client
+        client = clients[patient.id]
+        added_on = report_parameter.added_on.strftime('%d-%m-%y %I:%M %p')
+
+        try:
+            log_activity(
+                user_phone_number=created_by.mobile_number if created_by else None,
+                lab_staff=created_by,
+                client=client,
+                patient=patient,
+                operation="POST",
+                url="lab/lab_patient_report_generate",
+                model="LabPatientFixedReportTemplate",
+                activity=f"Fixed Report Parameter created for Patient {patient.name} for {lab_patient_test.name} "
+                         f"by {created_by.name if created_by else ''} on {added_on}",
+                model_instance_id=report_parameter.id,
+                response_code=201,
+                duration="",
+            )
+        except Exception as error:
+            logger.error(f"Error Creating Activitylog for technician_fixed_report Parameter for {patient.name} for "
+                         f"{lab_patient_test.name} in {client} on {added_on}: {error}", exc_info=True)
+
+
+def generate_fixed_report_parameters(tests_with_templates, created_by=None):
+    """
+    Generates the report parameters of tests from the active parameters of their fixed report templates.
+    tests_with_templates is a list of (lab_patient_test, lab_reports_template), the patient of each test should
+    be selected with its gender and age units. Parameters already generated with the same columns are reused.
+    Returns {lab_patient_test.id: [report parameters]} in the order of the template parameters.
+    """
+    report_template_ids = {lab_reports_template.id for _, lab_reports_template in tests_with_templates}
+    parameters_by_template = {}
+    for parameter in LabFixedParametersReportTemplate.objects.filter(
+            LabReportsTemplate__in=report_template_ids, is_active=True).order_by('id'):
+        parameters_by_template.setdefault(parameter.LabReportsTemplate_id, []).append(parameter)
+
+    reference_ranges = get_reference_range_index()
+
+    existing_parameters = {}
+    for report_parameter in LabPatientFixedReportTemplate.objects.filter(
+            LabPatientTestID__in=[lab_patient_test.id for lab_patient_test, _ in tests_with_templates]).order_by('id'):
+        existing_parameters.setdefault(get_match_key(report_parameter), report_parameter)
+
+    report_parameters = {}
+    missing_parameters = []
+    for lab_patient_test, lab_reports_template in tests_with_templates:
+        patient = lab_patient_test.patient
+        patient_gender = patient.gender.name
+        patient_age_in_days = get_patient_age_in_days(patient)
+
+        test_parameters = report_parameters.setdefault(lab_patient_test.id, [])
+        for parameter in parameters_by_template.get(lab_reports_template.id, []):
+            referral_range = reference_ranges.get_referral_range(parameter, patient_gender, patient_age_in_days)
+            report_parameter = LabPatientFixedReportTemplate(
+                LabGlobalTestID_id=lab_patient_test.LabGlobalTestId_id,
+                LabPatientTestID=lab_patient_test,
+                template=parameter,
+                ordering=parameter.ordering,
+                group=parameter.group,
+                method=parameter.method,
+                parameter=parameter.parameter,
+                units=parameter.units,
+                formula=parameter.formula,
+                referral_range=referral_range,
+                is_value_bold=parameter.is_value_bold,
+                is_value_only=parameter.is_value_only,
+                value=parameter.value,
+                created_by=created_by,
+                last_updated_by=created_by
+            )
+
+            key = get_match_key(report_parameter)
+            if key in existing_parameters:
+                report_parameter = existing_parameters[key]
+            else:
+                existing_parameters[key] = report_parameter
+                missing_parameters.append(report_parameter)
+            test_parameters.append(report_parameter)
+
+    if missing_parameters:
+        LabPatientFixedReportTemplate.objects.bulk_create(missing_parameters)
+        log_created_report_parameters(missing_parameters, created_by=created_by)
+        invalidate_reports_on_commit({report_parameter.LabPatientTestID_id for report_parameter in missing_parameters})
+
+    return report_parameters
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max
+
+from healtho_pro_user.models.business_models import BContacts, BusinessAddresses, BusinessProfiles
+from pro_laboratory.models.client_based_settings_models import LetterHeadSettings, ReportFontSizes, \
+    PrintReportSettings
+from pro_laboratory.models.doctors_models import DefaultsForDepartments, LabDoctors
+from pro_laboratory.models.global_models import LabStaff
+from pro_laboratory.models.labtechnicians_models import LabTechnicians, LabPatientFixedReportTemplate, \
+    LabPatientWordReportTemplate, LabTechnicianRemarks
+from pro_laboratory.models.patient_appointment_models import AppointmentDetails
+from pro_laboratory.models.patient_models import Patient, LabPatientInvoice, LabPatientReceipts, LabPatientPackages
+from pro_laboratory.models.phlebotomists_models import LabPhlebotomist
+from pro_laboratory.models.sourcing_lab_models import SourcingLabLetterHeadSettings
+from pro_laboratory.models.universal_models import PrintDataTemplate
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Only reports of tests in these statuses are final, same statuses checked before sending reports
+CACHEABLE_TEST_STATUSES = [3, 13, 17]
+
+TEST_INDEX_KEY_PREFIX = 'report_pdf_cache_test'
+
+
+def get_cache_root():
+    return getattr(settings, 'REPORT_PDF_CACHE_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'report_pdf_cache')
+
+
+def _schema_dir(schema_name=None):
+    return os.path.join(get_cache_root(), schema_name or connection.schema_name)
+
+
+def _entry_paths(key, schema_name=None):
+    directory = os.path.join(_schema_dir(schema_name), key[:2])
+    return os.path.join(directory, f'{key}.pdf'), os.path.join(directory, f'{key}.json')
+
+
+def _default(value):
+    return str(value)
+
+
+def build_report_cache_key(lab_patient_tests, client, letterhead=None, water_mark=None,
+                           sourcing_lab_for_settings=None):
+    """
+    Hash of everything the rendered test report depends on. Any edit to a report row, the technician entry,
+    the sample collection, the patient, their invoice, payments and appointment, the doctors and staff named on
+    the report, the business details, the letterhead and print settings or the print templates produces a
+    different key.
+    Returns None when any of the tests is not final yet, those reports are always rendered.
+    """
+    tests = list(lab_patient_tests.values('id', 'status_id', 'patient_id', 'name', 'display_name',
+                                          'department_id'))
+    if not tests or any(test['status_id'] not in CACHEABLE_TEST_STATUSES for test in tests):
+        return None
+
+    test_ids = [test['id'] for test in tests]
+    patient_ids = sorted({test['patient_id'] for test in tests})
+    department_ids = sorted({test['department_id'] for test in tests})
+
+    technicians = list(LabTechnicians.objects.filter(LabPatientTestID__in=test_ids).order_by('id').values_list(
+        'id', 'LabPatientTestID', 'last_updated', 'is_word_report', 'consulting_doctor', 'report_created_by'))
+    department_defaults = list(DefaultsForDepartments.objects.filter(
+        department__in=department_ids).order_by('id').values_list('id', 'department', 'doctor', 'lab_technician'))
+
+    patients = list(Patient.objects.filter(pk__in=patient_ids).order_by('id').values_list(
+        'id', 'title', 'name', 'age', 'dob', 'ULabPatientAge', 'gender', 'referral_doctor', 'mobile_number',
+        'mr_no', 'visit_id', 'partner', 'attender_name', 'attender_relationship_title', 'email', 'area', 'address',
+        'created_by', 'added_on', 'branch'))
+    phlebotomists = list(LabPhlebotomist.objects.filter(LabPatientTestID__in=test_ids).order_by('id').values_list(
+        'id', 'LabPatientTestID', 'assession_number', 'is_received', 'received_by', 'received_at', 'is_collected',
+        'collected_by', 'collected_at'))
+    invoices = list(LabPatientInvoice.objects.filter(patient__in=patient_ids).order_by('id').values_list(
+        'id', 'patient', 'invoice_id', 'total_price', 'total_discount', 'total_due', 'total_paid', 'total_refund'))
+
+    # Names and signatures of the doctors and staff signing the reports, the referral doctors, the staff who
+    # registered the patients and the phlebotomists are printed on them
+    doctor_ids = ({technician[4] for technician in technicians} | {defaults[2] for defaults in department_defaults} |
+                  {patient[7] for patient in patients})
+    staff_ids = ({technician[5] for technician in technicians} | {defaults[3] for defaults in department_defaults} |
+                 {patient[17] for patient in patients} | {phlebotomist[4] for phlebotomist in phlebotomists} |
+                 {phlebotomist[7] for phlebotomist in phlebotomists})
+    business_profile = BusinessProfiles.objects.filter(organization_name=client.name).values().first()
+    business_id = business_profile['id'] if business_profile else None
+
+    key_data = {
+        'schema': connection.schema_name,
+        'tests': tests,
+        'technicians': technicians,
+        'department_defaults': department_defaults,
+        'doctors': list(LabDoctors.objects.filter(pk__in=doctor_ids).order_by('id').values_list(
+            'id', 'name', 'signature_for_consulting', 'last_updated')),
+        'staff': list(LabStaff.objects.filter(pk__in=staff_ids).order_by('id').values_list('id', 'name', 'signature')),
+        'phlebotomists': phlebotomists,
+        'appointments': list(AppointmentDetails.objects.filter(patient__in=patient_ids).order_by('id').values_list(
+            'id', 'patient', 'appointment_at')),
+        'invoices': invoices,
+        # The payments of the receipts give the paid amount printed with the payment status
+        'receipts': list(LabPatientReceipts.objects.filter(
+            invoiceid__in=[invoice[0] for invoice in invoices]).order_by('id', 'payments').values_list(
+            'id', 'invoiceid', 'Receipt_id', 'payments', 'payments__pay_mode', 'payments__paid_amount')),
+        'packages': list(LabPatientPackages.objects.filter(patient__in=patient_ids).order_by('id').values_list(
+            'id', 'patient', 'last_updated')),
+        'fixed_reports': list(LabPatientFixedReportTemplate.objects.filter(
+            LabPatientTestID__in=test_ids).order_by('id').values_list(
+            'id', 'LabPatientTestID', 'template', 'ordering', 'group', 'method', 'parameter', 'value', 'units',
+            'referral_range', 'is_value_only', 'is_value_bold')),
+        'word_reports': list(LabPatientWordReportTemplate.objects.filter(
+            LabPatientTestID__in=test_ids).order_by('id').values_list('id', 'LabPatientTestID', 'last_updated_on')),
+        'remarks': list(LabTechnicianRemarks.objects.filter(LabPatientTestID__in=test_ids).order_by('id').values_list(
+            'id', 'remark')),
+        'patients': patients,
+        'letterhead_settings': list(LetterHeadSettings.objects.filter(client=client).values()),
+        'report_font_sizes': list(ReportFontSizes.objects.values()),
+        'print_report_settings': list(PrintReportSettings.objects.values()),
+        'print_templates': PrintDataTemplate.objects.aggregate(last_updated=Max('last_updated'))['last_updated'],
+        'business_profile': business_profile,
+        'business_address': BusinessAddresses.objects.filter(b_id=business_id).values().first(),
+        'contacts': BContacts.objects.filter(b_id=business_id, is_primary=True).values().first(),
+        'sourcing_lab_letterhead': list(SourcingLabLetterHeadSettings.objects.filter(
+            sourcing_lab=sourcing_lab_for_settings).values()) if sourcing_lab_for_settings else None,
+        'letterhead': str(letterhead).strip().lower(),
+        'water_mark': str(water_mark).strip().lower(),
+    }
+
+    encoded = json.dumps(key_data, sort_keys=True, default=_default).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_cached_report(key, schema_name=None):
+    # Returns (pdf_binary, metadata) or None
+    pdf_path, meta_path = _entry_paths(key, schema_name)
+    try:
+        with open(pdf_path, 'rb') as pdf_file:
+            pdf_binary = pdf_file.read()
+        with open(meta_path, 'r', encoding='utf-8') as meta_file:
+            metadata = json.load(meta_file)
+        return pdf_binary, metadata
+    except (FileNotFoundError, ValueError):
+        return None
+    except OSError as error:
+        logger.error(f"Error reading cached report {key}: {error}")
+        return None
+
+
+def _atomic_write(path, content, mode):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(file_descriptor, mode) as temp_file:
+            temp_file.write(content)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def set_cached_report(key, pdf_binary, test_ids, metadata=None, schema_name=None):
+    schema_name = schema_name or connection.schema_name
+    pdf_path, meta_path = _entry_paths(key, schema_name)
+    try:
+        _atomic_write(pdf_path, pdf_binary, 'wb')
+        _atomic_write(meta_path, json.dumps(metadata or {}, default=_default), 'w')
+    except OSError as error:
+        logger.error(f"Error writing cached report {key}: {error}")
+        return
+
+    # Index each test to its entries, so that edits can remove the files instead of leaving them to expire
+    for test_id in test_ids:
+        index_key = f'{TEST_INDEX_KEY_PREFIX}:{schema_name}:{test_id}'
+        keys = cache.get(index_key) or []
+        if key not in keys:
+            keys.append(key)
+        cache.set(index_key, keys, timeout=None)
+
+
+def _remove_entry(key, schema_name=None):
+    for path in _entry_paths(key, schema_name):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def invalidate_test_reports(test_id, schema_name=None):
+    schema_name = schema_name or connection.schema_name
+    index_key = f'{TEST_INDEX_KEY_PREFIX}:{schema_name}:{test_id}'
+    keys = cache.get(index_key) or []
+    for key in keys:
+        _remove_entry(key, schema_name)
+    cache.delete(index_key)
+
+
+def invalidate_tenant_reports(schema_name=None):
+    shutil.rmtree(_schema_dir(schema_name), ignore_errors=True)
+
+
+def purge_expired_reports(max_age_days=None):
+    # Entries of superseded keys are never read again, this removes them from disk after a while
+    max_age_days = max_age_days or getattr(settings, 'REPORT_PDF_CACHE_MAX_AGE_DAYS', 30)
+    expiry = time.time() - max_age_days * 24 * 60 * 60
+    removed = 0
+    for root, dirs, files in os.walk(get_cache_root()):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            try:
+                if os.path.getmtime(path) < expiry:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    print(f'Removed {removed} expired report cache files')
+    return removed
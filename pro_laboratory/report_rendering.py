@@ -0,0 +1,158 @@
+import base64
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from pypdf import PdfWriter, PdfReader
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY_PREFIX = 'report_render_job'
+JOB_RESULT_KEY_PREFIX = 'report_render_job_pdf'
+
+JOB_QUEUED = 'queued'
+JOB_RENDERING = 'rendering'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+
+def render_html_to_pdf(html_content):
+    # Runs inside the worker processes, so weasyprint is only imported there
+    from weasyprint import HTML
+    return HTML(string=html_content).write_pdf()
+
+
+def merge_pdfs(pdf_binaries):
+    pdf_writer = PdfWriter()
+
+    # Loop through each binary PDF and merge them
+    for pdf_binary in pdf_binaries:
+        pdf_reader = PdfReader(BytesIO(pdf_binary))
+        for page in pdf_reader.pages:
+            pdf_writer.add_page(page)
+
+    merged_pdf_binary = BytesIO()
+    pdf_writer.write(merged_pdf_binary)
+    return merged_pdf_binary.getvalue()
+
+
+def pdf_to_base64_data(pdf_binary):
+    pdf_base64 = base64.b64encode(pdf_binary).decode('utf-8')
+    return f"data:application/pdf;base64,{pdf_base64}"
+
+
+class ReportRenderPool:
+    """
+    Process pool used for WeasyPrint rendering.
+    Workers are started with the 'spawn' method so that no database connections or threads of the
+    ASGI process are inherited, and are recycled after a number of renders to release WeasyPrint memory.
+    """
+    max_tasks_per_child = 50
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    max_workers = getattr(settings, 'REPORT_RENDER_WORKERS', None) or os.cpu_count() or 1
+                    self._executor = ProcessPoolExecutor(max_workers=max_workers,
+                                                         mp_context=multiprocessing.get_context('spawn'),
+                                                         max_tasks_per_child=self.max_tasks_per_child)
+        return self._executor
+
+    def render_parts(self, html_parts):
+        """
+        Renders every html part in parallel and returns the PDFs in the same order.
+        A single part is rendered in the calling thread, as the round trip to a worker would only add latency.
+        """
+        if len(html_parts) == 1:
+            return [render_html_to_pdf(html_parts[0])]
+
+        executor = self.get_executor()
+        futures = [executor.submit(render_html_to_pdf, html_content) for html_content in html_parts]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+report_render_pool = ReportRenderPool()
+
+
+def render_and_merge_pdfs(html_parts):
+    pdf_files = report_render_pool.render_parts(html_parts)
+    if len(pdf_files) == 1:
+        return pdf_files[0]
+    return merge_pdfs(pdf_files)
+
+
+def get_job_timeout():
+    return getattr(settings, 'REPORT_RENDER_JOB_TTL', 60 * 60)
+
+
+def get_job(job_id):
+    return cache.get(f'{JOB_KEY_PREFIX}:{job_id}')
+
+
+def get_job_pdf(job_id):
+    return cache.get(f'{JOB_RESULT_KEY_PREFIX}:{job_id}')
+
+
+def _save_job(job):
+    cache.set(f"{JOB_KEY_PREFIX}:{job['job_id']}", job, timeout=get_job_timeout())
+
+
+def _update_job(job, **fields):
+    job.update(fields)
+    _save_job(job)
+
+
+def _run_job(job, html_parts, on_complete=None):
+    try:
+        _update_job(job, status=JOB_RENDERING)
+        pdf_binary = render_and_merge_pdfs(html_parts)
+        cache.set(f"{JOB_RESULT_KEY_PREFIX}:{job['job_id']}", pdf_binary, timeout=get_job_timeout())
+        _update_job(job, status=JOB_COMPLETED, completed_at=datetime.now().isoformat())
+        if on_complete is not None:
+            on_complete(pdf_binary)
+    except Exception as error:
+        logger.error(f"Report render job {job['job_id']} failed: {error}", exc_info=True)
+        _update_job(job, status=JOB_FAILED, error=str(error), completed_at=datetime.now().isoformat())
+
+
+def submit_render_job(html_parts, report_name=None, extra=None, on_complete=None):
+    """
+    Queues html parts for rendering and returns the job record immediately.
+    The merged PDF is stored in the cache once all parts are rendered and can be fetched by job id,
+    on_complete is then called with the PDF binary from the job thread.
+    """
+    job = {
+        'job_id': uuid.uuid4().hex,
+        'status': JOB_QUEUED,
+        'report_name': report_name,
+        'parts': len(html_parts),
+        'created_at': datetime.now().isoformat(),
+        'completed_at': None,
+        'error': None,
+    }
+    if extra:
+        job.update(extra)
+    _save_job(job)
+
+    worker = threading.Thread(target=_run_job, args=(job, list(html_parts), on_complete), daemon=True)
+    worker.start()
+    return job
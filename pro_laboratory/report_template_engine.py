@@ -0,0 +1,227 @@
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+from django.db import connection
+
+from pro_universal_data.models import Tag
+
+# Same patterns the report views used with re.sub
+TAG_PATTERN = re.compile(r"\{(.*?)\}")
+EXPRESSION_PATTERN = re.compile(r"\[\[(.*?)\]\]")
+
+LITERAL = 0
+TAG = 1
+EXPRESSION = 2
+
+CompiledTag = namedtuple('CompiledTag', ['tag_name', 'is_collection', 'has_formula', 'code'])
+CompiledTemplate = namedtuple('CompiledTemplate', ['nodes', 'two_phase'])
+
+
+@lru_cache(maxsize=4096)
+def compile_formula(formula):
+    # Returns None when the formula cannot be compiled, so callers fall back exactly like a failing eval().
+    # eval() of a string ignores leading spaces and tabs, compile() does not.
+    try:
+        return compile(formula.lstrip(' \t'), '<report-formula>', 'eval')
+    except (SyntaxError, ValueError, TypeError):
+        return None
+
+
+class TagTable:
+    """
+    In-process table of every Tag row with its formula pre-compiled.
+    Tags live in the public schema and change rarely, so the whole table is loaded in one query and
+    reloaded after refresh_interval seconds or when clear() is called from the Tag signals.
+    """
+    refresh_interval = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tags = None
+        self._loaded_at = 0
+
+    def _load(self):
+        tags = {}
+        for tag in Tag.objects.all().only('tag_name', 'tag_formula', 'is_collection'):
+            if not tag.tag_name:
+                continue
+            code = compile_formula(tag.tag_formula) if tag.tag_formula else None
+            tags[tag.tag_name] = CompiledTag(tag_name=tag.tag_name, is_collection=tag.is_collection,
+                                             has_formula=bool(tag.tag_formula), code=code)
+        return tags
+
+    def get_tags(self):
+        tags = self._tags
+        if tags is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+            with self._lock:
+                if self._tags is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+                    self._tags = self._load()
+                    self._loaded_at = time.monotonic()
+                tags = self._tags
+        return tags
+
+    def get(self, tag_name):
+        return self.get_tags().get('{' + tag_name + '}')
+
+    def clear(self):
+        with self._lock:
+            self._tags = None
+            self._loaded_at = 0
+
+
+tag_table = TagTable()
+
+
+def _split_expressions(text, nodes):
+    position = 0
+    for match in EXPRESSION_PATTERN.finditer(text):
+        if match.start() > position:
+            nodes.append((LITERAL, text[position:match.start()]))
+        nodes.append((EXPRESSION, match.group(1)))
+        position = match.end()
+    if position < len(text):
+        nodes.append((LITERAL, text[position:]))
+
+
+@lru_cache(maxsize=512)
+def compile_template(text):
+    """
+    Parses template text into literal, tag and [[expression]] nodes.
+    If an expression wraps a tag, the expression can only be evaluated after the tag is substituted,
+    so such templates are marked two_phase and rendered in the same order as the old re.sub chain.
+    """
+    text = text or ""
+    tag_spans = [(match.start(), match.end()) for match in TAG_PATTERN.finditer(text)]
+    expression_spans = [(match.start(), match.end()) for match in EXPRESSION_PATTERN.finditer(text)]
+    two_phase = any(e_start < t_end and t_start < e_end
+                    for e_start, e_end in expression_spans for t_start, t_end in tag_spans)
+
+    nodes = []
+    position = 0
+    for match in TAG_PATTERN.finditer(text):
+        literal = text[position:match.start()]
+        if literal:
+            if two_phase:
+                nodes.append((LITERAL, literal))
+            else:
+                _split_expressions(literal, nodes)
+        nodes.append((TAG, match.group(1)))
+        position = match.end()
+
+    literal = text[position:]
+    if literal:
+        if two_phase:
+            nodes.append((LITERAL, literal))
+        else:
+            _split_expressions(literal, nodes)
+
+    return CompiledTemplate(nodes=tuple(nodes), two_phase=two_phase)
+
+
+class CompiledTemplateCache:
+    """
+    Compiled PrintDataTemplate sections keyed by (schema, template id, last_updated, field).
+    An edit bumps last_updated, so stale entries are never hit and simply age out of the LRU.
+    """
+    max_entries = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, template, field):
+        key = (connection.schema_name, template.pk, template.last_updated, field)
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                return compiled
+
+        compiled = compile_template(getattr(template, field) or "")
+
+        with self._lock:
+            self._entries[key] = compiled
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+compiled_template_cache = CompiledTemplateCache()
+
+
+def get_compiled_template(template, field='data'):
+    return compiled_template_cache.get(template, field)
+
+
+def resolve_tag(tag_name, lab_patient_test=None, client_report_settings=None, details=None):
+    tag = tag_table.get(tag_name)
+    if tag is None:
+        if lab_patient_test and lab_patient_test.department.name == 'Medical Examination':
+            return details.get(f'{tag_name}', "")
+        print(f"{tag_name} not found!")
+        return ""
+
+    if tag.is_collection:
+        from pro_laboratory.views.universal_views import get_value_of_tag
+        return get_value_of_tag(tag_name=tag_name, lab_patient_test=lab_patient_test,
+                                client_report_settings=client_report_settings)
+
+    if not tag.has_formula:
+        print(f"No formula for {tag_name}")
+        return ""
+
+    try:
+        if tag.code is None:
+            raise SyntaxError(f"invalid formula for {tag_name}")
+        return str(eval(tag.code, {'details': details}))
+    except Exception as eval_error:
+        print(f"{tag_name} - Error in formula evaluation: {eval_error}")
+        return " "
+
+
+def evaluate_compiled_expression(expression, details=None):
+    code = compile_formula(expression)
+    try:
+        if code is None:
+            raise SyntaxError(f"invalid expression {expression}")
+        return str(eval(code, {'__builtins__': None}, {'details': details}))
+    except Exception as eval_error:
+        print(f"Error in expression evaluation: {eval_error}")
+        return ""
+
+
+def render_template(compiled, lab_patient_test=None, client_report_settings=None, details=None):
+    parts = []
+    for node_type, value in compiled.nodes:
+        if node_type == LITERAL:
+            parts.append(value)
+        elif node_type == TAG:
+            tag_value = resolve_tag(value, lab_patient_test=lab_patient_test,
+                                    client_report_settings=client_report_settings, details=details)
+            parts.append(tag_value if tag_value is not None else "")
+        else:
+            parts.append(evaluate_compiled_expression(value, details=details))
+
+    content = ''.join(parts)
+
+    if compiled.two_phase:
+        content = EXPRESSION_PATTERN.sub(lambda match: evaluate_compiled_expression(match.group(1), details=details),
+                                         content)
+    return content
+
+
+def render_template_text(text, lab_patient_test=None, client_report_settings=None, details=None):
+    return render_template(compile_template(text or ""), lab_patient_test=lab_patient_test,
+                           client_report_settings=client_report_settings, details=details)
+
+
+def render_template_field(template, field, lab_patient_test=None, client_report_settings=None, details=None):
+    return render_template(get_compiled_template(template, field), lab_patient_test=lab_patient_test,
+                           client_report_settings=client_report_settings, details=details)
@@ -3,7 +3,8 @@ from tempfile import template
 from rest_framework import serializers
 
 from pro_laboratory.models.bulk_messaging_models import BulkMessagingLogs, BulkSendSMSData, \
-    BulkSendAndSaveWhatsAppSMSData, BulkMessagingTemplates, BusinessMessagesCredits, BulkMessagingHistory
+    BulkSendAndSaveWhatsAppSMSData, BulkMessagingTemplates, BusinessMessagesCredits, BulkMessagingHistory, \
+    BulkMessagingJob
 
 
 class BulkMessagingLogsSerializer(serializers.ModelSerializer):
@@ -76,4 +77,24 @@ class BulkMessagingHistorySerializer(serializers.ModelSerializer):
             representation['created_by']={"id":created_by.id,
                                           "name":created_by.name}
 
-        return representation
\ No newline at end of file
+        return representation
+
+
+class BulkMessagingJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BulkMessagingJob
+        exclude = ['recipients']
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+
+        representation['template'] = {"id": instance.template.id,
+                                      "templateName": instance.template.templateName} if instance.template else None
+        representation['processed_messages'] = instance.sent_messages + instance.failed_messages
+
+        created_by = instance.created_by
+        if created_by:
+            representation['created_by'] = {"id": created_by.id,
+                                            "name": created_by.name}
+
+        return representation
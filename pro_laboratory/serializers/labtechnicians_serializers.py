@@ -3,11 +3,11 @@ from datetime import datetime
 from rest_framework import serializers
 
 from pro_laboratory.models.doctors_models import LabDoctors
-from pro_laboratory.models.global_models import LabFixedReportNormalReferralRanges
 from pro_laboratory.models.labtechnicians_models import LabTechnicians, LabTechnicianRemarks, \
     LabPatientWordReportTemplate, LabPatientFixedReportTemplate
 from pro_laboratory.models.patient_models import LabPatientTests, Patient
 from pro_laboratory.models.phlebotomists_models import LabPhlebotomist
+from pro_laboratory.reference_ranges import get_reference_range_index
 from pro_laboratory.serializers.global_serializers import LabFixedReportNormalReferralRangesSerializer
 from pro_laboratory.serializers.phlebotomists_serializers import LabPhlebotomistSerializer
 
@@ -146,16 +146,11 @@ class LabPatientFixedReportTemplateSerializer(serializers.ModelSerializer):
         return patient_age_in_days
 
     def get_normal_range_for_patient(self, patient_gender=None, patient_age_in_days=None, parameter=None):
-        genders_to_check = ["Both", f"{patient_gender}"]
-        normal_ranges = LabFixedReportNormalReferralRanges.objects.filter(parameter_id=parameter,
-                                                                          gender__name__in=genders_to_check,
-                                                                          age_min_in_days__lte=patient_age_in_days,
-                                                                          age_max_in_days__gte=patient_age_in_days
-                                                                          )
-
-        normal_range = normal_ranges.first() if normal_ranges else None
-
-        return normal_range
+        # The index is read once per serializer, so a list of parameters checks the ranges version once
+        if not hasattr(self, '_reference_ranges'):
+            self._reference_ranges = get_reference_range_index()
+        parameter_id = parameter.id if parameter else None
+        return self._reference_ranges.get_normal_range(parameter_id, patient_gender, patient_age_in_days)
 
     def to_representation(self, instance):
         fixed_parameter = instance.template
@@ -181,12 +176,19 @@ class LabPatientTestFixedReportGenerationSerializer(serializers.Serializer):
 
 
 class LabPatientTestReportGenerationSerializer(serializers.Serializer):
-    lab_patient_test_id = serializers.IntegerField()
+    lab_patient_test_id = serializers.IntegerField(required=False)
+    lab_patient_test_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
     created_by = serializers.IntegerField(required=False)
     template_id = serializers.IntegerField(required=False, allow_null=True)
 
     class Meta:
-        fields = ['lab_patient_test_id', 'created_by','template_id']
+        fields = ['lab_patient_test_id', 'lab_patient_test_ids', 'created_by','template_id']
+
+    def validate(self, attrs):
+        if not attrs.get('lab_patient_test_id') and not attrs.get('lab_patient_test_ids'):
+            raise serializers.ValidationError(
+                {'lab_patient_test_id': 'lab_patient_test_id or lab_patient_test_ids is required'})
+        return attrs
 
 
 class LabPatientTestWordReportGenerationSerializer(serializers.Serializer):
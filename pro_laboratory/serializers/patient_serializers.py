@@ -19,9 +19,11 @@ from pro_laboratory.models.global_models import LabDiscountType, LabGlobalTests,
     LabStaffDefaultBranch
 from pro_laboratory.models.lab_appointment_of_patient_models import LabAppointmentForPatient
 from pro_laboratory.models.labtechnicians_models import LabTechnicians
+from pro_laboratory.models.messaging_models import OutboundMessage
 from pro_laboratory.models.patient_models import HomeService, Patient, LabPatientInvoice, \
     LabPatientReceipts, LabPatientTests, LabPatientRefund, LabPatientPayments, LabPatientPackages
 from pro_laboratory.models.phlebotomists_models import LabPhlebotomist
+from pro_laboratory.outbound_messages import enqueue_messages
 from pro_laboratory.models.sourcing_lab_models import SourcingLabRevisedTestPrice, SourcingLabRegistration, \
     SourcingLabTestsTracker
 from pro_laboratory.serializers.b2b_serializers import CompanyWorkPartnershipSerializer
@@ -34,8 +36,6 @@ from pro_pharmacy.models import PatientMedicine, PharmaStock
 from pro_pharmacy.serializers import PharmaStockGetSerializer
 from pro_universal_data.models import ULabTestStatus, ULabPaymentModeType, PaymentFor
 from pro_universal_data.serializers import ULabPatientTitlesSerializer
-from pro_universal_data.models import MessagingTemplates, MessagingSendType
-from pro_universal_data.views import send_and_log_whatsapp_sms, send_and_log_sms
 
 
 class HomeServiceSerializer(serializers.ModelSerializer):
@@ -825,46 +825,28 @@ class PatientSerializer(serializers.ModelSerializer):
                                     test.added_on = added_on_time
                                     test.save()
 
-                    # Optionally, handle SMS and WhatsApp notifications here
-                    try:
-                        send_and_log_sms(search_id=patient.id, numbers=patient.mobile_number,
-                                         sms_template=MessagingTemplates.objects.get(pk=1),
-                                         messaging_send_type=MessagingSendType.objects.get(pk=1), client=client)
-                    except Exception as error:
-                        print(error)
-                        logger.error(f"SMS sending failed for patient {patient.id}: {error}", exc_info=True)
-
-                    try:                        
-                        print(1111, patient.name)
-                        print(client)
-                        send_and_log_whatsapp_sms(search_id=patient.id, numbers=patient.mobile_number,
-                                                  mwa_template=MessagingTemplates.objects.get(pk=10),
-                                                  messaging_send_type=MessagingSendType.objects.get(pk=1),
-                                                  client=client,send_reports_type='Automatic')
-                        
-                        print(1111, patient.name)
-                    except Exception as error:
-                        print(error)
-                        logger.error(f"Whatsapp SMS sending failed for patient {patient.id}: {error}", exc_info=True)
+                    # SMS and WhatsApp notifications are sent in the background once the patient is committed
+                    messages = [
+                        OutboundMessage(channel=OutboundMessage.SMS, template_id=1, messaging_send_type_id=1,
+                                        client=client, search_id=patient.id, numbers=patient.mobile_number),
+                        OutboundMessage(channel=OutboundMessage.WHATSAPP, template_id=10, messaging_send_type_id=1,
+                                        client=client, search_id=patient.id, numbers=patient.mobile_number,
+                                        send_reports_type='Automatic'),
+                    ]
                     if not existing_patients:
-                        try:
-                            
-                            send_and_log_whatsapp_sms(search_id=patient.id, numbers=patient.mobile_number,
-                                                      mwa_template=MessagingTemplates.objects.get(pk=12),
-                                                      messaging_send_type=MessagingSendType.objects.get(pk=1),
-                                                      client=client, send_reports_type='Automatic')
-                        except Exception as error:
-                            print(error)
-                            logger.error(f"Whatsapp SMS sending failed for patient {patient.id}: {error}",
-                                         exc_info=True)
+                        messages.append(
+                            OutboundMessage(channel=OutboundMessage.WHATSAPP, template_id=12, messaging_send_type_id=1,
+                                            client=client, search_id=patient.id, numbers=patient.mobile_number,
+                                            send_reports_type='Automatic'))
                     if patient.referral_doctor:
-                        try:
-                            send_and_log_sms(search_id=patient.id, numbers=patient.referral_doctor.mobile_number,
-                                             sms_template=MessagingTemplates.objects.get(pk=5),
-                                             messaging_send_type=MessagingSendType.objects.get(pk=1), client=client)
-                        except Exception as error:
-                            print(error)
-                            logger.error(f"SMS sending failed for referral doctor {patient.id}: {error}", exc_info=True)
+                        messages.append(
+                            OutboundMessage(channel=OutboundMessage.SMS, template_id=5, messaging_send_type_id=1,
+                                            client=client, search_id=patient.id,
+                                            numbers=patient.referral_doctor.mobile_number))
+                    try:
+                        enqueue_messages(messages)
+                    except Exception as error:
+                        logger.error(f"Queueing messages failed for patient {patient.id}: {error}", exc_info=True)
                     return patient
 
             except Exception as error:
@@ -1,9 +1,21 @@
-from django.core.cache import cache
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 
+from healtho_pro.list_cache import invalidate_list_cache
+from pro_laboratory.models.client_based_settings_models import LetterHeadSettings, ReportFontSizes, \
+    PrintReportSettings, BusinessControls, BusinessMessageSettings
 from pro_laboratory.models.doctors_models import LabDoctors
-from pro_laboratory.models.patient_models import LabPatientTests
+from pro_laboratory.models.global_models import LabFixedReportNormalReferralRanges
+from pro_laboratory.models.labtechnicians_models import LabPatientFixedReportTemplate, LabPatientWordReportTemplate, \
+    LabTechnicians, LabTechnicianRemarks
+from pro_laboratory.daily_rollups import mark_rollup_dates_on_commit
+from pro_laboratory.models.patient_models import LabPatientTests, Patient, LabPatientInvoice, LabPatientReceipts, \
+    LabPatientRefund, LabPatientPayments
+from pro_laboratory.models.universal_models import PrintDataTemplate, PrintTemplate
+from pro_laboratory.reference_ranges import bump_reference_ranges_version
+from pro_laboratory.report_pdf_cache import invalidate_test_reports, invalidate_tenant_reports
+from pro_laboratory.tenant_settings import bump_settings_version
 from pro_laboratory.views.labtechnicians_views import send_sms_when_reports_completed
 
 
@@ -20,16 +32,128 @@ from django.db import connection
 @receiver(post_delete, sender=LabDoctors)
 def invalidate_lab_doctors_cache(sender, instance, **kwargs):
     try:
-        client_id = connection.schema_name  # This works with django-tenants
-        cache_key_prefix = f'lab_referral_doctors_{client_id}_'
-
-        # Fetch all cache keys that match the pattern and delete them
-        keys_to_delete = cache.keys(f'{cache_key_prefix}*')
-        for key in keys_to_delete:
-            cache.delete(key)
-            print(f"Deleted cache key: {key}")
+        invalidate_list_cache('lab_referral_doctors')
 
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
         logger.error(f"Cache invalidation failed for LabDoctors: {e}")
+
+
+@receiver(post_save, sender=LabPatientFixedReportTemplate)
+@receiver(post_delete, sender=LabPatientFixedReportTemplate)
+@receiver(post_save, sender=LabPatientWordReportTemplate)
+@receiver(post_delete, sender=LabPatientWordReportTemplate)
+@receiver(post_save, sender=LabTechnicians)
+@receiver(post_delete, sender=LabTechnicians)
+@receiver(post_save, sender=LabTechnicianRemarks)
+@receiver(post_delete, sender=LabTechnicianRemarks)
+def invalidate_cached_test_report(sender, instance, **kwargs):
+    try:
+        if instance.LabPatientTestID_id:
+            invalidate_test_reports(instance.LabPatientTestID_id)
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Report cache invalidation failed for {sender.__name__}: {e}")
+
+
+@receiver(post_save, sender=LetterHeadSettings)
+@receiver(post_delete, sender=LetterHeadSettings)
+def invalidate_letterhead_settings_list(sender, instance, **kwargs):
+    try:
+        invalidate_list_cache('letterhead_settings')
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Cache invalidation failed for LetterHeadSettings: {e}")
+
+
+@receiver(post_save, sender=LetterHeadSettings)
+@receiver(post_save, sender=ReportFontSizes)
+@receiver(post_save, sender=PrintDataTemplate)
+def invalidate_cached_tenant_reports(sender, instance, **kwargs):
+    try:
+        invalidate_tenant_reports()
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Report cache invalidation failed for {sender.__name__}: {e}")
+
+
+@receiver(post_save, sender=LetterHeadSettings)
+@receiver(post_delete, sender=LetterHeadSettings)
+@receiver(post_save, sender=PrintReportSettings)
+@receiver(post_delete, sender=PrintReportSettings)
+@receiver(post_save, sender=ReportFontSizes)
+@receiver(post_delete, sender=ReportFontSizes)
+@receiver(post_save, sender=BusinessControls)
+@receiver(post_delete, sender=BusinessControls)
+@receiver(post_save, sender=BusinessMessageSettings)
+@receiver(post_delete, sender=BusinessMessageSettings)
+@receiver(post_save, sender=PrintTemplate)
+@receiver(post_delete, sender=PrintTemplate)
+@receiver(post_save, sender=PrintDataTemplate)
+@receiver(post_delete, sender=PrintDataTemplate)
+def invalidate_tenant_settings_snapshot(sender, instance, **kwargs):
+    schema_name = connection.schema_name
+
+    def bump_version():
+        try:
+            bump_settings_version(schema_name)
+        except Exception as e:
+            import logging
+            logger = logging.getLogger(__name__)
+            logger.error(f"Tenant settings invalidation failed for {sender.__name__}: {e}")
+
+    transaction.on_commit(bump_version)
+
+
+@receiver(post_save, sender=LabFixedReportNormalReferralRanges)
+@receiver(post_delete, sender=LabFixedReportNormalReferralRanges)
+def invalidate_reference_range_index(sender, instance, **kwargs):
+    schema_name = connection.schema_name
+
+    def bump_version():
+        try:
+            bump_reference_ranges_version(schema_name)
+        except Exception as e:
+            import logging
+            logger = logging.getLogger(__name__)
+            logger.error(f"Reference ranges invalidation failed for {schema_name}: {e}")
+
+    transaction.on_commit(bump_version)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=LabPatientReceipts)
+@receiver(post_delete, sender=LabPatientReceipts)
+@receiver(post_save, sender=LabPatientRefund)
+@receiver(post_delete, sender=LabPatientRefund)
+@receiver(post_save, sender=LabPatientTests)
+@receiver(post_delete, sender=LabPatientTests)
+def mark_rollup_date_of_row(sender, instance, **kwargs):
+    mark_rollup_dates_on_commit(instance.added_on)
+
+
+@receiver(post_save, sender=LabPatientInvoice)
+@receiver(post_delete, sender=LabPatientInvoice)
+def mark_rollup_date_of_invoice(sender, instance, **kwargs):
+    # Referral revenue is counted on the registration date of the patient
+    patient_added_on = Patient.objects.filter(pk=instance.patient_id).values_list('added_on', flat=True).first()
+    mark_rollup_dates_on_commit(patient_added_on or instance.added_on)
+
+
+@receiver(post_save, sender=LabPatientPayments)
+def mark_rollup_dates_of_payment(sender, instance, created, **kwargs):
+    # New payments are counted once they are added to their receipt
+    if not created:
+        mark_rollup_dates_on_commit(*LabPatientReceipts.objects.filter(payments=instance).values_list(
+            'added_on', flat=True))
+
+
+@receiver(m2m_changed, sender=LabPatientReceipts.payments.through)
+def mark_rollup_date_of_receipt_payments(sender, instance, action, reverse, **kwargs):
+    if not reverse and action in ['post_add', 'post_remove', 'post_clear']:
+        mark_rollup_dates_on_commit(instance.added_on)
@@ -0,0 +1,182 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import connection
+
+from healtho_pro_user.models.business_models import GlobalMessagingSettings
+from pro_laboratory.models.client_based_settings_models import LetterHeadSettings, PrintReportSettings, \
+    ReportFontSizes, BusinessControls, BusinessMessageSettings
+from pro_laboratory.models.universal_models import PrintTemplate, PrintDataTemplate
+from pro_universal_data.models import ULabTestStatus
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY_PREFIX = 'tenant_settings_version'
+SNAPSHOT_KEY_PREFIX = 'tenant_settings_snapshot'
+
+# Version of the settings stored in the public schema, shared by every tenant
+GLOBAL_VERSION_SCHEMA = 'public'
+
+
+class TenantSettingsSnapshot:
+    """
+    Near-static configuration of one tenant, loaded with one query per model.
+    Instances are shared between requests of the schema, so the model objects in it must not be modified.
+    """
+
+    def __init__(self, schema_name):
+        self.schema_name = schema_name
+        self.letterhead_settings = {obj.client_id: obj for obj in
+                                    LetterHeadSettings.objects.select_related('default_font').order_by('-id')}
+        self.print_report_settings = PrintReportSettings.objects.first()
+        self.report_font_sizes = ReportFontSizes.objects.first()
+        self.business_controls = BusinessControls.objects.first()
+        self.business_message_settings = {obj.client_id: obj for obj in
+                                          BusinessMessageSettings.objects.order_by('-id')}
+        self.first_business_message_settings = BusinessMessageSettings.objects.first()
+
+        self.global_messaging_settings = {}
+        for obj in GlobalMessagingSettings.objects.order_by('id'):
+            self.global_messaging_settings.setdefault(obj.type_id, obj)
+
+        self.test_statuses = {}
+        for obj in ULabTestStatus.objects.order_by('id'):
+            self.test_statuses.setdefault(obj.name, []).append(obj)
+
+        # Default print template of every type, with its data templates
+        self.default_print_templates = {}
+        for print_template in PrintTemplate.objects.filter(is_default=True).select_related(
+                'print_template_type').order_by('id'):
+            if print_template.print_template_type:
+                self.default_print_templates.setdefault(print_template.print_template_type.name, print_template)
+
+        self.print_data_templates = {}
+        for data_template in PrintDataTemplate.objects.filter(
+                print_template__in=self.default_print_templates.values()).order_by('id'):
+            self.print_data_templates.setdefault(data_template.print_template_id, []).append(data_template)
+
+    def get_letterhead_settings(self, client=None):
+        client_id = client.pk if hasattr(client, 'pk') else client
+        return self.letterhead_settings.get(client_id)
+
+    def get_business_message_settings(self, client=None):
+        if client is None:
+            return self.first_business_message_settings
+        client_id = client.pk if hasattr(client, 'pk') else client
+        return self.business_message_settings.get(client_id)
+
+    def get_global_messaging_settings(self, type_id):
+        return self.global_messaging_settings.get(type_id)
+
+    def get_test_status(self, name):
+        # Same errors as ULabTestStatus.objects.get(name=name)
+        statuses = self.test_statuses.get(name)
+        if not statuses:
+            raise ULabTestStatus.DoesNotExist(f"ULabTestStatus matching query does not exist: {name}")
+        if len(statuses) > 1:
+            raise ULabTestStatus.MultipleObjectsReturned(f"get() returned more than one ULabTestStatus: {name}")
+        return statuses[0]
+
+    def get_default_print_template(self, template_type_name):
+        return self.default_print_templates.get(template_type_name)
+
+    def get_default_data_templates(self, template_type_name):
+        print_template = self.default_print_templates.get(template_type_name)
+        if print_template is None:
+            return []
+        return self.print_data_templates.get(print_template.id, [])
+
+    def get_default_data_template(self, template_type_name):
+        # Same errors as PrintDataTemplate.objects.get(print_template=<default template of the type>)
+        data_templates = self.get_default_data_templates(template_type_name)
+        if not data_templates:
+            raise PrintDataTemplate.DoesNotExist(f"Default template does not exist for {template_type_name}")
+        if len(data_templates) > 1:
+            raise PrintDataTemplate.MultipleObjectsReturned(
+                f"More than one default template for {template_type_name}")
+        return data_templates[0]
+
+
+def _version_key(schema_name):
+    return f'{VERSION_KEY_PREFIX}:{schema_name}'
+
+
+def bump_settings_version(schema_name=None):
+    # A new random version instead of incr(), so that a missing or evicted key needs no special handling
+    schema_name = schema_name or connection.schema_name
+    cache.set(_version_key(schema_name), uuid.uuid4().hex, timeout=None)
+
+
+def bump_global_settings_version():
+    bump_settings_version(schema_name=GLOBAL_VERSION_SCHEMA)
+
+
+class TenantSettingsCache:
+    """
+    Snapshots are kept in-process and in Redis, keyed by the tenant version and the global version.
+    A post_save on any of the snapshot models bumps a version, after which the next request of every
+    process builds or fetches the new snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def _get_versions(self, schema_name):
+        tenant_key, global_key = _version_key(schema_name), _version_key(GLOBAL_VERSION_SCHEMA)
+        versions = cache.get_many([tenant_key, global_key])
+        tenant_version, global_version = versions.get(tenant_key), versions.get(global_key)
+
+        if tenant_version is None:
+            cache.add(tenant_key, uuid.uuid4().hex, timeout=None)
+            tenant_version = cache.get(tenant_key)
+        if global_version is None:
+            cache.add(global_key, uuid.uuid4().hex, timeout=None)
+            global_version = cache.get(global_key)
+        return tenant_version, global_version
+
+    def get(self):
+        schema_name = connection.schema_name
+        try:
+            versions = self._get_versions(schema_name)
+        except Exception as error:
+            # Without the versions a cached snapshot cannot be trusted, so it is read from the database
+            logger.error(f"Error reading tenant settings version of {schema_name}: {error}")
+            return TenantSettingsSnapshot(schema_name)
+
+        entry = self._snapshots.get(schema_name)
+        if entry is not None and entry[0] == versions:
+            return entry[1]
+
+        snapshot_key = f'{SNAPSHOT_KEY_PREFIX}:{schema_name}:{versions[0]}:{versions[1]}'
+        snapshot = None
+        try:
+            snapshot = cache.get(snapshot_key)
+        except Exception as error:
+            logger.error(f"Error reading tenant settings snapshot of {schema_name}: {error}")
+
+        if snapshot is None:
+            snapshot = TenantSettingsSnapshot(schema_name)
+            try:
+                cache.set(snapshot_key, snapshot, timeout=24 * 60 * 60)
+            except Exception as error:
+                logger.error(f"Error saving tenant settings snapshot of {schema_name}: {error}")
+
+        with self._lock:
+            self._snapshots[schema_name] = (versions, snapshot)
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+
+tenant_settings_cache = TenantSettingsCache()
+
+
+def get_tenant_settings():
+    # Snapshot of the schema the connection is currently set to
+    return tenant_settings_cache.get()
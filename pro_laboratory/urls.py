@@ -8,7 +8,8 @@ from pro_laboratory.views.b2b_views import CompanyViewSet, CompanyRevisedPricesV
 from pro_laboratory.views.bulk_messaging_views import BulkSMSAPIView, BulkWhatsAppMessagingAPIView, \
     BulkMessagingTemplatesViewSet, BulkMessagingLogsViewSet, \
     BulkWhatsAppMessagingLogsViewSet, BulkBusinessMessagingStatisticsView, \
-    BusinessMessagesCreditsView, SendAndLogCampaignMessagesView, BulkMessagingHistoryView
+    BusinessMessagesCreditsView, SendAndLogCampaignMessagesView, BulkMessagingHistoryView, \
+    BulkMessagingJobViewSet
 from pro_laboratory.views.client_based_settings_views import LetterHeadSettingsViewSet, CopiedLabDepartmentsDataView, \
     LabDepartmentsListToCopyView, BusinessDataStatusViewSet, BusinessDiscountSettingsViewset, \
     BusinessPaidAmountSettingsViewset, BusinessPNDTDetailsViewset, PrintReportSettingsViewSet, PrintDueReportsViewset, \
@@ -39,7 +40,8 @@ from pro_laboratory.views.global_views import LabGlobalTestsViewSet, LabDiscount
     LabStaffPayRollAPIView, LeaveStatisticsAPIView, LabStaffDefaultBranchViewSet, LabStaffPageGuardView
 from pro_laboratory.views.lab_appointment_of_patient_views import LabAppointmentForPatientViewset, \
     LabDoctorsAvailability, SendingAppointmentReminderSMSTOPatientsAPIView
-from pro_laboratory.views.machine_integration_views import ProcessingMachineDataSavingView
+from pro_laboratory.views.machine_integration_views import ProcessingMachineDataSavingView, \
+    ProcessingMachineIngestionMetricsView
 from pro_laboratory.views.marketing_views import MarketingExecutiveLocationTrackerViewset, \
     MarketingExecutiveVisitsViewset, MarketingExecutiveVisitsByLabstaffView, MarketingExecutiveTargetsViewSet, \
     MarketingExecutiveTargetByLabstaffView, MarketingExecutiveStatsView, ReferralDoctorStatsAPIView
@@ -78,12 +80,12 @@ from pro_laboratory.views.universal_views import (
     TpaUltrasoundImagesViewset, ReferralDoctorReportViewset,
     PrintTemplateViewset, PrintDataTemplateViewset,
     UserCollectionReportsList, TpaUltrasoundMetaInfoListView,
-    DownloadTestReportViewset, ActivityLogsListView, GeneratePatientRefundViewset,
+    DownloadTestReportViewset, ActivityLogsListView, ActivityLogWriterMetricsView, GeneratePatientRefundViewset,
     DoctorSharedTestReportViewset, DownloadPatientReceiptViewset, GetPrivilegeCardView,
     GeneratePatientMedicalCertificateViewSet, BulkPaymentsWithGenerateReceiptView,
     ReplaceTemplateHeaderContent,
     DownloadBulkPatientsReportsViewSet, PatientsReportsSendingViaEmailAPIView,
-    GenerateConsolidatedBillViewSet, TestCollectionReportView, StringToHTMLView
+    GenerateConsolidatedBillViewSet, TestCollectionReportView, StringToHTMLView, ReportRenderJobView
 )
 from pro_laboratory.views.doctorAuthorization_views import LabDoctorAuthorizationApprovalViewSet, \
     LabDoctorAuthorizationView
@@ -228,6 +230,7 @@ router.register(r'revised_test_price', SourcingLabRevisedTestPriceViewSet, basen
 router.register(r'bulk_messaging_templates', BulkMessagingTemplatesViewSet, basename='bulk_messaging_templates')
 router.register(r'bulk_sms_messaging_logs', BulkMessagingLogsViewSet, basename='bulk_sms_messaging_logs')
 router.register(r'bulk_whatsapp_messaging_logs', BulkWhatsAppMessagingLogsViewSet, basename='bulk_whatsapp_messaging_logs')
+router.register(r'bulk_messaging_jobs', BulkMessagingJobViewSet, basename='bulk_messaging_jobs')
 router.register(r'print_medical_certificate', GeneratePatientMedicalCertificateViewSet, basename='print_medical_certificate')
 router.register(r'update_business_subscription_plans', BusinessSubscriptionPlansPurchasedViewset, basename='update_business_subscription_plans')
 router.register(r'sourcing_lab_test_tracker', SourcingLabTestsTrackerViewset, basename='sourcing_lab_test_tracker')
@@ -320,11 +323,14 @@ urlpatterns = [
     path('tpa_ultrasound_integration/', TpaUltrasoundIntegrationView.as_view(), name='tpa_ultrasound_integration'),
     path('tpa_meta_info/', TpaUltrasoundMetaInfoListView.as_view(), name='tpa_meta_info'),
     path('tpa_machine_integration/', ProcessingMachineDataSavingView.as_view(), name='tpa_machine_integration'),
+    path('tpa_machine_integration/metrics/', ProcessingMachineIngestionMetricsView.as_view(),
+         name='tpa_machine_integration_metrics'),
 
 
     path('test_collection_report/', TestCollectionReportView.as_view(), name='test_collection_report'),
     path('user_collection_reports_list/', UserCollectionReportsList.as_view(), name='user_collection_reports_list'),
     path('activity_logs/', ActivityLogsListView.as_view(), name='activity_logs'),
+    path('activity_logs/metrics/', ActivityLogWriterMetricsView.as_view(), name='activity_logs_metrics'),
     path('lab_departments_list_to_copy/', LabDepartmentsListToCopyView.as_view(), name='lab_departments_list_to_copy'),
     path('patient_max_refund_limit/', PatientMaxRefundLimitAPIView.as_view(), name='patient_max_refund_view'),
     path('lab_departments_list_to_copy/', LabDepartmentsListToCopyView.as_view(), name='lab_departments_list_to_copy'),
@@ -399,6 +405,7 @@ urlpatterns = [
     path('print_past_reports/', PreviousVisitReportsAPIView.as_view(), name='print_past_reports'),
     path('get_current_timings/', CurrentTimingsAPIView.as_view(), name='get_current_timings'),
     path('string_to_html/', StringToHTMLView.as_view(), name='string_to_html'),
+    path('report_render_job/', ReportRenderJobView.as_view(), name='report_render_job'),
     path('doctor_login/', DoctorLoginAPIView.as_view(), name='doctor_login'),
     path('paymode_collections/', PaymentModePatientReportView.as_view(), name='paymode_collections')
 
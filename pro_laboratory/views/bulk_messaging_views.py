@@ -1,5 +1,4 @@
 import os
-import re
 
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.settings import api_settings
@@ -9,20 +8,24 @@ from rest_framework import generics, viewsets, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from healtho_pro_user.models.business_models import BusinessProfiles, GlobalMessagingSettings
+from healtho_pro_user.models.business_models import BusinessProfiles
 from healtho_pro_user.models.users_models import Client
+from pro_laboratory.bulk_messaging_jobs import start_bulk_messaging_job
 from pro_laboratory.filters import BulkMessagingHistoryFilter
+from pro_laboratory.messaging_template_engine import render_messaging_template, \
+    render_messaging_template_with_values
 from pro_laboratory.models.bulk_messaging_models import BulkMessagingLogs, BulkSendSMSData, \
     BulkSendAndSaveWhatsAppSMSData, BulkWhatsAppMessagingLogs, BulkMessagingTemplates, \
-    BusinessMessagesCredits, BulkMessagingHistory
-from pro_laboratory.models.client_based_settings_models import BusinessMessageSettings, ClientWiseMessagingTemplates
+    BusinessMessagesCredits, BulkMessagingHistory, BulkMessagingJob
+from pro_laboratory.models.client_based_settings_models import ClientWiseMessagingTemplates
 from pro_laboratory.models.doctors_models import LabDoctors
 from pro_laboratory.models.global_models import LabStaff
 from pro_laboratory.models.patient_models import Patient, LabPatientInvoice, LabPatientTests
 from pro_laboratory.serializers.bulk_messaging_serializers import BulkMessagingSerializer, BulkMessagingLogsSerializer, \
     BulkSendSMSDataSerializer, BulkSendAndSaveWhatsAppSMSDataSerializer, BulkMessagingTemplatesSerializer, \
-    BusinessMessagesCreditsSerializer, BulkMessagingHistorySerializer
-from pro_universal_data.models import MessagingSendType, Tag, MessagingVendors, MessagingServiceTypes
+    BusinessMessagesCreditsSerializer, BulkMessagingHistorySerializer, BulkMessagingJobSerializer
+from pro_laboratory.tenant_settings import get_tenant_settings
+from pro_universal_data.models import MessagingSendType, MessagingVendors, MessagingServiceTypes
 from pro_universal_data.template_data import template_data
 from pro_universal_data.views import FAST2SMS_KEY
 from rest_framework.exceptions import ValidationError
@@ -131,53 +134,7 @@ class BulkSendAndSaveWhatsAppSMSViewset(viewsets.ModelViewSet):
 
             # print(details)
 
-            # Regex search to get all the values with { }
-            search_pattern = r"\{(.*?)\}"
-            constant_pattern = r'{Constant:\s*([^}]*)\s*}'
-            template_content = mwa_template.templateContent
-            template_values = {}
-
-            def replace_tag(match):
-                tag_name = match.group(0)  # Gets the matched content including curly braces
-                try:
-                    if re.match(constant_pattern, tag_name):  # Handling {Constants}
-                        tag_value = re.match(constant_pattern, tag_name).group(1)
-                        template_values[tag_name] = tag_value
-                        return tag_value
-
-                    elif re.match(search_pattern, tag_name):  # Handling {variables}
-                        try:
-                            tag = Tag.objects.get(tag_name=tag_name)
-                            if tag.tag_formula:
-                                try:
-                                    tag_value = str(eval(tag.tag_formula, {'details': details}))
-                                    template_values[tag_name] = tag_value
-                                    return tag_value
-                                except Exception as error:
-                                    print(f"{tag_name} - This tag has error in the formula!Please Check: {error}")
-                                    tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                                    template_values[tag_name] = tag_value
-                                    return tag_value
-                            else:
-                                print(f"{tag_name} - This tag does not have a formula! Please check ")
-                                tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                                template_values[tag_name] = tag_value
-                                return tag_value
-
-                        except Tag.DoesNotExist:
-                            print(f"{tag_name} - This tag does not exist! ")
-                            tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                            template_values[tag_name] = tag_value
-                            return tag_value
-                except Exception as error:
-                    print(f"Error occured at {tag_name} - {error}")
-
-            # Function to replace the template_content and get the template_values dictionary
-            replaced_content = None
-            try:
-                replaced_content = re.sub(search_pattern, replace_tag, template_content)
-            except Exception as error:
-                print(error)
+            replaced_content, template_values = render_messaging_template(mwa_template.templateContent, details)
 
             template_values_list = []
 
@@ -381,53 +338,7 @@ class BulkSendAndSaveSMSDataViewset(viewsets.ModelViewSet):
             else:
                 pass
 
-            # Regex search to get all the values with { }
-            search_pattern = r"\{(.*?)\}"
-            constant_pattern = r'{Constant:\s*([^}]*)\s*}'
-            template_content = sms_template.templateContent
-            template_values = {}
-
-            def replace_tag(match):
-                tag_name = match.group(0)  # Gets the matched content including curly braces
-                try:
-                    if re.match(constant_pattern, tag_name):  # Handling {Constants}
-                        tag_value = re.match(constant_pattern, tag_name).group(1)
-                        template_values[tag_name] = tag_value
-                        return tag_value
-
-                    elif re.match(search_pattern, tag_name):  # Handling {variables}
-                        try:
-                            tag = Tag.objects.get(tag_name=tag_name)
-                            if tag.tag_formula:
-                                try:
-                                    tag_value = str(eval(tag.tag_formula, {'details': details}))
-                                    template_values[tag_name] = tag_value
-                                    return tag_value
-                                except Exception as error:
-                                    print(f"{tag_name} - This tag has error in the formula!Please Check: {error}")
-                                    tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                                    template_values[tag_name] = tag_value
-                                    return tag_value
-                            else:
-                                print(f"{tag_name} - This tag does not have a formula! Please check ")
-                                tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                                template_values[tag_name] = tag_value
-                                return tag_value
-
-                        except Tag.DoesNotExist:
-                            print(f"{tag_name} - This tag does not exist! ")
-                            tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                            template_values[tag_name] = tag_value
-                            return tag_value
-                except Exception as error:
-                    print(f"Error occured at {tag_name} - {error}")
-
-            # Function to replace the template_content and get the template_values dictionary
-            replaced_content = None
-            try:
-                replaced_content = re.sub(search_pattern, replace_tag, template_content)
-            except Exception as error:
-                print(error)
+            replaced_content, template_values = render_messaging_template(sms_template.templateContent, details)
 
             # Converting variable_values and keys to be passable into API
             variable_keys = list(template_values.keys())
@@ -556,8 +467,8 @@ class BulkSMSAPIView(generics.CreateAPIView):
             return Response({'detail': 'Invalid recipient type'}, status=400)
 
         template = BulkMessagingTemplates.objects.get(pk=template_id)
-        messages = BusinessMessageSettings.objects.first()
-        global_messages = GlobalMessagingSettings.objects.filter(type__id=1).first()
+        messages = get_tenant_settings().get_business_message_settings()
+        global_messages = get_tenant_settings().get_global_messaging_settings(1)
         client = request.client
 
         if messages.is_sms_active and global_messages.is_active:
@@ -594,30 +505,20 @@ class BulkSMSAPIView(generics.CreateAPIView):
                     {"Error": "You don't have credits. Credit Balance is Insufficient!Pls contact Admin!",
                      "response_code": 400}, status=status.HTTP_400_BAD_REQUEST)
 
-            successful_messages=0
-
-            for recipient in recipients:
-                response = bulk_send_and_log_sms(
-                    search_id=recipient.id,
-                    numbers=recipient.mobile_number,
-                    sms_template=BulkMessagingTemplates.objects.get(pk=template_id),
-                    messaging_send_type=MessagingSendType.objects.get(name=recipient_type.name),
-                    client=client
-                )
-
-                if response.status_code == 200:
-                    successful_messages+=1
-            credits.total_messages+=successful_messages
-            credits.save()
+            if recipient_type.name in ['Doctors', 'Admin']:
+                # Doctors/Admin SMS templates are filled from a date range, which bulk messages do not have
+                return Response({"Error": "One or more Mandatory parameters missing - from_date, to_date",
+                                 "response_code": 400}, status=status.HTTP_400_BAD_REQUEST)
 
             user = request.user
             lab_staff = LabStaff.objects.filter(mobile_number=user.phone_number).first()
 
-            history = BulkMessagingHistory.objects.create(template=template, sent_messages=successful_messages,
-                                                          created_by=lab_staff)
-
+            recipients = [{'search_id': recipient.id, 'numbers': recipient.mobile_number} for recipient in recipients]
+            job = start_bulk_messaging_job(template=template, messaging_send_type=recipient_type,
+                                           recipients=recipients, created_by=lab_staff)
 
-            return Response({'detail': f'Messages sent to {recipient_type} successfully'}, status=200)
+            return Response({'detail': f'Messages are being sent to {recipient_type}', 'job_id': job.id},
+                            status=status.HTTP_202_ACCEPTED)
 
         else:
             if not global_messages.is_active:
@@ -654,8 +555,8 @@ class BulkWhatsAppMessagingAPIView(generics.CreateAPIView):
 
 
         template = BulkMessagingTemplates.objects.get(pk=template_id)
-        messages = BusinessMessageSettings.objects.first()
-        global_messages = GlobalMessagingSettings.objects.filter(type__id=2).first()
+        messages = get_tenant_settings().get_business_message_settings()
+        global_messages = get_tenant_settings().get_global_messaging_settings(2)
         client = request.client
 
         if messages.is_whatsapp_active and global_messages.is_active:
@@ -687,27 +588,15 @@ class BulkWhatsAppMessagingAPIView(generics.CreateAPIView):
                      "response_code": 400},
                     status=status.HTTP_400_BAD_REQUEST)
 
-            successful_messages = 0
-
-            for recipient in recipients:
-                response = bulk_send_and_log_whatsapp_sms(search_id=recipient.id, numbers=recipient.mobile_number,
-                                               mwa_template=template,
-                                               messaging_send_type=MessagingSendType.objects.get(name=recipient_type.name),
-                                               )
-
-                if response.status_code == 200:
-                    successful_messages += 1
-
-            credits.total_messages += successful_messages
-            credits.save()
-
             user = request.user
             lab_staff = LabStaff.objects.filter(mobile_number=user.phone_number).first()
 
-            history = BulkMessagingHistory.objects.create(template=template, sent_messages=successful_messages,
-                                                          created_by=lab_staff)
+            recipients = [{'search_id': recipient.id, 'numbers': recipient.mobile_number} for recipient in recipients]
+            job = start_bulk_messaging_job(template=template, messaging_send_type=recipient_type,
+                                           recipients=recipients, created_by=lab_staff)
 
-            return Response({'detail': f'WhatsAppMessages sent to {recipient_type} successfully'}, status=200)
+            return Response({'detail': f'WhatsAppMessages are being sent to {recipient_type}', 'job_id': job.id},
+                            status=status.HTTP_202_ACCEPTED)
 
         else:
             if not global_messages.is_active:
@@ -759,44 +648,7 @@ class BulkMessagingCampaignForRecipients(generics.CreateAPIView):
 
     def create(self, numbers=None, template=None, client=None,details=None, *args, **kwargs):
         try:
-            # Regex search to get all the values with { }
-            search_pattern = r"\{(.*?)\}"
-            constant_pattern = r'{Constant:\s*([^}]*)\s*}'
-            template_content = template.templateContent
-            template_values = {}
-
-
-            def replace_tag(match):
-                tag_name = match.group(0)  # Gets the matched content including curly braces
-                try:
-                    if re.match(constant_pattern, tag_name):  # Handling {Constants}
-                        tag_value = re.match(constant_pattern, tag_name).group(1)
-                        template_values[tag_name] = tag_value
-                        return tag_value
-
-                    elif re.match(search_pattern, tag_name):  # Handling {variables}
-                        try:
-                            tag_value = details.get(f'{tag_name}',"")
-                            template_values[tag_name] = str(tag_value)
-                            return tag_value
-                        except Exception as error:
-                            print(f"{tag_name} - This tag has error in the formula!Please Check: {error}")
-                            tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                            template_values[tag_name] = tag_value
-                            return tag_value
-                    else:
-                        print(f"{tag_name} - This tag does not have a formula! Please check ")
-                        tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                        template_values[tag_name] = tag_value
-                        return tag_value
-                except Exception as error:
-                    print(error)
-
-            replaced_content = None
-            try:
-                replaced_content = re.sub(search_pattern, replace_tag, template_content)
-            except Exception as error:
-                print(error)
+            replaced_content, template_values = render_messaging_template_with_values(template.templateContent, details)
 
             template_values_list=[]
 
@@ -838,7 +690,7 @@ class BulkMessagingCampaignForRecipients(generics.CreateAPIView):
 
             sent_on = datetime.now()
             sms = BulkSendAndSaveWhatsAppSMSData(search_id=None, numbers=numbers, mwa_template=template,
-                                                 messaging_send_type=messaging_send_type, message=template.content,
+                                                 messaging_send_type=messaging_send_type, message=replaced_content,
                                                  sent_on=sent_on)
 
             sms.save()
@@ -873,43 +725,7 @@ class BulkMessagingCampaignForRecipientsForSMS(generics.CreateAPIView):
 
     def create(self, numbers=None, template=None, client=None,details=None, *args, **kwargs):
         try:
-            # Regex search to get all the values with { }
-            search_pattern = r"\{(.*?)\}"
-            constant_pattern = r'{Constant:\s*([^}]*)\s*}'
-            template_content = template.templateContent
-            template_values = {}
-
-            def replace_tag(match):
-                tag_name = match.group(0)  # Gets the matched content including curly braces
-                try:
-                    if re.match(constant_pattern, tag_name):  # Handling {Constants}
-                        tag_value = re.match(constant_pattern, tag_name).group(1)
-                        template_values[tag_name] = tag_value
-                        return tag_value
-
-                    elif re.match(search_pattern, tag_name):  # Handling {variables}
-                        try:
-                            tag_value = details.get(f'{tag_name}',"")
-                            template_values[tag_name] = str(tag_value)
-                            return tag_value
-                        except Exception as error:
-                            print(f"{tag_name} - This tag has error in the formula!Please Check: {error}")
-                            tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                            template_values[tag_name] = tag_value
-                            return tag_value
-                    else:
-                        print(f"{tag_name} - This tag does not have a formula! Please check ")
-                        tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                        template_values[tag_name] = tag_value
-                        return tag_value
-                except Exception as error:
-                    print(error)
-
-            replaced_content = None
-            try:
-                replaced_content = re.sub(search_pattern, replace_tag, template_content)
-            except Exception as error:
-                print(error)
+            replaced_content, template_values = render_messaging_template_with_values(template.templateContent, details)
             print(replaced_content)
 
             # Converting variable_values and keys to be passable into API
@@ -957,6 +773,17 @@ class BulkMessagingCampaignForRecipientsForSMS(generics.CreateAPIView):
             print(error)
             return Response({"error":f"{error}"})
 
+
+def start_campaign_job(request, template, recipients):
+    # Recipients of a campaign carry their own details, whose keys are the tags of the template without `{}`
+    lab_staff = LabStaff.objects.filter(mobile_number=request.user.phone_number).first()
+    recipients = [{'search_id': None, 'numbers': recipient.get('mobile_number'),
+                   'details': {f"{{{key}}}": value for key, value in recipient.items()}} for recipient in recipients]
+
+    return start_bulk_messaging_job(template=template, messaging_send_type=MessagingSendType.objects.get(pk=1),
+                                    recipients=recipients, created_by=lab_staff)
+
+
 #
 # Program to access SendSMSDataViewSet and MessagingLogsViewset
 class SendAndLogCampaignMessagesView(generics.CreateAPIView):
@@ -966,14 +793,14 @@ class SendAndLogCampaignMessagesView(generics.CreateAPIView):
         message_send_type=data.get('message_send_type')
         recipients = data.get('recipients')
         client=request.client
-        messages = BusinessMessageSettings.objects.get(client=client)
+        messages = get_tenant_settings().get_business_message_settings(client)
 
         template = BulkMessagingTemplates.objects.get(pk=template_id)
 
         messaging_service_types = template.messaging_service_types.name
 
         if messaging_service_types == 'WhatsApp':
-            global_messages = GlobalMessagingSettings.objects.filter(type__id=2).first()
+            global_messages = get_tenant_settings().get_global_messaging_settings(2)
 
             if messages.is_whatsapp_active and global_messages.is_active:
                 from pro_laboratory.views.client_based_settings_views import check_template_is_active_for_business
@@ -1003,31 +830,10 @@ class SendAndLogCampaignMessagesView(generics.CreateAPIView):
                         {"Error": "You don't have credits. Credit Balance is Insufficient!Pls contact Admin!", "response_code": 400},
                         status=status.HTTP_400_BAD_REQUEST)
 
-                send_sms =BulkMessagingCampaignForRecipients()
-
-                successful_messages = 0
-                for recipient in recipients:
-                    try:
-                        # Add `{}` around each key
-                        formatted_details = {f"{{{key}}}": value for key, value in recipient.items()}
-                        response = send_sms.create(numbers=recipient['mobile_number'],details=formatted_details, template=template, client=request.client)
-
-                        if response.status_code == 200:
-                            successful_messages+=1
-                    except Exception as error:
-                        print(error)
-
-                credits.total_messages += successful_messages
-                credits.save()
-
-                user=request.user
-                lab_staff = LabStaff.objects.filter(mobile_number=user.phone_number).first()
+                job = start_campaign_job(request, template, recipients)
 
-                history =  BulkMessagingHistory.objects.create(template=template,sent_messages=successful_messages,
-                    created_by=lab_staff)
-
-                return Response({"Status": "Message sent successfully!",
-                                  "response_code": 200})
+                return Response({"Status": "Messages are being sent!", "job_id": job.id, "response_code": 202},
+                                status=status.HTTP_202_ACCEPTED)
 
 
             else:
@@ -1040,7 +846,7 @@ class SendAndLogCampaignMessagesView(generics.CreateAPIView):
                                     status=status.HTTP_400_BAD_REQUEST)
 
         elif messaging_service_types == 'SMS':
-            global_messages = GlobalMessagingSettings.objects.filter(type__id=1).first()
+            global_messages = get_tenant_settings().get_global_messaging_settings(1)
 
             if messages.is_sms_active and global_messages.is_active:
                 from pro_laboratory.views.client_based_settings_views import check_template_is_active_for_business
@@ -1075,31 +881,10 @@ class SendAndLogCampaignMessagesView(generics.CreateAPIView):
                         {"Error": "You don't have credits. Credit Balance is Insufficient!Pls contact Admin!",
                          "response_code": 400}, status=status.HTTP_400_BAD_REQUEST)
 
-                send_sms = BulkMessagingCampaignForRecipientsForSMS()
-
-                successful_messages=0
-
-                for recipient in recipients:
-                    try:
-                        formatted_details = {f"{{{key}}}": value for key, value in recipient.items()}
-                        response = send_sms.create(numbers=recipient['mobile_number'],details=formatted_details, template=template,
-                                                   client=request.client)
-
-                        if response.status_code == 200:
-                            successful_messages+=1
-                    except Exception as error:
-                        print(error)
-
-                credits.total_messages += successful_messages
-                credits.save()
+                job = start_campaign_job(request, template, recipients)
 
-                user = request.user
-                lab_staff = LabStaff.objects.filter(mobile_number=user.phone_number).first()
-
-                history = BulkMessagingHistory.objects.create(template=template, sent_messages=successful_messages,
-                                                              created_by=lab_staff)
-
-                return Response({"Status": "Message sent successfully!", "response_code": 200})
+                return Response({"Status": "Messages are being sent!", "job_id": job.id, "response_code": 202},
+                                status=status.HTTP_202_ACCEPTED)
 
             else:
                 if not global_messages.is_active:
@@ -1119,5 +904,11 @@ class BulkMessagingHistoryView(generics.ListAPIView):
     filterset_class = BulkMessagingHistoryFilter
 
 
+class BulkMessagingJobViewSet(viewsets.ReadOnlyModelViewSet):
+    # Progress of the bulk messages sent in the background, by the job_id their request returned
+    queryset = BulkMessagingJob.objects.select_related('template', 'created_by').order_by('-id')
+    serializer_class = BulkMessagingJobSerializer
+
+
 
 
@@ -3,7 +3,6 @@ from datetime import datetime
 import re
 from http.client import HTTPResponse
 
-from django.core.cache import cache
 from django.db import connection
 from django.db.models import Count
 from django.forms import model_to_dict
@@ -16,6 +15,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from copy_biz_data import copy_biz_data
+from healtho_pro.list_cache import CachedListMixin
 from healtho_pro_user.models.business_models import BusinessProfiles, GlobalBusinessSettings
 from healtho_pro_user.models.users_models import Client
 from healtho_pro_user.views.business_views import get_business_from_client
@@ -42,51 +42,15 @@ from pro_pharmacy.models import PharmaItems
 from pro_universal_data.models import MessagingTemplates, DepartmentFlowType, ULabFonts, PrintTemplateType, Tag
 
 
-class LetterHeadSettingsViewSet(viewsets.ModelViewSet):
+class LetterHeadSettingsViewSet(CachedListMixin, viewsets.ModelViewSet):
     serializer_class = LetterHeadSettingsSerializer
+    list_cache_family = 'letterhead_settings'
 
     def get_queryset(self):
         client_id = self.request.query_params.get('client_id')
         if client_id is None:
             return LetterHeadSettings.objects.none()
-        try:
-            cache_key = f'letterhead_settings_{client_id}'
-            cache_data = cache.get(cache_key)
-            if cache_data:
-                return cache_data
-            queryset = LetterHeadSettings.objects.filter(client__id=client_id)
-            cache.set(cache_key, queryset)
-            return queryset
-        except Exception as e:
-            queryset = LetterHeadSettings.objects.filter(client__id=client_id)
-            return queryset
-
-    def perform_create(self, serializer):
-        super().perform_create(serializer)
-        self.invalidate_cache()
-
-    def perform_update(self, serializer):
-        super().perform_update(serializer)
-        self.invalidate_cache()
-
-    def perform_destroy(self, instance):
-        super().perform_destroy(instance)
-        self.invalidate_cache()
-
-    def invalidate_cache(self):
-        client_id = self.request.query_params.get('client_id')
-        if client_id:
-            cache_key = f'letterhead_settings_{client_id}'
-            try:
-                # Try to delete and refresh the cache
-                cache.delete(cache_key)
-                print(f"Deleted cache key: {cache_key}")
-                queryset = LetterHeadSettings.objects.filter(client__id=client_id)
-                cache.set(cache_key, queryset)
-                print(f"Refreshed cache with new data for key: {cache_key}")
-            except Exception as e:
-                # Log the error if cache operations fail
-                print(f"Cache invalidation failed: {e}")
+        return LetterHeadSettings.objects.filter(client__id=client_id)
 
 
 class PrintTestReportSettingsViewSet(viewsets.ModelViewSet):
@@ -1,19 +1,20 @@
 import calendar
-from collections import defaultdict
 from datetime import datetime
 
 from django.db import models
-from django.db.models import Sum, DecimalField, Q, Count, F, Case, When
-from django.db.models.functions import Coalesce
+from django.db.models import Sum, Q, Count, F, Case, When
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, viewsets, status
 from rest_framework.response import Response
 
+from pro_laboratory.dashboard_aggregates import get_collections_by_pay_mode, get_invoice_totals, \
+    get_patient_overview, get_patient_counts_by_hour, get_patient_counts_by_date, get_patient_counts_by_month, \
+    format_counts_by_date
+from pro_laboratory.daily_rollups import can_use_rollups, get_registration_counts
 from pro_laboratory.filters import BusinessStatusFilter, PatientAnalyticsFilter, ReferralDoctorDetailsFilter, \
     DepartmentAnalyticsFilter, PayModeAnalyticsFilter, LabPhlebotomistAnalyticsFilter, LabTechniciansAnalyticsFilter, \
     LabTestAnalyticsFilter, PatientRegistrationOverviewFilter, LabDoctorAuthorizationAnalyticsFilter
-from pro_laboratory.models.client_based_settings_models import BusinessControls
 from pro_laboratory.models.doctorAuthorization_models import LabDrAuthorization
 from pro_laboratory.models.global_models import LabStaffDefaultBranch
 from pro_laboratory.models.labtechnicians_models import LabTechnicians
@@ -28,6 +29,7 @@ from pro_laboratory.serializers.patient_serializers import BusinessStatusSeriali
     LabPatientTestDetailSerializer, PatientRegistrationOverviewSerializer, PatientCountSerializer
 from pro_laboratory.serializers.phlebotomists_serializers import LabPhlebotomistAnalyticsSerializer
 from pro_laboratory.serializers.universal_serializers import DashBoardSettingsSerializer
+from pro_laboratory.tenant_settings import get_tenant_settings
 from pro_universal_data.models import ULabPaymentModeType, DashBoardOptions
 
 
@@ -92,16 +94,10 @@ class DayWiseCollectionsAPIView(generics.GenericAPIView):
             return Response({'error': 'Date or date range (start_date and end_date) parameter is required'}, status=400)
 
         # Retrieve all payment modes dynamically from the ULabPaymentModeType model
-        payment_modes = ULabPaymentModeType.objects.values_list('name', flat=True)
-
-        # Initialize new_collections, previous_due_collections, and refund_collections
-        new_collections = {}
-        previous_due_collections = {}
-        refund_collections = {}
-        subtotals = {}
+        payment_modes = list(ULabPaymentModeType.objects.values_list('name', flat=True))
 
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -112,68 +108,10 @@ class DayWiseCollectionsAPIView(generics.GenericAPIView):
             receipts = LabPatientReceipts.objects.all()
             refunds = LabPatientRefund.objects.all()
 
-        for mode in payment_modes:
-            if start_date and end_date:
-                # Date range filter
-                # Calculate new collections within the date range
-                new_collections[mode] = receipts.filter(
-                    payments__pay_mode__name=mode,
-                    added_on__date__range=[start_date, end_date],
-                    invoiceid__added_on__date__range=[start_date, end_date]
-                ).aggregate(total=Sum('payments__paid_amount'))['total'] or 0
-
-                # Calculate previous due collections within the date range
-                previous_due_collections[mode] = receipts.filter(
-                    payments__pay_mode__name=mode,
-                    added_on__date__range=[start_date, end_date],
-                    invoiceid__added_on__lt=start_date  # Invoices issued before the start date
-                ).aggregate(total=Sum('payments__paid_amount'))['total'] or 0
-
-                # Calculate refund collections within the date range
-                refund_collections[mode] = refunds.filter(
-                    refund_mode__name=mode,
-                    added_on__date__range=[start_date, end_date]
-                ).aggregate(total=Sum('refund'))['total'] or 0
-
-            else:
-                # Single date filter
-                # Calculate new collections for the given date
-                new_collections[mode] = receipts.filter(
-                    payments__pay_mode__name=mode,
-                    added_on__date=date,
-                    invoiceid__added_on__date=date
-                ).aggregate(total=Sum('payments__paid_amount'))['total'] or 0
-
-                # Calculate previous due collections for the given date
-                previous_due_collections[mode] = receipts.filter(
-                    payments__pay_mode__name=mode,
-                    added_on__date=date,
-                    invoiceid__added_on__lt=date
-                ).aggregate(total=Sum('payments__paid_amount'))['total'] or 0
-
-                # Calculate refund collections for the given date
-                refund_collections[mode] = refunds.filter(
-                    refund_mode__name=mode,
-                    added_on__date=date
-                ).aggregate(total=Sum('refund'))['total'] or 0
-
-            # Calculate subtotals
-            subtotals[mode] = new_collections[mode] + previous_due_collections[mode] - refund_collections[mode]
-
-        # Calculate total values across all payment modes
-        new_collections['total'] = sum(new_collections[mode] for mode in payment_modes)
-        previous_due_collections['total'] = sum(previous_due_collections[mode] for mode in payment_modes)
-        refund_collections['total'] = sum(refund_collections[mode] for mode in payment_modes)
-        subtotals['total'] = sum(subtotals[mode] for mode in payment_modes)
-
-        # Construct response data
-        response_data = {
-            'new_collections': new_collections,
-            'previous_due_collections': previous_due_collections,
-            'refund_collections': refund_collections,
-            'subtotals': subtotals
-        }
+        if not (start_date and end_date):
+            start_date = end_date = date
 
+        response_data = get_collections_by_pay_mode(receipts, refunds, payment_modes, start_date, end_date)
         return Response(response_data)
 
 
@@ -186,43 +124,31 @@ class BusinessStatusAPIView(generics.ListAPIView):
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        if not queryset.exists():
-            return Response({
-                'total_amount': 0,
-                'total_discount': 0,
-                'net_amount': 0,
-                'balance_amount': 0,
-                'refund_amount': 0,
-                'total_paid': 0})
 
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
             queryset = queryset.filter(patient__branch__in=default_branch)
 
-        total_amount = queryset.aggregate(total_amount=Coalesce(Sum('total_cost'), 0, output_field=DecimalField()))[
-            'total_amount']
-        total_discount = \
-            queryset.aggregate(total_discount=Coalesce(Sum('total_discount'), 0, output_field=DecimalField()))[
-                'total_discount']
-        net_amount = queryset.aggregate(net_amount=Coalesce(Sum('total_price'), 0, output_field=DecimalField()))[
-            'net_amount']
-        balance_amount = queryset.aggregate(balance_amount=Coalesce(Sum('total_due'), 0, output_field=DecimalField()))[
-            'balance_amount']
-        refund_amount = queryset.aggregate(refund_amount=Coalesce(Sum('total_refund'), 0, output_field=DecimalField()))[
-            'refund_amount']
-        total_paid = queryset.aggregate(total_paid=Coalesce(Sum('total_paid'), 0, output_field=DecimalField()))[
-            'total_paid']
+        totals = get_invoice_totals(queryset)
+        if not totals['invoice_count']:
+            return Response({
+                'total_amount': 0,
+                'total_discount': 0,
+                'net_amount': 0,
+                'balance_amount': 0,
+                'refund_amount': 0,
+                'total_paid': 0})
 
         data = {
-            'total_amount': total_amount,
-            'total_discount': total_discount,
-            'net_amount': net_amount,
-            'balance_amount': balance_amount,
-            'refund_amount': refund_amount,
-            'total_paid': total_paid
+            'total_amount': totals['total_amount'],
+            'total_discount': totals['total_discount'],
+            'net_amount': totals['net_amount'],
+            'balance_amount': totals['balance_amount'],
+            'refund_amount': totals['refund_amount'],
+            'total_paid': totals['total_paid']
         }
 
         serializer = self.get_serializer(data=data)
@@ -241,7 +167,7 @@ class PatientOverviewListAPIView(generics.ListAPIView):
         queryset = Patient.objects.all()
 
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -252,38 +178,8 @@ class PatientOverviewListAPIView(generics.ListAPIView):
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
-        total_patients = queryset.count()
-        male_count = queryset.filter(gender__name='Male').count()
-        female_count = queryset.filter(gender__name='Female').count()
-
-        age_groups = {
-            '0_18': queryset.filter(age__lte=18).count(),
-            '19_30': queryset.filter(Q(age__gte=19) & Q(age__lte=30)).count(),
-            '31_50': queryset.filter(Q(age__gte=31) & Q(age__lte=50)).count(),
-            'above_50': queryset.filter(age__gt=50).count(),
-        }
-
-        age_group_serializer = self.serializer_class()
-        age_group = age_group_serializer.get_age_group(age_groups)
-
-        if not queryset:
-            return Response({
-                'total_patients': 0,
-                'male_count': 0,
-                'female_count': 0,
-                'age_group': {
-                    '0_18': 0,
-                    '19_30': 0,
-                    '31_50': 0,
-                    'above_50': 0
-                }
-            }, status=status.HTTP_200_OK)
-        return Response({
-            'total_patients': total_patients,
-            'male_count': male_count,
-            'female_count': female_count,
-            'age_group': age_group
-        }, status=status.HTTP_200_OK)
+        overview = get_patient_overview(queryset)
+        return Response(overview, status=status.HTTP_200_OK)
 
 
 
@@ -296,7 +192,7 @@ class ReferralDoctorDetailsAPIView(generics.ListAPIView):
         queryset = Patient.objects.all()
 
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -336,7 +232,7 @@ class DepartmentAnalyticsAPIView(generics.ListAPIView):
         queryset = queryset.exclude(name__isnull=True)
 
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -371,7 +267,7 @@ class PayModeAnalyticsListAPIView(generics.ListAPIView):
         queryset = LabPatientReceipts.objects.all()
 
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -415,7 +311,7 @@ class LabPhlebotomistAnalyticsAPIView(generics.ListAPIView):
         queryset = LabPhlebotomist.objects.all()
 
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -440,7 +336,7 @@ class LabTechnicianAnalyticsAPIView(generics.ListAPIView):
         queryset = LabTechnicians.objects.filter(report_created_by__isnull=False)
 
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -470,7 +366,7 @@ class TopTestDetailsAPIView(generics.ListAPIView):
         queryset = queryset.exclude(name__isnull=True)
 
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -505,7 +401,7 @@ class PatientRegistrationOverviewAPIView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -535,7 +431,7 @@ class DoctorAuthorizationAnalyticsAPIView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -565,11 +461,8 @@ class PatientAnalyticsView(generics.ListAPIView):
         date_range_after = self.request.query_params.get('date_range_after')
         date_range_before = self.request.query_params.get('date_range_before')
 
-        user = self.request.user
-        controls = BusinessControls.objects.first()
-        if controls and controls.multiple_branches:
-            default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
-            default_branch = default_branch_obj.default_branch.all()
+        default_branch = self.get_default_branch()
+        if default_branch is not None:
             queryset = Patient.objects.filter(branch__in=default_branch)
         else:
             queryset = Patient.objects.all()
@@ -601,6 +494,22 @@ class PatientAnalyticsView(generics.ListAPIView):
 
         return queryset
 
+    def get_default_branch(self):
+        controls = get_tenant_settings().business_controls
+        if controls and controls.multiple_branches:
+            user = self.request.user
+            default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
+            return default_branch_obj.default_branch.all()
+        return None
+
+    def get_counts_by_date(self, queryset, start_date, end_date, date_format):
+        # Past dates are read from the daily registration rollups
+        last_date = end_date - timezone.timedelta(days=1)
+        if can_use_rollups(last_date):
+            counts = get_registration_counts(start_date, last_date, self.get_default_branch())
+            return format_counts_by_date(counts, start_date, end_date, date_format)
+        return get_patient_counts_by_date(queryset, start_date, end_date, date_format)
+
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         year = self.request.query_params.get('year')
@@ -616,57 +525,21 @@ class PatientAnalyticsView(generics.ListAPIView):
             if date_range_after.year < 2024:
                 date_range_after = timezone.datetime(2024, 1, 1)
 
-            patient_counts = defaultdict(int)
-            current_date = date_range_after
-            while current_date < date_range_before:
-                formatted_date = current_date.strftime('%a, %Y %b %d')
-                patient_counts[formatted_date] += queryset.filter(added_on__date=current_date).count()
-                current_date += timezone.timedelta(days=1)
-
-            return Response(dict(patient_counts))
+            patient_counts = self.get_counts_by_date(queryset, date_range_after.date(), date_range_before.date(),
+                                                     '%a, %Y %b %d')
+            return Response(patient_counts)
 
         if date:
-            hour_count_dict = {}
-            for hour in range(24):
-                hour_count_dict[hour] = 0
-            for patient in queryset:
-                registration_hour = patient.added_on.astimezone().hour
-                hour_count_dict[registration_hour] += 1
-            return Response(hour_count_dict)
+            return Response(get_patient_counts_by_hour(queryset))
 
         elif month:
-            date_count_dict = {}
             year, month_num = map(int, month.split('-'))
-            days_in_month = calendar.monthrange(year, month_num)[1]
-            start_date = timezone.datetime(year, month_num, 1)
-            current_date = start_date
-            while current_date.month == month_num:
-                date_count_dict[current_date.strftime('%Y-%m-%d')] = 0
-                current_date += timezone.timedelta(days=1)
-            for patient in queryset:
-                registration_date = patient.added_on.astimezone().date()
-                if registration_date.strftime('%Y-%m-%d') in date_count_dict:
-                    date_count_dict[registration_date.strftime('%Y-%m-%d')] += 1
-            return Response(date_count_dict)
+            start_date = timezone.datetime(year, month_num, 1).date()
+            end_date = start_date + timezone.timedelta(days=calendar.monthrange(year, month_num)[1])
+            return Response(self.get_counts_by_date(queryset, start_date, end_date, '%Y-%m-%d'))
 
         elif year:
-            month_count_dict = {}
-
-            for patient in queryset:
-                registration_month = patient.added_on.astimezone().month
-
-                month_name = calendar.month_name[registration_month]
-
-                month_count_dict[month_name] = month_count_dict.get(month_name, 0) + 1
-
-            for month_num in range(1, 13):
-                month_name = calendar.month_name[month_num]
-
-                month_count_dict.setdefault(month_name, 0)
-
-            sorted_month_count_dict = dict(
-                sorted(month_count_dict.items(), key=lambda x: list(calendar.month_name).index(x[0])))
-            return Response(sorted_month_count_dict)
+            return Response(get_patient_counts_by_month(queryset))
 
         else:
             return Response({"message": "Please provide year, month, or date for search."})
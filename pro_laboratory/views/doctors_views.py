@@ -1,6 +1,5 @@
 import redis
 from datetime import datetime, timedelta
-from django.core.cache import cache
 from django.db import transaction
 from django.db.models import Q, Count, Sum, F, OuterRef, Exists, Max
 from django.db.models.functions import Coalesce
@@ -9,8 +8,10 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, generics
 from rest_framework.views import APIView
 
+from healtho_pro.list_cache import CachedListMixin, invalidate_list_cache
 from healtho_pro_user.models.users_models import HealthOProUser
 from healtho_pro_user.serializers.users_serializers import UserSerializer
+from pro_laboratory.daily_rollups import mark_rollup_dates_on_commit
 from pro_laboratory.filters import LabDoctorFilter
 from pro_laboratory.models.doctorAuthorization_models import LabDrAuthorization
 from pro_laboratory.models.doctors_models import LabDoctors, LabDoctorsType, ReferralAmountForDoctor, \
@@ -67,11 +68,7 @@ class LabDoctorsViewSet(viewsets.ModelViewSet):
         try:
             client_id = self.request.client
             if client_id:
-                cache_key_prefix = f'lab_referral_doctors_{client_id}_*'
-                keys_to_delete = [key for key in cache.keys(f'{cache_key_prefix}*')]
-                for key in keys_to_delete:
-                    cache.delete(key)
-                    print(f'Deleted cache key: {key}')
+                invalidate_list_cache('lab_referral_doctors')
         except Exception as e:
             print(f"Cache invalidation failed: {e}")
 
@@ -151,10 +148,13 @@ class LabConsultingDoctorsListView(generics.ListAPIView):
         return queryset
 
 
-class LabReferralDoctorsListView(generics.ListAPIView):
+class LabReferralDoctorsListView(CachedListMixin, generics.ListAPIView):
     serializer_class = ReferralDoctorCountSerializer
     # filter_backends = [DjangoFilterBackend]
     # filterset_class = LabDoctorFilter
+    list_cache_family = 'lab_referral_doctors'
+    # Patient counts of the doctors are in the response, so entries are kept only briefly
+    list_cache_timeout = 60
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -164,80 +164,40 @@ class LabReferralDoctorsListView(generics.ListAPIView):
         return context
 
     def get_queryset(self):
-        try:
-            client_id = self.request.client
-            query = self.request.query_params.get('q', '')
-            sort = self.request.query_params.get('sort', '')
-            marketing_executive = self.request.query_params.get('marketing_executive', '')
-            cache_key = f'lab_referral_doctors_{client_id}_{query}_{marketing_executive}_{sort}_*'
-            cache_data = cache.get(cache_key)
-            if cache_data:
-                return cache_data
-            queryset = LabDoctors.objects.filter(doctor_type_id=1).annotate(
-                last_patient_date=Max('patient__added_on')
-            )
+        query = self.request.query_params.get('q', '')
+        sort = self.request.query_params.get('sort', '')
+        marketing_executive = self.request.query_params.get('marketing_executive', '')
 
-            if marketing_executive:
-                queryset = queryset.filter(marketing_executive__id=marketing_executive)
-
-            if query:
-                search_query = (Q(name__icontains=query) |
-                                Q(specialization__name__icontains=query) |
-                                Q(mobile_number__icontains=query))
-                queryset = queryset.filter(search_query)
-
-            if sort == '-added_on':
-                queryset = queryset.order_by('-added_on', 'name')
-            elif sort == 'added_on':
-                queryset = queryset.order_by('added_on', 'name')
-
-            elif sort == '-last_patient_date':
-                queryset = queryset.order_by('-last_patient_date', 'name')
-            elif sort == 'last_patient_date':
-                queryset = queryset.order_by('last_patient_date', 'name')
-            elif sort == 'name':
-                queryset = queryset.order_by('name')
-            elif sort == '-name':
-                queryset = queryset.order_by('-name')
-            else:
-                queryset = queryset.order_by('name')
+        queryset = LabDoctors.objects.filter(doctor_type_id=1).annotate(
+            last_patient_date=Max('patient__added_on')
+        )
 
-            cache.set(cache_key, queryset)
-            return queryset
+        if marketing_executive:
+            queryset = queryset.filter(marketing_executive__id=marketing_executive)
 
-        except Exception as e:
-            query = self.request.query_params.get('q', '')
-            sort = self.request.query_params.get('sort', '')
-            marketing_executive = self.request.query_params.get('marketing_executive', '')
-
-            queryset = LabDoctors.objects.filter(doctor_type_id=1).annotate(
-                last_patient_date=Max('patient__added_on'))
-
-            if marketing_executive:
-                queryset = queryset.filter(marketing_executive__id=marketing_executive)
-
-            if query:
-                search_query = (Q(name__icontains=query) |
-                                Q(specialization__name__icontains=query) |
-                                Q(mobile_number__icontains=query))
-                queryset = queryset.filter(search_query)
-
-            if sort == '-added_on':
-                queryset = queryset.order_by('-added_on')
-            elif sort == 'added_on':
-                queryset = queryset.order_by('added_on')
-            elif sort == '-last_patient_date':
-                queryset = queryset.order_by('-last_patient_date', 'name')
-            elif sort == 'last_patient_date':
-                queryset = queryset.order_by('last_patient_date', 'name')
-            elif sort == 'name':
-                queryset = queryset.order_by('name')
-            elif sort == '-name':
-                queryset = queryset.order_by('-name')
-            else:
-                queryset = queryset.order_by('name')
+        if query:
+            search_query = (Q(name__icontains=query) |
+                            Q(specialization__name__icontains=query) |
+                            Q(mobile_number__icontains=query))
+            queryset = queryset.filter(search_query)
 
-            return queryset
+        if sort == '-added_on':
+            queryset = queryset.order_by('-added_on', 'name')
+        elif sort == 'added_on':
+            queryset = queryset.order_by('added_on', 'name')
+
+        elif sort == '-last_patient_date':
+            queryset = queryset.order_by('-last_patient_date', 'name')
+        elif sort == 'last_patient_date':
+            queryset = queryset.order_by('last_patient_date', 'name')
+        elif sort == 'name':
+            queryset = queryset.order_by('name')
+        elif sort == '-name':
+            queryset = queryset.order_by('-name')
+        else:
+            queryset = queryset.order_by('name')
+
+        return queryset
 
 
 class PatientWiseLabReferralDoctorsListView(generics.ListAPIView):
@@ -397,7 +357,10 @@ class ReferralDoctorsMergingViewSet(viewsets.ModelViewSet):
             try:
                 with transaction.atomic():
                     main_doctor = LabDoctors.objects.get(id=main_doctor_id)
-                    Patient.objects.filter(referral_doctor__in=duplicate_doctor_ids).update(referral_doctor=main_doctor)
+                    merged_patients = Patient.objects.filter(referral_doctor__in=duplicate_doctor_ids)
+                    # update() sends no post_save, the referral rollups of the patients' days are marked here
+                    mark_rollup_dates_on_commit(*merged_patients.values_list('added_on', flat=True).distinct())
+                    merged_patients.update(referral_doctor=main_doctor)
 
                     # Iterate through duplicate doctors and update them using save() to trigger signals
                     duplicate_doctors = LabDoctors.objects.filter(id__in=duplicate_doctor_ids)
@@ -1,6 +1,5 @@
 import random
 import string
-from django.core.cache import cache
 from django.db.models import Q
 from django_filters.rest_framework import DjangoFilterBackend
 from geopy import Nominatim
@@ -10,6 +9,8 @@ from rest_framework.views import APIView
 from datetime import datetime, timedelta
 
 from accounts.models import LabExpenses
+from healtho_pro.cache_tags import bump_generation, cache_family
+from healtho_pro.list_cache import CachedListMixin, invalidate_list_cache
 from healtho_pro_user.models.universal_models import HealthcareRegistryType, UserType
 from healtho_pro_user.models.users_models import HealthOProUser, UserTenant, OTP
 from healtho_pro_user.serializers.users_serializers import UserSerializer
@@ -25,7 +26,7 @@ from pro_laboratory.models.global_models import LabGlobalTests, LabStaff, LabDis
     LabStaffDefaultBranch
 from pro_laboratory.models.patient_models import LabPatientReceipts, LabPatientRefund
 from pro_laboratory.models.sourcing_lab_models import SourcingLabRegistration
-from pro_laboratory.models.universal_models import ActivityLogs, ChangesInModels
+from pro_laboratory.activity_log_writer import log_activity
 from pro_laboratory.serializers.global_serializers import LabGlobalTestsSerializer, LabStaffSerializer, \
     LabDiscountTypeSerializer, LabReportsTemplatesSerializer, LabWordReportTemplateSerializer, \
     LabFixedParametersReportTemplateSerializer, LabStaffAccessSerializer, \
@@ -131,89 +132,47 @@ class LabGlobalTestsViewSet(viewsets.ModelViewSet):
         client_id = self.request.client
         try:
             if client_id:
-                cache_key_prefix = f'master_search_for_tests_{client_id}_'
-                keys_to_delete = [key for key in cache.keys(f'{cache_key_prefix}*')]
-                for key in keys_to_delete:
-                    cache.delete(key)
-                    print(f'Deleted cache key: {key}')
+                bump_generation(cache_family('master_search_for_tests', client_id))
         except Exception as e:
             print(f"Cache invalidation failed: {e}")
 
 
-class LabStaffViewSet(viewsets.ModelViewSet):
+class LabStaffViewSet(CachedListMixin, viewsets.ModelViewSet):
     serializer_class = LabStaffSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = LabStaffFilter
+    list_cache_family = 'lab_staff'
 
     def get_queryset(self):
-        try:
-            queryset = LabStaff.objects.all().order_by('id')
-            query = self.request.query_params.get('q', None)
-            sort = self.request.query_params.get('sort', None)
-            role = self.request.query_params.get('role', None)
-
-            client = self.request.client
-            cache_key = f'lab_staff_{client}_{query}_{sort}_{role}'
-            cache_data = cache.get(cache_key)
-            if cache_data:
-                print('cache data of labstaff',cache_data)
-                return cache_data
-            print('normal data of labstaff, not cache')
-            if query is not None:
-                search_query = Q(name__icontains=query) | Q(branch__name__icontains=query) | Q(
-                    mobile_number__icontains=query)
-                queryset = queryset.filter(search_query)
-            if role is not None:
-                queryset = queryset.filter(role__name='MarketingExecutive')
-
-            if sort == '-added_on':
-                queryset = queryset.order_by('-added_on')
-            if sort == 'added_on':
-                queryset = queryset.order_by('added_on')
-            cache.set(cache_key, queryset)
-            return queryset
-        except Exception as e:
-            print('in exception of labstaff',e)
-            queryset = LabStaff.objects.all().order_by('id')
-            query = self.request.query_params.get('q', None)
-            sort = self.request.query_params.get('sort', None)
-            role = self.request.query_params.get('role', None)
-
-            if query is not None:
-                search_query = Q(name__icontains=query) | Q(branch__name__icontains=query) | Q(
-                    mobile_number__icontains=query)
-                queryset = queryset.filter(search_query)
-
-            if role is not None:
-                queryset = queryset.filter(role__name='MarketingExecutive')
-
-            if sort == '-added_on':
-                queryset = queryset.order_by('-added_on')
-            if sort == 'added_on':
-                queryset = queryset.order_by('added_on')
-            return queryset
+        queryset = LabStaff.objects.all().order_by('id')
+        query = self.request.query_params.get('q', None)
+        sort = self.request.query_params.get('sort', None)
+        role = self.request.query_params.get('role', None)
+
+        if query is not None:
+            search_query = Q(name__icontains=query) | Q(branch__name__icontains=query) | Q(
+                mobile_number__icontains=query)
+            queryset = queryset.filter(search_query)
+
+        if role is not None:
+            queryset = queryset.filter(role__name='MarketingExecutive')
+
+        if sort == '-added_on':
+            queryset = queryset.order_by('-added_on')
+        if sort == 'added_on':
+            queryset = queryset.order_by('added_on')
+        return queryset
 
     def perform_update(self, serializer):
         client = self.request.client
         serializer.context['client'] = client
         super().perform_update(serializer)
 
-        try:
-            base_cache_key = f'lab_staff_{client}_'
-            for key in cache.iter_keys(f'{base_cache_key}*'):  # Use a wildcard to find matching keys
-                cache.delete(key)
-        except Exception as e:
-            print(f"Error occurred while invalidating cache: {str(e)}")
-
     def perform_destroy(self, instance):
-        client = self.request.client
         try:
-            base_cache_key = f'lab_staff_{client}_'
-            for key in cache.iter_keys(f'{base_cache_key}*'):  # Use a wildcard to find matching keys
-                cache.delete(key)
             super().perform_destroy(instance)
         except Exception as e:
-            print(f"Error occurred while invalidating cache: {str(e)}")
+            print(f"Error occurred while deleting lab staff: {str(e)}")
 
 
 class LabStaffAccessViewSet(viewsets.ModelViewSet):
@@ -563,7 +522,7 @@ class LabWordReportTemplateViewSet(viewsets.ModelViewSet):
 
         if existing_report_content != updated_report_content:
             try:
-                activity_log = ActivityLogs.objects.create(
+                log_activity(
                     user=request.user,
                     lab_staff=instance.last_updated_by,
                     client=request.client,
@@ -575,13 +534,9 @@ class LabWordReportTemplateViewSet(viewsets.ModelViewSet):
                     model_instance_id=instance.id,
                     response_code=200,
                     duration="",
+                    changes=[('report', existing_report_content, updated_report_content)]
                 )
 
-                change = ChangesInModels.objects.create(field_name='report',
-                                                        before_value=existing_report_content,
-                                                        after_value=updated_report_content)
-                activity_log.changes.add(change)
-
             except Exception as error:
                 logger.error(
                     f"Error Creating Activitylog for word_report {instance.LabReportsTemplate.name} for on {instance.added_on.strftime('%d-%m-%y %I:%M %p')}: {error}",
@@ -1088,23 +1043,15 @@ class LabStaffDefaultBranchViewSet(viewsets.ModelViewSet):
 
 
     def perform_update(self, serializer):
-        client = self.request.client
         super().perform_update(serializer)
-        staff_id = serializer.instance.lab_staff.id
         try:
-            cache_key = f'lab_staff_{client}_{staff_id}'
-            if cache_key:
-                cache.delete(cache_key)
+            invalidate_list_cache('lab_staff')
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
     def perform_destroy(self, instance):
-        client = self.request.client
-        staff_id = instance.id
         try:
-            cache_key = f'lab_staff_{client}_{staff_id}'
-            if cache_key:
-                cache.delete(cache_key)
             super().perform_destroy(instance)
+            invalidate_list_cache('lab_staff')
         except Exception as e:
             print(f"Error occurred while deleting instancce and invalidating cache: {str(e)}")
\ No newline at end of file
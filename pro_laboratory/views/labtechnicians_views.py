@@ -1,19 +1,24 @@
 import base64
+import hashlib
 import logging
 from django.core.files.base import ContentFile
 from django_tenants.utils import schema_context
 from rest_framework import viewsets, generics
 from rest_framework.views import APIView
+from django.db import transaction
 from django.db.models import Q, Value
 from healtho_pro_user.models.users_models import Client
-from pro_laboratory.models.client_based_settings_models import BusinessControls
 from pro_laboratory.models.doctors_models import LabDoctors, DefaultsForDepartments
-from pro_laboratory.models.global_models import LabReportsTemplates, LabFixedParametersReportTemplate, \
-    LabWordReportTemplate, LabStaff, LabFixedReportNormalReferralRanges, LabStaffDefaultBranch
+from pro_laboratory.models.global_models import LabReportsTemplates, LabWordReportTemplate, LabStaff, \
+    LabStaffDefaultBranch
 from pro_laboratory.models.labtechnicians_models import LabTechnicians, LabTechnicianRemarks, \
     LabPatientWordReportTemplate, LabPatientFixedReportTemplate
+from pro_laboratory.models.messaging_models import OutboundMessage
 from pro_laboratory.models.patient_models import LabPatientTests, Patient, PatientPDFs
 from pro_laboratory.models.universal_models import ActivityLogs, ChangesInModels
+from pro_laboratory.outbound_messages import enqueue_messages
+from pro_laboratory.report_parameters import generate_fixed_report_parameters
+from pro_laboratory.tenant_settings import get_tenant_settings
 from pro_laboratory.serializers.labtechnicians_serializers import (LabTechnicianSerializer, \
     LabTechnicianRemarksSerializer, LabPatientWordReportTemplateSerializer, LabPatientFixedReportTemplateSerializer, \
     LabPatientTestFixedReportDeletionSerializer, LabTechnicianListSerializer, \
@@ -24,7 +29,7 @@ from datetime import datetime, timedelta
 from django.utils import timezone
 from pro_laboratory.views.universal_views import generate_test_report_content, get_rtf_content_for_word_report, \
     GenerateTestReportViewset, get_pdf_content
-from pro_universal_data.models import ULabTestStatus, ULabReportType, MessagingTemplates, MessagingSendType
+from pro_universal_data.models import MessagingTemplates, MessagingSendType
 from pro_universal_data.views import send_and_log_sms, send_and_log_whatsapp_sms
 
 
@@ -85,7 +90,7 @@ class LabTechniciansListView(generics.ListAPIView):
 
         user = self.request.user
 
-        controls = BusinessControls.objects.first()
+        controls = get_tenant_settings().business_controls
         if controls and controls.multiple_branches:
             default_branch_obj = LabStaffDefaultBranch.objects.get(lab_staff__mobile_number=user.phone_number)
             default_branch = default_branch_obj.default_branch.all()
@@ -286,29 +291,29 @@ class LabPatientFixedReportTemplateUpdateViewSet(viewsets.ModelViewSet):
         if labtechnician.is_report_finished:
             if labpatienttest.status_id.name == 'Processing':
                 if labpatienttest.is_authorization:
-                    labpatienttest.status_id = ULabTestStatus.objects.get(name='Authorization Pending')
+                    labpatienttest.status_id = get_tenant_settings().get_test_status('Authorization Pending')
                     labpatienttest.save()
 
                 else:
-                    labpatienttest.status_id = ULabTestStatus.objects.get(name='Completed')
+                    labpatienttest.status_id = get_tenant_settings().get_test_status('Completed')
                     labpatienttest.save()
 
             elif labpatienttest.status_id.name == 'Emergency (Processing)':
                 if labpatienttest.is_authorization:
-                    labpatienttest.status_id = ULabTestStatus.objects.get(name='Emergency (Authorization Pending)')
+                    labpatienttest.status_id = get_tenant_settings().get_test_status('Emergency (Authorization Pending)')
                     labpatienttest.save()
 
                 else:
-                    labpatienttest.status_id = ULabTestStatus.objects.get(name='Emergency (Completed)')
+                    labpatienttest.status_id = get_tenant_settings().get_test_status('Emergency (Completed)')
                     labpatienttest.save()
 
             elif labpatienttest.status_id.name == 'Urgent (Processing)':
                 if labpatienttest.is_authorization:
-                    labpatienttest.status_id = ULabTestStatus.objects.get(name='Urgent (Authorization Pending)')
+                    labpatienttest.status_id = get_tenant_settings().get_test_status('Urgent (Authorization Pending)')
                     labpatienttest.save()
 
                 else:
-                    labpatienttest.status_id = ULabTestStatus.objects.get(name='Urgent (Completed)')
+                    labpatienttest.status_id = get_tenant_settings().get_test_status('Urgent (Completed)')
                     labpatienttest.save()
 
         return Response(serializer.data)
@@ -335,35 +340,35 @@ class LabPatientTestFixedReportDeletionView(APIView):
 
                     #For tests in processing
                     if lab_patient_test.status_id.name == 'Processing':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Sample Collected')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Sample Collected')
                         lab_patient_test.save()
                     elif lab_patient_test.status_id.name == 'Emergency (Processing)':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Emergency (Sample Collected)')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Emergency (Sample Collected)')
                         lab_patient_test.save()
                     elif lab_patient_test.status_id.name == 'Urgent (Processing)':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Urgent (Sample Collected)')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Urgent (Sample Collected)')
                         lab_patient_test.save()
 
                     # For tests in Authorization Pending
                     elif lab_patient_test.status_id.name == 'Authorization Pending':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Sample Collected')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Sample Collected')
                         lab_patient_test.save()
                     elif lab_patient_test.status_id.name == 'Emergency (Authorization Pending)':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Emergency (Sample Collected)')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Emergency (Sample Collected)')
                         lab_patient_test.save()
                     elif lab_patient_test.status_id.name == 'Urgent (Authorization Pending)':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Urgent (Sample Collected)')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Urgent (Sample Collected)')
                         lab_patient_test.save()
 
                     #For tests in Completed
                     elif lab_patient_test.status_id.name == 'Completed':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Sample Collected')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Sample Collected')
                         lab_patient_test.save()
                     elif lab_patient_test.status_id.name == 'Emergency (Completed)':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Emergency (Sample Collected)')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Emergency (Sample Collected)')
                         lab_patient_test.save()
                     elif lab_patient_test.status_id.name == 'Urgent (Completed)':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Urgent (Sample Collected)')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Urgent (Sample Collected)')
                         lab_patient_test.save()
 
                     technician = LabTechnicians.objects.filter(LabPatientTestID=lab_patient_test).first()
@@ -389,24 +394,24 @@ class LabPatientTestFixedReportDeletionView(APIView):
 
                     # For tests in Authorization Pending
                     if lab_patient_test.status_id.name == 'Authorization Pending':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Processing')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Processing')
                         lab_patient_test.save()
                     elif lab_patient_test.status_id.name == 'Emergency (Authorization Pending)':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Emergency Processing')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Emergency Processing')
                         lab_patient_test.save()
                     elif lab_patient_test.status_id.name == 'Urgent (Authorization Pending)':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Urgent Processing')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Urgent Processing')
                         lab_patient_test.save()
 
                     # For tests in Completed
                     elif lab_patient_test.status_id.name == 'Completed':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Processing')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Processing')
                         lab_patient_test.save()
                     elif lab_patient_test.status_id.name == 'Emergency (Completed)':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Emergency Processing')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Emergency Processing')
                         lab_patient_test.save()
                     elif lab_patient_test.status_id.name == 'Urgent (Completed)':
-                        lab_patient_test.status_id = ULabTestStatus.objects.get(name='Urgent Processing')
+                        lab_patient_test.status_id = get_tenant_settings().get_test_status('Urgent Processing')
                         lab_patient_test.save()
 
                     technician = LabTechnicians.objects.filter(LabPatientTestID=lab_patient_test).first()
@@ -485,28 +490,28 @@ class LabPatientWordReportTemplateListViewSet(viewsets.ModelViewSet):
             if labtechnician.is_report_finished:
                 if labpatienttest.status_id.name == 'Processing':
                     if labpatienttest.is_authorization:
-                        labpatienttest.status_id = ULabTestStatus.objects.get(name='Authorization Pending')
+                        labpatienttest.status_id = get_tenant_settings().get_test_status('Authorization Pending')
                         labpatienttest.save()
                     else:
-                        labpatienttest.status_id = ULabTestStatus.objects.get(name='Completed')
+                        labpatienttest.status_id = get_tenant_settings().get_test_status('Completed')
                         labpatienttest.save()
 
                 elif labpatienttest.status_id.name == 'Emergency (Processing)':
                     if labpatienttest.is_authorization:
-                        labpatienttest.status_id = ULabTestStatus.objects.get(name='Emergency (Authorization Pending)')
+                        labpatienttest.status_id = get_tenant_settings().get_test_status('Emergency (Authorization Pending)')
                         labpatienttest.save()
 
                     else:
-                        labpatienttest.status_id = ULabTestStatus.objects.get(name='Emergency (Completed)')
+                        labpatienttest.status_id = get_tenant_settings().get_test_status('Emergency (Completed)')
                         labpatienttest.save()
 
                 elif labpatienttest.status_id.name == 'Urgent (Processing)':
                     if labpatienttest.is_authorization:
-                        labpatienttest.status_id = ULabTestStatus.objects.get(name='Urgent (Authorization Pending)')
+                        labpatienttest.status_id = get_tenant_settings().get_test_status('Urgent (Authorization Pending)')
                         labpatienttest.save()
 
                     else:
-                        labpatienttest.status_id = ULabTestStatus.objects.get(name='Urgent (Completed)')
+                        labpatienttest.status_id = get_tenant_settings().get_test_status('Urgent (Completed)')
                         labpatienttest.save()
 
             if existing_report_content != updated_report_content:
@@ -548,211 +553,170 @@ class LabPatientTestReportGenerationViewset(viewsets.ModelViewSet):
         return []
 
 
-    def get_age_in_days_for_patient(self, patient=None):
-        patient_age_in_days = 0
-        patient_age = patient.age
-        patient_age_units = patient.ULabPatientAge.name
+    def get_reports_templates(self, lab_patient_tests, template_id=None):
+        # The requested template for every test, otherwise the default template of each test's global test
+        if template_id:
+            lab_reports_template = LabReportsTemplates.objects.get(pk=template_id)
+            return {lab_patient_test.id: lab_reports_template for lab_patient_test in lab_patient_tests}
 
-        if patient_age_units == "Days":
-            patient_age_in_days = patient_age
-        elif patient_age_units == "Months":
-            patient_age_in_days = patient_age * 30
-            print(patient_age_in_days, 'months')
-        elif patient_age_units == "Years":
-            patient_age_in_days = patient_age * 365
-            print(patient_age_in_days,'dasdddsa')
-        elif patient_age_units == "DOB":
-            today = datetime.now().date()
-            print(today, 'today')
-            print(patient.dob, 'dob')
+        default_templates = {
+            lab_reports_template.LabGlobalTestID_id: lab_reports_template
+            for lab_reports_template in LabReportsTemplates.objects.filter(
+                LabGlobalTestID__in={lab_patient_test.LabGlobalTestId_id for lab_patient_test in lab_patient_tests},
+                is_default=True)
+        }
+        return {lab_patient_test.id: default_templates.get(lab_patient_test.LabGlobalTestId_id)
+                for lab_patient_test in lab_patient_tests}
+
+    def mark_report_generated(self, lab_patient_test, is_word_report=False):
+        if lab_patient_test.status_id.name == 'Sample Collected':
+            lab_patient_test.status_id = get_tenant_settings().get_test_status('Processing')
+            lab_patient_test.save()
+        elif lab_patient_test.status_id.name == 'Emergency (Sample Collected)':
+            lab_patient_test.status_id = get_tenant_settings().get_test_status('Emergency (Processing)')
+            lab_patient_test.save()
+        elif lab_patient_test.status_id.name == 'Urgent (Sample Collected)':
+            lab_patient_test.status_id = get_tenant_settings().get_test_status('Urgent (Processing)')
+            lab_patient_test.save()
+
+        lab_technician = LabTechnicians.objects.filter(LabPatientTestID=lab_patient_test).first()
+        if is_word_report:
+            lab_technician.is_word_report = True
+        lab_technician.is_report_generated = True
+        lab_technician.is_report_printed = False
 
-            patient_age_in_days = (today-patient.dob).days
-            print(patient_age_in_days, 'days age')
+        try:
+            department_defaults = DefaultsForDepartments.objects.filter(department=lab_patient_test.department).first()
 
-        return patient_age_in_days
+            if department_defaults and department_defaults.doctor:
+                default_doctor = department_defaults.doctor
 
-    def get_ref_range_for_patient(self, patient_gender=None, patient_age_in_days=None, parameter=None):
-        normal_ref_range = ""
+                lab_technician.consulting_doctor = default_doctor
 
-        if parameter.referral_range:
-            normal_ref_range = parameter.referral_range
-        else:
-            genders_to_check = ["Both", f"{patient_gender}"]
-            normal_ranges = LabFixedReportNormalReferralRanges.objects.filter(parameter_id=parameter,
-                                                                              gender__name__in=genders_to_check,
-                                                                              age_min_in_days__lte=patient_age_in_days,
-                                                                              age_max_in_days__gte=patient_age_in_days
-                                                                              )
+        except Exception as error:
+            print(error)
 
-            if normal_ranges:
-                normal_range = normal_ranges.first()
-                normal_ref_range = f"{normal_range.value_min}-{normal_range.value_max}"
+        lab_technician.save()
 
-        return normal_ref_range
+    def generate_fixed_reports(self, tests_with_templates, created_by=None):
+        report_parameters = generate_fixed_report_parameters(tests_with_templates, created_by=created_by)
 
+        reports = {}
+        for lab_patient_test, lab_reports_template in tests_with_templates:
+            # A test that cannot be marked generated gets its own Status, like the word reports, and its status
+            # change is rolled back without undoing the other tests
+            try:
+                with transaction.atomic():
+                    self.mark_report_generated(lab_patient_test)
+            except Exception as error:
+                logger.error(f"Error marking report of test {lab_patient_test.id} as generated: {error}",
+                             exc_info=True)
+                reports[lab_patient_test.id] = {"Status": f"{error}"}
+                continue
+
+            serializer = LabPatientFixedReportTemplateSerializer(report_parameters[lab_patient_test.id], many=True)
+            reports[lab_patient_test.id] = {
+                "type": "fixed",
+                'count': len(serializer.data),  # Add the count of results
+                'results': serializer.data
+            }
+        return reports
+
+    def generate_word_report(self, lab_patient_test, lab_reports_template, created_by=None):
+        lab_word_report_template = LabWordReportTemplate.objects.filter(
+            LabReportsTemplate=lab_reports_template).first()
+
+        lab_patient_word_report_template, created = LabPatientWordReportTemplate.objects.get_or_create(
+            LabPatientTestID=lab_patient_test)
+        lab_patient_word_report_template.report = lab_word_report_template.report
+        lab_patient_word_report_template.rtf_content_report = lab_word_report_template.rtf_content
+        lab_patient_word_report_template.created_by = created_by
+        lab_patient_word_report_template.last_updated_by = created_by
+        lab_patient_word_report_template.save()
+
+        rtf_content_header = get_rtf_content_for_word_report(test_id=lab_patient_test.id)
+        header, signature_content = generate_test_report_content(test_id=lab_patient_test.id)
+
+        test_report_data = LabPatientWordReportTemplate.objects.filter(
+            LabPatientTestID=lab_patient_test).annotate(header=Value(header),
+                                                        rtf_content_header=Value(rtf_content_header),
+                                                        signature_content=Value(signature_content))
+
+        serializer = LabPatientWordReportTemplateSerializer(test_report_data, many=True)
+        self.mark_report_generated(lab_patient_test, is_word_report=True)
+
+        return {
+            "type": "word",
+            'count': len(serializer.data),  # Add the count of results
+            'results': serializer.data
+        }
 
-    def create(self, request=None,lab_patient_test_id=None, created_by=None, template_id=None, *args, **kwargs):
+    def create(self, request=None, lab_patient_test_id=None, created_by=None, template_id=None,
+               lab_patient_test_ids=None, *args, **kwargs):
+        """
+        Generates the report of a test, or with lab_patient_test_ids the reports of many tests like the tests of
+        a sample. The parameters of all the fixed reports are generated together.
+        """
         if request:
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             serializer_data = serializer.validated_data
             lab_patient_test_id = serializer_data.get('lab_patient_test_id')
+            lab_patient_test_ids = serializer_data.get('lab_patient_test_ids')
             created_by_id = serializer_data.get('created_by')
             template_id = serializer_data.get('template_id')
         else:
-            lab_patient_test_id = lab_patient_test_id
             created_by_id = created_by
-            template_id = template_id
-
-        lab_patient_test = LabPatientTests.objects.get(pk=lab_patient_test_id)
-        created_by = LabStaff.objects.get(pk=created_by_id) if created_by_id is not None else None
-        global_test_id = lab_patient_test.LabGlobalTestId
-
-        patient = lab_patient_test.patient
-        patient_gender = patient.gender.name
-        patient_age_in_days = self.get_age_in_days_for_patient(patient=patient)
-
-        lab_reports_template = LabReportsTemplates.objects.get(
-            LabGlobalTestID=global_test_id,
-            is_default=True
-        )
 
-        if template_id:
-            lab_reports_template = LabReportsTemplates.objects.get(pk=template_id)
+        many = bool(lab_patient_test_ids)
+        test_ids = list(dict.fromkeys(lab_patient_test_ids)) if many else [lab_patient_test_id]
 
-        if lab_reports_template.report_type == ULabReportType.objects.get(pk=1):
-            fixed_parameters_report_template_set = LabFixedParametersReportTemplate.objects.filter(
-                LabReportsTemplate=lab_reports_template, is_active=True)
+        lab_patient_tests = {
+            lab_patient_test.id: lab_patient_test
+            for lab_patient_test in LabPatientTests.objects.filter(pk__in=test_ids).select_related(
+                'patient__gender', 'patient__ULabPatientAge', 'status_id')
+        }
+        missing_test_ids = [test_id for test_id in test_ids if test_id not in lab_patient_tests]
+        if missing_test_ids:
+            return Response({"Status": f"Lab patient tests {missing_test_ids} not found"},
+                            status=status.HTTP_400_BAD_REQUEST)
 
+        lab_patient_tests = [lab_patient_tests[test_id] for test_id in test_ids]
+        created_by = LabStaff.objects.get(pk=created_by_id) if created_by_id is not None else None
+        lab_reports_templates = self.get_reports_templates(lab_patient_tests, template_id=template_id)
+
+        reports = {}
+        fixed_tests = []
+        for lab_patient_test in lab_patient_tests:
+            lab_reports_template = lab_reports_templates[lab_patient_test.id]
+            if lab_reports_template is None:
+                reports[lab_patient_test.id] = {"Status": "Default report template not found"}
+            elif lab_reports_template.report_type_id == 1:
+                fixed_tests.append((lab_patient_test, lab_reports_template))
+
+        if fixed_tests:
             try:
-                test_report_data = []
-
-                for fixed_parameters_report_template in fixed_parameters_report_template_set:
-                    referral_range = self.get_ref_range_for_patient(patient_gender=patient_gender,
-                                                                       patient_age_in_days=patient_age_in_days,
-                                                                       parameter=fixed_parameters_report_template)
-                    lab_patient_fixed_report_template, created = LabPatientFixedReportTemplate.objects.get_or_create(
-                        LabGlobalTestID=global_test_id,
-                        LabPatientTestID=lab_patient_test,
-                        template=fixed_parameters_report_template,
-                        ordering=fixed_parameters_report_template.ordering,
-                        group=fixed_parameters_report_template.group,
-                        method=fixed_parameters_report_template.method,
-                        parameter=fixed_parameters_report_template.parameter,
-                        units=fixed_parameters_report_template.units,
-                        formula=fixed_parameters_report_template.formula,
-                        referral_range=referral_range,
-                        is_value_bold=fixed_parameters_report_template.is_value_bold,
-                        is_value_only=fixed_parameters_report_template.is_value_only
-                    )
-
-                    if created:
-                        lab_patient_fixed_report_template.value=fixed_parameters_report_template.value
-                        lab_patient_fixed_report_template.created_by = created_by
-                        lab_patient_fixed_report_template.last_updated_by = created_by
-                        lab_patient_fixed_report_template.save()
-
-                    test_report_data.append(lab_patient_fixed_report_template)
-
-                serializer = LabPatientFixedReportTemplateSerializer(test_report_data, many=True)
-
-                if lab_patient_test.status_id.name == 'Sample Collected':
-                    lab_patient_test.status_id = ULabTestStatus.objects.get(name='Processing')
-                    lab_patient_test.save()
-                elif lab_patient_test.status_id.name == 'Emergency (Sample Collected)':
-                    lab_patient_test.status_id = ULabTestStatus.objects.get(name='Emergency (Processing)')
-                    lab_patient_test.save()
-                elif lab_patient_test.status_id.name == 'Urgent (Sample Collected)':
-                    lab_patient_test.status_id = ULabTestStatus.objects.get(name='Urgent (Processing)')
-                    lab_patient_test.save()
-
-                lab_technician = LabTechnicians.objects.filter(LabPatientTestID=lab_patient_test).first()
-                lab_technician.is_report_generated = True
-                lab_technician.is_report_printed = False
-
-                try:
-                    department_defaults = DefaultsForDepartments.objects.filter(department=lab_patient_test.department).first()
-
-                    if department_defaults and department_defaults.doctor:
-                        default_doctor = department_defaults.doctor
-
-                        lab_technician.consulting_doctor = default_doctor
-
-                except Exception as error:
-                    print(error)
-
-                lab_technician.save()
-
-                response_data = {
-                    "type": "fixed",
-                    'count': len(serializer.data),  # Add the count of results
-                    'results': serializer.data
-                }
-                return Response(response_data)
-
+                reports.update(self.generate_fixed_reports(fixed_tests, created_by=created_by))
             except Exception as error:
                 return Response({"Status": f"{error}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        elif lab_reports_template.report_type == ULabReportType.objects.get(pk=2):
-            lab_word_report_template = LabWordReportTemplate.objects.filter(
-                LabReportsTemplate=lab_reports_template).first()
-
-            try:
-                lab_patient_word_report_template, created = LabPatientWordReportTemplate.objects.get_or_create(
-                    LabPatientTestID=lab_patient_test)
-                lab_patient_word_report_template.report = lab_word_report_template.report
-                lab_patient_word_report_template.rtf_content_report = lab_word_report_template.rtf_content
-                lab_patient_word_report_template.created_by = created_by
-                lab_patient_word_report_template.last_updated_by = created_by
-                lab_patient_word_report_template.save()
-
-                rtf_content_header = get_rtf_content_for_word_report(test_id=lab_patient_test_id)
-                header, signature_content = generate_test_report_content(test_id=lab_patient_test.id)
-
-                test_report_data = LabPatientWordReportTemplate.objects.filter(
-                    LabPatientTestID=lab_patient_test).annotate(header=Value(header),
-                                                                rtf_content_header=Value(rtf_content_header),
-                                                                signature_content=Value(signature_content))
-
-                serializer = LabPatientWordReportTemplateSerializer(test_report_data, many=True)
-
-                if lab_patient_test.status_id.name == 'Sample Collected':
-                    lab_patient_test.status_id = ULabTestStatus.objects.get(name='Processing')
-                    lab_patient_test.save()
-                elif lab_patient_test.status_id.name == 'Emergency (Sample Collected)':
-                    lab_patient_test.status_id = ULabTestStatus.objects.get(name='Emergency (Processing)')
-                    lab_patient_test.save()
-                elif lab_patient_test.status_id.name == 'Urgent (Sample Collected)':
-                    lab_patient_test.status_id = ULabTestStatus.objects.get(name='Urgent (Processing)')
-                    lab_patient_test.save()
-
-                lab_technician = LabTechnicians.objects.filter(LabPatientTestID=lab_patient_test).first()
-                lab_technician.is_word_report = True
-                lab_technician.is_report_generated = True
-                lab_technician.is_report_printed = False
-
+        for lab_patient_test in lab_patient_tests:
+            lab_reports_template = lab_reports_templates[lab_patient_test.id]
+            if lab_reports_template is not None and lab_reports_template.report_type_id == 2:
                 try:
-                    department_defaults = DefaultsForDepartments.objects.filter(
-                        department=lab_patient_test.department).first()
-
-                    if department_defaults and department_defaults.doctor:
-                        default_doctor = department_defaults.doctor
-
-                        lab_technician.consulting_doctor = default_doctor
-
+                    reports[lab_patient_test.id] = self.generate_word_report(lab_patient_test, lab_reports_template,
+                                                                             created_by=created_by)
                 except Exception as error:
-                    print(error)
+                    reports[lab_patient_test.id] = {"Status": f"{error}"}
 
-                lab_technician.save()
-                response_data = {
-                    "type": "word",
-                    'count': len(serializer.data),  # Add the count of results
-                    'results': serializer.data
-                }
-                return Response(response_data)
+        if not many:
+            report = reports.get(lab_patient_test_id) or {"Status": "Report type of the template is not supported"}
+            if "Status" in report:
+                return Response(report, status=status.HTTP_400_BAD_REQUEST)
+            return Response(report)
 
-            except Exception as error:
-                return Response({"Status": f"{error}"}, status=status.HTTP_400_BAD_REQUEST)
+        results = [{'lab_patient_test_id': test_id, **reports.get(test_id, {})} for test_id in test_ids]
+        return Response({'count': len(results), 'results': results})
 
 
 class SendTestReportInWhatsappView(APIView):
@@ -861,28 +825,24 @@ class SendTestReportInWhatsappView(APIView):
 
 def send_sms_when_reports_completed(patient=None):
     try:
-        tests = LabPatientTests.objects.filter(patient=patient)
-        if LabPatientTests.objects.filter(patient=patient).exclude(
-                status_id__id__in=[3, 13, 17, 9, 21]).exists():
+        test_statuses = list(LabPatientTests.objects.filter(patient=patient).values_list('id', 'status_id'))
+        if any(status_id not in [3, 13, 17, 9, 21] for _, status_id in test_statuses):
             print('Cannot sent reports ready, as some tests are still pending!')
         else:
-            sms_template = MessagingTemplates.objects.get(pk=2)
-            messaging_send_type = MessagingSendType.objects.get(pk=1)
-            client = patient.client
-
-            sms_template = MessagingTemplates.objects.get(pk=2)
-            whatsapp_template = MessagingTemplates.objects.get(pk=13)
-
-            send_and_log_whatsapp_sms(search_id=patient.id, numbers=patient.mobile_number,
-                                      mwa_template=whatsapp_template,
-                                      messaging_send_type=messaging_send_type,
-                                      client=client,send_reports_type='Automatic'
-                                      )
-
-            send_and_log_sms(search_id=patient.id, numbers=patient.mobile_number,
-                             sms_template=sms_template, messaging_send_type=messaging_send_type,
-                             client=client)
-            print('reports sent as tests are completed')
+            # One reports ready message per completion of the patient's current tests, later saves of the same
+            # completed tests queue nothing
+            test_ids = ','.join(str(test_id) for test_id, _ in sorted(test_statuses))
+            completion = hashlib.md5(test_ids.encode()).hexdigest()
+            enqueue_messages([
+                OutboundMessage(channel=OutboundMessage.WHATSAPP, template_id=13, messaging_send_type_id=1,
+                                client=patient.client, search_id=patient.id, numbers=patient.mobile_number,
+                                send_reports_type='Automatic',
+                                dedup_key=f'reports_ready:whatsapp:{patient.id}:{completion}'),
+                OutboundMessage(channel=OutboundMessage.SMS, template_id=2, messaging_send_type_id=1,
+                                client=patient.client, search_id=patient.id, numbers=patient.mobile_number,
+                                dedup_key=f'reports_ready:sms:{patient.id}:{completion}'),
+            ])
+            logger.info('reports ready messages queued as tests are completed')
 
     except Exception as error:
         logger.error(f"Unexpected error sending sms: {error}", exc_info=True)
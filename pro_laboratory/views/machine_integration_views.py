@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import connection
+from django.utils import timezone
 from rest_framework import serializers, generics, permissions, status
 from rest_framework.response import Response
 
@@ -27,16 +29,16 @@ class ProcessingMachineDataSavingView(generics.CreateAPIView):
 
     def create(self, request, *args, **kwargs):
         try:
-            logger.error(f"Started the processing of machine integration API",exc_info=True)
+            logger.info(f"Started the processing of machine integration API")
 
-            logger.error(f"Machine integration data posted by machine: {request.data}",exc_info=True)
+            logger.info(f"Machine integration data posted by machine: {request.data}")
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             validated_data = serializer.validated_data
             secret_key = validated_data.pop('secret_key', None)
 
             if secret_key is None:
-                logger.error(f"MCIT - Error: Secret Key not given", exc_info=True)
+                logger.warning(f"MCIT - Error: Secret Key not given")
                 return Response({"Error": "Secret Key not given"})
 
             lab_tpa_secret_key = LabTpaSecretKeys.objects.get(secret_key=secret_key, is_active=True)
@@ -63,43 +65,58 @@ class ProcessingMachineDataSavingView(generics.CreateAPIView):
                 machine = ProcessingMachine.objects.get(pk=machine_id)
 
                 if not machine.is_active:
-                    logger.error(f"MCIT - Error: Machine is inactive", exc_info=True)
+                    logger.warning(f"MCIT - Error: Machine is inactive")
                     return Response({"Error": "Machine is inactive!"}, status=status.HTTP_400_BAD_REQUEST)
 
 
                 if input_data is not None:
-                    instance = DataFromProcessingMachine.objects.create(machine=machine, data=input_data)
+                    if compliance not in ['HL7', 'ASTM']:
+                        logger.warning(f"MCIT - Error: Compliance Not Selected: HL7 or ASTM!")
+                        return Response({"Error": "Compliance Not Selected: HL7 or ASTM!"}, status=status.HTTP_400_BAD_REQUEST)
+
+                    if getattr(settings, 'MACHINE_INGESTION_MODE', 'sync') == 'queued':
+                        # Only the raw message is saved here, the consumer thread parses and applies it
+                        instance = DataFromProcessingMachine.objects.create(machine=machine, data=input_data,
+                                                                            compliance=compliance,
+                                                                            status=DataFromProcessingMachine.QUEUED)
+                        from machine_integration_files.ingestion_queue import enqueue_machine_messages
+                        enqueue_machine_messages(connection.schema_name)
+                        return Response({"message_id": instance.id,
+                                         "status": instance.status}, status=status.HTTP_202_ACCEPTED)
+
+                    instance = DataFromProcessingMachine.objects.create(machine=machine, data=input_data,
+                                                                        compliance=compliance)
                     print('integration obj created', instance)
-                    logger.error(f"MCIT - Error: integration obj created", exc_info=True)
+                    logger.info(f"MCIT - Error: integration obj created")
 
                     if compliance == 'HL7':
                         print('in HL7 flow')
-                        logger.error(f"MCIT - Error: in HL7 flow", exc_info=True)
+                        logger.info(f"MCIT - Error: in HL7 flow")
                         from machine_integration_files.hl7_message import process_hl7_message
                         sample_id, saving_status = process_hl7_message(message=input_data)
-                        print('integration work completed')
-                        logger.error(f"MCIT - Error: integration work completed", exc_info=True)
-                        return Response({"sample_id": sample_id,
-                                         "saving_status": saving_status,
-                                         "hl7 message": input_data})
-                    elif compliance == 'ASTM':
+                    else:
                         print('in ASTM flow')
-                        logger.error(f"MCIT - Error: in ASTM flow", exc_info=True)
+                        logger.info(f"MCIT - Error: in ASTM flow")
                         from machine_integration_files.astm_message import process_astm_message
                         sample_id, saving_status = process_astm_message(message=input_data)
-                        print('integration work completed')
-                        logger.error(f"MCIT - Error: integration work completed", exc_info=True)
-                        return Response({"sample_id": sample_id,
-                                         "saving_status": saving_status,
-                                         "hl7 message": input_data})
-                    else:
-                        logger.error(f"MCIT - Error: Compliance Not Selected: HL7 or ASTM!", exc_info=True)
-                        return Response({"Error": "Compliance Not Selected: HL7 or ASTM!"}, status=status.HTTP_400_BAD_REQUEST)
+
+                    instance.sample_id = sample_id
+                    instance.saving_status = saving_status
+                    instance.status = DataFromProcessingMachine.PROCESSED if saving_status and saving_status.startswith(
+                        'Processed') else DataFromProcessingMachine.FAILED
+                    instance.processed_on = timezone.now()
+                    instance.save()
+
+                    print('integration work completed')
+                    logger.info(f"MCIT - Error: integration work completed")
+                    return Response({"sample_id": sample_id,
+                                     "saving_status": saving_status,
+                                     "hl7 message": input_data})
 
                     # return HttpResponse(input_data)
                 else:
 
-                    logger.error(f"MCIT - Error: No data is sent", exc_info=True)
+                    logger.warning(f"MCIT - Error: No data is sent")
                     return Response({"Error": "No data is sent"}, status=status.HTTP_400_BAD_REQUEST)
 
             except Exception as error:
@@ -123,4 +140,15 @@ def process_parameter_value(parameter=None, parameter_value_from_machine =None):
                 logger.error(f"MCIT - Error(While conversion of parameter value): {error}", exc_info=True)
 
 
-    return parameter_value_from_machine
\ No newline at end of file
+    return parameter_value_from_machine
+
+
+class ProcessingMachineIngestionMetricsView(generics.GenericAPIView):
+    def get(self, request, *args, **kwargs):
+        from machine_integration_files.ingestion_queue import get_machine_ingestion_metrics
+        try:
+            window_minutes = int(request.query_params.get('window_minutes', 60))
+        except ValueError:
+            return Response({"Error": "window_minutes must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(get_machine_ingestion_metrics(window_minutes=max(window_minutes, 1)))
@@ -3,7 +3,6 @@ import calendar
 from django.http import HttpResponse
 from django.utils import timezone
 from django.db.models import Q, Count, Sum, DurationField, Min, Max
-from django.db.models.functions import TruncMonth
 from django_filters.rest_framework import DjangoFilterBackend
 from geopy import Nominatim
 from geopy.exc import GeocoderTimedOut
@@ -13,12 +12,13 @@ from rest_framework.response import Response
 from rest_framework import generics
 from rest_framework.views import APIView
 
+from pro_laboratory.daily_rollups import get_referral_totals
 from pro_laboratory.filters import MarketingExecutiveVisitsFilter
 from pro_laboratory.models.doctors_models import LabDoctors
 from pro_laboratory.models.global_models import LabStaff
 from pro_laboratory.models.marketing_models import MarketingExecutiveVisits, MarketingExecutiveLocationTracker, \
     MarketingExecutiveTargets
-from pro_laboratory.models.patient_models import Patient, LabPatientInvoice
+from pro_laboratory.models.patient_models import Patient
 from pro_laboratory.serializers.doctors_serializers import ReferralDoctorCountSerializer
 from pro_laboratory.serializers.marketing_serializers import MarketingExecutiveVisitsSerializer, \
     MarketingExecutiveLocationTrackerSerializer, \
@@ -235,12 +235,8 @@ def calculate_target_achieved_by_marketing_executive(target=None):
                                         added_on__date__gte=target.from_date,
                                         added_on__date__lte=target.to_date)
 
-    patients = Patient.objects.filter(added_on__date__gte=target.from_date,
-                                      added_on__date__lte=target.to_date,
-                                      referral_doctor__in=doctors)
-
-    total_price = LabPatientInvoice.objects.filter(patient__in=patients).aggregate(total=Sum('total_price'))[
-                      'total'] or 0
+    referral_totals = get_referral_totals(doctors.values_list('id', flat=True), target.from_date, target.to_date)
+    total_price = sum(totals['total_price'] for totals in referral_totals.values())
 
     return {"total_price": total_price,
             "ref_doctors_count": doctors.count(),
@@ -489,15 +485,25 @@ class ReferralDoctorStatsAPIView(APIView):
                 <tbody>
         """
 
+        # Patients and invoice totals of all the doctors, read once instead of per doctor and month
+        referral_totals = {}
+        if date:
+            try:
+                selected_date = timezone.datetime.strptime(date, '%Y-%m-%d').date()
+            except ValueError:
+                raise ValidationError({'error': 'Invalid date format. Expected format: YYYY-MM-DD'})
+            referral_totals = get_referral_totals(referral_doctors.values_list('id', flat=True), selected_date,
+                                                  selected_date)
+        elif start_date and end_date:
+            referral_totals = get_referral_totals(referral_doctors.values_list('id', flat=True), start_date, end_date,
+                                                  by_month=True)
+
         sno = 1
         for doctor in referral_doctors:
-            patients_query = Patient.objects.filter(referral_doctor=doctor)
-
             if date:
-                patients_query = patients_query.filter(added_on__date=date)
-                patients_count = patients_query.count()
-                collection = LabPatientInvoice.objects.filter(patient__in=patients_query).aggregate(Sum('total_price'))[
-                                 'total_price__sum'] or 0
+                doctor_totals = referral_totals.get((doctor.id, None), {})
+                patients_count = doctor_totals.get('patients_count', 0)
+                collection = doctor_totals.get('total_price', 0)
 
                 html_content += f"""
                 <tr>
@@ -509,26 +515,15 @@ class ReferralDoctorStatsAPIView(APIView):
                 </tr>
                 """
             elif start_date and end_date:
-                patients_query = patients_query.filter(added_on__date__range=[start_date, end_date])
                 monthly_counts = {f"{calendar.month_abbr[month]}'{str(year)[-2:]}": 0 for year, month in selected_months}
                 monthly_collections = {f"{calendar.month_abbr[month]}'{str(year)[-2:]}": 0 for year, month in selected_months}
 
-                # Annotate by month and count patients
-                patients_by_month = patients_query.annotate(month=TruncMonth('added_on')).values('month').annotate(
-                    count=Count('id')).order_by('month')
-
-                for month_data in patients_by_month:
-                    year = month_data['month'].year
-                    month = month_data['month'].month
-                    month_key = f"{calendar.month_abbr[month]}'{str(year)[-2:]}"
-                    monthly_counts[month_key] = month_data['count']
-
-                    collection_for_month = LabPatientInvoice.objects.filter(
-                        patient__in=patients_query,
-                        patient__added_on__month=month,
-                        patient__added_on__year=year
-                    ).aggregate(Sum('total_cost'))['total_cost__sum'] or 0
-                    monthly_collections[month_key] = collection_for_month
+                for year, month in selected_months:
+                    month_totals = referral_totals.get((doctor.id, (year, month)))
+                    if month_totals:
+                        month_key = f"{calendar.month_abbr[month]}'{str(year)[-2:]}"
+                        monthly_counts[month_key] = month_totals['patients_count']
+                        monthly_collections[month_key] = month_totals['total_cost']
 
                 counts_html = "".join([f"<td>{monthly_counts[header]}</td><td>{monthly_collections[header]}</td>" for header in month_headers])
 
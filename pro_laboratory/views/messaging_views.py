@@ -1,10 +1,12 @@
 from datetime import datetime
 
 import requests
+from django.conf import settings
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 
 from healtho_pro_user.models.business_models import BusinessProfiles
+from pro_laboratory.messaging_template_engine import render_messaging_template
 from pro_laboratory.models.client_based_settings_models import BusinessMessageSettings
 from pro_laboratory.models.doctors_models import LabDoctors
 from pro_laboratory.models.messaging_models import MessagingLogs, SendSMSData, WhatsAppMessagingLogs, \
@@ -12,12 +14,17 @@ from pro_laboratory.models.messaging_models import MessagingLogs, SendSMSData, W
 from pro_laboratory.models.patient_models import Patient, LabPatientInvoice, LabPatientTests
 from pro_laboratory.serializers.messaging_serializers import MessagingLogsSerializer, SendSMSDataSerializer, \
     SendAndSaveWhatsAppSMSDataSerializer, WhatsappConfigurationsSerializer
-from pro_universal_data.models import MessagingVendors, Tag
+from pro_universal_data.models import MessagingVendors
 import os
-import re
 
 from pro_universal_data.template_data import template_data
 
+
+def get_request_timeout():
+    # Vendor calls are bounded, so a hung vendor cannot hold a queued message past its claim
+    return getattr(settings, 'MESSAGING_REQUEST_TIMEOUT_SECONDS', 30)
+
+
 FAST2SMS_KEY = os.environ.get('FAST2SMS_KEY')
 META_WHATSAPP_KEY = os.environ.get('META_WHATSAPP_KEY')
 META_WHATSAPP_PHONE_ID = os.environ.get('META_WHATSAPP_PHONE_ID')
@@ -144,53 +151,7 @@ class SendAndSaveSMSDataViewset(viewsets.ModelViewSet):
             else:
                 pass
 
-            # Regex search to get all the values with { }
-            search_pattern = r"\{(.*?)\}"
-            constant_pattern = r'{Constant:\s*([^}]*)\s*}'
-            template_content = sms_template.templateContent
-            template_values = {}
-
-            def replace_tag(match):
-                tag_name = match.group(0)  # Gets the matched content including curly braces
-                try:
-                    if re.match(constant_pattern, tag_name):  # Handling {Constants}
-                        tag_value = re.match(constant_pattern, tag_name).group(1)
-                        template_values[tag_name] = tag_value
-                        return tag_value
-
-                    elif re.match(search_pattern, tag_name):  # Handling {variables}
-                        try:
-                            tag = Tag.objects.get(tag_name=tag_name)
-                            if tag.tag_formula:
-                                try:
-                                    tag_value = str(eval(tag.tag_formula, {'details': details}))
-                                    template_values[tag_name] = tag_value
-                                    return tag_value
-                                except Exception as error:
-                                    print(f"{tag_name} - This tag has error in the formula!Please Check: {error}")
-                                    tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                                    template_values[tag_name] = tag_value
-                                    return tag_value
-                            else:
-                                print(f"{tag_name} - This tag does not have a formula! Please check ")
-                                tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                                template_values[tag_name] = tag_value
-                                return tag_value
-
-                        except Tag.DoesNotExist:
-                            print(f"{tag_name} - This tag does not exist! ")
-                            tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                            template_values[tag_name] = tag_value
-                            return tag_value
-                except Exception as error:
-                    print(f"Error occured at {tag_name} - {error}")
-
-            # Function to replace the template_content and get the template_values dictionary
-            replaced_content = None
-            try:
-                replaced_content = re.sub(search_pattern, replace_tag, template_content)
-            except Exception as error:
-                print(error)
+            replaced_content, template_values = render_messaging_template(sms_template.templateContent, details)
 
             # Converting variable_values and keys to be passable into API
             variable_keys = list(template_values.keys())
@@ -215,7 +176,8 @@ class SendAndSaveSMSDataViewset(viewsets.ModelViewSet):
                 'cache-control': "no-cache"
             }
 
-            response = requests.request("GET", self.url, headers=headers, params=querystring)
+            response = requests.request("GET", self.url, headers=headers, params=querystring,
+                                        timeout=get_request_timeout())
             response_data = response.json()
             error_msg = response_data['message']
 
@@ -308,58 +270,10 @@ class SendAndSaveWhatsAppSMSViewset(viewsets.ModelViewSet):
             except Exception as error:
                 print(f"While fetching details,-{error}")
 
-            # Regex search to get all the values with { }
-            search_pattern = r"\{(.*?)\}"
-            constant_pattern = r'{Constant:\s*([^}]*)\s*}'
-            template_content = mwa_template.templateContent
-            template_values = {}
-            # print(details)
-
-            def replace_tag(match):
-                tag_name = match.group(0)  # Gets the matched content including curly braces
-                try:
-                    if re.match(constant_pattern, tag_name):  # Handling {Constants}
-                        tag_value = re.match(constant_pattern, tag_name).group(1)
-                        template_values[tag_name] = tag_value
-                        return tag_value
-
-                    elif re.match(search_pattern, tag_name):  # Handling {variables}
-                        try:
-                            tag = Tag.objects.get(tag_name=tag_name)
-                            if tag.tag_formula:
-                                try:
-                                    tag_value = str(eval(tag.tag_formula, {'details': details}))
-                                    template_values[tag_name] = tag_value
-                                    return tag_value
-                                except Exception as error:
-                                    print(f"{tag_name} - This tag has error in the formula!Please Check: {error}")
-                                    tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                                    template_values[tag_name] = tag_value
-                                    return tag_value
-                            else:
-                                print(f"{tag_name} - This tag does not have a formula! Please check ")
-                                tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                                template_values[tag_name] = tag_value
-                                return tag_value
-
-                        except Tag.DoesNotExist:
-                            print(f"{tag_name} - This tag does not exist! ")
-                            tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                            template_values[tag_name] = tag_value
-                            return tag_value
-                except Exception as error:
-                    print(f"Error occured at {tag_name} - {error}")
-
-            # Function to replace the template_content and get the template_values dictionary
-            replaced_content = None
+            replaced_content, template_values = render_messaging_template(mwa_template.templateContent, details)
             response_code = None
             response_message = None
 
-            try:
-                replaced_content = re.sub(search_pattern, replace_tag, template_content)
-            except Exception as error:
-                print(error)
-
             send_reports_type = send_reports_type or 'Automatic'
             messages = BusinessMessageSettings.objects.first()
             messaging_vendor = messages.whatsapp_vendor
@@ -408,7 +322,8 @@ class SendAndSaveWhatsAppSMSViewset(viewsets.ModelViewSet):
                             }
                         }
 
-                        response = requests.request("POST", url, headers=headers, json=data)
+                        response = requests.request("POST", url, headers=headers, json=data,
+                                                    timeout=get_request_timeout())
                         response_json = response.json()
                         response_code = response.status_code
                         if response_code == 200:
@@ -435,7 +350,8 @@ class SendAndSaveWhatsAppSMSViewset(viewsets.ModelViewSet):
                             "message": replaced_content
                         }
 
-                        response = requests.post(url="https://connect2chat.com/api/send/whatsapp", params=chat)
+                        response = requests.post(url="https://connect2chat.com/api/send/whatsapp", params=chat,
+                                                 timeout=get_request_timeout())
                         response_json = response.json()
                         response_code = response_json['status']
                         response_message = response_json['message']
@@ -504,7 +420,7 @@ class SendPDFWhatsAppSMSViewSet(viewsets.ModelViewSet):
                 'messaging_product': 'whatsapp',
                 'type': 'document'
             }
-            response = requests.post(url, headers=headers, files=files, data=data)
+            response = requests.post(url, headers=headers, files=files, data=data, timeout=get_request_timeout())
         if response.status_code == 200:
             return response.json().get('id')
         else:
@@ -543,59 +459,10 @@ class SendPDFWhatsAppSMSViewSet(viewsets.ModelViewSet):
             except Exception as error:
                 print(f"While fetching details,-{error}")
 
-            # Regex search to get all the values with { }
-            search_pattern = r"\{(.*?)\}"
-            constant_pattern = r'{Constant:\s*([^}]*)\s*}'
-            template_content = mwa_template.templateContent
-            template_values = {}
-            # print(details)
-            print(template_content, 'template content')
-
-            def replace_tag(match):
-                tag_name = match.group(0)  # Gets the matched content including curly braces
-                try:
-                    if re.match(constant_pattern, tag_name):  # Handling {Constants}
-                        tag_value = re.match(constant_pattern, tag_name).group(1)
-                        template_values[tag_name] = tag_value
-                        return tag_value
-
-                    elif re.match(search_pattern, tag_name):  # Handling {variables}
-                        try:
-                            tag = Tag.objects.get(tag_name=tag_name)
-                            print('here')
-                            if tag.tag_formula:
-                                try:
-                                    tag_value = str(eval(tag.tag_formula, {'details': details}))
-                                    template_values[tag_name] = tag_value
-                                    return tag_value
-                                except Exception as error:
-                                    print(f"{tag_name} - This tag has error in the formula!Please Check: {error}")
-                                    tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                                    template_values[tag_name] = tag_value
-                                    return tag_value
-                            else:
-                                print(f"{tag_name} - This tag does not have a formula! Please check ")
-                                tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                                template_values[tag_name] = tag_value
-                                return tag_value
-
-                        except Tag.DoesNotExist:
-                            print(f"{tag_name} - This tag does not exist! ")
-                            tag_value = f"*{re.match(search_pattern, tag_name).group(1)}*"
-                            template_values[tag_name] = tag_value
-                            return tag_value
-                except Exception as error:
-                    print(f"Error occured at {tag_name} - {error}")
-            # Function to replace the template_content and get the template_values dictionary
-            replaced_content = None
+            replaced_content, template_values = render_messaging_template(mwa_template.templateContent, details)
             response_code = None
             response_message = None
 
-            try:
-                replaced_content = re.sub(search_pattern, replace_tag, template_content)
-            except Exception as error:
-                print(error)
-
             send_reports_type = send_reports_type or 'Automatic'
             messages = BusinessMessageSettings.objects.first()
             messaging_vendor = messages.whatsapp_vendor
@@ -666,7 +533,8 @@ class SendPDFWhatsAppSMSViewSet(viewsets.ModelViewSet):
                         
                         
                         
-                        response = requests.request("POST", url, headers=headers, json=data)
+                        response = requests.request("POST", url, headers=headers, json=data,
+                                                    timeout=get_request_timeout())
                         response_json = response.json()
                         print(response, 'response')
                         print(response_json, 'response json data')
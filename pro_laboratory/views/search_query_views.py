@@ -8,6 +8,7 @@ from rest_framework import viewsets
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from healtho_pro.cache_tags import cache_family, tagged_cache_key
 from logging_middleware import logger
 from pro_hospital.models.universal_models import DoctorConsultationDetails, GlobalServices, GlobalRoom
 from pro_hospital.serializers.universal_serializers import DoctorConsultationDetailsForPatientsSerializer, \
@@ -70,7 +71,7 @@ def master_search_for_tests(request):
         return Response({"error": "client_id is required"}, status=400)
 
     # Generate a unique cache key per client and query
-    cache_key = f'master_search_for_tests_{client_id}_{query}_ref_lab_{referral_lab}'
+    cache_key = tagged_cache_key(cache_family('master_search_for_tests', client_id), query, 'ref_lab', referral_lab)
 
     try:
         # Try to fetch from cache
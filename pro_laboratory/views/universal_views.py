@@ -2,6 +2,7 @@ import base64
 from datetime import datetime, timedelta, time
 import re
 from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
 import barcode
 import qrcode
 from dateutil.relativedelta import relativedelta
@@ -11,7 +12,6 @@ from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from django_tenants.utils import schema_context
 from num2words import num2words
-from pypdf import PdfWriter, PdfReader
 from rest_framework import status
 from rest_framework import viewsets, generics, permissions
 from weasyprint import HTML
@@ -20,9 +20,11 @@ from accounts.models import LabExpenses
 from healtho_pro_user.models.business_models import BContacts, BusinessProfiles, BusinessAddresses
 from healtho_pro_user.models.users_models import HealthOProUser, Client, Domain
 from interoperability.models import LabTpaSecretKeys
+from pro_laboratory.activity_log_writer import get_activity_log_metrics
+from pro_laboratory.daily_rollups import can_use_rollups, get_test_counts, get_staff_collections
 from pro_laboratory.filters import TpaUltraSoundFilter, ActivityLogsFilter
 from pro_laboratory.models.client_based_settings_models import LetterHeadSettings, BusinessReferralDoctorSettings, \
-    PrintTestReportSettings, PrintReportSettings, BusinessEmailDetails, ReportFontSizes
+    PrintTestReportSettings, BusinessEmailDetails
 from pro_laboratory.models.doctors_models import ReferralAmountForDoctor, DefaultsForDepartments
 from pro_laboratory.models.global_models import LabStaff, LabStaffDefaultBranch, LabGlobalTests, LabGlobalPackages
 from pro_laboratory.models.labtechnicians_models import (LabPatientFixedReportTemplate, LabTechnicians, \
@@ -34,6 +36,12 @@ from pro_laboratory.models.phlebotomists_models import LabPhlebotomist
 from pro_laboratory.models.privilege_card_models import PrivilegeCardMemberships, PrivilegeCardsLabDepartmentsBenefits, PrivilegeCardsLabTestBenefits, PrivilegeCardsMembershipApplicableBenefits
 from pro_laboratory.models.sourcing_lab_models import SourcingLabLetterHeadSettings
 from pro_laboratory.models.universal_models import PrintTemplate, PrintDataTemplate, ChangesInModels
+from pro_laboratory.report_pdf_cache import build_report_cache_key, get_cached_report, set_cached_report
+from pro_laboratory.report_rendering import render_and_merge_pdfs, pdf_to_base64_data, submit_render_job, get_job, \
+    get_job_pdf, JOB_COMPLETED
+from pro_laboratory.tenant_settings import get_tenant_settings
+from pro_laboratory.report_template_engine import render_template_field, render_template_text, resolve_tag, \
+    evaluate_compiled_expression
 from pro_laboratory.models.universal_models import TpaUltrasoundConfig, TpaUltrasound, TpaUltrasoundImages, \
     ActivityLogs
 from pro_laboratory.serializers.client_based_settings_serializers import LetterHeadSettingsSerializer
@@ -189,6 +197,12 @@ class ActivityLogsListView(generics.ListAPIView):
         return queryset
 
 
+class ActivityLogWriterMetricsView(generics.GenericAPIView):
+    def get(self, request, *args, **kwargs):
+        # Counters of this process, activity logs are queued and written per process
+        return Response(get_activity_log_metrics())
+
+
 class GenerateBarcodePDFViewset(viewsets.ModelViewSet):
     serializer_class = GenerateBarcodePDFTrailSerializer
 
@@ -280,7 +294,7 @@ class GenerateBarcodePDFViewset(viewsets.ModelViewSet):
             code.write(buffer)
             image = buffer.getvalue()
             barcode_image = base64.b64encode(image).decode('utf-8')
-            barcode_alignments = PrintReportSettings.objects.first()
+            barcode_alignments = get_tenant_settings().print_report_settings
 
             barcode_image = f'''<img style="height:{barcode_alignments.barcode_height}px;width:{barcode_alignments.barcode_width}px;" src="data:image/png;base64,{barcode_image}" alt="Barcode Image">'''
 
@@ -330,6 +344,8 @@ def generate_barcode_pdf(sample_id, mr_no, date_time):
     response = viewset.create(sample_id=sample_id, mr_no=mr_no, date_time=date_time)
 
 
+# Same barcode is drawn for every test of a patient, images are cached per process
+@lru_cache(maxsize=1024)
 def generate_barcode_image(barcode_no):  # For invoice no
     try:
         barcode_number = f"{barcode_no}"
@@ -351,6 +367,22 @@ def generate_barcode_image(barcode_no):  # For invoice no
         return None
 
 
+def generate_qrcode_image(qr_data):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=0
+    )
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white").convert("RGBA")
+    qr_buffer = BytesIO()
+    img.save(qr_buffer, format='PNG')
+    qr_base64 = base64.b64encode(qr_buffer.getvalue()).decode()
+    return f"data:image/png;base64,{qr_base64}"
+
+
 def get_branch_address_of_lab_staff(lab_staff=None):
     try:
         branch_obj = LabStaffDefaultBranch.objects.filter(lab_staff=lab_staff).first()
@@ -2703,22 +2735,28 @@ def get_age_details_in_short_form(patient):
     return f"{age} {age_units[:1]}"
 
 
+def get_value_from_select_value(value):
+    if value.lower().startswith('select**'):
+        match = re.match(r'^select\*\*(.*?)\*\*', value, re.IGNORECASE)
+        if match:
+            extracted_value = match.group(1)
+            return extracted_value
+    return value
+
+
 def get_param_value(parameter=None, lab_patient_test=None):
     report = LabPatientFixedReportTemplate.objects.filter(LabPatientTestID=lab_patient_test,
                                                           parameter=parameter).first()
     if report:
-        value = report.value
-        if value.lower().startswith('select**'):
-            match = re.match(r'^select\*\*(.*?)\*\*', value, re.IGNORECASE)
-            if match:
-                extracted_value = match.group(1)
-                return extracted_value
-        return value
+        return get_value_from_select_value(report.value)
 
 
 
 def get_lab_patient_details(test_id=None, patient_id=None, client_id=None, printed_by_id=None, receipt_id=None):
     print(test_id, 'test_id', client_id, 'client_id', printed_by_id, 'patient_id', patient_id)
+    if test_id and not receipt_id:
+        return get_lab_patient_details_for_tests(test_ids=[test_id], client_id=client_id,
+                                                 printed_by_id=printed_by_id).get(int(test_id))
     try:
         lab_patient_test, lab_phlebotomist, lab_technician, template, template_type, is_word_report = None, None, None, None, None, None
         if test_id:
@@ -2754,21 +2792,20 @@ def get_lab_patient_details(test_id=None, patient_id=None, client_id=None, print
         client = Client.objects.get(pk=client_id)
         bProfile = BusinessProfiles.objects.get(organization_name=client.name)
         b_address = BusinessAddresses.objects.filter(b_id=bProfile.id).first()
-        letterhead_settings = LetterHeadSettings.objects.filter(client=client).first()
+        tenant_settings = get_tenant_settings()
+        letterhead_settings = tenant_settings.get_letterhead_settings(client)
         background_image_url = bProfile.b_letterhead if letterhead_settings.display_letterhead else ""
         appointment_details = AppointmentDetails.objects.filter(patient=patient).first()
         contacts = BContacts.objects.filter(b_id=bProfile, is_primary=True).first()
         labpatientinvoice = LabPatientInvoice.objects.filter(patient=patient).first()
         labpatientpackages = LabPatientPackages.objects.filter(patient=patient).first()
         receipt = LabPatientReceipts.objects.filter(invoiceid=labpatientinvoice).first()
-        Signature_template_type = PrintTemplateType.objects.get(name='Signature on Reports')
-        signature_print_template = PrintTemplate.objects.filter(print_template_type=Signature_template_type,
-                                                                is_default=True).first()
-        signature_template = PrintDataTemplate.objects.filter(print_template=signature_print_template).first()
+        signature_templates = tenant_settings.get_default_data_templates('Signature on Reports')
+        signature_template = signature_templates[0] if signature_templates else None
 
         signature_content = signature_template.data if signature_template else ""
 
-        client_report_settings = ReportFontSizes.objects.first()
+        client_report_settings = tenant_settings.report_font_sizes
 
 
         if receipt_id:
@@ -2793,7 +2830,7 @@ def get_lab_patient_details(test_id=None, patient_id=None, client_id=None, print
         visit_id_barcode_img = generate_barcode_image(patient.visit_id) if patient else None
         paid_amount_of_receipt = sum(payment.paid_amount for payment in receipt.payments.all())
         paid_amount_in_words = f"{num2words(paid_amount_of_receipt, lang='en_IN').title()} rupees only"
-        qr_alignments = PrintReportSettings.objects.first()
+        qr_alignments = tenant_settings.print_report_settings
         invoice_barcode_img = (
             f'<img class="invoiceBarcode" alt ="invoice_barcode_img" src ="{invoice_barcode_img}" style="height:30px; min-width:100px;'
             f'padding:0 10px 0 0"/>') if invoice_barcode_img else ""
@@ -2829,20 +2866,7 @@ def get_lab_patient_details(test_id=None, patient_id=None, client_id=None, print
         domain_url = domain_obj.url
 
         qr_data = f"{domain_url}/patient_report/?t={hashed_test_id}&c={hashed_client_id}&m={hashed_mobile_number}"
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=0
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white").convert("RGBA")
-        # img = qr.make_image(fill='black', back_color='white')
-        qr_buffer = BytesIO()
-        img.save(qr_buffer, format='PNG')
-        qr_base64 = base64.b64encode(qr_buffer.getvalue()).decode()
-        qrcode_img = f"data:image/png;base64,{qr_base64}"
+        qrcode_img = generate_qrcode_image(qr_data)
         qrcode_img = (
             f'<img alt ="qrcode_img" src ="{qrcode_img}" style="height:{qr_alignments.qr_code_size}px; width:{qr_alignments.qr_code_size}px;"/>') if qrcode_img else "NA"
 
@@ -3003,6 +3027,293 @@ def get_lab_patient_details(test_id=None, patient_id=None, client_id=None, print
 
 
 
+def get_report_template_for_test(lab_patient_test=None, is_word_report=None, tenant_settings=None):
+    if is_word_report:
+        template_type_name = 'Lab Test Report (Word)'
+    elif lab_patient_test.department.name == "Medical Examination":
+        template_type_name = 'Medical Examination Report'
+    else:
+        template_type_name = 'Lab Test Report (Fixed)'
+
+    return tenant_settings.get_default_data_template(template_type_name)
+
+
+def get_report_shared_details(client_id=None, printed_by_id=None):
+    # Details which are same for every test of a report, loaded once per report instead of once per test
+    tenant_settings = get_tenant_settings()
+    client = Client.objects.get(pk=client_id)
+    bProfile = BusinessProfiles.objects.get(organization_name=client.name)
+    b_address = BusinessAddresses.objects.filter(b_id=bProfile.id).first()
+    letterhead_settings = tenant_settings.get_letterhead_settings(client)
+    contacts = BContacts.objects.filter(b_id=bProfile, is_primary=True).first()
+
+    signature_templates = tenant_settings.get_default_data_templates('Signature on Reports')
+    signature_template = signature_templates[0] if signature_templates else None
+
+    printed_by = LabStaff.objects.get(pk=printed_by_id) if printed_by_id else ""
+
+    return {
+        'tenant_settings': tenant_settings,
+        'client': client,
+        'bProfile': bProfile,
+        'b_address': b_address,
+        'letterhead_settings': letterhead_settings,
+        'background_image_url': bProfile.b_letterhead if letterhead_settings.display_letterhead else "",
+        'contacts': contacts,
+        'signature_content': signature_template.data if signature_template else "",
+        'client_report_settings': tenant_settings.report_font_sizes,
+        'qr_alignments': tenant_settings.print_report_settings,
+        'domain_url': Domain.objects.first().url,
+        'printed_by': printed_by,
+        'branch_address': get_branch_address_of_lab_staff(lab_staff=printed_by) if printed_by else "",
+    }
+
+
+def _first_by(objects, key):
+    # objects are ordered by id, so this keeps the same row .filter(...).first() would return
+    first_objects = {}
+    for obj in objects:
+        first_objects.setdefault(key(obj), obj)
+    return first_objects
+
+
+def get_lab_patient_details_for_tests(test_ids=None, client_id=None, printed_by_id=None, shared_details=None):
+    """
+    Batched get_lab_patient_details for test reports.
+    All tests are loaded with a fixed number of queries, regardless of how many tests are printed together.
+    Returns {test_id: details}, a test whose details cannot be built maps to None.
+    """
+    test_ids = [int(test_id) for test_id in test_ids]
+    details_by_test = {test_id: None for test_id in test_ids}
+
+    try:
+        lab_patient_tests = list(LabPatientTests.objects.filter(id__in=test_ids).select_related(
+            'patient', 'patient__ULabPatientAge', 'patient__created_by', 'patient__partner', 'department'))
+        if not lab_patient_tests:
+            print(f"LabPatientTests matching query does not exist for test_ids: {test_ids}")
+            return details_by_test
+
+        shared = shared_details or get_report_shared_details(client_id=client_id, printed_by_id=printed_by_id)
+
+        patients = {test.patient_id: test.patient for test in lab_patient_tests}
+        department_ids = {test.department_id for test in lab_patient_tests}
+
+        phlebotomists = {phlebotomist.LabPatientTestID_id: phlebotomist for phlebotomist in
+                         LabPhlebotomist.objects.filter(LabPatientTestID__in=test_ids)}
+        technicians = _first_by(LabTechnicians.objects.filter(LabPatientTestID__in=test_ids).select_related(
+            'report_created_by', 'consulting_doctor').order_by('id'), key=lambda obj: obj.LabPatientTestID_id)
+        remarks = _first_by(LabTechnicianRemarks.objects.filter(LabPatientTestID__in=test_ids).order_by('id'),
+                            key=lambda obj: obj.LabPatientTestID_id)
+        word_reports = _first_by(LabPatientWordReportTemplate.objects.filter(
+            LabPatientTestID__in=test_ids).order_by('id'), key=lambda obj: obj.LabPatientTestID_id)
+
+        fixed_reports = {}
+        for fixed_report in LabPatientFixedReportTemplate.objects.filter(LabPatientTestID__in=test_ids).only(
+                'id', 'LabPatientTestID', 'parameter', 'value', 'added_on').order_by('id'):
+            fixed_reports.setdefault(fixed_report.LabPatientTestID_id, []).append(fixed_report)
+
+        department_defaults = _first_by(DefaultsForDepartments.objects.filter(
+            department__in=department_ids).select_related('doctor', 'lab_technician').order_by('id'),
+                                        key=lambda obj: obj.department_id)
+
+        appointments = _first_by(AppointmentDetails.objects.filter(patient__in=patients.keys()).order_by('id'),
+                                 key=lambda obj: obj.patient_id)
+        invoices = _first_by(LabPatientInvoice.objects.filter(patient__in=patients.keys()).order_by('id'),
+                             key=lambda obj: obj.patient_id)
+        packages = _first_by(LabPatientPackages.objects.filter(patient__in=patients.keys()).order_by('id'),
+                             key=lambda obj: obj.patient_id)
+        receipts = _first_by(LabPatientReceipts.objects.filter(invoiceid__in=invoices.values()).prefetch_related(
+            'payments').order_by('id'), key=lambda obj: obj.invoiceid_id)
+
+    except Exception as error:
+        print(f"Error occurred: {error}")
+        return details_by_test
+
+    qr_alignments = shared['qr_alignments']
+    hashed_client_id = encode_id(client_id)
+    patient_details = {}
+    # Same print time on every test, the report cache looks for it in the rendered report
+    report_printed_on = datetime.now().strftime('%d-%m-%y %I:%M %p')
+
+    for lab_patient_test in lab_patient_tests:
+        try:
+            patient = lab_patient_test.patient
+            lab_phlebotomist = phlebotomists.get(lab_patient_test.id)
+            lab_technician = technicians.get(lab_patient_test.id)
+            is_word_report = lab_technician.is_word_report if lab_technician is not None else False
+            template = get_report_template_for_test(lab_patient_test=lab_patient_test, is_word_report=is_word_report,
+                                                    tenant_settings=shared['tenant_settings'])
+
+            # Patient level values are the same for every test of the patient
+            if patient.id not in patient_details:
+                labpatientinvoice = invoices.get(patient.id)
+                receipt = receipts.get(labpatientinvoice.id) if labpatientinvoice else None
+                paid_amount_of_receipt = sum(payment.paid_amount for payment in receipt.payments.all())
+
+                invoice_barcode_img = generate_barcode_image(labpatientinvoice.id) if labpatientinvoice else None
+                receipt_barcode_img = generate_barcode_image(receipt.id) if receipt else None
+                mr_no_barcode_img = generate_barcode_image(patient.mr_no)
+                visit_id_barcode_img = generate_barcode_image(patient.visit_id)
+
+                payment_status = None
+                if labpatientinvoice:
+                    if labpatientinvoice.total_paid == 0:
+                        payment_status = f"<span style='color:red;'>UNPAID</span>"
+                    elif 0 < labpatientinvoice.total_paid < labpatientinvoice.total_due:
+                        payment_status = f"<span style='color:blue;'>PARTIALLY PAID</span>"
+                    elif labpatientinvoice.total_paid >= labpatientinvoice.total_due:
+                        payment_status = f"<span style='color: green;'>FULLY PAID</span>"
+
+                patient_details[patient.id] = {
+                    'patient': patient,
+                    "age": get_age_details(patient),
+                    "age_short_form": get_age_details_in_short_form(patient),
+                    'appointment_details': appointments.get(patient.id),
+                    'labpatientinvoice': labpatientinvoice,
+                    'receipt': receipt,
+                    "mr_no_barcode_img": (
+                        f'<img class="mrNoBarcode" alt ="mr_no_barcode_img" src ="{mr_no_barcode_img}" style="height:30px; min-width:100px;' f'padding:0 10px 0 0"/>') if mr_no_barcode_img else "",
+                    "visit_id_barcode_img": (
+                        f'<img class="visitIdBarcode" alt ="mr_no_barcode_img" src ="{visit_id_barcode_img}" style="height:30px; min-width:100px;' f'padding:0 10px 0 0"/>') if visit_id_barcode_img else "",
+                    'invoice_barcode_img': (
+                        f'<img class="invoiceBarcode" alt ="invoice_barcode_img" src ="{invoice_barcode_img}" style="height:30px; min-width:100px;'
+                        f'padding:0 10px 0 0"/>') if invoice_barcode_img else "",
+                    'receipt_barcode_img': (
+                        f'<img class="receiptBarcode" alt ="invoice_barcode_img" src ="{receipt_barcode_img}" style="height:30px; min-width:100px;' f'padding:0 10px 0 0"/>') if receipt_barcode_img else "",
+                    'payment_status': payment_status,
+                    "created_by": patient.created_by,
+                    "paid_amount_of_receipt": paid_amount_of_receipt,
+                    "paid_amount_in_words": f"{num2words(paid_amount_of_receipt, lang='en_IN').title()} rupees only",
+                    'labpatientpackages': packages.get(patient.id),
+                }
+
+            sample_barcode_image = generate_barcode_image(
+                f"{lab_phlebotomist.assession_number}|{lab_patient_test.department.name}") if lab_phlebotomist else None
+
+            sample_barcode_img = (
+                f'<img class="sampleBarcode" alt ="barcode_img" src ="{sample_barcode_image}" style="height:{qr_alignments.test_barcode_height}px; min-width: {qr_alignments.test_barcode_width}px; '
+                f'padding:0 10px 0 0"/>') if sample_barcode_image else ""
+
+            vertical_sample_barcode_img = (
+                f'<img class="verticalSampleBarcode" alt="barcode_img" src="{sample_barcode_image}"  style="height:{qr_alignments.test_barcode_height}px; min-width: {qr_alignments.test_barcode_width}px; '
+                f'padding:0 10px 0 0; transform:rotate(90deg)"/>') if sample_barcode_image else ""
+
+            qr_data = f"{shared['domain_url']}/patient_report/?t={encode_id(lab_patient_test.id)}&c={hashed_client_id}&m={encode_id(patient.mobile_number)}"
+            qrcode_img = (
+                f'<img alt ="qrcode_img" src ="{generate_qrcode_image(qr_data)}" style="height:{qr_alignments.qr_code_size}px; width:{qr_alignments.qr_code_size}px;"/>')
+
+            lab_technician_sign = None
+            consulting_doctor_sign = None
+
+            if lab_technician:
+                lab_technician_sign = lab_technician.report_created_by.signature if lab_technician.report_created_by else None
+                consulting_doctor_sign = lab_technician.consulting_doctor.signature_for_consulting if lab_technician.consulting_doctor else None
+
+            lab_technician_sign = (
+                f'<img class="labTechnicianSign" alt ="lab_technician_sign" src ="{lab_technician_sign}" style="height:30px; min-width:100px; '
+                f'padding:0 10px 0 0"/>') if lab_technician_sign else ""
+
+            consulting_doctor_sign = (
+                f'<img class="consultingDoctorSign" alt ="consulting_doctor_sign" src ="{consulting_doctor_sign}" style="height:30px; '
+                f'min-width:100px;'
+                f'padding:0 10px 0 0"/>') if consulting_doctor_sign else ""
+
+            lab_technician_remarks = remarks.get(lab_patient_test.id)
+            if lab_technician_remarks:
+                lab_technician_remarks = lab_technician_remarks.remark if lab_technician_remarks.remark else ""
+
+            word_report = word_reports.get(lab_patient_test.id)
+            test_fixed_reports = fixed_reports.get(lab_patient_test.id, [])
+
+            test_report_date = ''
+            if lab_technician:
+                if lab_technician.is_word_report:
+                    test_report_date = word_report.added_on if word_report else ''
+                else:
+                    test_report_date = test_fixed_reports[0].added_on if test_fixed_reports else ''
+
+            default_consulting_doctor = None
+            default_technician = None
+            default_consulting_doctor_name = ""
+            default_technician_name = ""
+            default_consulting_doctor_sign = ""
+            default_technician_sign = ""
+
+            defaults_obj = department_defaults.get(lab_patient_test.department_id)
+            if defaults_obj:
+                default_consulting_doctor = defaults_obj.doctor if defaults_obj.doctor else ""
+                default_technician = defaults_obj.lab_technician if defaults_obj.lab_technician else ""
+
+                if default_consulting_doctor:
+                    default_consulting_doctor_name = default_consulting_doctor.name
+                    default_consulting_doctor_sign_content = default_consulting_doctor.signature_for_consulting
+
+                    default_consulting_doctor_sign = (
+                        f'<img class="defconsultingDoctorSign" alt ="consulting_doctor_sign" src ="{default_consulting_doctor_sign_content}" style="height:30px; '
+                        f'min-width:100px;'
+                        f'padding:0 10px 0 0"/>') if default_consulting_doctor_sign_content else ""
+
+                if default_technician:
+                    default_technician_name = default_technician.name
+                    default_technician_sign_value = default_technician.signature
+                    default_technician_sign = (
+                        f'<img class="deflabTechnicianSign" alt ="lab_technician_sign" src ="{default_technician_sign_value}" style="height:30px; min-width:100px; '
+                        f'padding:0 10px 0 0"/>') if default_technician_sign_value else ""
+
+            details = {
+                **patient_details[patient.id],
+                'lab_patient_test': lab_patient_test,
+                'bProfile': shared['bProfile'],
+                'contacts': shared['contacts'],
+                'sample_barcode_img': sample_barcode_img,
+                'vertical_sample_barcode_img': vertical_sample_barcode_img,
+                "qrcode_img": qrcode_img,
+                'is_word_report': is_word_report,
+                'lab_phlebotomist': lab_phlebotomist,
+                'lab_technician': lab_technician,
+                "lab_technician_remarks": lab_technician_remarks,
+                'word_report_content': word_report.report if word_report else '',
+                'test_report_date': test_report_date,
+                "report_printed_on": report_printed_on,
+                "lab_technician_sign": lab_technician_sign,
+                "consulting_doctor_sign": consulting_doctor_sign,
+                "b_letterhead": shared['bProfile'].b_letterhead,
+                "printed_by": shared['printed_by'],
+                'template': template,
+                'letterhead_settings': shared['letterhead_settings'],
+                'background_image_url': shared['background_image_url'],
+                'b_address': shared['b_address'],
+                "signature_content": shared['signature_content'],
+                "default_consulting_doctor": default_consulting_doctor,
+                "default_technician": default_technician,
+                "default_consulting_doctor_name": default_consulting_doctor_name,
+                "default_technician_name": default_technician_name,
+                "default_consulting_doctor_sign": default_consulting_doctor_sign,
+                "default_technician_sign": default_technician_sign,
+                "branch_address": shared['branch_address'],
+                "partner": "",
+                "client_report_settings": shared['client_report_settings']
+            }
+
+            if lab_patient_test.department.name == 'Medical Examination':
+                # Same value get_param_value returns, the first row of each parameter
+                param_values = {}
+                for obj in test_fixed_reports:
+                    param_values.setdefault(obj.parameter, get_value_from_select_value(obj.value))
+                for parameter, value in param_values.items():
+                    details[f"get_value_of_{parameter}"] = value
+                    details[f"{parameter}"] = value
+
+                details['partner'] = patient.partner
+
+            details_by_test[lab_patient_test.id] = details
+
+        except Exception as error:
+            print(f"Error occurred: {error}")
+
+    return details_by_test
+
+
 # using to remove multiple occurrences of Department heading in multiprint
 def remove_duplicate_department_headings(content):
     # Regex to match the entire <tr> row containing "DEPARTMENT OF ..."
@@ -3049,42 +3360,12 @@ def remove_duplicate_report_headings(content=None):
 
 
 def replace_tag(match=None, lab_patient_test=None,client_report_settings=None, details=None):
-    tag_name = match.group(1)
-
-    try:
-        tag = Tag.objects.get(tag_name='{'+tag_name+'}')
-        if tag.is_collection:
-            return get_value_of_tag(tag_name=tag_name, lab_patient_test=lab_patient_test,
-                                    client_report_settings=client_report_settings)
-        else:
-            if tag.tag_formula:
-                try:
-                    tag_value = str(eval(tag.tag_formula, {'details': details}))
-                    return tag_value
-                except Exception as eval_error:
-                    print(f"{tag_name} - Error in formula evaluation: {eval_error}")
-                    return " "
-            else:
-                print(f"No formula for {tag_name}")
-                return ""
-    except Tag.DoesNotExist:
-        if lab_patient_test.department.name == 'Medical Examination':
-            tag_value = details.get(f'{tag_name}', "")
-            return tag_value
-
-        else:
-            print(f"{tag_name} not found!")
-            return ""
+    return resolve_tag(match.group(1), lab_patient_test=lab_patient_test,
+                       client_report_settings=client_report_settings, details=details)
 
 
 def evaluate_expression(match=None, details=None):
-    expression = match.group(1)
-    try:
-        result = str(eval(expression, {'__builtins__': None}, {'details': details}))
-        return result
-    except Exception as eval_error:
-        print(f"Error in expression evaluation: {eval_error}")
-        return ""
+    return evaluate_compiled_expression(match.group(1), details=details)
 
 
 
@@ -3138,28 +3419,18 @@ class GenerateTestReportViewset(viewsets.ModelViewSet):
 
         # print(f"details at test report : {details}")
 
-        search_pattern = r"\{(.*?)\}"
-        expression_pattern = r"\[\[(.*?)\]\]"
-
+        render_kwargs = {'lab_patient_test': lab_patient_test, 'client_report_settings': client_report_settings,
+                         'details': details}
 
         word_report = LabPatientWordReportTemplate.objects.filter(LabPatientTestID=lab_patient_test).first()
         if word_report:
-            template_content = "<div>" + word_report.report + "</div>"
+            final_content = render_template_text("<div>" + word_report.report + "</div>", **render_kwargs)
         else:
-            template_content = template.data
-
-        intermediate_content = re.sub(search_pattern, lambda match: replace_tag(match=match, lab_patient_test=lab_patient_test,
-                                                                    client_report_settings=client_report_settings,
-                                                                    details=details), template_content)
-
-        final_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details), intermediate_content)
+            final_content = render_template_field(template, 'data', **render_kwargs)
 
         signature_content = details['signature_content']
         #
-        sign_intermediate_content = re.sub(search_pattern, lambda match: replace_tag(match=match, lab_patient_test=lab_patient_test,
-                                                                    client_report_settings=client_report_settings,
-                                                                    details=details), signature_content)
-        sign_final_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details), sign_intermediate_content)
+        sign_final_content = render_template_text(signature_content, **render_kwargs)
 
         if sign_final_content:
             sign_final_content = f'''
@@ -3184,19 +3455,10 @@ class GenerateTestReportViewset(viewsets.ModelViewSet):
 
         else:
             # Header
-            template_header_content = template.header if template.header else ""
-            intermediate_header_content = re.sub(search_pattern, lambda match: replace_tag(match=match, lab_patient_test=lab_patient_test,
-                                                                    client_report_settings=client_report_settings,
-                                                                    details=details), template_header_content)
-            final_header_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details), intermediate_header_content)
-
+            final_header_content = render_template_field(template, 'header', **render_kwargs)
 
             # Footer
-            template_footer_content = template.footer if template.footer else ""
-            intermediate_footer_content = re.sub(search_pattern, lambda match: replace_tag(match=match, lab_patient_test=lab_patient_test,
-                                                                    client_report_settings=client_report_settings,
-                                                                    details=details), template_footer_content)
-            final_footer_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details), intermediate_footer_content)
+            final_footer_content = render_template_field(template, 'footer', **render_kwargs)
 
         base64_pdf = ""
         if pdf:
@@ -3308,17 +3570,15 @@ class GeneratePatientTestReportViewset(viewsets.ModelViewSet):
         last_department = None
         is_current_report_type_word = None
 
-        search_pattern = r"\{(.*?)\}"
-        expression_pattern = r"\[\[(.*?)\]\]"
-
-
         if lab_patient_tests and download=='false':
+            details_by_test = get_lab_patient_details_for_tests(test_ids=[test.id for test in lab_patient_tests],
+                                                                client_id=client_id)
             for test in lab_patient_tests:
                 department = test.department.name
                 last_department = department
 
                 try:
-                    details = get_lab_patient_details(test_id=test.id, patient_id=patient_id, client_id=client_id)
+                    details = details_by_test.get(test.id)
                     is_word_report = details['is_word_report']
                     lab_patient_test = details['lab_patient_test']
                     letterhead_settings = details['letterhead_settings']
@@ -3362,32 +3622,29 @@ class GeneratePatientTestReportViewset(viewsets.ModelViewSet):
 
                 # Determine the template type
                 if not is_word_report and lab_patient_test.department.name == "Medical Examination":
-                    template_type = PrintTemplateType.objects.get(name='Medical Examination Report')
+                    template_type_name = 'Medical Examination Report'
 
                 elif not is_word_report:
-                    template_type = PrintTemplateType.objects.get(name='Lab Test Report (Fixed)')
+                    template_type_name = 'Lab Test Report (Fixed)'
                 else:
-                    template_type = PrintTemplateType.objects.get(name='Lab Test Report (Word)')
+                    template_type_name = 'Lab Test Report (Word)'
 
                 # Fetch the template
-                print_template = PrintTemplate.objects.filter(print_template_type=template_type,
-                                                              is_default=True).first()
-                if print_template:
-                    template = PrintDataTemplate.objects.get(print_template=print_template)
+                tenant_settings = get_tenant_settings()
+                if tenant_settings.get_default_print_template(template_type_name):
+                    template = tenant_settings.get_default_data_template(template_type_name)
                 else:
                     return Response({"Error": "Please check whether default template is selected or not!"},
                                     status=status.HTTP_400_BAD_REQUEST)
 
+                render_kwargs = {'lab_patient_test': lab_patient_test,
+                                 'client_report_settings': client_report_settings, 'details': details}
+
                 word_report = LabPatientWordReportTemplate.objects.filter(LabPatientTestID=lab_patient_test).first()
                 if word_report:
-                    template_content = "<div>" + word_report.report + "</div>"
+                    final_content = render_template_text("<div>" + word_report.report + "</div>", **render_kwargs)
                 else:
-                    template_content = template.data
-
-                intermediate_content = re.sub(search_pattern, lambda match: replace_tag(match=match,lab_patient_test=lab_patient_test,
-                                                                          client_report_settings=client_report_settings,
-                                                                          details=details), template_content)
-                final_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details), intermediate_content)
+                    final_content = render_template_field(template, 'data', **render_kwargs)
 
                 if lab_patient_test.department.name == "Medical Examination":
                     medical_examination_content += final_content
@@ -3396,26 +3653,13 @@ class GeneratePatientTestReportViewset(viewsets.ModelViewSet):
                 else:
                     if department == department_under_progress:
                         final_content = remove_duplicate_report_headings(content=final_content)
-                    template_header_content = template.header if template.header else ""
-                    intermediate_header_content = re.sub(search_pattern, lambda match: replace_tag(match=match,lab_patient_test=lab_patient_test,
-                                                                          client_report_settings=client_report_settings,
-                                                                          details=details), template_header_content)
-                    final_header_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details),
-                                                     intermediate_header_content)
+                    final_header_content = render_template_field(template, 'header', **render_kwargs)
 
                     # Footer
-                    template_footer_content = template.footer if template.footer else ""
-                    intermediate_footer_content = re.sub(search_pattern, lambda match: replace_tag(match=match,lab_patient_test=lab_patient_test,
-                                                                          client_report_settings=client_report_settings,
-                                                                          details=details), template_footer_content)
-                    final_footer_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details),
-                                                     intermediate_footer_content)
+                    final_footer_content = render_template_field(template, 'footer', **render_kwargs)
 
                     signature_content = details['signature_content']
-                    sign_intermediate_content = re.sub(search_pattern, lambda match: replace_tag(match=match,lab_patient_test=lab_patient_test,
-                                                                          client_report_settings=client_report_settings,
-                                                                          details=details), signature_content)
-                    sign_final_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details), sign_intermediate_content)
+                    sign_final_content = render_template_text(signature_content, **render_kwargs)
                     if sign_final_content:
                             sign_final_content = f'''
                                                         <tr>
@@ -4105,22 +4349,30 @@ class PrintReceptionistReportViewset(viewsets.ModelViewSet):
             return total_content
 
         def return_total_calculations_data():
-            related_objects = LabPatientReceipts.objects.filter(added_on__gte=start_date,added_on__lt=end_date,
-                                                            created_by=lab_staff).prefetch_related('payments__pay_mode')
+            if can_use_rollups(end_date):
+                collections = get_staff_collections(lab_staff, start_date, end_date)
+                total_calculation = sum(mode['collected_amount'] for mode in collections.values())
+                total_refund = collections.get('Cash', {}).get('refund_amount') or Decimal('0.00')
+                total_online_payments = sum(
+                    mode['collected_amount'] for name, mode in collections.items() if name != 'Cash')
+            else:
+                related_objects = LabPatientReceipts.objects.filter(
+                    added_on__gte=start_date, added_on__lt=end_date, created_by=lab_staff
+                ).prefetch_related('payments__pay_mode')
 
-            total_calculation = sum(
-                payment.paid_amount for obj in related_objects for payment in obj.payments.all()
-            )
+                total_calculation = sum(
+                    payment.paid_amount for obj in related_objects for payment in obj.payments.all()
+                )
 
-            refund_objects = LabPatientRefund.objects.filter(added_on__gte=start_date, added_on__lt=end_date,
-                                                             created_by=lab_staff, refund_mode__name='Cash')
+                refund_objects = LabPatientRefund.objects.filter(added_on__gte=start_date, added_on__lt=end_date,
+                                                                 created_by=lab_staff, refund_mode__name='Cash')
 
-            total_refund = refund_objects.aggregate(total=Sum('refund'))['total'] or Decimal('0.00')
+                total_refund = refund_objects.aggregate(total=Sum('refund'))['total'] or Decimal('0.00')
 
-            total_online_payments = sum(
-                payment.paid_amount for obj in related_objects for payment in
-                obj.payments.exclude(pay_mode__name="Cash")
-            )
+                total_online_payments = sum(
+                    payment.paid_amount for obj in related_objects for payment in
+                    obj.payments.exclude(pay_mode__name="Cash")
+                )
 
             expenses_by_cash_list = LabExpenses.objects.filter(authorized_by=lab_staff, added_on__gte=start_date,
                                                    added_on__lte=end_date,pay_mode__name='Cash')
@@ -4564,10 +4816,14 @@ class TestCollectionReportView(generics.ListCreateAPIView):
 
             if action == 'tests_details':
                 tests_data=[]
-                tests = LabPatientTests.objects.filter(is_package_test=False,added_on__gte=start_date,
-                                              added_on__lte=end_date).exclude(status_id__name='Cancelled')
+                last_date = end_date - timezone.timedelta(days=1)
+                if can_use_rollups(last_date):
+                    lab_global_test_counts = get_test_counts(start_date, last_date)
+                else:
+                    tests = LabPatientTests.objects.filter(is_package_test=False,added_on__gte=start_date,
+                                                  added_on__lte=end_date).exclude(status_id__name='Cancelled')
 
-                lab_global_test_counts = tests.values("LabGlobalTestId").annotate(patients_count=Count("patient")).order_by("-patients_count")
+                    lab_global_test_counts = tests.values("LabGlobalTestId").annotate(patients_count=Count("patient")).order_by("-patients_count")
 
                 page = self.paginate_queryset(lab_global_test_counts)
                 if page is not None:
@@ -4782,13 +5038,15 @@ class DownloadTestReportViewset(viewsets.ModelViewSet):
     def get_queryset(self):
         return []
 
-    def list(self=None, request=None, test_ids=None, client_id=None, letterhead=None, water_mark=None,sourcing_lab_for_settings=None, *args, **kwargs):
+    def list(self=None, request=None, test_ids=None, client_id=None, letterhead=None, water_mark=None,sourcing_lab_for_settings=None,
+             render_pdf=True, async_mode=False, *args, **kwargs):
         if request:
             test_ids = self.request.query_params.get('t', None)
             client_id = self.request.query_params.get('c', None)
             letterhead = self.request.query_params.get('lh', None)
             water_mark = self.request.query_params.get('mark', None)
             sourcing_lab_for_settings = self.request.query_params.get('sourcing_lab_for_settings', None)
+            async_mode = self.request.query_params.get('async', 'false').lower() in ['1', 'true']
 
 
         else:
@@ -4820,92 +5078,78 @@ class DownloadTestReportViewset(viewsets.ModelViewSet):
             else:
                 pass
 
+            report_cache_key = None
+            if render_pdf:
+                report_cache_key = build_report_cache_key(lab_patient_tests, client, letterhead=letterhead,
+                                                          water_mark=water_mark,
+                                                          sourcing_lab_for_settings=sourcing_lab_for_settings)
+                cached_report = get_cached_report(report_cache_key) if report_cache_key else None
+                if cached_report:
+                    pdf_binary, report_metadata = cached_report
+                    return Response({
+                        "pdf": True,
+                        "report": "TestReport",
+                        "report_name": report_metadata.get('report_name'),
+                        "pdf_base64": pdf_to_base64_data(pdf_binary),
+                        "html_content": report_metadata.get('html_content'),
+                        "letter_head_settings_content": report_metadata.get('letter_head_settings_content'),
+                    })
+
             try:
                 try:
                     from weasyprint import HTML
                 except ImportError as import_error:
                     HTML = None
 
-                pdf_files = []
+                html_parts = []
                 overall_content = ""
                 final_header_content = ""
                 final_footer_content = ""
+                details_by_test = get_lab_patient_details_for_tests(
+                    test_ids=[test.id for test in lab_patient_tests], client_id=client_id)
                 for test in lab_patient_tests:
-                    details = get_lab_patient_details(test_id=test.id, client_id=client_id)
+                    details = details_by_test.get(test.id)
                     lab_patient_test = details['lab_patient_test']
                     is_word_report = details['is_word_report']
                     client_report_settings = details['client_report_settings']
 
-                    search_pattern = r"\{(.*?)\}"
-                    expression_pattern = r"\[\[(.*?)\]\]"
-
 
                     if is_word_report:
-                        template_type = PrintTemplateType.objects.get(name='Lab Test Report (Word)')
+                        template_type_name = 'Lab Test Report (Word)'
                     else:
                         if lab_patient_test.department.name == "Medical Examination":
-                            template_type = PrintTemplateType.objects.get(name='Medical Examination Report')
+                            template_type_name = 'Medical Examination Report'
                         else:
-                            template_type = PrintTemplateType.objects.get(name='Lab Test Report (Fixed)')
+                            template_type_name = 'Lab Test Report (Fixed)'
 
-                    print_template = PrintTemplate.objects.filter(print_template_type=template_type,
-                                                                  is_default=True).first()
+                    tenant_settings = get_tenant_settings()
                     template = None
-                    if print_template:
-                        template = PrintDataTemplate.objects.get(print_template=print_template)
+                    if tenant_settings.get_default_print_template(template_type_name):
+                        template = tenant_settings.get_default_data_template(template_type_name)
                     else:
                         return Response({"Error": "Please check whether default template is selected or not!"},
                                         status=status.HTTP_400_BAD_REQUEST)
 
 
+                    render_kwargs = {'lab_patient_test': lab_patient_test,
+                                     'client_report_settings': client_report_settings, 'details': details}
+
                     if is_word_report:
                         word_report = LabPatientWordReportTemplate.objects.filter(
                             LabPatientTestID=lab_patient_test).first()
-                        template_content = "<div>" + word_report.report + "</div>"
+                        modified_content = render_template_text("<div>" + word_report.report + "</div>", **render_kwargs)
                     else:
-                        template_content = template.data
-
-                    intermediate_content = re.sub(search_pattern,  lambda match: replace_tag(match=match,
-                                                                                            lab_patient_test=lab_patient_test,
-                                                                                            client_report_settings=client_report_settings,
-                                                                                            details=details), template_content)
-                    modified_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details),
-                                           intermediate_content)
+                        modified_content = render_template_field(template, 'data', **render_kwargs)
 
                     # header content
-                    if is_word_report:
-                        template_header_content = template.header if template.header else ""
-                        intermediate_header_content = re.sub(search_pattern, lambda match: replace_tag(match=match,
-                                                                                            lab_patient_test=lab_patient_test,
-                                                                                            client_report_settings=client_report_settings,
-                                                                                            details=details), template_header_content)
-                        final_header_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details),
-                                                         intermediate_header_content)
-                    else:
-                        template_header_content = template.header if template.header else ""
-                        intermediate_header_content = re.sub(search_pattern,  lambda match: replace_tag(match=match,
-                                                                                            lab_patient_test=lab_patient_test,
-                                                                                            client_report_settings=client_report_settings,
-                                                                                            details=details), template_header_content)
-                        final_header_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details),
-                                                         intermediate_header_content)
+                    final_header_content = render_template_field(template, 'header', **render_kwargs)
 
                     # footer content
-                    template_footer_content = template.footer if template.footer else ""
-                    intermediate_footer_content = re.sub(search_pattern, lambda match: replace_tag(match=match,
-                                                                                            lab_patient_test=lab_patient_test,
-                                                                                            client_report_settings=client_report_settings,
-                                                                                            details=details), template_footer_content)
-                    final_footer_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details),
-                                                     intermediate_footer_content)
+                    final_footer_content = render_template_field(template, 'footer', **render_kwargs)
 
                     # doctor signature template content
                     signature_content = details['signature_content']
-                    sign_intermediate_content = re.sub(search_pattern,  lambda match: replace_tag(match=match,
-                                                                                            lab_patient_test=lab_patient_test,
-                                                                                            client_report_settings=client_report_settings,
-                                                                                            details=details), signature_content)
-                    sign_final_content = re.sub(expression_pattern, lambda match: evaluate_expression(match=match, details=details), sign_intermediate_content)
+                    sign_final_content = render_template_text(signature_content, **render_kwargs)
 
                     if sign_final_content:
                         sign_final_content = f'''
@@ -5067,27 +5311,42 @@ class DownloadTestReportViewset(viewsets.ModelViewSet):
 
                         final_content = header + f'<div class = "content">{final_content}</div>' + footer
                         overall_content += final_content
-                        pdf_file = HTML(string=final_content).write_pdf()
-                        pdf_files.append(pdf_file)
-
-                pdf_binaries = pdf_files
-                pdf_writer = PdfWriter()
-
-                # Loop through each binary PDF and merge them
-                for pdf_binary in pdf_binaries:
-                    pdf_reader = PdfReader(BytesIO(pdf_binary))  # Read the binary data into a PdfReader
-                    for page in pdf_reader.pages:
-                        pdf_writer.add_page(page)  # Add each page from the PDF to the writer
-
-                # Write the merged PDF to a binary stream
-                merged_pdf_binary = BytesIO()
-                pdf_writer.write(merged_pdf_binary)
-
-                # Convert the merged PDF binary to base64
-                pdf_base64 = base64.b64encode(merged_pdf_binary.getvalue()).decode('utf-8')
-
+                        html_parts.append(final_content)
+
+                # A report showing the time it is printed would keep its first print time when served from the
+                # cache, those reports are always rendered
+                if report_cache_key and details['report_printed_on'] in overall_content:
+                    report_cache_key = None
+
+                report_metadata = {'report_name': report_name, 'html_content': overall_content,
+                                   'letter_head_settings_content': letter_head_settings_content}
+                cached_test_ids = [test.id for test in lab_patient_tests]
+                schema_name = client.schema_name
+
+                def cache_rendered_report(pdf_binary):
+                    if report_cache_key:
+                        set_cached_report(report_cache_key, pdf_binary, cached_test_ids, metadata=report_metadata,
+                                          schema_name=schema_name)
+
+                if HTML is not None and async_mode:
+                    job = submit_render_job(html_parts, report_name=report_name,
+                                            extra={'report': 'TestReport', 'client_id': client_id},
+                                            on_complete=cache_rendered_report)
+                    return Response({"pdf": True,
+                                     "async": True,
+                                     "job_id": job['job_id'],
+                                     "status": job['status'],
+                                     "report": "TestReport",
+                                     "report_name": report_name,
+                                     "letter_head_settings_content": letter_head_settings_content,
+                                     }, status=status.HTTP_202_ACCEPTED)
 
-                pdf_base64_with_data = f"data:application/pdf;base64,{pdf_base64}"
+                pdf_base64_with_data = None
+                if HTML is not None and render_pdf and html_parts:
+                    # Each test is rendered on its own worker and the parts are merged in test order
+                    pdf_binary = render_and_merge_pdfs(html_parts)
+                    cache_rendered_report(pdf_binary)
+                    pdf_base64_with_data = pdf_to_base64_data(pdf_binary)
 
                 # response = HttpResponse(pdf_file, content_type='application/pdf')
                 # response['Content-Disposition'] = 'attachment; filename="tests_report.pdf"'
@@ -5121,10 +5380,11 @@ class DownloadBulkPatientsReportsViewSet(viewsets.ModelViewSet):
     serializer_class = GenerateTestReportSerializer
     permission_classes = [permissions.AllowAny]
 
-    def list(self, request=None, patient_ids=None, client_id=None, letterhead=None, *args, **kwargs):
+    def list(self, request=None, patient_ids=None, client_id=None, letterhead=None, async_mode=False, *args, **kwargs):
         if request:
             client_id = self.request.query_params.get('c', None)
             patient_ids = self.request.query_params.get('p', None)
+            async_mode = self.request.query_params.get('async', 'false').lower() in ['1', 'true']
 
         if client_id is None or patient_ids is None:
             return Response({"Error": "Client ID and Patient IDs must be provided!"},
@@ -5147,10 +5407,12 @@ class DownloadBulkPatientsReportsViewSet(viewsets.ModelViewSet):
                 hashed_test_ids = ','.join(encode_id(test_id) for test_id in test_ids)
 
                 try:
+                    # Only the html of each patient is needed here, the combined PDF is rendered once below
                     download_response = download_api.list(
                         test_ids=hashed_test_ids,
                         client_id=encode_id(client_id),
-                        letterhead=letterhead
+                        letterhead=letterhead,
+                        render_pdf=False
                     )
                     html_content = download_response.data.get('html_content', None)
 
@@ -5160,23 +5422,64 @@ class DownloadBulkPatientsReportsViewSet(viewsets.ModelViewSet):
                 except Exception as error:
                     return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
-        pdf_file = HTML(string=final_content).write_pdf()
+        report_name = "Multiple_Patient_Test_Reports.pdf"
+
+        if async_mode:
+            job = submit_render_job([final_content], report_name=report_name,
+                                    extra={'report': 'MultiplePatientsTestReports', 'client_id': client_id})
+            return Response({
+                "pdf": True,
+                "async": True,
+                "job_id": job['job_id'],
+                "status": job['status'],
+                "report_name": report_name,
+            }, status=status.HTTP_202_ACCEPTED)
+
+        pdf_file = render_and_merge_pdfs([final_content])
         # response = HttpResponse(pdf_file, content_type='application/pdf')
         # response['Content-Disposition'] = 'attachment; filename="tests_report.pdf"'
         # return response
 
-        pdf_base64 = base64.b64encode(pdf_file).decode('utf-8')
-
-        report_name = "Multiple_Patient_Test_Reports.pdf"
-
         return Response({
             "pdf": True,
             "report_name": report_name,
-            "pdf_base64": f"data:application/pdf;base64,{pdf_base64}",
+            "pdf_base64": pdf_to_base64_data(pdf_file),
             "html_content": final_content,
         })
 
 
+class ReportRenderJobView(APIView):
+    """
+    Poll and fetch for reports requested with ?async=1.
+    GET ?job_id=<id> returns the job status, add &fetch=true to receive the PDF once the job is completed.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        job_id = request.query_params.get('job_id', None)
+        fetch = request.query_params.get('fetch', 'false').lower() in ['1', 'true']
+
+        if not job_id:
+            return Response({"Error": "job_id is required!"}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = get_job(job_id)
+        if job is None:
+            return Response({"Error": "Job not found or expired!"}, status=status.HTTP_404_NOT_FOUND)
+
+        response_data = {key: value for key, value in job.items() if key != 'client_id'}
+
+        if fetch:
+            if job['status'] != JOB_COMPLETED:
+                return Response(response_data, status=status.HTTP_409_CONFLICT)
+
+            pdf_binary = get_job_pdf(job_id)
+            if pdf_binary is None:
+                return Response({"Error": "Job result expired!"}, status=status.HTTP_404_NOT_FOUND)
+            response_data['pdf_base64'] = pdf_to_base64_data(pdf_binary)
+
+        return Response(response_data)
+
+
 class GeneratePatientRefundViewset(viewsets.ModelViewSet):
     serializer_class = GeneratePatientRefundSerializer
 
@@ -1,14 +1,16 @@
-from django.core.cache import cache
 from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django_tenants.utils import schema_context
 
-from healtho_pro_user.models.business_models import BusinessModules
+from healtho_pro.cache_tags import bump_generation
+from healtho_pro_user.models.business_models import BusinessModules, GlobalMessagingSettings
 from healtho_pro_user.models.users_models import Client
 from pro_laboratory.models.global_models import LabMenuAccess
+from pro_laboratory.report_template_engine import tag_table
+from pro_laboratory.tenant_settings import bump_global_settings_version
 from pro_universal_data.models import ULabPatientAttenderTitles, ULabPatientGender, ULabPatientTitles, \
-    ULabPaymentModeType, ULabPatientAge, ULabMenus
+    ULabPaymentModeType, ULabPatientAge, ULabMenus, Tag, ULabTestStatus
 
 
 @receiver(post_save, sender=ULabPatientAttenderTitles)
@@ -16,11 +18,7 @@ from pro_universal_data.models import ULabPatientAttenderTitles, ULabPatientGend
 def clear_ulab_patient_attender_titles_cache(sender, instance, **kwargs):
     def invalidate_cache():
         try:
-            cache_key_prefix = f'ulab_patient_attender_titles_list'
-            keys_to_delete = [key for key in cache.keys(f'{cache_key_prefix}*')]
-            for key in keys_to_delete:
-                cache.delete(key)
-                print(f'Deleted cache key: {key}')
+            bump_generation('ulab_patient_attender_titles_list')
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -32,11 +30,7 @@ def clear_ulab_patient_attender_titles_cache(sender, instance, **kwargs):
 def clear_ulab_patient_gender_cache(sender, instance, **kwargs):
     def invalidate_cache():
         try:
-            cache_key_prefix = f'ulab_patient_gender_list'
-            keys_to_delete = [key for key in cache.keys(f'{cache_key_prefix}*')]
-            for key in keys_to_delete:
-                cache.delete(key)
-                print(f'Deleted cache key: {key}')
+            bump_generation('ulab_patient_gender_list')
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -48,11 +42,7 @@ def clear_ulab_patient_gender_cache(sender, instance, **kwargs):
 def clear_ulab_patient_titles_cache(sender, instance, **kwargs):
     def invalidate_cache():
         try:
-            cache_key_prefix = f'ulab_patient_titles_list'
-            keys_to_delete = [key for key in cache.keys(f'{cache_key_prefix}*')]
-            for key in keys_to_delete:
-                cache.delete(key)
-                print(f'Deleted cache key: {key}')
+            bump_generation('ulab_patient_titles_list')
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -64,11 +54,7 @@ def clear_ulab_patient_titles_cache(sender, instance, **kwargs):
 def clear_ulab_paymode_type_cache(sender, instance, **kwargs):
     def invalidate_cache():
         try:
-            cache_key_prefix = f'ulab_paymode_type_list'
-            keys_to_delete = [key for key in cache.keys(f'{cache_key_prefix}*')]
-            for key in keys_to_delete:
-                cache.delete(key)
-                print(f'Deleted cache key: {key}')
+            bump_generation('ulab_payment_mode_type_list')
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -80,11 +66,7 @@ def clear_ulab_paymode_type_cache(sender, instance, **kwargs):
 def clear_ulab_patient_age_cache(sender, instance, **kwargs):
     def invalidate_cache():
         try:
-            cache_key_prefix = f'ulab_patient_age_list'
-            keys_to_delete = [key for key in cache.keys(f'{cache_key_prefix}*')]
-            for key in keys_to_delete:
-                cache.delete(key)
-                print(f'Deleted cache key: {key}')
+            bump_generation('ulab_patient_age_list')
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -96,15 +78,7 @@ def clear_ulab_patient_age_cache(sender, instance, **kwargs):
 def clear_ulab_menu_list_cache(sender, instance, **kwargs):
     def invalidate_cache():
         try:
-            cache_key_prefix = 'ulab_menu_list'
-            keys_to_delete = [key for key in cache.keys(f'{cache_key_prefix}*')]
-
-            if keys_to_delete:
-                for key in keys_to_delete:
-                    cache.delete(key)
-                    print(f'Deleted cache key: {key}')
-            else:
-                print("No cache.")
+            bump_generation('ulab_menu_list')
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -116,14 +90,7 @@ def clear_ulab_menu_list_cache(sender, instance, **kwargs):
 def clear_ulab_menu_list_cache(sender, instance, **kwargs):
     def invalidate_cache():
         try:
-            cache_key_prefix = 'ulab_menu_list'
-            keys_to_delete = [key for key in cache.keys(f'{cache_key_prefix}*')]
-            if keys_to_delete:
-                for key in keys_to_delete:
-                    cache.delete(key)
-                    print(f'Deleted cache key: {key}')
-            else:
-                print("No cache.")
+            bump_generation('ulab_menu_list')
         except Exception as e:
             print(f"Error occurred while invalidating cache: {str(e)}")
 
@@ -151,3 +118,29 @@ def check_lab_menu_access(sender, instance, **kwargs):
                     lab_menu_access.lab_menu.remove(*extra_menus)
 
     transaction.on_commit(check)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def clear_report_tag_table(sender, instance, **kwargs):
+    def invalidate_tag_table():
+        try:
+            tag_table.clear()
+        except Exception as e:
+            print(f"Error occurred while clearing tag table: {str(e)}")
+
+    transaction.on_commit(invalidate_tag_table)
+
+
+@receiver(post_save, sender=ULabTestStatus)
+@receiver(post_delete, sender=ULabTestStatus)
+@receiver(post_save, sender=GlobalMessagingSettings)
+@receiver(post_delete, sender=GlobalMessagingSettings)
+def invalidate_global_settings_snapshot(sender, instance, **kwargs):
+    def bump_version():
+        try:
+            bump_global_settings_version()
+        except Exception as e:
+            print(f"Error occurred while invalidating settings snapshot: {str(e)}")
+
+    transaction.on_commit(bump_version)
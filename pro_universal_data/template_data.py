@@ -2,6 +2,7 @@ import base64
 import os
 from datetime import datetime
 
+from django.db.models import Count
 from pytz import timezone
 from healtho_pro_user.models.business_models import BContacts, BExecutive, BusinessProfiles, BusinessAddresses
 from healtho_pro_user.models.users_models import Domain
@@ -16,122 +17,151 @@ def encode_id(value):
     return encoded_bytes.decode('utf-8')
 
 
-def generate_tests_report_url(test_ids, client, mobile_number, lh):
+def get_domain_url():
+    domain_obj = Domain.objects.first()
+    return domain_obj.url
+
+
+def generate_tests_report_url(test_ids, client, mobile_number, lh, domain_url=None):
     hashed_test_ids = ','.join(encode_id(test_id) for test_id in test_ids)
     hashed_client_id = encode_id(client)
     hashed_mobile_number = encode_id(mobile_number)
-    domain_obj = Domain.objects.first()
-    domain_url = domain_obj.url
+    domain_url = domain_url or get_domain_url()
     qr_data = f"{domain_url}/patient_report/?t={hashed_test_ids}&c={hashed_client_id}&m={hashed_mobile_number}&lh={lh}"
 
     return qr_data
 
 
-def generate_test_report_url(test_id, client, mobile_number, lh):
+def generate_test_report_url(test_id, client, mobile_number, lh, domain_url=None):
     hashed_test_id = encode_id(test_id)
     hashed_client_id = encode_id(client)
     hashed_mobile_number = encode_id(mobile_number)
-    domain_obj = Domain.objects.first()
-    domain_url = domain_obj.url
+    domain_url = domain_url or get_domain_url()
     qr_data = f"{domain_url}/patient_report/?t={hashed_test_id}&c={hashed_client_id}&m={hashed_mobile_number}&lh={lh}"
 
     return qr_data
 
 
-def generate_patient_receipt_url(client, patient, receipt):
+def generate_patient_receipt_url(client, patient, receipt, domain_url=None):
     hashed_client_id = encode_id(client)
     hashed_patient_id = encode_id(patient)
     hashed_receipt = encode_id(receipt)
-    domain_obj = Domain.objects.first()
-    domain_url = domain_obj.url
+    domain_url = domain_url or get_domain_url()
     receipt_data = f"{domain_url}/download_patient_receipt/?c={hashed_client_id}&p={hashed_patient_id}&r={hashed_receipt}"
 
     return receipt_data
 
 
 def template_data(search_id, messaging_send_type, client, test_id=None,test_ids=None, receipt=None, letterhead=None):
+    return template_data_many([search_id], messaging_send_type, client, test_id=test_id, test_ids=test_ids,
+                              receipt=receipt, letterhead=letterhead)[search_id]
+
+
+def template_data_many(search_ids, messaging_send_type, client, test_id=None, test_ids=None, receipt=None,
+                       letterhead=None):
+    """
+    Details of the messaging templates of many recipients of one send type, as {search_id: details}.
+    The recipients are read with one query and the business, contacts and invoices they share with one query
+    each, instead of 4 to 6 queries per recipient. Recipients that are not found only get report_printed_on.
+    """
     from pro_laboratory.views.universal_views import get_age_details,get_age_details_in_short_form
-    details = {}
 
     report_printed_on = datetime.now().strftime('%d-%m-%y %I:%M %p')
-    details['report_printed_on'] = report_printed_on
+    details_by_id = {search_id: {'report_printed_on': report_printed_on} for search_id in search_ids}
+
+    def get_found(model_objects):
+        # The objects of the search ids, keyed by the search id they were asked with
+        objects_by_pk = {str(obj.pk): obj for obj in model_objects}
+        return [(search_id, objects_by_pk[str(search_id)]) for search_id in search_ids
+                if str(search_id) in objects_by_pk]
 
     if messaging_send_type.name == 'Patients':
         try:
-            patient = Patient.objects.get(pk=search_id)
+            patients = get_found(Patient.objects.select_related('ULabPatientAge', 'title', 'gender').filter(
+                pk__in=search_ids))
             bProfile = BusinessProfiles.objects.filter(organization_name=client.name).first()
             contacts = BContacts.objects.filter(b_id=bProfile, is_primary=True).first()
-            labpatientinvoice = LabPatientInvoice.objects.filter(patient=patient).first()
-
-            indian_timezone = timezone('Asia/Kolkata')
-            if patient:
-                patient.added_on = patient.added_on.astimezone(indian_timezone)
+            invoices = {}
+            for labpatientinvoice in LabPatientInvoice.objects.filter(
+                    patient__in=[patient for _, patient in patients]).order_by('id'):
+                invoices.setdefault(labpatientinvoice.patient_id, labpatientinvoice)
+            domain_url = get_domain_url() if patients else None
 
             indian_timezone = timezone('Asia/Kolkata')
-            if labpatientinvoice:
-                labpatientinvoice.added_on = labpatientinvoice.added_on.astimezone(indian_timezone)
-
-            # Assign fetched values to details dict
-            details['patient'] = patient
-            details['age']=get_age_details(patient)
-            details['age_short_form']=get_age_details_in_short_form(patient)
-            details['bProfile'] = bProfile
-            details['contacts'] = contacts
-            details['labpatientinvoice'] = labpatientinvoice
-            details['patient_receipt_url'] = generate_patient_receipt_url(client.id, patient.id, receipt)
-            if test_id:
-                details['test_report_url'] = generate_test_report_url(test_id, client.id, patient.mobile_number, letterhead)
-            if test_ids:
-                details['tests_report_url'] = generate_tests_report_url(test_ids, client.id, patient.mobile_number,letterhead)
-
-            print(details.get('test_report_url'), details.get('tests_report_url'))
+            for search_id, patient in patients:
+                try:
+                    patient.added_on = patient.added_on.astimezone(indian_timezone)
+
+                    labpatientinvoice = invoices.get(patient.id)
+                    if labpatientinvoice:
+                        labpatientinvoice.added_on = labpatientinvoice.added_on.astimezone(indian_timezone)
+
+                    # Assign fetched values to details dict
+                    details = details_by_id[search_id]
+                    details['patient'] = patient
+                    details['age'] = get_age_details(patient)
+                    details['age_short_form'] = get_age_details_in_short_form(patient)
+                    details['bProfile'] = bProfile
+                    details['contacts'] = contacts
+                    details['labpatientinvoice'] = labpatientinvoice
+                    details['patient_receipt_url'] = generate_patient_receipt_url(client.id, patient.id, receipt,
+                                                                                  domain_url)
+                    if test_id:
+                        details['test_report_url'] = generate_test_report_url(test_id, client.id,
+                                                                              patient.mobile_number, letterhead,
+                                                                              domain_url)
+                    if test_ids:
+                        details['tests_report_url'] = generate_tests_report_url(test_ids, client.id,
+                                                                                patient.mobile_number, letterhead,
+                                                                                domain_url)
+                except Exception as error:
+                    print(f"Error occurred: {error}")
         except Exception as error:
             print(f"Error occurred: {error}")
-        return details
 
     elif messaging_send_type.name == 'Doctors':
         try:
-            doctor = LabDoctors.objects.get(pk=search_id)
+            doctors = get_found(LabDoctors.objects.filter(pk__in=search_ids))
             bProfile = BusinessProfiles.objects.filter(organization_name=client.name).first()
             contacts = BContacts.objects.filter(b_id=bProfile, is_primary=True).first()
             executive = BExecutive.objects.filter(b_id=bProfile, is_primary=True).first()
-            patients = Patient.objects.filter(referral_doctor=doctor)
-            patient_count = patients.count()
+            patient_counts = dict(Patient.objects.filter(referral_doctor__in=[doctor for _, doctor in doctors]).values(
+                'referral_doctor').annotate(count=Count('id')).values_list('referral_doctor', 'count'))
 
-            details['doctor'] = doctor
-            details['bProfile'] = bProfile
-            details['contacts'] = contacts
-            details['executive'] = executive
-            details['patient_count'] = patient_count
+            for search_id, doctor in doctors:
+                details = details_by_id[search_id]
+                details['doctor'] = doctor
+                details['bProfile'] = bProfile
+                details['contacts'] = contacts
+                details['executive'] = executive
+                details['patient_count'] = patient_counts.get(doctor.id, 0)
 
         except Exception as error:
             print(f"Error occurred: {error}")
 
-        return details
-
     elif messaging_send_type.name == 'Admin':
         try:
             bProfile = BusinessProfiles.objects.filter(organization_name=client.name).first()
             contacts = BContacts.objects.filter(b_id=bProfile, is_primary=True).first()
-            details['contacts'] = contacts
-            details['bProfile'] = bProfile
+            for details in details_by_id.values():
+                details['contacts'] = contacts
+                details['bProfile'] = bProfile
 
         except Exception as error:
             print(f"Error occurred: {error}")
 
-        return details
     elif messaging_send_type.name == 'Appointment':
         try:
-            print(messaging_send_type.name, messaging_send_type.name=='Appointment')
-
-            appointments = LabAppointmentForPatient.objects.get(pk=search_id)
+            appointments = get_found(LabAppointmentForPatient.objects.filter(pk__in=search_ids))
             bProfile = BusinessProfiles.objects.filter(organization_name=client.name).first()
             b_address = BusinessAddresses.objects.filter(b_id=bProfile.id).first()
 
-            details['appointments'] = appointments
-            details['bProfile'] = bProfile
-            details['b_address'] = b_address
+            for search_id, appointment in appointments:
+                details = details_by_id[search_id]
+                details['appointments'] = appointment
+                details['bProfile'] = bProfile
+                details['b_address'] = b_address
         except Exception as error:
             print(f"Error occurred: {error}")
 
-        return details
+    return details_by_id
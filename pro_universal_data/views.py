@@ -1,9 +1,9 @@
-from django.core.cache import cache
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, viewsets
+from healtho_pro.list_cache import CachedListMixin
 from pro_laboratory.models.bulk_messaging_models import BusinessMessagesCredits
 from pro_laboratory.models.client_based_settings_models import BusinessMessageSettings
-from pro_laboratory.views.messaging_views import SendPDFWhatsAppSMSViewSet
+from pro_laboratory.views.messaging_views import SendPDFWhatsAppSMSViewSet, get_request_timeout
 from pro_universal_data.filters import DoctorSharedReportFilter
 from pro_universal_data.models import ULabStaffGender, ULabPatientAction, ULabReportType, ULabPatientTitles, \
     ULabPatientAttenderTitles, ULabTestStatus, ULabPaymentModeType, \
@@ -33,50 +33,26 @@ from pro_universal_data.serializers import ULabMenusSerializer, ULabPatientActio
     UniversalAilmentsSerializer, UniversalDayTimePeriodSerializer, UniversalFoodIntakeSerializer, PatientTypeSerializer
 
 
-class ULabMenusListView(generics.ListAPIView):
+class ULabMenusListView(CachedListMixin, generics.ListAPIView):
     # queryset = ULabMenus.objects.filter(is_active=True)
     serializer_class = ULabMenusSerializer
+    list_cache_family = 'ulab_menu_list'
+    list_cache_per_tenant = False
 
     def get_queryset(self):
-        try:
-            client = self.request.client
-            cache_key = f'ulab_menu_list_{client}'
-            cache_data = cache.get(cache_key)
-            if cache_data:
-                return cache_data
-
-            business = BusinessProfiles.objects.get(organization_name=client.name)
-            obj = BusinessModules.objects.get(business=business)
-            queryset = obj.modules.all()
-            cache.set(cache_key, queryset)
-
-            return queryset
-        except Exception as error:
-            print(error)
-            business = BusinessProfiles.objects.get(organization_name=self.request.client.name)
-            obj = BusinessModules.objects.get(business=business)
-            queryset = obj.modules.all()
-            return queryset
+        business = BusinessProfiles.objects.get(organization_name=self.request.client.name)
+        obj = BusinessModules.objects.get(business=business)
+        return obj.modules.all()
 
 
-class ULabPatientGenderViewSet(viewsets.ModelViewSet):
+class ULabPatientGenderViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = ULabPatientGender.objects.all()
     serializer_class = ULabPatientGenderSerializer
+    list_cache_family = 'ulab_patient_gender_list'
+    list_cache_per_tenant = False
 
     def get_queryset(self):
-        try:
-            cache_key = 'ulab_patient_gender_list'
-            cached_data = cache.get(cache_key)
-            if cached_data:
-                print(cached_data)
-                return cached_data
-            queryset = super().get_queryset().order_by('id')
-            cache.set(cache_key, queryset)
-            print(queryset, '****queryset data****')
-            return queryset
-        except Exception as e:
-            queryset = super().get_queryset()
-            return queryset
+        return super().get_queryset().order_by('id')
 
 
 class ULabReportsGenderViewSet(viewsets.ModelViewSet):
@@ -99,40 +75,24 @@ class ULabReportTypeListView(generics.ListAPIView):
     serializer_class = ULabReportTypeSerializer
 
 
-class ULabPatientTitlesViewSet(viewsets.ModelViewSet):
+class ULabPatientTitlesViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = ULabPatientTitles.objects.all()
     serializer_class = ULabPatientTitlesSerializer
+    list_cache_family = 'ulab_patient_titles_list'
+    list_cache_per_tenant = False
 
     def get_queryset(self):
-        try:
-            cache_key = 'ulab_patient_titles_list'
-            cached_data = cache.get(cache_key)
-            if cached_data:
-                return cached_data
-            queryset = super().get_queryset().order_by('id')
-            cache.set(cache_key, queryset)
-            return queryset
-        except Exception as e:
-            queryset = super().get_queryset()
-            return queryset
-
-
-class ULabPatientAttenderTitlesViewSet(viewsets.ModelViewSet):
+        return super().get_queryset().order_by('id')
+
+
+class ULabPatientAttenderTitlesViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = ULabPatientAttenderTitles.objects.all()
     serializer_class = ULabPatientAttenderTitlesSerializer
+    list_cache_family = 'ulab_patient_attender_titles_list'
+    list_cache_per_tenant = False
 
     def get_queryset(self):
-        try:
-            cache_key = 'ulab_patient_attender_titles_list'
-            cached_data = cache.get(cache_key)
-            if cached_data:
-                return cached_data
-            queryset = super().get_queryset().order_by('id')
-            cache.set(cache_key, queryset)
-            return queryset
-        except Exception as e:
-            queryset = super().get_queryset()
-            return queryset
+        return super().get_queryset().order_by('id')
 
 
 class ULabTestStatusViewSet(viewsets.ModelViewSet):
@@ -140,42 +100,24 @@ class ULabTestStatusViewSet(viewsets.ModelViewSet):
     serializer_class = ULabTestStatusSerializer
 
 
-class ULabPaymentModeTypeViewSet(viewsets.ModelViewSet):
+class ULabPaymentModeTypeViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = ULabPaymentModeType.objects.all()
     serializer_class = ULabPaymentModeTypeSerializer
+    list_cache_family = 'ulab_payment_mode_type_list'
+    list_cache_per_tenant = False
 
     def get_queryset(self):
-        try:
-            cache_key = 'ulab_payment_mode_type_list'
-            cached_data = cache.get(cache_key)
+        return super().get_queryset().order_by('id')
 
-            if cached_data:
-                print(cached_data)
-                return cached_data
-            queryset = super().get_queryset().order_by('id')
-            cache.set(cache_key, queryset)
-            return queryset
-        except Exception as e:
-            queryset = super().get_queryset()
-            return queryset
 
-
-class ULabPatientAgeViewset(viewsets.ModelViewSet):
+class ULabPatientAgeViewset(CachedListMixin, viewsets.ModelViewSet):
     queryset = ULabPatientAge.objects.all()
     serializer_class = ULabPatientAgeSerializer
+    list_cache_family = 'ulab_patient_age_list'
+    list_cache_per_tenant = False
 
     def get_queryset(self):
-        try:
-            cache_key = 'ulab_patient_age_list'
-            cached_data = cache.get(cache_key)
-            if cached_data:
-                return cached_data
-            queryset = super().get_queryset().order_by('id')
-            cache.set(cache_key, queryset)
-            return queryset
-        except Exception as e:
-            queryset = super().get_queryset()
-            return queryset
+        return super().get_queryset().order_by('id')
 
 
 class PrivilegeCardBenefitsViewset(viewsets.ModelViewSet):
@@ -343,7 +285,8 @@ def send_sms(numbers, variables_values):
     headers = {
         'cache-control': "no-cache"
     }
-    response = requests.request("GET", url, headers=headers, params=querystring)
+    response = requests.request("GET", url, headers=headers, params=querystring,
+                                timeout=get_request_timeout())
     print(response.json())
     return response.json()
 